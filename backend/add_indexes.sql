@@ -1,5 +1,7 @@
 -- Índices para otimização de queries
 -- Execute este SQL na base de dados PostgreSQL
+-- Legado: os índices compostos das queries quentes são geridos pelo Alembic
+-- (revisão hot_path_indexes; verificar com benchmarks/explain_hot_queries.py)
 
 -- Índice para workspace lookup (muito usado)
 CREATE INDEX IF NOT EXISTS idx_workspaces_owner_id ON workspaces(owner_id);
@@ -10,10 +12,8 @@ CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions(transaction_dat
 CREATE INDEX IF NOT EXISTS idx_transactions_created_at ON transactions(created_at);
 CREATE INDEX IF NOT EXISTS idx_transactions_category_id ON transactions(category_id);
 
--- Índice composto para filtros comuns (workspace + amount filter)
-CREATE INDEX IF NOT EXISTS idx_transactions_workspace_amount 
-ON transactions(workspace_id, amount_cents) 
-WHERE abs(amount_cents) != 1;
+-- Filtro de seed: substituído pela coluna is_seed e pelo índice parcial
+-- idx_transactions_workspace_date_not_seed (migração Alembic tx_is_seed)
 
 -- Índice para categories por workspace
 CREATE INDEX IF NOT EXISTS idx_categories_workspace_id ON categories(workspace_id);
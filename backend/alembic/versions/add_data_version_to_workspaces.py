@@ -0,0 +1,27 @@
+"""Add data_version to workspaces table
+
+Revision ID: ws_data_version
+Revises: workspace_category_month
+Create Date: 2026-10-18
+
+Contador incrementado a cada escrita nos dados do workspace (transações, categorias,
+recorrentes, metas); o dashboard usa-o como chave de cache e ETag.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'ws_data_version'
+down_revision: Union[str, None] = 'workspace_category_month'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('workspaces', sa.Column('data_version', sa.BigInteger(), nullable=False, server_default='0'))
+
+
+def downgrade() -> None:
+    op.drop_column('workspaces', 'data_version')
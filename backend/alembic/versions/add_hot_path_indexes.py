@@ -0,0 +1,51 @@
+"""Add composite indexes for the hot query paths
+
+Revision ID: hot_path_indexes
+Revises: tx_is_seed
+Create Date: 2026-10-18
+
+Índices compostos derivados das queries reais (ver benchmarks/explain_hot_queries.py).
+Substituem o add_indexes.sql aplicado à mão. Todos criados CONCURRENTLY (fora de transação)
+para não bloquear escritas; IF NOT EXISTS torna a migração segura em BDs onde já existam.
+
+Já cobertos por revisões/constraints anteriores (não repetidos aqui):
+- transactions (workspace_id, created_at): prefixo de idx_transactions_workspace_created_id
+- category_mapping_cache (workspace_id, description_normalized, transaction_type):
+  constraint unique_workspace_mapping
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'hot_path_indexes'
+down_revision: Union[str, None] = 'tx_is_seed'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    # Leituras por período (dashboard, insights, Telegram)
+    ('idx_transactions_workspace_date', 'transactions', ['workspace_id', 'transaction_date']),
+    # Orçamento/estatísticas por categoria num período, saldo de cofres
+    ('idx_transactions_workspace_category_date', 'transactions', ['workspace_id', 'category_id', 'transaction_date']),
+    # categorization_engine: scores dos tokens da descrição
+    ('idx_token_scores_workspace_type_token', 'token_scores', ['workspace_id', 'transaction_type', 'token']),
+    # Telegram: pendentes de um batch (confirmar/cancelar tudo)
+    ('idx_telegram_pending_chat_batch', 'telegram_pending_transactions', ['chat_id', 'batch_id']),
+    # Circuit-breaker do Gemini: eventos recentes do workspace
+    ('idx_gemini_events_workspace_timestamp', 'gemini_events', ['workspace_id', 'timestamp']),
+    # Admin: últimos logs de auditoria de um utilizador
+    ('idx_audit_logs_user_created', 'audit_logs', ['user_id', 'created_at']),
+]
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,54 @@
+"""Add is_seed flag to transactions with a partial (workspace_id, transaction_date) index
+
+Revision ID: tx_is_seed
+Revises: tx_workspace_created_id_idx
+Create Date: 2026-10-18
+
+As transações de exemplo do registo eram reconhecidas por abs(amount_cents) = 1, um filtro
+que impede range scans por índice. Passam a ter is_seed = true; as leituras usam NOT is_seed,
+servido pelo índice parcial. O índice manual idx_transactions_workspace_amount (add_indexes.sql)
+deixa de ser usado e é removido.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'tx_is_seed'
+down_revision: Union[str, None] = 'tx_workspace_created_id_idx'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('transactions', sa.Column('is_seed', sa.Boolean(), nullable=False, server_default=sa.false()))
+    # Mesma regra usada até aqui: 1 cêntimo (positivo ou negativo) é transação de exemplo
+    op.execute("UPDATE transactions SET is_seed = true WHERE abs(amount_cents) = 1")
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'idx_transactions_workspace_date_not_seed',
+            'transactions',
+            ['workspace_id', sa.text('transaction_date DESC')],
+            postgresql_where=sa.text('NOT is_seed'),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.drop_index(
+            'idx_transactions_workspace_amount',
+            table_name='transactions',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'idx_transactions_workspace_date_not_seed',
+            table_name='transactions',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+    op.drop_column('transactions', 'is_seed')
@@ -0,0 +1,48 @@
+"""Add recurring idempotency key to transactions
+
+Revision ID: tx_recurring_idempotency_key
+Revises: ws_recurring_processed_through
+Create Date: 2026-10-18
+
+As transações geradas por recorrentes passam a guardar (recurring_id, recurring_period);
+o índice único parcial impede duplicados mesmo com o job a correr em mais de um worker.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = 'tx_recurring_idempotency_key'
+down_revision: Union[str, None] = 'ws_recurring_processed_through'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('transactions', sa.Column('recurring_id', postgresql.UUID(as_uuid=True), nullable=True))
+    op.add_column('transactions', sa.Column('recurring_period', sa.Date(), nullable=True))
+    op.create_foreign_key(
+        'transactions_recurring_id_fkey',
+        'transactions',
+        'recurring_transactions',
+        ['recurring_id'],
+        ['id'],
+        ondelete='SET NULL',
+    )
+    op.create_index(
+        'uq_transactions_recurring_period',
+        'transactions',
+        ['recurring_id', 'recurring_period'],
+        unique=True,
+        postgresql_where=sa.text('recurring_id IS NOT NULL'),
+        if_not_exists=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('uq_transactions_recurring_period', table_name='transactions', if_exists=True)
+    op.drop_constraint('transactions_recurring_id_fkey', 'transactions', type_='foreignkey')
+    op.drop_column('transactions', 'recurring_period')
+    op.drop_column('transactions', 'recurring_id')
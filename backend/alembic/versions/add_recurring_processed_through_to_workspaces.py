@@ -0,0 +1,28 @@
+"""Add recurring_processed_through to workspaces table
+
+Revision ID: ws_recurring_processed_through
+Revises: users_email_lower_idx
+Create Date: 2026-10-18
+
+Marca até que data as recorrentes do workspace já foram geradas; as leituras
+(dashboard, insights, transações) deixam de reprocessar quando está em dia.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'ws_recurring_processed_through'
+down_revision: Union[str, None] = 'users_email_lower_idx'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # NULL = nunca processado; a próxima execução do job (ou a próxima leitura) põe em dia
+    op.add_column('workspaces', sa.Column('recurring_processed_through', sa.Date(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('workspaces', 'recurring_processed_through')
@@ -0,0 +1,37 @@
+"""Add shared_state table (UNLOGGED, cross-worker counters)
+
+Revision ID: shared_state
+Revises: telegram_updates
+Create Date: 2026-10-18
+
+Estado partilhado entre workers de core.shared_state (SHARED_STATE_BACKEND=postgres): dedupe do
+webhook do Telegram e rate limits. UNLOGGED porque são só contadores com TTL: escritas sem WAL e,
+num crash, a tabela volta vazia, o que apenas reinicia as janelas.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'shared_state'
+down_revision: Union[str, None] = 'telegram_updates'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'shared_state',
+        sa.Column('key', sa.String(), nullable=False),
+        sa.Column('value', sa.BigInteger(), nullable=False),
+        sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('key'),
+        prefixes=['UNLOGGED'],
+    )
+    op.create_index('idx_shared_state_expires_at', 'shared_state', ['expires_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('idx_shared_state_expires_at', table_name='shared_state')
+    op.drop_table('shared_state')
@@ -0,0 +1,43 @@
+"""Add telegram_updates table (durable queue for the Telegram webhook)
+
+Revision ID: telegram_updates
+Revises: hot_path_indexes
+Create Date: 2026-10-18
+
+O webhook grava cada update aqui e responde 200 logo; os workers de core.telegram_queue
+processam-no em segundo plano. A PK update_id deduplica os reenvios do Telegram e as linhas
+por acabar (pending/processing) são recuperadas após um restart.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = 'telegram_updates'
+down_revision: Union[str, None] = 'hot_path_indexes'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'telegram_updates',
+        sa.Column('update_id', sa.BigInteger(), autoincrement=False, nullable=False),
+        sa.Column('chat_id', sa.String(), nullable=True),
+        sa.Column('payload', postgresql.JSONB(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False, server_default='pending'),
+        sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('received_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.text('now()')),
+        sa.Column('claimed_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('processed_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('update_id'),
+    )
+    op.create_index('idx_telegram_updates_status_received', 'telegram_updates', ['status', 'received_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('idx_telegram_updates_status_received', table_name='telegram_updates')
+    op.drop_table('telegram_updates')
@@ -0,0 +1,56 @@
+"""Add transactions.description_canonical and its token GIN index
+
+Revision ID: tx_description_canonical
+Revises: shared_state
+Create Date: 2026-10-18
+
+Forma canónica da descrição (categorization_engine.canonicalize), mantida em cada escrita por
+core.description_index, e índice GIN sobre os seus tokens: a similaridade com o histórico passa a
+ser uma query indexada em vez de carregar e canonicalizar 500 transações por pedido.
+O backfill corre em lotes com o mesmo canonicalize da app; o índice é criado CONCURRENTLY.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'tx_description_canonical'
+down_revision: Union[str, None] = 'shared_state'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 5000
+
+
+def upgrade() -> None:
+    from app.core.categorization_engine import canonicalize_many
+
+    op.add_column('transactions', sa.Column('description_canonical', sa.String(length=255), nullable=True))
+
+    connection = op.get_bind()
+    select_batch = sa.text(
+        "SELECT id, description FROM transactions "
+        "WHERE description IS NOT NULL AND description_canonical IS NULL LIMIT :limit"
+    )
+    update_row = sa.text("UPDATE transactions SET description_canonical = :canonical WHERE id = :id")
+    while True:
+        rows = connection.execute(select_batch, {'limit': BATCH_SIZE}).all()
+        if not rows:
+            break
+        connection.execute(update_row, [
+            {'id': row.id, 'canonical': canonical}
+            for row, canonical in zip(rows, canonicalize_many(row.description for row in rows))
+        ])
+
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_transactions_description_tokens "
+            "ON transactions USING gin (string_to_array(description_canonical, ' '))"
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS idx_transactions_description_tokens")
+    op.drop_column('transactions', 'description_canonical')
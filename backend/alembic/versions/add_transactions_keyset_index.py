@@ -0,0 +1,40 @@
+"""Add (workspace_id, created_at, id) index for transactions keyset pagination
+
+Revision ID: tx_workspace_created_id_idx
+Revises: ws_data_version
+Create Date: 2026-10-18
+
+GET /transactions/ pagina por cursor (created_at, id); com este índice cada página é um
+index scan limitado, independentemente da profundidade. Criado CONCURRENTLY para não
+bloquear escritas na tabela.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'tx_workspace_created_id_idx'
+down_revision: Union[str, None] = 'ws_data_version'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'idx_transactions_workspace_created_id',
+            'transactions',
+            ['workspace_id', 'created_at', 'id'],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'idx_transactions_workspace_created_id',
+            table_name='transactions',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
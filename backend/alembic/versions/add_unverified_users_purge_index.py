@@ -0,0 +1,33 @@
+"""Partial index for the unverified-users purge job
+
+Revision ID: unverified_users_purge_idx
+Revises: add_salary_general_expense_ws
+Create Date: 2026-10-18
+
+O job purge_expired_unverified_users (main.start_scheduler) faz
+DELETE ... WHERE is_email_verified = false AND created_at < cutoff;
+o índice parcial cobre só as contas por verificar.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = 'unverified_users_purge_idx'
+down_revision: Union[str, None] = 'add_salary_general_expense_ws'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_users_unverified_created_at',
+        'users',
+        ['created_at'],
+        postgresql_where=sa.text('is_email_verified = false'),
+        if_not_exists=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_users_unverified_created_at', table_name='users', if_exists=True)
@@ -0,0 +1,26 @@
+"""Functional index on lower(users.email)
+
+Revision ID: users_email_lower_idx
+Revises: unverified_users_purge_idx
+Create Date: 2026-10-18
+
+get_current_user procura o utilizador por func.lower(User.email), que não usa o
+índice simples de email; este índice cobre os cache misses do core.user_cache.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = 'users_email_lower_idx'
+down_revision: Union[str, None] = 'unverified_users_purge_idx'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_users_email_lower', 'users', [sa.text('lower(email)')], if_not_exists=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_users_email_lower', table_name='users', if_exists=True)
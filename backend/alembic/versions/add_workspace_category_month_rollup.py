@@ -0,0 +1,55 @@
+"""Add workspace_category_month rollup table
+
+Revision ID: workspace_category_month
+Revises: tx_recurring_idempotency_key
+Create Date: 2026-10-18
+
+Totais mensais por workspace/categoria, mantidos pela aplicação (core.month_rollup).
+A tabela é preenchida a partir das transações existentes; rebuild_month_rollup.py
+verifica e reconstrói se for preciso.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = 'workspace_category_month'
+down_revision: Union[str, None] = 'tx_recurring_idempotency_key'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'workspace_category_month',
+        sa.Column('workspace_id', postgresql.UUID(as_uuid=True), sa.ForeignKey('workspaces.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('category_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('month', sa.Date(), nullable=False),
+        sa.Column('credit_cents', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('credit_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('debit_cents', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('debit_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.PrimaryKeyConstraint('workspace_id', 'category_id', 'month'),
+    )
+    # Preencher com o histórico (seed de 1 cêntimo excluído, como nas leituras)
+    op.execute("""
+        INSERT INTO workspace_category_month
+            (workspace_id, category_id, month, credit_cents, credit_count, debit_cents, debit_count)
+        SELECT
+            workspace_id,
+            COALESCE(category_id, '00000000-0000-0000-0000-000000000000'::uuid),
+            date_trunc('month', transaction_date)::date,
+            COALESCE(SUM(amount_cents) FILTER (WHERE amount_cents > 0), 0),
+            COUNT(*) FILTER (WHERE amount_cents > 0),
+            COALESCE(SUM(amount_cents) FILTER (WHERE amount_cents < 0), 0),
+            COUNT(*) FILTER (WHERE amount_cents < 0)
+        FROM transactions
+        WHERE abs(amount_cents) <> 1
+        GROUP BY 1, 2, 3
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('workspace_category_month')
@@ -7,7 +7,7 @@ import uuid
 logger = logging.getLogger(__name__)
 
 
-async def log_action(db: Session, action: str, user_id: uuid.UUID = None, details: str = None, request: Request = None):
+def log_action(db: Session, action: str, user_id: uuid.UUID = None, details: str = None, request: Request = None):
     ip = request.client.host if request and request.client else None
     log = database.AuditLog(
         id=uuid.uuid4(),
@@ -7,9 +7,12 @@ import re
 import unicodedata
 import logging
 from datetime import datetime, timedelta, timezone
-from typing import List, Optional, Tuple, Dict, Any
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 from uuid import UUID
 
+from .keyword_matcher import KeywordMatcher
+
 logger = logging.getLogger(__name__)
 
 # Thresholds (spec)
@@ -115,6 +118,36 @@ INCOME_KEYWORDS = frozenset({
     'transferencia', 'transferência', 'pagamento'
 })
 
+# Autómatos das listas acima (uma passagem pelo texto em vez de um `in` por entrada).
+# Merchants sem espaços: "uber eats" casa com "ubereats" e vice-versa, como antes.
+def _build_keyword_matchers() -> Tuple[KeywordMatcher, KeywordMatcher, KeywordMatcher]:
+    return (
+        KeywordMatcher((m.replace(' ', ''), cat) for m, cat in KNOWN_MERCHANTS.items()),
+        KeywordMatcher(CATEGORY_KEYWORDS.items()),
+        KeywordMatcher((kw, kw) for kw in sorted(INCOME_KEYWORDS)),
+    )
+
+
+_merchant_matcher, _category_keyword_matcher, _income_matcher = _build_keyword_matchers()
+
+
+def rebuild_keyword_matchers() -> None:
+    """Reconstrói os autómatos; chamar depois de alterar KNOWN_MERCHANTS, CATEGORY_KEYWORDS ou INCOME_KEYWORDS."""
+    global _merchant_matcher, _category_keyword_matcher, _income_matcher
+    _merchant_matcher, _category_keyword_matcher, _income_matcher = _build_keyword_matchers()
+
+
+# Regex da canonicalização, compiladas uma vez
+_MONEY_RE = re.compile(r'\d+[.,\s]*\d*\s*(?:€|eur|euros?|e)?', re.IGNORECASE)
+_DATE_RE = re.compile(r'\d{1,2}[-/]\d{1,2}[-/]\d{2,4}')
+# '\\b' literal (não é fronteira de palavra), como sempre foi: corrigir mudaria as chaves canónicas já
+# gravadas (category_mapping_cache, token_scores)
+_LONG_CODE_RE = re.compile(r'\\b[a-z0-9]{10,}\\b', re.IGNORECASE)
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+# Descrições repetem-se muito (histórico, aliases, pendentes, extratos): cache LRU pela string original
+CANONICALIZE_CACHE_SIZE = 50000
+
 
 def canonicalize(description: str) -> str:
     """
@@ -123,18 +156,35 @@ def canonicalize(description: str) -> str:
     """
     if not description or not isinstance(description, str):
         return ""
+    return _canonicalize_cached(description)
+
+
+def canonicalize_many(descriptions: Iterable[Optional[str]]) -> List[str]:
+    """canonicalize() de um lote (ex.: linhas do histórico ou de um extrato), pela mesma ordem."""
+    cached = _canonicalize_cached
+    return [cached(d) if d and isinstance(d, str) else "" for d in descriptions]
+
+
+def canonicalize_cache_stats() -> dict:
+    info = _canonicalize_cached.cache_info()
+    return {'size': info.currsize, 'maxsize': info.maxsize, 'hits': info.hits, 'misses': info.misses}
+
+
+@lru_cache(maxsize=CANONICALIZE_CACHE_SIZE)
+def _canonicalize_cached(description: str) -> str:
     text = description.strip().lower()
-    # Remover acentos
-    text = unicodedata.normalize('NFD', text)
-    text = ''.join(c for c in text if unicodedata.category(c) != 'Mn')
+    # Remover acentos (texto só ASCII não tem nenhum: evitar o NFD)
+    if not text.isascii():
+        text = unicodedata.normalize('NFD', text)
+        text = ''.join(c for c in text if unicodedata.category(c) != 'Mn')
     # Remover valores monetários
-    text = re.sub(r'\d+[.,\s]*\d*\s*(?:€|eur|euros?|e)?', ' ', text, flags=re.IGNORECASE)
+    text = _MONEY_RE.sub(' ', text)
     # Remover datas comuns (DD-MM-YYYY, etc.)
-    text = re.sub(r'\d{1,2}[-/]\d{1,2}[-/]\d{2,4}', ' ', text)
+    text = _DATE_RE.sub(' ', text)
     # Remover códigos e referências longas (IBANs, refs, ids)
-    text = re.sub(r'\\b[a-z0-9]{10,}\\b', ' ', text, flags=re.IGNORECASE)
+    text = _LONG_CODE_RE.sub(' ', text)
     # Extrair tokens alfanuméricos
-    tokens = re.findall(r'[a-z0-9]+', text)
+    tokens = _TOKEN_RE.findall(text)
     # Remover stopwords e tokens muito curtos
     tokens = [t for t in tokens if t not in STOPWORDS and len(t) >= 2 and not t.isdigit()]
     # Stemming simples (pt/en)
@@ -176,13 +226,11 @@ def apply_deterministic_rules(description_raw: str, tipo: str) -> Optional[str]:
     Retorna nome da categoria se houver match, senão None.
     """
     text_lower = description_raw.lower().strip()
-    text_canon = canonicalize(description_raw)
 
-    # Salário / receita recorrente
-    if tipo == 'income':
-        for kw in INCOME_KEYWORDS:
-            if kw in text_lower or kw in text_canon:
-                return 'Salário'
+    # Salário / receita recorrente: texto original e canónico numa só passagem (o separador não
+    # aparece em nenhuma keyword)
+    if tipo == 'income' and _income_matcher.first(f"{text_lower}\n{canonicalize(description_raw)}"):
+        return 'Salário'
 
     # IBAN (transferência bancária - genérico)
     if re.search(r'\b[A-Z]{2}\d{2}\s?\d{4}\s?\d{4}\s?\d{4}\s?\d{4}\s?\d{4}\s?\d{3}\b', description_raw, re.IGNORECASE):
@@ -191,29 +239,24 @@ def apply_deterministic_rules(description_raw: str, tipo: str) -> Optional[str]:
         return 'Transferências'
 
     # Merchants conhecidos (fallback local)
-    for merchant, cat in KNOWN_MERCHANTS.items():
-        if merchant in text_lower or merchant.replace(' ', '') in text_lower.replace(' ', ''):
-            return cat
+    merchant = _merchant_matcher.first(text_lower.replace(' ', ''))
+    if merchant:
+        return merchant[1]
 
     return None
 
 
-def lookup_merchant_registry(description_raw: str, tipo: str, db, models) -> Optional[Tuple[str, str]]:
+def lookup_merchant_registry(description_raw: str, tipo: str) -> Optional[Tuple[str, str]]:
     """
-    Procura alias em merchant_registry. Retorna (category_name, alias) ou None.
+    Procura alias em merchant_registry (índice em memória, core.merchant_index).
+    Retorna (category_name, alias) ou None.
     """
+    from .merchant_index import merchant_index
     try:
         canon = canonicalize(description_raw)
         if not canon:
             return None
-        aliases = db.query(models.MerchantRegistry).filter(
-            models.MerchantRegistry.is_active == True,
-            models.MerchantRegistry.transaction_type == tipo,
-        ).all()
-        for entry in aliases:
-            alias_can = canonicalize(entry.alias)
-            if alias_can and alias_can in canon:
-                return (entry.category_name, entry.alias)
+        return merchant_index.lookup(canon, tipo)
     except Exception as e:
         logger.warning(f"Merchant registry lookup falhou: {e}")
     return None
@@ -229,46 +272,49 @@ def compute_category_scores_from_tokens(
     """
     Soma scores por categoria a partir dos token_scores do workspace.
     score = alpha * freq_recent + beta * freq_total (com decay temporal).
+    Usa o modelo em memória do workspace (core.token_model).
     """
     if not tokens:
         return {}, {}
+    from .token_model import get_model
+    return get_model(db, models, workspace_id, tipo).score(tokens)
+
+
+def compute_category_scores_many(
+    token_lists: List[List[str]],
+    workspace_id: UUID,
+    tipo: str,
+    db,
+    models,
+) -> List[Tuple[Dict[UUID, float], Dict[UUID, Dict[str, float]]]]:
+    """compute_category_scores_from_tokens para um lote de descrições (ex.: linhas de um extrato)."""
+    from .token_model import get_model
+    return get_model(db, models, workspace_id, tipo).score_many(token_lists)
 
-    alpha = 0.7
-    beta = 0.3
-    scores: Dict[UUID, float] = {}
-    token_contribs: Dict[UUID, Dict[str, float]] = {}
-
-    rows = db.query(
-        models.TokenScore.category_id,
-        models.TokenScore.token,
-        models.TokenScore.count,
-        models.TokenScore.score,
-        models.TokenScore.last_updated,
-    ).filter(
-        models.TokenScore.workspace_id == workspace_id,
-        models.TokenScore.transaction_type == tipo,
-        models.TokenScore.token.in_(tokens),
-    ).all()
-
-    for r in rows:
-        if not r.category_id:
-            continue
-        recency = 1.0
-        if r.last_updated:
-            age_days = (datetime.now(timezone.utc) - r.last_updated.replace(tzinfo=timezone.utc)).days
-            recency = max(0.2, 1.0 - (age_days / 60) * 0.8)
-        freq_recent = float(r.count or 1) * recency
-        freq_total = float(r.count or 1)
-        contrib = (alpha * freq_recent + beta * freq_total) * float(r.score or 1.0)
-        scores[r.category_id] = scores.get(r.category_id, 0) + contrib
-        token_contribs.setdefault(r.category_id, {})[r.token] = token_contribs.get(r.category_id, {}).get(r.token, 0) + contrib
-
-    if scores:
-        max_score = max(scores.values())
-        for cat_id in scores:
-            scores[cat_id] = scores[cat_id] / max_score if max_score else 0
-
-    return scores, token_contribs
+
+def score_descriptions(
+    items: List[Tuple[str, str]],
+    workspace_id: UUID,
+    db,
+    models,
+) -> List[Tuple[Dict[UUID, float], Dict[UUID, Dict[str, float]]]]:
+    """
+    Token scoring (passo 4 de infer_category) de várias linhas (descrição, tipo) de uma vez: um
+    compute_category_scores_many por tipo, pela ordem de `items`. Passar cada resultado a
+    infer_category(token_scores=...) nas listas do Telegram e documentos com várias linhas.
+    """
+    results: List[Any] = [None] * len(items)
+    by_tipo: Dict[str, List[int]] = {}
+    for i, (_, tipo) in enumerate(items):
+        by_tipo.setdefault(tipo, []).append(i)
+    for tipo, indices in by_tipo.items():
+        canonicals = canonicalize_many(items[i][0] for i in indices)
+        scored = compute_category_scores_many(
+            [extract_tokens(c, n=3) if c else [] for c in canonicals], workspace_id, tipo, db, models
+        )
+        for i, scores in zip(indices, scored):
+            results[i] = scores
+    return results
 
 
 def _find_similar_transaction(
@@ -279,40 +325,9 @@ def _find_similar_transaction(
     models,
 ) -> Optional[UUID]:
     """Busca transações similares no histórico. Retorna category_id ou None."""
-    from datetime import date
-    words = set(canonical.split()) if canonical else set()
-    if not words:
-        return None
-    cutoff_date = date.today() - timedelta(days=180)
-    txns = db.query(models.Transaction).filter(
-        models.Transaction.workspace_id == workspace_id,
-        models.Transaction.transaction_date >= cutoff_date,
-        models.Transaction.category_id.isnot(None),
-    ).order_by(models.Transaction.transaction_date.desc()).limit(500).all()
-    if tipo == "expense":
-        txns = [t for t in txns if t.amount_cents < 0 and abs(t.amount_cents) != 1]
-    else:
-        txns = [t for t in txns if t.amount_cents > 0 and abs(t.amount_cents) != 1]
-    best_match = None
-    best_score = 0
-    for t in txns:
-        if not t.description:
-            continue
-        desc_can = canonicalize(t.description)
-        desc_words = set(desc_can.split())
-        common = words.intersection(desc_words)
-        if not common:
-            continue
-        score = len(common) + sum(2 for w in common if len(w) > 4)
-        days_ago = (date.today() - t.transaction_date).days
-        score += 3 if days_ago <= 7 else (2 if days_ago <= 30 else (1 if days_ago <= 90 else 0))
-        has_important = any(len(w) > 4 for w in common)
-        # Relaxado: 1 palavra importante OU 2+ palavras em comum (favorece dados históricos antes de IA)
-        accept = (has_important and len(common) >= 1) or len(common) >= 2
-        if accept and score >= 2 and score > best_score:
-            best_score = score
-            best_match = t.category_id
-    return best_match
+    from .description_index import best_similar_category
+    best = best_similar_category(db, workspace_id, tipo, canonical)
+    return best[0] if best else None
 
 
 def check_gemini_circuit_breaker(db, models, workspace_id: Optional[UUID] = None) -> bool:
@@ -353,9 +368,11 @@ def infer_category(
     settings,
     explicit_category_id: Optional[UUID] = None,
     use_gemini: bool = True,
+    token_scores: Optional[Tuple[Dict[UUID, float], Dict[UUID, Dict[str, float]]]] = None,
 ) -> Tuple[Optional[UUID], str, bool, Optional[float], str, List[str]]:
     """
     Pipeline de inferência de categoria.
+    token_scores: resultado do passo 4 já calculado em lote (score_descriptions), em vez de pontuar aqui.
     Retorna: (category_id, inference_source, needs_review, confidence, decision_reason, explain_tokens)
     inference_source: 'explicit'|'merchant_registry'|'deterministic'|'cache_private'|'token_scoring'|
                       'history_similarity'|'cache_global'|'gemini'|'fallback'
@@ -377,7 +394,7 @@ def infer_category(
         return (fb.id, 'fallback', True, 0.0, 'fallback:empty', [])
 
     # 1b. Merchant registry (aliases)
-    merchant_match = lookup_merchant_registry(description_raw, tipo, db, models)
+    merchant_match = lookup_merchant_registry(description_raw, tipo)
     if merchant_match:
         cat_name, alias = merchant_match
         for c in filtered_categories:
@@ -393,11 +410,10 @@ def infer_category(
 
     # 2.5 Keyword matching (keywords genéricos -> categoria)
     text_lower = description_raw.lower().strip()
-    for keyword, cat_name in CATEGORY_KEYWORDS.items():
-        if keyword in text_lower:
-            for c in filtered_categories:
-                if c.name.lower() == cat_name.lower():
-                    return (c.id, 'keyword_match', False, 0.90, f"keyword:{keyword}", [keyword])
+    for keyword, cat_name in _category_keyword_matcher.matches(text_lower):
+        for c in filtered_categories:
+            if c.name.lower() == cat_name.lower():
+                return (c.id, 'keyword_match', False, 0.90, f"keyword:{keyword}", [keyword])
 
     # 3. Cache privada (description_canonical)
     cache_entry = db.query(models.CategoryMappingCache).filter(
@@ -409,8 +425,11 @@ def infer_category(
         return (cache_entry.category_id, 'cache_private', False, 1.0, f"cache_private:{canonical}", [canonical])
 
     # 4. Token scoring
-    tokens = extract_tokens(canonical, n=3)
-    category_scores, token_contribs = compute_category_scores_from_tokens(tokens, workspace_id, tipo, db, models)
+    if token_scores is not None:
+        category_scores, token_contribs = token_scores
+    else:
+        tokens = extract_tokens(canonical, n=3)
+        category_scores, token_contribs = compute_category_scores_from_tokens(tokens, workspace_id, tipo, db, models)
     if category_scores:
         best_cat = max(category_scores, key=category_scores.get)
         best_score = category_scores[best_cat]
@@ -597,6 +616,8 @@ def learn_from_correction(
             is_global=False,
         ))
     db.commit()
+    from .token_model import invalidate
+    invalidate(workspace_id)
     logger.info(f"Aprendizagem: '{canonical}' -> {category_name} (tokens: {len(tokens)})")
 
     # Heurística simples: promover alias de merchant se descrição é curta/consistente
@@ -623,6 +644,8 @@ def learn_from_correction(
                         is_active=True,
                     ))
                 db.commit()
+                from .merchant_index import merchant_index
+                merchant_index.invalidate()
     except Exception as e:
         db.rollback()
         logger.warning(f"Merchant registry update falhou: {e}")
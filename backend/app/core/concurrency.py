@@ -0,0 +1,32 @@
+"""
+Modelo de execução: handlers síncronos e trabalho bloqueante correm no threadpool do anyio.
+
+Os handlers declarados com `def` já são executados pelo FastAPI no threadpool. Os que precisam
+de `await` (ler o corpo do pedido, enviar email) usam `run_blocking` para a parte que usa a BD
+ou clientes HTTP síncronos (requests, stripe, openai), para não bloquear o event loop.
+"""
+import logging
+from typing import Any, Callable, TypeVar
+
+import anyio.to_thread
+from starlette.concurrency import run_in_threadpool
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+def configure_threadpool(size: int | None = None) -> int:
+    """Ajusta o número de threads do threadpool partilhado (chamar no startup, dentro do event loop)."""
+    size = size or settings.THREADPOOL_SIZE
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    limiter.total_tokens = max(1, int(size))
+    logger.info(f"Threadpool configurado com {limiter.total_tokens} threads")
+    return limiter.total_tokens
+
+
+async def run_blocking(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Executa uma função bloqueante no threadpool e devolve o resultado."""
+    return await run_in_threadpool(func, *args, **kwargs)
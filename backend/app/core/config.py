@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -121,5 +122,66 @@ class Settings(BaseSettings):
     # Configuração de ambiente
     ENVIRONMENT: str = os.getenv('ENVIRONMENT', 'development')
 
+    # Threadpool onde correm os handlers síncronos e o trabalho bloqueante (BD, Stripe, OpenAI).
+    # Por defeito o anyio usa 40 threads; em instâncias pequenas convém limitar, em grandes aumentar.
+    THREADPOOL_SIZE: int = int(os.getenv('THREADPOOL_SIZE', 40))
+
+    # Pool de ligações à BD (aplica-se ao engine síncrono e ao async/asyncpg)
+    DB_POOL_SIZE: int = int(os.getenv('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW: int = int(os.getenv('DB_MAX_OVERFLOW', 10))
+    DB_POOL_TIMEOUT: int = int(os.getenv('DB_POOL_TIMEOUT', 30))  # segundos à espera de uma ligação livre
+
+    # Cache em memória do utilizador autenticado (core.user_cache)
+    USER_CACHE_TTL_SECONDS: int = int(os.getenv('USER_CACHE_TTL_SECONDS', 60))
+    USER_CACHE_MAX_SIZE: int = int(os.getenv('USER_CACHE_MAX_SIZE', 10000))
+
+    # Cache em memória do workspace de cada utilizador (core.workspace_cache)
+    WORKSPACE_CACHE_TTL_SECONDS: int = int(os.getenv('WORKSPACE_CACHE_TTL_SECONDS', 300))
+    WORKSPACE_CACHE_MAX_SIZE: int = int(os.getenv('WORKSPACE_CACHE_MAX_SIZE', 10000))
+
+    # Cache das respostas de /dashboard/snapshot (core.dashboard_cache); a chave inclui a versão dos dados
+    DASHBOARD_CACHE_TTL_SECONDS: int = int(os.getenv('DASHBOARD_CACHE_TTL_SECONDS', 600))
+    DASHBOARD_CACHE_MAX_SIZE: int = int(os.getenv('DASHBOARD_CACHE_MAX_SIZE', 5000))
+
+    # Cliente da Bot API do Telegram (core.telegram_client)
+    TELEGRAM_API_TIMEOUT_SECONDS: float = float(os.getenv('TELEGRAM_API_TIMEOUT_SECONDS', 10))
+    TELEGRAM_API_MAX_RETRIES: int = int(os.getenv('TELEGRAM_API_MAX_RETRIES', 3))
+    TELEGRAM_API_MAX_CONNECTIONS: int = int(os.getenv('TELEGRAM_API_MAX_CONNECTIONS', 50))
+    # Limites de envio do Telegram: total do bot, por chat privado (com pequeno pico) e por grupo
+    TELEGRAM_GLOBAL_RATE_PER_SECOND: float = float(os.getenv('TELEGRAM_GLOBAL_RATE_PER_SECOND', 30))
+    TELEGRAM_CHAT_RATE_PER_SECOND: float = float(os.getenv('TELEGRAM_CHAT_RATE_PER_SECOND', 1))
+    TELEGRAM_CHAT_BURST: int = int(os.getenv('TELEGRAM_CHAT_BURST', 3))
+    TELEGRAM_GROUP_RATE_PER_MINUTE: int = int(os.getenv('TELEGRAM_GROUP_RATE_PER_MINUTE', 20))
+
+    # Fila do webhook Telegram (core.telegram_queue): workers (= lanes, ordem por chat) e tamanho de cada lane
+    TELEGRAM_QUEUE_WORKERS: int = int(os.getenv('TELEGRAM_QUEUE_WORKERS', 8))
+    TELEGRAM_QUEUE_LANE_SIZE: int = int(os.getenv('TELEGRAM_QUEUE_LANE_SIZE', 500))
+    TELEGRAM_QUEUE_MAX_ATTEMPTS: int = int(os.getenv('TELEGRAM_QUEUE_MAX_ATTEMPTS', 3))
+    # Varrimento que recupera updates pendentes/presos (segundos) e quando um 'processing' se considera preso
+    TELEGRAM_QUEUE_RECOVER_SECONDS: int = int(os.getenv('TELEGRAM_QUEUE_RECOVER_SECONDS', 30))
+    TELEGRAM_QUEUE_STALE_SECONDS: int = int(os.getenv('TELEGRAM_QUEUE_STALE_SECONDS', 300))
+    TELEGRAM_UPDATES_RETENTION_HOURS: int = int(os.getenv('TELEGRAM_UPDATES_RETENTION_HOURS', 48))
+
+    # Estado partilhado entre workers (core.shared_state): dedupe do webhook, rate limits do Telegram e da API.
+    # memory = só este processo; postgres = tabela UNLOGGED shared_state; sqlite = ficheiro local (mesma máquina)
+    SHARED_STATE_BACKEND: str = os.getenv('SHARED_STATE_BACKEND', 'memory')
+    SHARED_STATE_SQLITE_PATH: str = os.getenv(
+        'SHARED_STATE_SQLITE_PATH', os.path.join(tempfile.gettempdir(), 'finly_shared_state.sqlite3')
+    )
+    SHARED_STATE_MEMORY_MAX_KEYS: int = int(os.getenv('SHARED_STATE_MEMORY_MAX_KEYS', 100000))
+
+    # Índice em memória do merchant_registry (core.merchant_index): intervalo máximo entre verificações de alterações
+    MERCHANT_INDEX_REFRESH_SECONDS: float = float(os.getenv('MERCHANT_INDEX_REFRESH_SECONDS', 10))
+
+    # Modelo de token scoring por workspace/tipo em memória (core.token_model)
+    TOKEN_MODEL_CACHE_MAX_SIZE: int = int(os.getenv('TOKEN_MODEL_CACHE_MAX_SIZE', 500))
+    TOKEN_MODEL_CACHE_TTL_SECONDS: int = int(os.getenv('TOKEN_MODEL_CACHE_TTL_SECONDS', 300))
+
+    # Recorrentes: quantos meses para trás o gerador recupera se o serviço esteve em baixo (0 = só o mês atual)
+    RECURRING_CATCH_UP_MONTHS: int = int(os.getenv('RECURRING_CATCH_UP_MONTHS', 3))
+    # Minutos após a meia-noite em que as leituras aceitam o marcador de ontem: o job do dia (00:05)
+    # ainda está por correr e não deve ser o primeiro GET de cada workspace a gerar e escrever
+    RECURRING_READ_GRACE_MINUTES: int = int(os.getenv('RECURRING_READ_GRACE_MINUTES', 30))
+
 settings = Settings()
 
@@ -0,0 +1,68 @@
+"""
+Cache das respostas de /dashboard/snapshot.
+
+A chave inclui a versão dos dados do workspace (core.data_version), por isso qualquer escrita
+torna as entradas antigas inalcançáveis sem invalidação explícita; o LRU/TTL limpa-as. A ETag
+é derivada da mesma chave: o cliente recebe 304 sem o servidor recalcular nada.
+"""
+import hashlib
+import threading
+import uuid
+from datetime import date
+from typing import Any, NamedTuple, Optional
+
+from .cache import TTLCache
+from .config import settings
+
+
+class DashboardKey(NamedTuple):
+    workspace_id: uuid.UUID
+    version: int
+    year: Optional[int]
+    month: Optional[int]
+    include_collections: bool
+    today: date  # days_left / daily_allowance dependem do dia
+    currency: str
+
+    @property
+    def etag(self) -> str:
+        digest = hashlib.sha1(repr(tuple(self)).encode()).hexdigest()[:20]
+        return f'"{digest}"'
+
+
+_cache = TTLCache(maxsize=settings.DASHBOARD_CACHE_MAX_SIZE, ttl_seconds=settings.DASHBOARD_CACHE_TTL_SECONDS)
+_not_modified = 0
+_lock = threading.Lock()
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match (lista separada por vírgulas, aceita W/ e *) contém a ETag atual?"""
+    if not if_none_match:
+        return False
+    candidates = [c.strip() for c in if_none_match.split(',')]
+    return '*' in candidates or any(c.removeprefix('W/') == etag for c in candidates)
+
+
+def record_not_modified() -> None:
+    global _not_modified
+    with _lock:
+        _not_modified += 1
+
+
+def get(key: DashboardKey) -> Any:
+    return _cache.get(key)
+
+
+def store(key: DashboardKey, response: Any) -> None:
+    _cache.set(key, response)
+
+
+def clear() -> None:
+    global _not_modified
+    _cache.clear()
+    with _lock:
+        _not_modified = 0
+
+
+def stats() -> dict:
+    return {**_cache.stats(), 'not_modified': _not_modified}
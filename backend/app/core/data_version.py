@@ -0,0 +1,66 @@
+"""
+Versão dos dados de cada workspace (Workspace.data_version).
+
+Qualquer escrita ORM em transações, categorias, recorrentes, parcelamentos, metas ou no próprio
+workspace incrementa o contador no mesmo transaction (hook before_flush), venha ela das rotas,
+do Telegram ou do import. Escritas em lote fora do ORM (bulk-delete, gerador de recorrentes)
+chamam bump. Leituras caras (dashboard) usam a versão como chave de cache e ETag: a versão
+vive na BD, por isso é coerente entre workers.
+"""
+import uuid
+from typing import Iterable
+
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session
+
+from ..models import database as models
+
+_WATCHED = (
+    models.Transaction,
+    models.Category,
+    models.RecurringTransaction,
+    models.InstallmentGroup,
+    models.SavingsGoal,
+)
+
+
+def _workspace_id(obj):
+    if isinstance(obj, models.Workspace):
+        return obj.id
+    return obj.workspace_id or getattr(obj.workspace, 'id', None)
+
+
+@event.listens_for(Session, 'before_flush')
+def _bump_on_write(session: Session, flush_context, instances) -> None:
+    workspace_ids = set()
+    for obj in session.new:
+        if isinstance(obj, _WATCHED):
+            workspace_ids.add(_workspace_id(obj))
+    for obj in session.dirty:
+        if isinstance(obj, _WATCHED + (models.Workspace,)) and session.is_modified(obj):
+            workspace_ids.add(_workspace_id(obj))
+    for obj in session.deleted:
+        if isinstance(obj, _WATCHED):
+            workspace_ids.add(_workspace_id(obj))
+    workspace_ids.discard(None)
+    if workspace_ids:
+        _bump(session.connection(), workspace_ids)
+
+
+def _bump(connection, workspace_ids: Iterable[uuid.UUID]) -> None:
+    W = models.Workspace
+    connection.execute(
+        update(W).where(W.id.in_(list(workspace_ids))).values(data_version=W.data_version + 1)
+    )
+
+
+def bump(db: Session, *workspace_ids: uuid.UUID) -> None:
+    """Incrementa a versão de workspaces alterados fora do ORM (no transaction de `db`)."""
+    if workspace_ids:
+        _bump(db.connection(), workspace_ids)
+
+
+def current(db: Session, workspace_id: uuid.UUID) -> int:
+    """Versão atual dos dados do workspace (0 se não existir)."""
+    W = models.Workspace
+    return db.execute(select(W.data_version).where(W.id == workspace_id)).scalar() or 0
@@ -1,8 +1,11 @@
+from functools import lru_cache
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from .config import settings
-from fastapi_mail import ConnectionConfig
 
 # pool_pre_ping: testa a ligação antes de usar (evita "SSL unexpected eof" / "Connection reset by peer")
 # pool_recycle: recicla ligações antes do timeout do servidor (ex.: 10 min em managed Postgres)
@@ -10,22 +13,61 @@ engine = create_engine(
     settings.DATABASE_URL,
     pool_pre_ping=True,
     pool_recycle=600,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
 )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
-conf = ConnectionConfig(
-    MAIL_USERNAME=settings.MAIL_USERNAME or "placeholder@example.com",
-    MAIL_PASSWORD=settings.MAIL_PASSWORD or "password",
-    MAIL_FROM=settings.MAIL_FROM or "placeholder@example.com",
-    MAIL_PORT=settings.MAIL_PORT,
-    MAIL_SERVER=settings.MAIL_SERVER,
-    MAIL_STARTTLS=settings.MAIL_STARTTLS,
-    MAIL_SSL_TLS=settings.MAIL_SSL_TLS,
-    USE_CREDENTIALS=settings.USE_CREDENTIALS,
-    VALIDATE_CERTS=True,
-    MAIL_FROM_NAME=getattr(settings, 'MAIL_FROM_NAME', None) or settings.PROJECT_NAME,
+
+def _async_database_url(url: str) -> tuple[str, dict]:
+    """Converte DATABASE_URL para o driver asyncpg; o asyncpg não aceita sslmode no URL (passa a connect_args)."""
+    parts = urlsplit(url)
+    scheme = parts.scheme.split('+')[0]
+    if scheme == 'postgres':
+        scheme = 'postgresql'
+    query = dict(parse_qsl(parts.query))
+    connect_args = {}
+    sslmode = query.pop('sslmode', None)
+    if sslmode:
+        connect_args['ssl'] = sslmode
+    return urlunsplit((f'{scheme}+asyncpg', parts.netloc, parts.path, urlencode(query), parts.fragment)), connect_args
+
+
+# Engine async (asyncpg) para as rotas de leitura mais usadas: um worker serve muitos pedidos
+# concorrentes sem ocupar uma thread por pedido.
+_async_url, _async_connect_args = _async_database_url(settings.DATABASE_URL)
+async_engine = create_async_engine(
+    _async_url,
+    connect_args=_async_connect_args,
+    pool_pre_ping=True,
+    pool_recycle=600,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
 )
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+
+@lru_cache(maxsize=1)
+def get_mail_conf():
+    """Configuração SMTP partilhada; fastapi_mail só é importado no primeiro envio de email."""
+    from fastapi_mail import ConnectionConfig
+
+    return ConnectionConfig(
+        MAIL_USERNAME=settings.MAIL_USERNAME or "placeholder@example.com",
+        MAIL_PASSWORD=settings.MAIL_PASSWORD or "password",
+        MAIL_FROM=settings.MAIL_FROM or "placeholder@example.com",
+        MAIL_PORT=settings.MAIL_PORT,
+        MAIL_SERVER=settings.MAIL_SERVER,
+        MAIL_STARTTLS=settings.MAIL_STARTTLS,
+        MAIL_SSL_TLS=settings.MAIL_SSL_TLS,
+        USE_CREDENTIALS=settings.USE_CREDENTIALS,
+        VALIDATE_CERTS=True,
+        MAIL_FROM_NAME=getattr(settings, 'MAIL_FROM_NAME', None) or settings.PROJECT_NAME,
+    )
+
 
 def get_db():
     db = SessionLocal()
@@ -34,3 +76,7 @@ def get_db():
     finally:
         db.close()
 
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
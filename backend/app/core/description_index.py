@@ -0,0 +1,98 @@
+"""
+Descrição canónica das transações (transactions.description_canonical) e similaridade com o histórico.
+
+A categorização por histórico (motor e webhook do Telegram) carregava até 500 transações recentes e
+canonicalizava cada descrição em Python em cada pedido. A forma canónica passa a ser gravada com a
+transação e indexada por token (GIN sobre string_to_array(description_canonical, ' ')):
+
+- escritas ORM: o hook before_flush preenche/atualiza a coluna quando a descrição muda;
+- escritas em lote fora do ORM (gerador de recorrentes) chamam fill_missing com o mesmo filtro;
+- best_similar_category faz uma query indexada que só devolve transações com pelo menos um token
+  em comum e pontua-as sem canonicalizar nada.
+"""
+from datetime import date, timedelta
+from typing import Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import Text, cast, event, func, inspect, literal_column, select, update
+from sqlalchemy.dialects.postgresql import ARRAY, array
+from sqlalchemy.orm import Session
+
+from .categorization_engine import canonicalize, canonicalize_many
+from ..models import database as models
+
+_T = models.Transaction
+# Mesma expressão do índice idx_transactions_description_tokens (literal, para o planner a reconhecer)
+_TOKENS = func.string_to_array(_T.description_canonical, literal_column("' '"), type_=ARRAY(Text))
+
+HISTORY_DAYS = 180
+HISTORY_LIMIT = 500
+
+
+def _canonical(description: Optional[str]) -> Optional[str]:
+    return canonicalize(description) if description is not None else None
+
+
+@event.listens_for(Session, 'before_flush')
+def _track_description_changes(session: Session, flush_context, instances) -> None:
+    for obj in session.new:
+        if isinstance(obj, _T):
+            obj.description_canonical = _canonical(obj.description)
+    for obj in session.dirty:
+        if isinstance(obj, _T) and inspect(obj).attrs.description.history.has_changes():
+            obj.description_canonical = _canonical(obj.description)
+
+
+def fill_missing(db: Session, condition) -> int:
+    """Preenche description_canonical das transações do filtro inseridas fora do ORM. Devolve quantas."""
+    rows = db.execute(
+        select(_T.id, _T.description).where(condition, _T.description.isnot(None), _T.description_canonical.is_(None))
+    ).all()
+    if rows:
+        # UPDATE em lote por chave primária (executemany)
+        db.execute(update(_T), [
+            {'id': row.id, 'description_canonical': canonical}
+            for row, canonical in zip(rows, canonicalize_many(row.description for row in rows))
+        ])
+    return len(rows)
+
+
+def best_similar_category(
+    db: Session, workspace_id: UUID, tipo: str, canonical: str
+) -> Optional[Tuple[UUID, int, Optional[str]]]:
+    """
+    Categoria da transação recente (HISTORY_DAYS) mais parecida com `canonical`, do mesmo tipo e sem
+    seed: (category_id, score, descrição) ou None. Score: palavras em comum (+2 se longas) + recência.
+    """
+    words = set(canonical.split()) if canonical else set()
+    if not words:
+        return None
+    today = date.today()
+    rows = db.execute(
+        select(_T.category_id, _T.description, _T.description_canonical, _T.transaction_date)
+        .where(
+            _T.workspace_id == workspace_id,
+            _T.transaction_date >= today - timedelta(days=HISTORY_DAYS),
+            _T.category_id.isnot(None),
+            ~_T.is_seed,
+            _T.amount_cents < 0 if tipo == 'expense' else _T.amount_cents > 0,
+            _TOKENS.op('&&')(cast(array(sorted(words)), ARRAY(Text))),
+        )
+        .order_by(_T.transaction_date.desc())
+        .limit(HISTORY_LIMIT)
+    ).all()
+
+    best, best_score = None, 0
+    for row in rows:
+        common = words.intersection(row.description_canonical.split())
+        if not common:
+            continue
+        score = len(common) + sum(2 for w in common if len(w) > 4)
+        days_ago = (today - row.transaction_date).days
+        score += 3 if days_ago <= 7 else (2 if days_ago <= 30 else (1 if days_ago <= 90 else 0))
+        has_important = any(len(w) > 4 for w in common)
+        # Relaxado: 1 palavra importante OU 2+ palavras em comum (favorece dados históricos antes de IA)
+        accept = (has_important and len(common) >= 1) or len(common) >= 2
+        if accept and score >= 2 and score > best_score:
+            best, best_score = row, score
+    return (best.category_id, best_score, best.description) if best else None
@@ -4,6 +4,8 @@ Financial Engine - Fonte única de verdade para cálculos financeiros
 from dataclasses import dataclass
 from typing import List, Dict, Optional
 from datetime import date, datetime
+from sqlalchemy import and_, func, select
+from sqlalchemy.orm import Session
 from ..models import database as models
 
 
@@ -137,4 +139,113 @@ class FinancialEngine:
             transaction_count=len(transactions),
             category_totals=category_totals
         )
-
+    
+    @staticmethod
+    def calculate_snapshot_sql(
+        db: Session,
+        workspace,
+        period_start: Optional[date] = None,
+        period_end: Optional[date] = None
+    ) -> FinancialSnapshot:
+        """
+        Mesmo snapshot que calculate_snapshot, mas com as somas feitas na BD: uma query
+        agrupada por categoria (sem carregar transações). Custo em memória constante e
+        totais exatos, qualquer que seja o tamanho do histórico. Exclui transações de seed.
+        """
+        t = models.Transaction
+        c = models.Category
+        conditions = [
+            t.workspace_id == workspace.id,
+            ~t.is_seed,
+        ]
+        if period_start:
+            conditions.append(t.transaction_date >= period_start)
+        if period_end:
+            conditions.append(t.transaction_date <= period_end)
+        
+        # Categoria de outro workspace conta como "não encontrada", como no cat_map de calculate_snapshot
+        rows = db.execute(
+            select(
+                c.id,
+                c.type,
+                c.vault_type,
+                func.sum(t.amount_cents).label('net_cents'),
+                func.sum(func.abs(t.amount_cents)).label('abs_cents'),
+                func.count(t.id).label('tx_count'),
+                func.min(t.transaction_date).label('first_date'),
+                func.max(t.transaction_date).label('last_date'),
+            )
+            .select_from(t)
+            .outerjoin(c, and_(c.id == t.category_id, c.workspace_id == t.workspace_id))
+            .where(*conditions)
+            .group_by(c.id, c.type, c.vault_type)
+        ).all()
+        
+        income_cents = 0
+        expenses_cents = 0
+        vault_emergency_cents = 0
+        vault_investment_cents = 0
+        cumulative_cents = 0
+        transaction_count = 0
+        first_date: Optional[date] = None
+        last_date: Optional[date] = None
+        category_totals: Dict[str, float] = {}
+        
+        for cat_id, cat_type, vault_type, net_cents, abs_cents, tx_count, row_first, row_last in rows:
+            net_cents = int(net_cents or 0)
+            abs_cents = int(abs_cents or 0)
+            transaction_count += tx_count
+            first_date = row_first if first_date is None or row_first < first_date else first_date
+            last_date = row_last if last_date is None or row_last > last_date else last_date
+            
+            if cat_id is None:
+                # Categoria não encontrada, tratar como despesa
+                expenses_cents += abs_cents
+                cumulative_cents += net_cents
+            elif vault_type != 'none':
+                # Vault não afeta income/expenses nem cumulative_balance
+                if vault_type == 'emergency':
+                    vault_emergency_cents += net_cents
+                elif vault_type == 'investment':
+                    vault_investment_cents += net_cents
+            else:
+                category_totals[str(cat_id)] = abs_cents / 100
+                if cat_type == 'income':
+                    income_cents += net_cents
+                    cumulative_cents += net_cents
+                elif cat_type == 'expense':
+                    expenses_cents += abs_cents
+                    cumulative_cents += net_cents
+        
+        income = income_cents / 100
+        expenses = expenses_cents / 100
+        vault_emergency = vault_emergency_cents / 100
+        vault_investment = vault_investment_cents / 100
+        vault_total = vault_emergency + vault_investment
+        
+        opening_balance = (workspace.opening_balance_cents / 100) if workspace.opening_balance_cents else 0.0
+        available_cash = max(0.0, opening_balance + income - expenses)
+        net_worth = vault_total + available_cash
+        
+        MIN_INCOME_THRESHOLD = 100.0  # 1€ mínimo
+        saving_rate = 0.0
+        if income >= MIN_INCOME_THRESHOLD:
+            calculated = ((income - expenses) / income) * 100
+            saving_rate = max(-100.0, min(100.0, calculated))
+        
+        today = date.today()
+        return FinancialSnapshot(
+            income=income,
+            expenses=expenses,
+            vault_total=vault_total,
+            vault_emergency=vault_emergency,
+            vault_investment=vault_investment,
+            available_cash=available_cash,
+            net_worth=net_worth,
+            saving_rate=saving_rate,
+            cumulative_balance=cumulative_cents / 100,
+            period_start=period_start or first_date or today,
+            period_end=period_end or last_date or today,
+            transaction_count=transaction_count,
+            category_totals=category_totals
+        )
@@ -0,0 +1,79 @@
+"""
+Matcher de várias palavras-chave de uma vez (autómato Aho-Corasick), para as listas fixas do motor de
+categorização (merchants conhecidos, keywords de categoria e de receita).
+
+Em vez de um `in` por palavra-chave (centenas por transação), o texto é percorrido uma só vez e
+saem todas as palavras-chave contidas nele. A ordem de prioridade é a ordem em que os padrões foram
+dados (a ordem do dicionário), igual ao ciclo `for ... in DICT.items()` que substitui.
+"""
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+class KeywordMatcher:
+    """Autómato construído uma vez a partir de pares (padrão, valor); procura por substring, como `in`."""
+
+    def __init__(self, patterns: Iterable[Tuple[str, Any]]):
+        self._patterns: List[Tuple[str, Any]] = []
+        goto: List[Dict[str, int]] = [{}]
+        out: List[List[int]] = [[]]
+        seen = set()
+        for pattern, value in patterns:
+            if not pattern or pattern in seen:
+                continue  # repetido: vale o primeiro (maior prioridade)
+            seen.add(pattern)
+            node = 0
+            for ch in pattern:
+                nxt = goto[node].get(ch)
+                if nxt is None:
+                    nxt = goto[node][ch] = len(goto)
+                    goto.append({})
+                    out.append([])
+                node = nxt
+            out[node].append(len(self._patterns))
+            self._patterns.append((pattern, value))
+
+        # Ligações de falha em largura: o estado do maior sufixo próprio que também é prefixo de um padrão
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in goto[node].items():
+                queue.append(nxt)
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                out[nxt].extend(out[fail[nxt]])
+
+        self._goto = goto
+        self._fail = fail
+        self._out = [tuple(sorted(o)) for o in out]
+
+    def _scan(self, text: str) -> set:
+        goto, fail, out = self._goto, self._fail, self._out
+        found = set()
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                found.update(out[node])
+        return found
+
+    def matches(self, text: str) -> List[Tuple[str, Any]]:
+        """Todos os (padrão, valor) contidos no texto, por ordem de prioridade."""
+        if not text:
+            return []
+        return [self._patterns[i] for i in sorted(self._scan(text))]
+
+    def first(self, text: str) -> Optional[Tuple[str, Any]]:
+        """O (padrão, valor) de maior prioridade contido no texto, ou None."""
+        if not text:
+            return None
+        found = self._scan(text)
+        return self._patterns[min(found)] if found else None
+
+    def __len__(self) -> int:
+        return len(self._patterns)
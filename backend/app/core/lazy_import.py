@@ -0,0 +1,54 @@
+"""
+Import diferido de dependências pesadas (stripe, requests...).
+
+`stripe = lazy_module('stripe')` no topo do módulo mantém o código igual (`stripe.Customer...`,
+`except stripe.error.StripeError`), mas o pacote só é importado no primeiro acesso a um atributo,
+não no arranque de cada worker. Atribuições feitas antes disso (ex.: `stripe.api_key = ...`)
+ficam guardadas e são aplicadas quando o módulo é carregado.
+"""
+import importlib
+import threading
+from types import ModuleType
+from typing import Any, Dict
+
+
+class _LazyModule:
+    __slots__ = ('_name', '_module', '_pending', '_lock')
+
+    def __init__(self, name: str):
+        object.__setattr__(self, '_name', name)
+        object.__setattr__(self, '_module', None)
+        object.__setattr__(self, '_pending', {})
+        object.__setattr__(self, '_lock', threading.Lock())
+
+    def _load(self) -> ModuleType:
+        module = self._module
+        if module is None:
+            # import_module já serializa imports concorrentes; o lock protege só _pending
+            module = importlib.import_module(self._name)
+            with self._lock:
+                pending: Dict[str, Any] = self._pending
+                for attr, value in pending.items():
+                    setattr(module, attr, value)
+                pending.clear()
+                object.__setattr__(self, '_module', module)
+        return module
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr: str, value: Any) -> None:
+        with self._lock:
+            if self._module is None:
+                self._pending[attr] = value
+                return
+        setattr(self._module, attr, value)
+
+    def __repr__(self) -> str:
+        state = 'carregado' if self._module is not None else 'por carregar'
+        return f'<lazy module {self._name!r} ({state})>'
+
+
+def lazy_module(name: str) -> Any:
+    """Proxy do módulo `name`, importado no primeiro acesso a um atributo."""
+    return _LazyModule(name)
@@ -1,5 +1,46 @@
+import time
+
+from limits.storage import Storage
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 
-limiter = Limiter(key_func=get_remote_address)
+from .config import settings
+from .shared_state import get_store
+
+
+class SharedStateStorage(Storage):
+    """Storage do `limits` sobre core.shared_state (storage_uri sharedstate://): limites globais entre workers."""
+
+    STORAGE_SCHEME = ['sharedstate']
+
+    @property
+    def base_exceptions(self):
+        return (Exception,)
+
+    def incr(self, key: str, expiry: int, elastic_expiry: bool = False, amount: int = 1) -> int:
+        return get_store().incr(f"api:{key}", expiry, amount)[0]
+
+    def get(self, key: str) -> int:
+        return get_store().get(f"api:{key}")[0]
+
+    def get_expiry(self, key: str) -> float:
+        return get_store().get(f"api:{key}")[1] or time.time()
+
+    def check(self) -> bool:
+        try:
+            return get_store().check()
+        except Exception:
+            return False
+
+    def reset(self):
+        return None
+
+    def clear(self, key: str) -> None:
+        get_store().delete(f"api:{key}")
+
 
+# Com um só worker (memory) fica o storage em memória do próprio limits
+limiter = Limiter(
+    key_func=get_remote_address,
+    storage_uri='memory://' if settings.SHARED_STATE_BACKEND.lower() == 'memory' else 'sharedstate://',
+)
@@ -0,0 +1,155 @@
+"""
+Índice em memória do merchant_registry: aliases canonicalizados -> (categoria, alias), num autómato
+por tipo de transação (core.keyword_matcher).
+
+lookup_merchant_registry carregava todos os aliases ativos e canonicalizava-os em cada inferência
+(por transação e por linha de extrato). Aqui carregam-se uma vez por processo e depois só as linhas
+alteradas: marca d'água em updated_at, verificada no máximo a cada MERCHANT_INDEX_REFRESH_SECONDS.
+A procura é uma passagem pelo texto canónico, com o mesmo critério de antes (alias contido no texto).
+
+- A marca d'água recua um minuto em cada refresh: updated_at é a hora de início da transação que
+  escreveu, e uma transação longa pode fazer commit depois de um refresh com hora posterior.
+- Linhas apagadas não têm updated_at: um reload completo periódico apanha-as.
+- Prioridade entre aliases contidos no mesmo texto: o mais antigo (created_at, id).
+- O refresh usa uma sessão própria e curta, nunca a do pedido: linhas só com flush numa transação
+  que depois faz rollback não podem entrar no índice nem avançar a marca d'água.
+"""
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from .categorization_engine import canonicalize
+from .config import settings
+from .dependencies import SessionLocal
+from .keyword_matcher import KeywordMatcher
+from ..models import database as models
+
+_WATERMARK_OVERLAP = timedelta(seconds=60)
+_FULL_RELOAD_SECONDS = 3600
+
+
+class MerchantIndex:
+    """Usar a instância `merchant_index`."""
+
+    def __init__(self, refresh_seconds: float, session_factory: Callable[[], Session] = SessionLocal):
+        self.refresh_seconds = float(refresh_seconds)
+        self.session_factory = session_factory
+        # id -> (tipo, alias canónico, categoria, alias, ordem)
+        self._entries: Dict[object, tuple] = {}
+        self._matchers: Dict[str, KeywordMatcher] = {}
+        self._watermark: Optional[datetime] = None
+        self._checked_at = 0.0
+        self._loaded_at = 0.0
+        self._refreshed_at: Optional[datetime] = None
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.refreshes = 0
+        self.rebuilds = 0
+        self.last_refresh_ms = 0.0
+
+    def invalidate(self) -> None:
+        """Força a verificação de alterações na próxima procura (após escrever no merchant_registry)."""
+        self._checked_at = 0.0
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._matchers = {}
+            self._watermark = None
+            self._checked_at = self._loaded_at = 0.0
+
+    def lookup(self, canonical: str, tipo: str) -> Optional[Tuple[str, str]]:
+        """(category_name, alias) do alias ativo contido em `canonical`, ou None."""
+        self._maybe_refresh()
+        matcher = self._matchers.get(tipo)
+        match = matcher.first(canonical) if matcher else None
+        return match[1] if match else None
+
+    def _maybe_refresh(self) -> None:
+        if time.monotonic() - self._checked_at < self.refresh_seconds:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if now - self._checked_at < self.refresh_seconds:
+                return  # outra thread acabou de atualizar
+            started = time.perf_counter()
+            db = self.session_factory()
+            try:
+                if self._watermark is None or now - self._loaded_at >= _FULL_RELOAD_SECONDS:
+                    self._load(db)
+                else:
+                    self._refresh(db)
+            finally:
+                db.close()
+            self.last_refresh_ms = (time.perf_counter() - started) * 1000
+            self._checked_at = time.monotonic()
+            self._refreshed_at = datetime.now(timezone.utc)
+
+    def _rows(self, db: Session, since: Optional[datetime]):
+        R = models.MerchantRegistry
+        q = db.query(R.id, R.alias, R.category_name, R.transaction_type, R.is_active, R.created_at, R.updated_at)
+        if since is not None:
+            q = q.filter(R.updated_at > since)
+        return q.all()
+
+    @staticmethod
+    def _entry(row) -> Optional[tuple]:
+        alias_can = canonicalize(row.alias)
+        if not row.is_active or not alias_can:
+            return None
+        return (row.transaction_type, alias_can, row.category_name, row.alias, (row.created_at, str(row.id)))
+
+    def _load(self, db: Session) -> None:
+        rows = self._rows(db, None)
+        self._entries = {r.id: e for r in rows if (e := self._entry(r)) is not None}
+        self._watermark = max((r.updated_at for r in rows), default=datetime(1970, 1, 1, tzinfo=timezone.utc))
+        self._loaded_at = time.monotonic()
+        self._rebuild({e[0] for e in self._entries.values()} | set(self._matchers))
+        self.loads += 1
+
+    def _refresh(self, db: Session) -> None:
+        rows = self._rows(db, self._watermark - _WATERMARK_OVERLAP)
+        changed = set()
+        for r in rows:
+            self._watermark = max(self._watermark, r.updated_at)
+            entry = self._entry(r)
+            old = self._entries.get(r.id)
+            if entry == old:
+                continue  # já visto (janela de sobreposição) ou mudou só usage_count/confidence
+            if old is not None:
+                changed.add(old[0])
+                del self._entries[r.id]
+            if entry is not None:
+                changed.add(entry[0])
+                self._entries[r.id] = entry
+        if changed:
+            self._rebuild(changed)
+        self.refreshes += 1
+
+    def _rebuild(self, types) -> None:
+        matchers = dict(self._matchers)
+        for tipo in types:
+            entries = sorted((e for e in self._entries.values() if e[0] == tipo), key=lambda e: e[4])
+            matchers[tipo] = KeywordMatcher((e[1], (e[2], e[3])) for e in entries)
+        self._matchers = matchers  # troca atómica: as procuras em curso usam o dicionário anterior
+        self.rebuilds += 1
+
+    def stats(self) -> dict:
+        now = datetime.now(timezone.utc)
+        return {
+            'aliases': len(self._entries),
+            'by_type': {tipo: len(m) for tipo, m in self._matchers.items()},
+            'watermark': self._watermark.isoformat() if self._watermark else None,
+            # Quanto tempo pode estar atrasado face à BD (alterações de outros workers)
+            'refresh_lag_seconds': round((now - self._refreshed_at).total_seconds(), 1) if self._refreshed_at else None,
+            'last_refresh_ms': round(self.last_refresh_ms, 2),
+            'loads': self.loads,
+            'refreshes': self.refreshes,
+            'rebuilds': self.rebuilds,
+        }
+
+
+merchant_index = MerchantIndex(settings.MERCHANT_INDEX_REFRESH_SECONDS)
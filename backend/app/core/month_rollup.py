@@ -0,0 +1,270 @@
+"""
+Rollup mensal por workspace/categoria (tabela workspace_category_month).
+
+Mantido incrementalmente:
+- escritas ORM de Transaction (rotas, confirmações do Telegram, import, metas...): o hook
+  before_flush aplica a diferença no mesmo transaction da escrita;
+- escritas em lote fora do ORM (bulk-delete, gerador de recorrentes) chamam
+  add_matching / remove_matching com o mesmo filtro.
+As leituras mensais passam a ler O(categorias) linhas em vez de O(transações).
+rebuild_month_rollup.py (na pasta backend) verifica contra os dados brutos e reconstrói.
+
+Como nas restantes leituras, as transações de seed (is_seed) não entram no rollup.
+"""
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import Date, cast, delete, event, func, inspect, literal, select
+from sqlalchemy.dialects.postgresql import UUID, insert as pg_insert
+from sqlalchemy.orm import Session
+
+from ..models import database as models
+
+# Chave de categoria para transações sem categoria (ou cuja categoria foi apagada)
+NO_CATEGORY = uuid.UUID(int=0)
+
+_R = models.WorkspaceCategoryMonth
+_T = models.Transaction
+_TRACKED = ('workspace_id', 'category_id', 'transaction_date', 'amount_cents', 'is_seed')
+_SUMS = ('credit_cents', 'credit_count', 'debit_cents', 'debit_count')
+
+
+@dataclass
+class MonthTotals:
+    credit_cents: int = 0
+    credit_count: int = 0
+    debit_cents: int = 0  # negativo
+    debit_count: int = 0
+
+    @property
+    def count(self) -> int:
+        return self.credit_count + self.debit_count
+
+
+def month_start(d: date) -> date:
+    return d.replace(day=1)
+
+
+def _add(deltas: Dict[Tuple, List[int]], workspace_id, category_id, tx_date, amount_cents, is_seed, sign: int) -> None:
+    if workspace_id is None or tx_date is None or not amount_cents or is_seed:
+        return
+    delta = deltas[(workspace_id, category_id or NO_CATEGORY, month_start(tx_date))]
+    if amount_cents > 0:
+        delta[0] += sign * amount_cents
+        delta[1] += sign
+    else:
+        delta[2] += sign * amount_cents
+        delta[3] += sign
+
+
+def _upsert_stmt(stmt):
+    """ON CONFLICT soma os valores novos aos existentes."""
+    return stmt.on_conflict_do_update(
+        index_elements=[_R.workspace_id, _R.category_id, _R.month],
+        set_={name: getattr(_R, name) + getattr(stmt.excluded, name) for name in _SUMS},
+    )
+
+
+def _apply_deltas(connection, deltas: Dict[Tuple, List[int]]) -> None:
+    rows = [
+        {
+            'workspace_id': ws_id, 'category_id': cat_id, 'month': month,
+            'credit_cents': d[0], 'credit_count': d[1], 'debit_cents': d[2], 'debit_count': d[3],
+        }
+        for (ws_id, cat_id, month), d in deltas.items()
+        if any(d)
+    ]
+    if rows:
+        connection.execute(_upsert_stmt(pg_insert(_R).values(rows)))
+
+
+def _identity(obj):
+    identity = inspect(obj).identity
+    return identity[0] if identity else None
+
+
+@event.listens_for(Session, 'before_flush')
+def _track_transaction_changes(session: Session, flush_context, instances) -> None:
+    deltas: Dict[Tuple, List[int]] = defaultdict(lambda: [0, 0, 0, 0])
+
+    for obj in session.new:
+        if isinstance(obj, _T):
+            workspace_id = obj.workspace_id or getattr(obj.workspace, 'id', None)
+            category_id = obj.category_id or getattr(obj.category, 'id', None)
+            _add(deltas, workspace_id, category_id, obj.transaction_date, obj.amount_cents, obj.is_seed, +1)
+
+    # Valores antigos lidos da BD (os atributos podem estar expirados): só para alteradas/apagadas
+    old_ids = []
+    for obj in session.dirty:
+        if isinstance(obj, _T) and _identity(obj) is not None:
+            state = inspect(obj)
+            if any(state.attrs[name].history.has_changes() for name in _TRACKED):
+                old_ids.append(_identity(obj))
+                _add(deltas, obj.workspace_id, obj.category_id, obj.transaction_date, obj.amount_cents, obj.is_seed, +1)
+    old_ids.extend(_identity(obj) for obj in session.deleted if isinstance(obj, _T) and _identity(obj) is not None)
+    if old_ids:
+        old_rows = session.connection().execute(
+            select(_T.workspace_id, _T.category_id, _T.transaction_date, _T.amount_cents, _T.is_seed).where(_T.id.in_(old_ids))
+        )
+        for workspace_id, category_id, tx_date, amount_cents, is_seed in old_rows:
+            _add(deltas, workspace_id, category_id, tx_date, amount_cents, is_seed, -1)
+
+    if deltas:
+        _apply_deltas(session.connection(), deltas)
+
+    # Categoria apagada: as transações ficam sem categoria (FK SET NULL), o rollup acompanha
+    for obj in session.deleted:
+        if isinstance(obj, models.Category) and _identity(obj) is not None:
+            _move_category_to_no_category(session.connection(), _identity(obj))
+
+
+def _move_category_to_no_category(connection, category_id: uuid.UUID) -> None:
+    moved = select(_R.workspace_id, literal(NO_CATEGORY, UUID(as_uuid=True)), _R.month, *[getattr(_R, n) for n in _SUMS]).where(
+        _R.category_id == category_id
+    )
+    connection.execute(_upsert_stmt(pg_insert(_R).from_select(
+        [_R.workspace_id, _R.category_id, _R.month, *[getattr(_R, n) for n in _SUMS]], moved
+    )))
+    connection.execute(delete(_R).where(_R.category_id == category_id))
+
+
+def _aggregate_select(*conditions, sign: int = 1):
+    """Agregado das transações que satisfazem `conditions`, por (workspace, categoria, mês)."""
+    category_key = func.coalesce(_T.category_id, literal(NO_CATEGORY, UUID(as_uuid=True)))
+    month_key = cast(func.date_trunc('month', _T.transaction_date), Date)
+    return select(
+        _T.workspace_id,
+        category_key,
+        month_key,
+        func.coalesce(func.sum(_T.amount_cents).filter(_T.amount_cents > 0), 0) * sign,
+        func.count().filter(_T.amount_cents > 0) * sign,
+        func.coalesce(func.sum(_T.amount_cents).filter(_T.amount_cents < 0), 0) * sign,
+        func.count().filter(_T.amount_cents < 0) * sign,
+    ).where(
+        ~_T.is_seed,
+        *conditions,
+    ).group_by(_T.workspace_id, category_key, month_key)
+
+
+def _apply_matching(db: Session, conditions, sign: int) -> None:
+    stmt = pg_insert(_R).from_select(
+        [_R.workspace_id, _R.category_id, _R.month, *[getattr(_R, n) for n in _SUMS]],
+        _aggregate_select(*conditions, sign=sign),
+    )
+    db.execute(_upsert_stmt(stmt))
+
+
+def add_matching(db: Session, *conditions) -> None:
+    """Soma ao rollup as transações (já inseridas) que satisfazem `conditions`. Para escritas fora do ORM."""
+    _apply_matching(db, conditions, +1)
+
+
+def remove_matching(db: Session, *conditions) -> None:
+    """Retira do rollup as transações que satisfazem `conditions`; chamar ANTES do DELETE em lote."""
+    _apply_matching(db, conditions, -1)
+
+
+def _next_month_start(d: date) -> date:
+    return (month_start(d) + timedelta(days=32)).replace(day=1)
+
+
+def totals(
+    db: Session,
+    workspace_id: uuid.UUID,
+    month: date,
+    category_id: Optional[uuid.UUID] = None,
+    through: Optional[date] = None,
+) -> MonthTotals:
+    """
+    Totais de um mês do workspace (todas as categorias ou só uma).
+    `through`: só transações até esse dia, inclusive (ex.: "até hoje" no mês corrente). O rollup tem o
+    mês inteiro; as do mesmo mês com data posterior (agendadas/futuras, poucas) são descontadas com
+    uma query às transações servida pelo índice (workspace_id, transaction_date).
+    """
+    query = select(*[func.coalesce(func.sum(getattr(_R, n)), 0) for n in _SUMS]).where(
+        _R.workspace_id == workspace_id,
+        _R.month == month_start(month),
+    )
+    if category_id is not None:
+        query = query.where(_R.category_id == category_id)
+    result = MonthTotals(*(int(v) for v in db.execute(query).one()))
+
+    next_start = _next_month_start(month)
+    if through is None or not (month_start(month) <= through < next_start):
+        return result
+    conditions = [_T.workspace_id == workspace_id, ~_T.is_seed, _T.transaction_date > through, _T.transaction_date < next_start]
+    if category_id is not None:
+        conditions.append(_T.category_id.is_(None) if category_id == NO_CATEGORY else _T.category_id == category_id)
+    later = db.execute(select(
+        func.coalesce(func.sum(_T.amount_cents).filter(_T.amount_cents > 0), 0),
+        func.count().filter(_T.amount_cents > 0),
+        func.coalesce(func.sum(_T.amount_cents).filter(_T.amount_cents < 0), 0),
+        func.count().filter(_T.amount_cents < 0),
+    ).where(*conditions)).one()
+    return MonthTotals(*(getattr(result, n) - int(v) for n, v in zip(_SUMS, later)))
+
+
+def count(
+    db: Session,
+    workspace_id: uuid.UUID,
+    *category_conditions,
+    first_month: Optional[date] = None,
+    last_month: Optional[date] = None,
+    category_id: Optional[uuid.UUID] = None,
+) -> int:
+    """
+    Número de transações do workspace entre dois meses (inclusive), sem ler transações.
+    `category_conditions` (sobre models.Category) fazem join com a categoria de cada linha.
+    """
+    query = select(func.coalesce(func.sum(_R.credit_count + _R.debit_count), 0)).where(_R.workspace_id == workspace_id)
+    if first_month is not None:
+        query = query.where(_R.month >= month_start(first_month))
+    if last_month is not None:
+        query = query.where(_R.month <= month_start(last_month))
+    if category_id is not None:
+        query = query.where(_R.category_id == category_id)
+    if category_conditions:
+        query = query.join(models.Category, models.Category.id == _R.category_id).where(*category_conditions)
+    return int(db.execute(query).scalar_one())
+
+
+def _rollup_rows(db: Session, workspace_id: Optional[uuid.UUID]) -> Dict[Tuple, Tuple[int, ...]]:
+    query = select(_R.workspace_id, _R.category_id, _R.month, *[getattr(_R, n) for n in _SUMS])
+    if workspace_id is not None:
+        query = query.where(_R.workspace_id == workspace_id)
+    return {tuple(r[:3]): tuple(int(v) for v in r[3:]) for r in db.execute(query) if any(r[3:])}
+
+
+def _raw_rows(db: Session, workspace_id: Optional[uuid.UUID]) -> Dict[Tuple, Tuple[int, ...]]:
+    conditions = [_T.workspace_id == workspace_id] if workspace_id is not None else []
+    return {tuple(r[:3]): tuple(int(v) for v in r[3:]) for r in db.execute(_aggregate_select(*conditions))}
+
+
+def verify(db: Session, workspace_id: Optional[uuid.UUID] = None) -> List[dict]:
+    """Compara o rollup com a agregação das transações; devolve as chaves divergentes."""
+    rollup = _rollup_rows(db, workspace_id)
+    raw = _raw_rows(db, workspace_id)
+    mismatches = []
+    for key in sorted(set(rollup) | set(raw), key=lambda k: (str(k[0]), str(k[1]), k[2])):
+        expected = raw.get(key, (0, 0, 0, 0))
+        actual = rollup.get(key, (0, 0, 0, 0))
+        if expected != actual:
+            mismatches.append({
+                'workspace_id': key[0], 'category_id': key[1], 'month': key[2],
+                'expected': dict(zip(_SUMS, expected)), 'actual': dict(zip(_SUMS, actual)),
+            })
+    return mismatches
+
+
+def rebuild(db: Session, workspace_id: Optional[uuid.UUID] = None) -> None:
+    """Reconstrói o rollup a partir das transações (todo ou só de um workspace). Não faz commit."""
+    stmt = delete(_R)
+    conditions = []
+    if workspace_id is not None:
+        stmt = stmt.where(_R.workspace_id == workspace_id)
+        conditions.append(_T.workspace_id == workspace_id)
+    db.execute(stmt)
+    add_matching(db, *conditions)
@@ -0,0 +1,181 @@
+"""
+Recurring Engine - Geração em lote das transações automáticas das recorrentes
+
+Um INSERT ... SELECT por mês (período) cobre todas as regras ativas de todos os workspaces:
+calcula a data efetiva de cada regra no mês, faz anti-join com as transações existentes e
+insere só as ocorrências em falta. A chave de idempotência é (recurring_id, recurring_period),
+com índice único parcial; ON CONFLICT DO NOTHING torna seguro correr em paralelo.
+"""
+import calendar
+import logging
+import time
+from dataclasses import dataclass, asdict
+from datetime import date, datetime, timezone
+from typing import List, Optional
+from uuid import UUID
+
+from sqlalchemy import Date, and_, cast, exists, false, func, literal, or_, select, true, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from . import data_version, description_index, month_rollup
+from .config import settings
+from ..models import database as models
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RecurringRunStats:
+    """Métricas de uma execução do gerador"""
+    generated: int
+    periods: List[date]
+    workspaces_marked: int
+    elapsed_ms: float
+    finished_at: datetime
+
+    def as_dict(self) -> dict:
+        data = asdict(self)
+        data['periods'] = [p.isoformat() for p in self.periods]
+        data['finished_at'] = self.finished_at.isoformat()
+        return data
+
+
+_last_run: Optional[RecurringRunStats] = None
+
+
+def last_run_stats() -> Optional[dict]:
+    """Métricas da última execução global (job noturno) neste processo."""
+    return _last_run.as_dict() if _last_run else None
+
+
+def _month_start(d: date, months_back: int = 0) -> date:
+    index = d.year * 12 + (d.month - 1) - months_back
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _periods(today: date, catch_up_months: int) -> List[date]:
+    """Primeiros dias dos meses a processar, do mais antigo para o atual."""
+    return [_month_start(today, back) for back in range(max(0, catch_up_months), -1, -1)]
+
+
+def _insert_period(db: Session, period_start: date, today: date, workspace_id: Optional[UUID]) -> int:
+    """Gera as ocorrências em falta de um mês; devolve o número de transações inseridas."""
+    R = models.RecurringTransaction
+    T = models.Transaction
+    W = models.Workspace
+
+    last_day = calendar.monthrange(period_start.year, period_start.month)[1]
+    period_end = date(period_start.year, period_start.month, last_day)
+    is_current = period_start == _month_start(today)
+
+    # Dia efetivo neste mês (ex.: 31 em fev -> 28 ou 29), igual a _effective_day_for_month
+    effective_day = func.least(R.day_of_month, last_day)
+    description = func.left(func.concat('(R) ', R.description), 255)
+
+    conditions = [
+        R.is_active == true(),
+        # Regra criada depois do fim do mês não gera ocorrência nesse mês
+        cast(R.created_at, Date) <= period_end,
+        # Chave de idempotência
+        ~exists().where(T.recurring_id == R.id, T.recurring_period == period_start),
+        # Ocorrências antigas (sem chave) ou confirmadas à mão: mesma regra de duplicado de sempre
+        ~exists().where(
+            T.workspace_id == R.workspace_id,
+            or_(T.description == R.description, T.description == func.concat('(R) ', R.description)),
+            T.amount_cents == R.amount_cents,
+            T.transaction_date >= period_start,
+            T.transaction_date <= period_end,
+        ),
+    ]
+    if is_current:
+        conditions.append(effective_day <= today.day)
+    else:
+        # Recuperação: só workspaces cujo processamento parou antes do fim deste mês
+        conditions.append(exists().where(
+            W.id == R.workspace_id,
+            W.recurring_processed_through.isnot(None),
+            W.recurring_processed_through < period_end,
+        ))
+    if workspace_id is not None:
+        conditions.append(R.workspace_id == workspace_id)
+
+    due = select(
+        func.gen_random_uuid(),
+        R.workspace_id,
+        R.category_id,
+        R.amount_cents,
+        description,
+        func.make_date(period_start.year, period_start.month, effective_day),
+        false(),
+        false(),
+        R.id,
+        literal(period_start, Date),
+    ).where(and_(*conditions))
+
+    stmt = pg_insert(T).from_select(
+        [
+            T.id, T.workspace_id, T.category_id, T.amount_cents, T.description, T.transaction_date,
+            T.is_installment, T.needs_review, T.recurring_id, T.recurring_period,
+        ],
+        due,
+        include_defaults=False,
+    ).on_conflict_do_nothing(
+        index_elements=[T.recurring_id, T.recurring_period],
+        index_where=T.recurring_id.isnot(None),
+    )
+    inserted = db.execute(stmt.returning(T.id, T.workspace_id)).all()
+    if inserted:
+        # INSERT fora do ORM: rollup mensal, descrição canónica e versão dos dados não passam pelos hooks before_flush
+        month_rollup.add_matching(db, T.id.in_([row.id for row in inserted]))
+        description_index.fill_missing(db, T.id.in_([row.id for row in inserted]))
+        data_version.bump(db, *{row.workspace_id for row in inserted})
+    return len(inserted)
+
+
+def generate_recurring_transactions(
+    db: Session,
+    today: Optional[date] = None,
+    workspace_id: Optional[UUID] = None,
+    catch_up_months: Optional[int] = None,
+) -> RecurringRunStats:
+    """
+    Gera as transações automáticas devidas até `today` e marca os workspaces como processados
+    (Workspace.recurring_processed_through). Sem `workspace_id` processa todos (job noturno).
+
+    Recuperação: meses anteriores (até `catch_up_months`, por defeito RECURRING_CATCH_UP_MONTHS)
+    só são considerados para workspaces cujo marcador ficou parado antes do fim desse mês.
+    Workspaces nunca processados (marcador NULL) começam no mês atual.
+    """
+    global _last_run
+    today = today or date.today()
+    if catch_up_months is None:
+        catch_up_months = settings.RECURRING_CATCH_UP_MONTHS
+    started = time.perf_counter()
+
+    periods = _periods(today, catch_up_months)
+    generated = 0
+    for period_start in periods:
+        generated += _insert_period(db, period_start, today, workspace_id)
+
+    W = models.Workspace
+    mark = update(W).where(or_(W.recurring_processed_through.is_(None), W.recurring_processed_through < today))
+    if workspace_id is not None:
+        mark = mark.where(W.id == workspace_id)
+    workspaces_marked = db.execute(mark.values(recurring_processed_through=today)).rowcount or 0
+    db.commit()
+
+    stats = RecurringRunStats(
+        generated=generated,
+        periods=periods,
+        workspaces_marked=workspaces_marked,
+        elapsed_ms=round((time.perf_counter() - started) * 1000, 1),
+        finished_at=datetime.now(timezone.utc),
+    )
+    if workspace_id is None:
+        _last_run = stats
+        logger.info(
+            "[Recorrentes] %d transação(ões) gerada(s), %d workspace(s) marcado(s), %d mês(es), %.1f ms",
+            stats.generated, stats.workspaces_marked, len(periods), stats.elapsed_ms,
+        )
+    return stats
@@ -0,0 +1,281 @@
+"""
+Estado partilhado entre workers (uvicorn/gunicorn com vários processos): deduplicação de updates do
+Telegram, rate limits por chat e os limites da API (slowapi, via core.limiter).
+
+Em memória cada worker tinha os seus contadores: com N workers um chat podia fazer N vezes o limite e
+um reenvio do Telegram que caísse noutro worker não era visto como duplicado. Três implementações da
+mesma interface, escolhida por SHARED_STATE_BACKEND:
+
+- memory: só este processo (core.ttl_store); o comportamento antigo, para um único worker.
+- postgres: tabela UNLOGGED shared_state na BD da app (sem WAL, perde-se num crash, o que para
+  contadores com TTL não importa). Cada operação é um único upsert atómico.
+- sqlite: ficheiro local em modo WAL, para vários workers na mesma máquina sem ir à BD.
+
+Os contadores são de janela fixa com expiração (incr) e os rate limits usam janela deslizante
+aproximada: contador da janela atual + o da anterior pesado pelo tempo que falta dela.
+"""
+import logging
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Dict, Tuple
+
+from sqlalchemy import text
+
+from .config import settings
+from .ttl_store import SlidingWindowLimiter, TTLMap
+
+logger = logging.getLogger(__name__)
+
+
+class SharedStore(ABC):
+    """Chaves com valor inteiro e expiração. As operações de escrita são atómicas entre workers."""
+
+    backend = ''
+
+    @abstractmethod
+    def add(self, key: str, ttl_seconds: float) -> bool:
+        """Grava a chave só se não existir (ou tiver expirado). True se gravou."""
+
+    @abstractmethod
+    def incr(self, key: str, ttl_seconds: float, amount: int = 1) -> Tuple[int, float]:
+        """Soma `amount` ao contador; se não existir ou expirou, recomeça com expiração agora + ttl.
+        Devolve (valor, expira_em) com expira_em em epoch segundos."""
+
+    @abstractmethod
+    def get(self, key: str) -> Tuple[int, float]:
+        """(valor, expira_em) da chave, ou (0, 0.0) se não existir ou já expirou."""
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        ...
+
+    def purge_expired(self) -> int:
+        """Apaga as chaves expiradas (job periódico). Devolve quantas apagou."""
+        return 0
+
+    def check(self) -> bool:
+        return True
+
+    def stats(self) -> dict:
+        return {'backend': self.backend}
+
+    def hit(self, key: str, limit: int, window_seconds: float) -> bool:
+        """Regista um evento de `key`; False se já houve `limit` na última janela (não conta o recusado)."""
+        now = time.time()
+        index, offset = divmod(now, window_seconds)
+        previous, _ = self.get(f"{key}:{int(index) - 1}")
+        bucket = f"{key}:{int(index)}"
+        current, _ = self.incr(bucket, window_seconds * 2)
+        if previous * (1 - offset / window_seconds) + current > limit:
+            # O incr já contou: desfazer. Como o incr é atómico, nunca entram mais de `limit` entre workers
+            self.incr(bucket, window_seconds * 2, -1)
+            return False
+        return True
+
+
+class MemoryStore(SharedStore):
+    """Só este processo: um TTLMap por TTL e rate limits exatos por janela deslizante."""
+
+    backend = 'memory'
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._maps: Dict[float, TTLMap] = {}
+        self._limiters: Dict[tuple, SlidingWindowLimiter] = {}
+        self._lock = threading.Lock()
+
+    def _map(self, ttl_seconds: float) -> TTLMap:
+        with self._lock:
+            if ttl_seconds not in self._maps:
+                self._maps[ttl_seconds] = TTLMap(self.maxsize, ttl_seconds)
+            return self._maps[ttl_seconds]
+
+    def add(self, key: str, ttl_seconds: float) -> bool:
+        return self._map(ttl_seconds).add(key)
+
+    def incr(self, key: str, ttl_seconds: float, amount: int = 1) -> Tuple[int, float]:
+        now = time.time()
+
+        def bump(item):
+            if item is None or item[1] <= now:
+                return amount, now + ttl_seconds
+            return item[0] + amount, item[1]
+
+        return self._map(ttl_seconds).update(key, bump)
+
+    def get(self, key: str) -> Tuple[int, float]:
+        now = time.time()
+        for ttl_map in list(self._maps.values()):
+            item = ttl_map.get(key)
+            if item is not None and item is not True and item[1] > now:
+                return item
+        return 0, 0.0
+
+    def delete(self, key: str) -> None:
+        for ttl_map in list(self._maps.values()):
+            ttl_map.pop(key)
+
+    def hit(self, key: str, limit: int, window_seconds: float) -> bool:
+        with self._lock:
+            limiter = self._limiters.get((limit, window_seconds))
+            if limiter is None:
+                limiter = self._limiters[(limit, window_seconds)] = SlidingWindowLimiter(
+                    limit, window_seconds, self.maxsize
+                )
+        return limiter.hit(key)
+
+    def stats(self) -> dict:
+        return {
+            'backend': self.backend,
+            'maps': {str(ttl): m.stats() for ttl, m in list(self._maps.items())},
+            'rate_limits': {f"{limit}/{window:g}s": l.stats() for (limit, window), l in list(self._limiters.items())},
+        }
+
+
+class PostgresStore(SharedStore):
+    """Tabela UNLOGGED shared_state (migração shared_state); o relógio é o da BD (now())."""
+
+    backend = 'postgres'
+
+    _ADD = text(
+        "INSERT INTO shared_state AS s (key, value, expires_at) "
+        "VALUES (:key, 1, now() + :ttl * interval '1 second') "
+        "ON CONFLICT (key) DO UPDATE SET value = 1, expires_at = EXCLUDED.expires_at "
+        "WHERE s.expires_at <= now() "
+        "RETURNING s.key"
+    )
+    _INCR = text(
+        "INSERT INTO shared_state AS s (key, value, expires_at) "
+        "VALUES (:key, :amount, now() + :ttl * interval '1 second') "
+        "ON CONFLICT (key) DO UPDATE SET "
+        "value = CASE WHEN s.expires_at <= now() THEN EXCLUDED.value ELSE s.value + EXCLUDED.value END, "
+        "expires_at = CASE WHEN s.expires_at <= now() THEN EXCLUDED.expires_at ELSE s.expires_at END "
+        "RETURNING s.value, extract(epoch from s.expires_at)"
+    )
+    _GET = text(
+        "SELECT value, extract(epoch from expires_at) FROM shared_state WHERE key = :key AND expires_at > now()"
+    )
+
+    def __init__(self):
+        from .dependencies import engine
+        self._engine = engine
+
+    def add(self, key: str, ttl_seconds: float) -> bool:
+        with self._engine.begin() as conn:
+            return conn.execute(self._ADD, {'key': key, 'ttl': float(ttl_seconds)}).first() is not None
+
+    def incr(self, key: str, ttl_seconds: float, amount: int = 1) -> Tuple[int, float]:
+        with self._engine.begin() as conn:
+            value, expires_at = conn.execute(
+                self._INCR, {'key': key, 'ttl': float(ttl_seconds), 'amount': amount}
+            ).one()
+        return int(value), float(expires_at)
+
+    def get(self, key: str) -> Tuple[int, float]:
+        with self._engine.connect() as conn:
+            row = conn.execute(self._GET, {'key': key}).first()
+        return (int(row[0]), float(row[1])) if row else (0, 0.0)
+
+    def delete(self, key: str) -> None:
+        with self._engine.begin() as conn:
+            conn.execute(text("DELETE FROM shared_state WHERE key = :key"), {'key': key})
+
+    def purge_expired(self) -> int:
+        with self._engine.begin() as conn:
+            return conn.execute(text("DELETE FROM shared_state WHERE expires_at <= now()")).rowcount
+
+    def check(self) -> bool:
+        with self._engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        return True
+
+    def stats(self) -> dict:
+        with self._engine.connect() as conn:
+            keys = conn.execute(text("SELECT count(*) FROM shared_state")).scalar()
+        return {'backend': self.backend, 'keys': keys}
+
+
+class SQLiteStore(SharedStore):
+    """Ficheiro SQLite local (WAL) partilhado pelos workers da mesma máquina; uma ligação por thread."""
+
+    backend = 'sqlite'
+
+    _ADD = (
+        "INSERT INTO shared_state (key, value, expires_at) VALUES (:key, 1, :expires) "
+        "ON CONFLICT (key) DO UPDATE SET value = 1, expires_at = excluded.expires_at "
+        "WHERE shared_state.expires_at <= :now "
+        "RETURNING key"
+    )
+    _INCR = (
+        "INSERT INTO shared_state (key, value, expires_at) VALUES (:key, :amount, :expires) "
+        "ON CONFLICT (key) DO UPDATE SET "
+        "value = CASE WHEN shared_state.expires_at <= :now THEN excluded.value "
+        "ELSE shared_state.value + excluded.value END, "
+        "expires_at = CASE WHEN shared_state.expires_at <= :now THEN excluded.expires_at "
+        "ELSE shared_state.expires_at END "
+        "RETURNING value, expires_at"
+    )
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._conn()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Autocommit: cada upsert é a sua própria transação; timeout = espera pelo lock de escrita
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS shared_state ("
+                "key TEXT PRIMARY KEY, value INTEGER NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_shared_state_expires_at ON shared_state (expires_at)")
+            self._local.conn = conn
+        return conn
+
+    def add(self, key: str, ttl_seconds: float) -> bool:
+        now = time.time()
+        row = self._conn().execute(self._ADD, {'key': key, 'now': now, 'expires': now + ttl_seconds}).fetchone()
+        return row is not None
+
+    def incr(self, key: str, ttl_seconds: float, amount: int = 1) -> Tuple[int, float]:
+        now = time.time()
+        value, expires_at = self._conn().execute(
+            self._INCR, {'key': key, 'now': now, 'expires': now + ttl_seconds, 'amount': amount}
+        ).fetchone()
+        return int(value), float(expires_at)
+
+    def get(self, key: str) -> Tuple[int, float]:
+        row = self._conn().execute(
+            "SELECT value, expires_at FROM shared_state WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return (int(row[0]), float(row[1])) if row else (0, 0.0)
+
+    def delete(self, key: str) -> None:
+        self._conn().execute("DELETE FROM shared_state WHERE key = ?", (key,))
+
+    def purge_expired(self) -> int:
+        return self._conn().execute("DELETE FROM shared_state WHERE expires_at <= ?", (time.time(),)).rowcount
+
+    def stats(self) -> dict:
+        keys = self._conn().execute("SELECT count(*) FROM shared_state").fetchone()[0]
+        return {'backend': self.backend, 'path': self.path, 'keys': keys}
+
+
+@lru_cache
+def get_store() -> SharedStore:
+    """Store configurado em SHARED_STATE_BACKEND (memory | postgres | sqlite), criado no primeiro uso."""
+    backend = settings.SHARED_STATE_BACKEND.lower()
+    if backend == 'postgres':
+        return PostgresStore()
+    if backend == 'sqlite':
+        return SQLiteStore(settings.SHARED_STATE_SQLITE_PATH)
+    if backend != 'memory':
+        logger.warning("SHARED_STATE_BACKEND desconhecido (%s): a usar memória", backend)
+    return MemoryStore(settings.SHARED_STATE_MEMORY_MAX_KEYS)
@@ -0,0 +1,315 @@
+"""
+Cliente da Bot API do Telegram: um httpx.AsyncClient por processo (keep-alive, HTTP/2), em vez de
+uma ligação HTTPS nova por chamada.
+
+- Limites de envio do Telegram (~30 mensagens/s no total, ~1/s por chat privado, 20/min por grupo):
+  os envios esperam pela sua vez em vez de levarem 429.
+- 429: respeita `parameters.retry_after`, bloqueia o chat (ou o bot todo) durante esse tempo e repete.
+  Erros de rede e 5xx: repete com backoff exponencial.
+- Edições da mesma mensagem que chegam enquanto a anterior espera pela vez são agrupadas: só o
+  texto mais recente é enviado.
+
+O processamento do webhook é síncrono (threadpool): `call_sync`, `edit_message_sync`, ... submetem a
+chamada ao event loop onde o cliente foi iniciado (startup da app) e esperam pelo resultado; `send_nowait`
+não espera (typing, answerCallbackQuery). Sem loop iniciado (scripts, CLI) usa um cliente temporário.
+"""
+import asyncio
+import importlib.util
+import logging
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+import httpx
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+API_BASE_URL = 'https://api.telegram.org'
+
+# Métodos que contam para os limites de envio (mensagens novas e edições)
+RATE_LIMITED_METHODS = frozenset({
+    'sendMessage', 'sendDocument', 'sendPhoto', 'sendMediaGroup', 'copyMessage', 'forwardMessage',
+    'editMessageText', 'editMessageReplyMarkup',
+})
+
+_MAX_TRACKED_CHATS = 10000
+
+
+def _http2_available() -> bool:
+    # HTTP/2 precisa do extra httpx[http2] (pacote h2); sem ele fica HTTP/1.1 com keep-alive
+    return importlib.util.find_spec('h2') is not None
+
+
+class _TokenBucket:
+    """Balde de tokens por reserva: cada envio tira um token e fica a saber quanto tem de esperar."""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def reserve(self, now: float) -> float:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def is_full(self, now: float) -> bool:
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+class TelegramClient:
+    """Chamadas à Bot API com ligação partilhada, limites de envio e retry. Usar a instância `telegram_client`."""
+
+    def __init__(self, token: Optional[str] = None, *, transport: Optional[httpx.AsyncBaseTransport] = None,
+                 max_retries: Optional[int] = None):
+        self._token = token  # None: lê settings.TELEGRAM_BOT_TOKEN em cada chamada
+        self._transport = transport
+        self.max_retries = settings.TELEGRAM_API_MAX_RETRIES if max_retries is None else max_retries
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._global = _TokenBucket(settings.TELEGRAM_GLOBAL_RATE_PER_SECOND, settings.TELEGRAM_GLOBAL_RATE_PER_SECOND,
+                                    time.monotonic())
+        self._chats: Dict[Any, _TokenBucket] = {}
+        self._blocked_until: Dict[Any, float] = {}  # chat_id (None = bot inteiro) -> time.monotonic()
+        self._queued_edits: Dict[tuple, list] = {}  # (chat_id, message_id) -> [payload, future]
+        self._sending_edits: Dict[tuple, asyncio.Future] = {}
+        self.requests = 0
+        self.retries = 0
+        self.flood_waits = 0
+        self.edits_coalesced = 0
+
+    @property
+    def token(self) -> str:
+        return self._token if self._token is not None else settings.TELEGRAM_BOT_TOKEN
+
+    # --- ciclo de vida -------------------------------------------------------------------------
+
+    async def start(self) -> None:
+        """Associa o cliente ao event loop atual (startup da app); as chamadas síncronas passam a usá-lo."""
+        self._loop = asyncio.get_running_loop()
+        self._http()
+
+    async def aclose(self) -> None:
+        client, self._client = self._client, None
+        self._loop = None
+        if client is not None:
+            await client.aclose()
+
+    def _http(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=API_BASE_URL,
+                http2=_http2_available(),
+                timeout=httpx.Timeout(settings.TELEGRAM_API_TIMEOUT_SECONDS, connect=5.0),
+                limits=httpx.Limits(max_connections=settings.TELEGRAM_API_MAX_CONNECTIONS, keepalive_expiry=60.0),
+                transport=self._transport,
+            )
+        return self._client
+
+    # --- limites de envio ----------------------------------------------------------------------
+
+    def _chat_bucket(self, chat_id: Any, now: float) -> _TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= _MAX_TRACKED_CHATS:
+                self._prune(now)
+            if str(chat_id).startswith('-'):
+                rate = settings.TELEGRAM_GROUP_RATE_PER_MINUTE / 60.0
+                bucket = _TokenBucket(rate, settings.TELEGRAM_GROUP_RATE_PER_MINUTE, now)
+            else:
+                bucket = _TokenBucket(settings.TELEGRAM_CHAT_RATE_PER_SECOND, settings.TELEGRAM_CHAT_BURST, now)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def _prune(self, now: float) -> None:
+        for chat_id in [c for c, b in self._chats.items() if b.is_full(now)]:
+            del self._chats[chat_id]
+        for chat_id in [c for c, until in self._blocked_until.items() if until <= now]:
+            del self._blocked_until[chat_id]
+
+    async def _wait_turn(self, method: str, chat_id: Any) -> None:
+        now = time.monotonic()
+        wait = max(self._blocked_until.get(None, 0.0), self._blocked_until.get(chat_id, 0.0)) - now
+        if method in RATE_LIMITED_METHODS:
+            wait = max(wait, self._global.reserve(now))
+            if chat_id is not None:
+                wait = max(wait, self._chat_bucket(chat_id, now).reserve(now))
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def _block(self, chat_id: Any, seconds: float) -> None:
+        until = time.monotonic() + seconds
+        self._blocked_until[chat_id] = max(until, self._blocked_until.get(chat_id, 0.0))
+
+    async def _backoff(self, attempt: int) -> None:
+        self.retries += 1
+        await asyncio.sleep(min(8.0, 0.5 * 2 ** attempt) * (0.5 + random.random() / 2))
+
+    # --- chamadas ------------------------------------------------------------------------------
+
+    async def _request(self, method: str, *, chat_id: Any = None, waited: bool = False,
+                       timeout: Optional[float] = None, **kwargs) -> Optional[dict]:
+        """POST /bot<token>/<method>. Devolve o corpo JSON do Telegram (ok, result, description...) ou None."""
+        token = self.token
+        if not token:
+            logger.warning("TELEGRAM_BOT_TOKEN não configurado")
+            return None
+        if timeout is not None:
+            kwargs['timeout'] = timeout
+        for attempt in range(self.max_retries + 1):
+            if attempt or not waited:
+                await self._wait_turn(method, chat_id)
+            self.requests += 1
+            try:
+                response = await self._http().post(f'/bot{token}/{method}', **kwargs)
+            except httpx.TransportError as e:
+                if attempt < self.max_retries:
+                    await self._backoff(attempt)
+                    continue
+                logger.warning("[Telegram] %s falhou após %s tentativas: %s", method, attempt + 1, e)
+                return None
+            try:
+                body = response.json()
+            except ValueError:
+                body = {'ok': False, 'error_code': response.status_code, 'description': response.text[:200]}
+            if response.status_code == 429 and attempt < self.max_retries:
+                retry_after = (body.get('parameters') or {}).get('retry_after') or 1
+                logger.warning("[Telegram] %s: flood control, retry_after=%ss (chat %s)", method, retry_after, chat_id)
+                self.flood_waits += 1
+                self.retries += 1
+                self._block(chat_id, float(retry_after))
+                continue
+            if response.status_code >= 500 and attempt < self.max_retries:
+                await self._backoff(attempt)
+                continue
+            if not body.get('ok'):
+                logger.warning("[Telegram] %s: %s %s", method, response.status_code, body.get('description'))
+            return body
+        return None
+
+    async def call(self, method: str, payload: Optional[dict] = None, *, files: Optional[dict] = None,
+                   timeout: Optional[float] = None) -> Optional[dict]:
+        """Chama um método da Bot API. Com `files` envia multipart (payload nos campos do formulário)."""
+        chat_id = (payload or {}).get('chat_id')
+        if files:
+            return await self._request(method, chat_id=chat_id, timeout=timeout, data=payload, files=files)
+        return await self._request(method, chat_id=chat_id, timeout=timeout, json=payload or {})
+
+    async def edit_message_text(self, payload: dict) -> Optional[dict]:
+        """editMessageText; edições da mesma mensagem ainda por enviar são substituídas pela mais recente."""
+        key = (payload['chat_id'], payload['message_id'])
+        queued = self._queued_edits.get(key)
+        if queued is not None:
+            queued[0] = payload
+            self.edits_coalesced += 1
+            return await asyncio.shield(queued[1])
+
+        done = asyncio.get_running_loop().create_future()
+        queued = self._queued_edits[key] = [payload, done]
+        try:
+            previous = self._sending_edits.get(key)
+            if previous is not None:
+                await asyncio.shield(previous)  # mantém a ordem das edições da mesma mensagem
+            await self._wait_turn('editMessageText', payload['chat_id'])
+            # A partir daqui o texto fica fixo; edições seguintes formam outro lote
+            del self._queued_edits[key]
+            self._sending_edits[key] = done
+            result = await self._request('editMessageText', chat_id=payload['chat_id'], waited=True, json=queued[0])
+            done.set_result(result)
+            return result
+        finally:
+            if not done.done():
+                done.set_result(None)
+            if self._queued_edits.get(key) is queued:
+                del self._queued_edits[key]
+            if self._sending_edits.get(key) is done:
+                del self._sending_edits[key]
+
+    async def download_file(self, file_id: str, max_bytes: int, timeout: float = 30) -> Optional[tuple]:
+        """(conteúdo, file_path) de um ficheiro recebido pelo bot; None se falhar ou exceder max_bytes."""
+        info = await self.call('getFile', {'file_id': file_id})
+        result = (info or {}).get('result') or {}
+        file_path = result.get('file_path')
+        if not file_path:
+            logger.warning("[Telegram] getFile sem file_path: %s", info)
+            return None
+        if (result.get('file_size') or 0) > max_bytes:
+            logger.warning("[Telegram] Ficheiro demasiado grande: %s bytes", result.get('file_size'))
+            return None
+        try:
+            response = await self._http().get(f'/file/bot{self.token}/{file_path}', timeout=timeout)
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            logger.warning("[Telegram] Download de ficheiro falhou: %s", e)
+            return None
+        content = response.content
+        if not content or len(content) > max_bytes:
+            logger.warning("[Telegram] Ficheiro vazio ou demasiado grande: %s bytes", len(content or b''))
+            return None
+        return content, file_path
+
+    # --- ponte para código síncrono (threadpool) ------------------------------------------------
+
+    def run_sync(self, make_call: Callable[['TelegramClient'], Awaitable[T]]) -> T:
+        """Corre `make_call(client)` no event loop do cliente e espera pelo resultado (chamar fora do loop)."""
+        loop = self._loop
+        if loop is None or not loop.is_running():
+            return asyncio.run(self._run_standalone(make_call))
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            raise RuntimeError("TelegramClient: dentro do event loop usar await, não as variantes _sync")
+        return asyncio.run_coroutine_threadsafe(make_call(self), loop).result()
+
+    async def _run_standalone(self, make_call: Callable[['TelegramClient'], Awaitable[T]]) -> T:
+        client = TelegramClient(self._token, transport=self._transport, max_retries=self.max_retries)
+        try:
+            return await make_call(client)
+        finally:
+            await client.aclose()
+
+    def call_sync(self, method: str, payload: Optional[dict] = None, **kwargs) -> Optional[dict]:
+        return self.run_sync(lambda client: client.call(method, payload, **kwargs))
+
+    def edit_message_sync(self, payload: dict) -> Optional[dict]:
+        return self.run_sync(lambda client: client.edit_message_text(payload))
+
+    def download_file_sync(self, file_id: str, max_bytes: int, timeout: float = 30) -> Optional[tuple]:
+        return self.run_sync(lambda client: client.download_file(file_id, max_bytes, timeout))
+
+    def send_nowait(self, method: str, payload: dict) -> None:
+        """Chamada sem esperar pela resposta (typing, answerCallbackQuery); síncrona se não houver loop."""
+        loop = self._loop
+        if loop is None or not loop.is_running():
+            self.call_sync(method, payload)
+            return
+        future = asyncio.run_coroutine_threadsafe(self.call(method, payload), loop)
+        future.add_done_callback(_log_failure)
+
+    def stats(self) -> dict:
+        return {
+            'requests': self.requests,
+            'retries': self.retries,
+            'flood_waits': self.flood_waits,
+            'edits_coalesced': self.edits_coalesced,
+            'tracked_chats': len(self._chats),
+            'http2': _http2_available(),
+        }
+
+
+def _log_failure(future) -> None:
+    if not future.cancelled() and future.exception() is not None:
+        logger.warning("[Telegram] Chamada em segundo plano falhou: %s", future.exception())
+
+
+telegram_client = TelegramClient()
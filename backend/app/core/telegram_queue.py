@@ -0,0 +1,296 @@
+"""
+Fila de updates do Telegram: o webhook grava o update (tabela telegram_updates) e responde 200 logo;
+workers asyncio processam-no em segundo plano, no threadpool (BD, OpenAI e Bot API são síncronos).
+
+- Ordem por chat: cada chat vai sempre para a mesma lane e cada lane tem um só worker; chats
+  diferentes correm em paralelo. Entre processos (vários workers uvicorn) e quando um update falhado
+  volta a 'pending' atrás de outros mais recentes, o claim recusa um update enquanto houver outro mais
+  antigo (update_id menor) do mesmo chat em 'pending'/'processing': fica para o varrimento, que
+  enfileira por ordem de chegada.
+- Falhas: a função de processamento lança exceção quando o update falha. A sessão leva rollback antes
+  de gravar o estado; o update volta a 'pending' até TELEGRAM_QUEUE_MAX_ATTEMPTS e depois 'failed'.
+  O handler não é idempotente (grava pendentes/transações e responde ao utilizador entre commits): só
+  se volta a tentar uma falha anterior ao primeiro commit do handler (handler_committed). Depois de um
+  commit, repetir duplicaria o que já ficou gravado, e o update passa logo a 'failed'. A função recebe
+  `last_attempt` para só avisar o utilizador do erro quando não há nova tentativa.
+- Durabilidade: a tabela é a fonte de verdade. Se a lane estiver cheia, o processo reiniciar ou um
+  worker morrer a meio, o varrimento periódico volta a enfileirar os updates pendentes ou presos em
+  'processing'. O claim é um UPDATE condicional: com vários workers uvicorn, cada update é processado
+  uma só vez.
+- Métricas (stats): profundidade das lanes, processados/falhados/recuperados e percentis da latência
+  (receção -> fim) e da duração do processamento.
+"""
+import asyncio
+import logging
+import time
+import zlib
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import and_, event, exists, func, or_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session, aliased
+
+from .concurrency import run_blocking
+from .config import settings
+from .dependencies import SessionLocal
+from ..models import database as models
+
+logger = logging.getLogger(__name__)
+
+U = models.TelegramUpdate
+
+# Função que processa um update: (payload, db, last_attempt) -> qualquer coisa, lança exceção se falhar;
+# registada no startup (webhooks.telegram)
+ProcessFn = Callable[[dict, Session, bool], Any]
+
+
+_COMMITTED = 'telegram_queue_committed'
+
+
+def handler_committed(db: Session) -> bool:
+    """True se o handler já fez commit nesta sessão (falha a seguir não volta a ser tentada)."""
+    return db.info.get(_COMMITTED, False)
+
+
+def _mark_committed(session: Session) -> None:
+    session.info[_COMMITTED] = True
+
+
+def update_chat_id(data: dict) -> Optional[str]:
+    """chat_id de um update (mensagem, mensagem editada ou botão inline), para a ordem por chat."""
+    message = data.get('message') or data.get('edited_message') or (data.get('callback_query') or {}).get('message')
+    chat = (message or {}).get('chat') or {}
+    return str(chat['id']) if chat.get('id') is not None else None
+
+
+def persist(db: Session, update_id: int, chat_id: Optional[str], payload: dict) -> bool:
+    """Grava o update; False se já existia (reenvio do Telegram)."""
+    inserted = db.execute(
+        pg_insert(U)
+        .values(update_id=update_id, chat_id=chat_id, payload=payload)
+        .on_conflict_do_nothing(index_elements=[U.update_id])
+        .returning(U.update_id)
+    ).first()
+    db.commit()
+    return inserted is not None
+
+
+def backlog(db: Session) -> Dict[str, int]:
+    """Contagem por estado das linhas por acabar ou falhadas (health)."""
+    rows = (
+        db.query(U.status, func.count())
+        .filter(U.status.in_(('pending', 'processing', 'failed')))
+        .group_by(U.status)
+        .all()
+    )
+    return {status: count for status, count in rows}
+
+
+def _percentiles(samples) -> Dict[str, float]:
+    if not samples:
+        return {'p50': 0.0, 'p95': 0.0, 'max': 0.0}
+    ordered = sorted(samples)
+    return {
+        'p50': round(ordered[len(ordered) // 2] * 1000, 1),
+        'p95': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 1),
+        'max': round(ordered[-1] * 1000, 1),
+    }
+
+
+class UpdateQueue:
+    """Lanes asyncio (uma por worker) sobre a tabela telegram_updates. Usar a instância `telegram_queue`."""
+
+    def __init__(self, workers: int, lane_size: int):
+        self.workers = max(1, int(workers))
+        self.lane_size = max(1, int(lane_size))
+        self._process: Optional[ProcessFn] = None
+        self._lanes: List[asyncio.Queue] = []
+        self._tasks: List[asyncio.Task] = []
+        self._queued: set = set()  # update_ids nas lanes deste processo (evita duplicar no varrimento)
+        self.processed = 0
+        self.failed = 0
+        self.recovered = 0
+        self.overflow = 0
+        self._latencies: deque = deque(maxlen=1000)
+        self._durations: deque = deque(maxlen=1000)
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self, process: ProcessFn) -> None:
+        self._process = process
+        self._lanes = [asyncio.Queue(maxsize=self.lane_size) for _ in range(self.workers)]
+        self._tasks = [asyncio.create_task(self._worker(lane)) for lane in self._lanes]
+        self._tasks.append(asyncio.create_task(self._recover_loop()))
+        logger.info("Fila Telegram iniciada com %s workers", self.workers)
+
+    async def stop(self) -> None:
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._queued.clear()
+
+    def _lane(self, update_id: int, chat_id: Optional[str]) -> asyncio.Queue:
+        key = chat_id if chat_id is not None else str(update_id)
+        return self._lanes[zlib.crc32(key.encode()) % len(self._lanes)]
+
+    def enqueue(self, update_id: int, chat_id: Optional[str]) -> bool:
+        """Põe o update na lane do chat (chamar no event loop). False se cheia: fica para o varrimento."""
+        if update_id in self._queued:
+            return True
+        try:
+            self._lane(update_id, chat_id).put_nowait(update_id)
+        except asyncio.QueueFull:
+            self.overflow += 1
+            return False
+        self._queued.add(update_id)
+        return True
+
+    async def _worker(self, lane: asyncio.Queue) -> None:
+        while True:
+            update_id = await lane.get()
+            try:
+                outcome = await run_blocking(self.process_now, update_id)
+            except Exception:
+                logger.exception("Fila Telegram: erro inesperado no update %s", update_id)
+            else:
+                self._record(outcome)
+            finally:
+                self._queued.discard(update_id)
+                lane.task_done()
+
+    def _record(self, outcome: Optional[tuple]) -> None:
+        if outcome is None:
+            return  # já tratado por outro worker/processo
+        ok, latency, duration = outcome
+        if ok:
+            self.processed += 1
+        else:
+            self.failed += 1
+        self._latencies.append(latency)
+        self._durations.append(duration)
+
+    def process_now(self, update_id: int) -> Optional[tuple]:
+        """
+        Claim + processamento de um update (síncrono, threadpool). Devolve (ok, latência, duração) ou
+        None se o update já não estava disponível (processado ou em curso noutro worker).
+        """
+        db = SessionLocal()
+        try:
+            now = datetime.now(timezone.utc)
+            stale = now - timedelta(seconds=settings.TELEGRAM_QUEUE_STALE_SECONDS)
+            older = aliased(U)
+            claimed = (
+                db.query(U)
+                .filter(
+                    U.update_id == update_id,
+                    or_(U.status == 'pending', and_(U.status == 'processing', U.claimed_at < stale)),
+                    # Ordem por chat: não passar à frente de um update mais antigo do mesmo chat por acabar
+                    ~exists().where(
+                        older.chat_id == U.chat_id,
+                        older.update_id < U.update_id,
+                        older.status.in_(('pending', 'processing')),
+                    ),
+                )
+                .update({U.status: 'processing', U.claimed_at: now, U.attempts: U.attempts + 1},
+                        synchronize_session=False)
+            )
+            db.commit()
+            if not claimed:
+                return None
+            row = db.get(U, update_id)
+            # Lidos antes de processar: o handler faz commits/rollbacks na mesma sessão
+            payload, attempts, received_at = row.payload, row.attempts, row.received_at
+            last_attempt = attempts >= settings.TELEGRAM_QUEUE_MAX_ATTEMPTS
+            started = time.perf_counter()
+            db.info[_COMMITTED] = False
+            event.listen(db, 'after_commit', _mark_committed)
+            try:
+                self._process(payload, db, last_attempt)
+                ok, error = True, None
+            except Exception as e:
+                logger.exception("Fila Telegram: update %s falhou (tentativa %s)", update_id, attempts)
+                ok, error = False, f"{e.__class__.__name__}: {e}"[:500]
+            finally:
+                event.remove(db, 'after_commit', _mark_committed)
+            duration = time.perf_counter() - started
+            # A sessão pode ter ficado numa transação abortada (erro de BD apanhado pelo handler)
+            db.rollback()
+            if ok:
+                status = 'done'
+            elif last_attempt or handler_committed(db):
+                status = 'failed'
+            else:
+                status = 'pending'
+            finished = datetime.now(timezone.utc)
+            db.query(U).filter(U.update_id == update_id).update(
+                {U.status: status, U.processed_at: finished, U.last_error: error}, synchronize_session=False
+            )
+            db.commit()
+            return ok, (finished - received_at).total_seconds(), duration
+        finally:
+            db.close()
+
+    def _due_updates(self) -> List[tuple]:
+        """Pendentes esquecidos (lane cheia, restart) e presos em 'processing'; apaga os antigos já tratados."""
+        db = SessionLocal()
+        try:
+            now = datetime.now(timezone.utc)
+            # Pendentes muito recentes estão quase de certeza numa lane: dar-lhes uns segundos
+            grace = now - timedelta(seconds=settings.TELEGRAM_QUEUE_RECOVER_SECONDS)
+            stale = now - timedelta(seconds=settings.TELEGRAM_QUEUE_STALE_SECONDS)
+            rows = (
+                db.query(U.update_id, U.chat_id)
+                .filter(or_(
+                    and_(U.status == 'pending', U.received_at < grace),
+                    and_(U.status == 'processing', U.claimed_at < stale,
+                         U.attempts < settings.TELEGRAM_QUEUE_MAX_ATTEMPTS),
+                ))
+                .order_by(U.received_at, U.update_id)
+                .limit(self.workers * self.lane_size)
+                .all()
+            )
+            # Presos em 'processing' vezes demais (o worker morre sempre neste update): desistir
+            db.query(U).filter(
+                U.status == 'processing', U.claimed_at < stale, U.attempts >= settings.TELEGRAM_QUEUE_MAX_ATTEMPTS
+            ).update({U.status: 'failed', U.last_error: 'processamento interrompido'}, synchronize_session=False)
+            retention = now - timedelta(hours=settings.TELEGRAM_UPDATES_RETENTION_HOURS)
+            db.query(U).filter(U.status.in_(('done', 'failed')), U.received_at < retention).delete(
+                synchronize_session=False
+            )
+            db.commit()
+            return [tuple(r) for r in rows]
+        finally:
+            db.close()
+
+    async def _recover_loop(self) -> None:
+        while True:
+            try:
+                for update_id, chat_id in await run_blocking(self._due_updates):
+                    if update_id not in self._queued and self.enqueue(update_id, chat_id):
+                        self.recovered += 1
+            except Exception:
+                logger.exception("Fila Telegram: varrimento de recuperação falhou")
+            await asyncio.sleep(settings.TELEGRAM_QUEUE_RECOVER_SECONDS)
+
+    def stats(self) -> dict:
+        depths = [lane.qsize() for lane in self._lanes]
+        return {
+            'running': self.running,
+            'workers': self.workers,
+            'depth': sum(depths),
+            'max_lane_depth': max(depths, default=0),
+            'processed': self.processed,
+            'failed': self.failed,
+            'recovered': self.recovered,
+            'overflow': self.overflow,
+            'latency_ms': _percentiles(list(self._latencies)),
+            'duration_ms': _percentiles(list(self._durations)),
+        }
+
+
+telegram_queue = UpdateQueue(settings.TELEGRAM_QUEUE_WORKERS, settings.TELEGRAM_QUEUE_LANE_SIZE)
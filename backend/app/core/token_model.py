@@ -0,0 +1,124 @@
+"""
+Modelo de token scoring por workspace/tipo em memória (categorization_engine.compute_category_scores_*).
+
+Cada inferência fazia um `token IN (...)` a token_scores e recalculava o decaimento por recência com
+datetime.now() linha a linha. Em listas do Telegram e documentos com várias linhas o mesmo workspace é
+pontuado dezenas de vezes seguidas; aqui os token_scores do workspace/tipo carregam-se uma vez para
+um modelo (LRU limitado com TTL) com a contribuição de cada (token, categoria) já calculada, e as
+linhas de uma mensagem/documento pontuam-se num só score_many (categorization_engine.score_descriptions):
+
+    contribuição = (0.7 * count * recência + 0.3 * count) * score
+
+A recência é avaliada na carga; com o TTL de minutos a diferença para o cálculo por pedido é nula
+na prática. learn_from_correction invalida o modelo do workspace neste processo; nos outros workers
+a correção entra quando o TTL expira.
+"""
+import threading
+import uuid
+from array import array
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Tuple
+
+from .cache import TTLCache
+from .config import settings
+
+ALPHA = 0.7
+BETA = 0.3
+
+Scores = Tuple[Dict[uuid.UUID, float], Dict[uuid.UUID, Dict[str, float]]]
+
+
+def _contribution(count, score, last_updated, now: datetime) -> float:
+    recency = 1.0
+    if last_updated:
+        age_days = (now - last_updated.replace(tzinfo=timezone.utc)).days
+        recency = max(0.2, 1.0 - (age_days / 60) * 0.8)
+    freq_total = float(count or 1)
+    return (ALPHA * freq_total * recency + BETA * freq_total) * float(score or 1.0)
+
+
+class TokenScoreModel:
+    """token -> (índices de categoria, contribuições) em arrays paralelos; categorias numa lista."""
+
+    def __init__(self, workspace_id: uuid.UUID, rows: Iterable, now: datetime):
+        self.workspace_id = workspace_id
+        self.categories: List[uuid.UUID] = []
+        category_index: Dict[uuid.UUID, int] = {}
+        postings: Dict[str, Tuple[array, array]] = {}
+        for category_id, token, count, score, last_updated in rows:
+            if not category_id:
+                continue
+            index = category_index.get(category_id)
+            if index is None:
+                index = category_index[category_id] = len(self.categories)
+                self.categories.append(category_id)
+            cats, weights = postings.setdefault(token, (array('i'), array('d')))
+            cats.append(index)
+            weights.append(_contribution(count, score, last_updated, now))
+        self._postings = postings
+        self.rows = sum(len(cats) for cats, _ in postings.values())
+
+    def score(self, tokens: List[str]) -> Scores:
+        """Scores por categoria (normalizados pelo máximo) e contribuição de cada token por categoria."""
+        totals = [0.0] * len(self.categories)
+        contribs: Dict[int, Dict[str, float]] = {}
+        for token in dict.fromkeys(tokens):  # como o IN: cada token conta uma vez
+            posting = self._postings.get(token)
+            if posting is None:
+                continue
+            for index, weight in zip(*posting):
+                totals[index] += weight
+                per_token = contribs.setdefault(index, {})
+                per_token[token] = per_token.get(token, 0) + weight
+        if not contribs:
+            return {}, {}
+        max_score = max(totals[i] for i in contribs)
+        scores = {self.categories[i]: (totals[i] / max_score if max_score else 0) for i in contribs}
+        return scores, {self.categories[i]: c for i, c in contribs.items()}
+
+    def score_many(self, token_lists: Iterable[List[str]]) -> List[Scores]:
+        return [self.score(tokens) for tokens in token_lists]
+
+
+_cache = TTLCache(maxsize=settings.TOKEN_MODEL_CACHE_MAX_SIZE, ttl_seconds=settings.TOKEN_MODEL_CACHE_TTL_SECONDS)
+_loads = 0
+_lock = threading.Lock()
+
+
+def get_model(db, models, workspace_id: uuid.UUID, tipo: str) -> TokenScoreModel:
+    """Modelo do workspace/tipo: da cache, ou carregado com uma query a token_scores."""
+    global _loads
+    key = (workspace_id, tipo)
+    model = _cache.get(key)
+    if model is None:
+        rows = db.query(
+            models.TokenScore.category_id,
+            models.TokenScore.token,
+            models.TokenScore.count,
+            models.TokenScore.score,
+            models.TokenScore.last_updated,
+        ).filter(
+            models.TokenScore.workspace_id == workspace_id,
+            models.TokenScore.transaction_type == tipo,
+        ).all()
+        model = TokenScoreModel(workspace_id, rows, datetime.now(timezone.utc))
+        _cache.set(key, model)
+        with _lock:
+            _loads += 1
+    return model
+
+
+def invalidate(workspace_id: uuid.UUID) -> None:
+    """Descarta os modelos do workspace, de todos os tipos (após escrever em token_scores)."""
+    _cache.discard_where(lambda model: model.workspace_id == workspace_id)
+
+
+def clear() -> None:
+    global _loads
+    _cache.clear()
+    with _lock:
+        _loads = 0
+
+
+def stats() -> dict:
+    return {**_cache.stats(), 'loads': _loads}
@@ -0,0 +1,148 @@
+"""
+Estruturas em memória com TTL e tamanho máximo, para estado por chat/utilizador em workers longos
+(deduplicação de updates, rate limits, memória de conversa do Telegram).
+
+Cada mapa tem um TTL fixo e cada escrita renova a entrada e passa-a para o fim: a ordem de inserção
+é a ordem de expiração. Expirar é só retirar do início enquanto o primeiro estiver vencido, O(1)
+amortizado, sem varrer o mapa nem precisar de heap. Chats inativos desaparecem sozinhos e o
+tamanho máximo limita a memória mesmo com picos de chats novos (sai o que expira primeiro).
+"""
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Hashable, Optional
+
+_MISSING = object()
+
+
+class TTLMap:
+    """Mapa thread-safe com TTL igual para todas as entradas (renovado a cada escrita) e tamanho máximo."""
+
+    def __init__(self, maxsize: int, ttl_seconds: float):
+        self.maxsize = max(1, int(maxsize))
+        self.ttl_seconds = float(ttl_seconds)
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.expired = 0
+        self.evicted = 0
+
+    def _expire(self, now: float) -> None:
+        data = self._data
+        while data:
+            key, (expires_at, _) = next(iter(data.items()))
+            if expires_at > now:
+                return
+            del data[key]
+            self.expired += 1
+
+    def _store(self, key: Hashable, value: Any, now: float) -> None:
+        self._data[key] = (now + self.ttl_seconds, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evicted += 1
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            item = self._data.get(key, _MISSING)
+            return default if item is _MISSING else item[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            self._store(key, value, now)
+
+    def add(self, key: Hashable, value: Any = True) -> bool:
+        """Grava só se a chave não existir (ou já tiver expirado). True se gravou."""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            if key in self._data:
+                return False
+            self._store(key, value, now)
+            return True
+
+    def update(self, key: Hashable, fn: Callable[[Optional[Any]], Any]) -> Any:
+        """Lê-modifica-grava atómico: grava fn(valor atual ou None) e renova o TTL. Devolve o novo valor."""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            item = self._data.get(key, _MISSING)
+            value = fn(None if item is _MISSING else item[1])
+            self._store(key, value, now)
+            return value
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.pop(key, _MISSING)
+        return default if item is _MISSING else item[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.expired = 0
+            self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._expire(time.monotonic())
+            # Aproximado: contentor + tuplos (expiração, valor) + valores (sem seguir referências internas)
+            approx_bytes = sys.getsizeof(self._data) + sum(
+                sys.getsizeof(item) + sys.getsizeof(item[1]) for item in self._data.values()
+            )
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl_seconds': self.ttl_seconds,
+                'expired': self.expired,
+                'evicted': self.evicted,
+                'approx_bytes': approx_bytes,
+            }
+
+
+class SlidingWindowLimiter:
+    """Rate limit por chave: no máximo `limit` eventos nos últimos `window_seconds`. Chaves inativas expiram."""
+
+    def __init__(self, limit: int, window_seconds: float, maxsize: int):
+        self.limit = int(limit)
+        self.window_seconds = float(window_seconds)
+        self._hits = TTLMap(maxsize, window_seconds)
+        self.rejected = 0
+
+    def hit(self, key: Hashable) -> bool:
+        """Regista um evento; False (sem registar) se o limite da janela já foi atingido."""
+        now = time.monotonic()
+        allowed = True
+
+        def record(window: Optional[deque]) -> deque:
+            nonlocal allowed
+            window = window if window is not None else deque()
+            while window and now - window[0] >= self.window_seconds:
+                window.popleft()
+            if len(window) >= self.limit:
+                allowed = False
+            else:
+                window.append(now)
+            return window
+
+        self._hits.update(key, record)
+        if not allowed:
+            self.rejected += 1
+        return allowed
+
+    def clear(self) -> None:
+        self._hits.clear()
+        self.rejected = 0
+
+    def stats(self) -> dict:
+        return {**self._hits.stats(), 'limit': self.limit, 'rejected': self.rejected}
@@ -0,0 +1,99 @@
+"""
+Cache do utilizador autenticado (get_current_user_snapshot).
+
+Guarda, por subject do token (email normalizado), um snapshot imutável e desligado da sessão
+com os campos que as rotas de leitura precisam. Rotas que alteram estes campos (perfil,
+subscrição, admin) chamam invalidate_user explicitamente; o TTL limita qualquer desvio.
+"""
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .cache import TTLCache
+from .config import settings
+from ..models import database as models
+
+
+@dataclass(frozen=True)
+class UserSnapshot:
+    id: uuid.UUID
+    email: str
+    language: str
+    currency: str
+    subscription_status: str
+    pro_granted_until: Optional[datetime]
+    is_admin: bool
+    is_active: bool
+
+    # Mesma regra do modelo (admin, subscrição ativa ou Pro concedido até data futura)
+    has_effective_pro = models.User.has_effective_pro
+
+    @classmethod
+    def from_user(cls, user: models.User) -> "UserSnapshot":
+        return cls(
+            id=user.id,
+            email=user.email,
+            language=user.language or 'pt',
+            currency=user.currency or 'EUR',
+            subscription_status=user.subscription_status or 'none',
+            pro_granted_until=user.pro_granted_until,
+            is_admin=bool(user.is_admin),
+            is_active=bool(user.is_active if user.is_active is not None else True),
+        )
+
+
+_cache = TTLCache(maxsize=settings.USER_CACHE_MAX_SIZE, ttl_seconds=settings.USER_CACHE_TTL_SECONDS)
+
+_PENDING_KEY = 'user_cache_pending_invalidation'
+
+
+def get_snapshot(subject: str) -> Optional[UserSnapshot]:
+    return _cache.get(subject)
+
+
+def store_user(subject: str, user: models.User) -> UserSnapshot:
+    snapshot = UserSnapshot.from_user(user)
+    _cache.set(subject, snapshot)
+    return snapshot
+
+
+def _invalidate_id(user_id: uuid.UUID) -> None:
+    # Por id e não por subject: depois de mudar o email o subject antigo também sai
+    _cache.discard_where(lambda snapshot: snapshot.id == user_id)
+
+
+def invalidate_user(user, db: Optional[Session] = None) -> None:
+    """
+    Remove o utilizador da cache. Com `db`, volta a invalidar depois do commit dessa sessão,
+    para que um pedido concorrente não volte a guardar os valores antigos entretanto.
+    """
+    user_id = user if isinstance(user, uuid.UUID) else getattr(user, 'id', None)
+    if user_id is None:
+        return
+    _invalidate_id(user_id)
+    if db is not None:
+        db.info.setdefault(_PENDING_KEY, set()).add(user_id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session: Session) -> None:
+    pending = session.info.pop(_PENDING_KEY, None)
+    for user_id in pending or ():
+        _invalidate_id(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
+
+
+def clear() -> None:
+    _cache.clear()
+
+
+def stats() -> dict:
+    return _cache.stats()
@@ -0,0 +1,90 @@
+"""
+Cache do workspace de cada utilizador (get_current_workspace).
+
+Guarda, por owner_id, o workspace principal (o primeiro por created_at, o mesmo que o import
+usa) com os campos de que as rotas precisam: id, saldo inicial e marcador de recorrentes.
+Quem apaga ou recria workspaces (purge-data, eliminar conta) chama invalidate_owner; o TTL
+limita qualquer desvio.
+"""
+import uuid
+from dataclasses import dataclass, replace
+from datetime import date
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .cache import TTLCache
+from .config import settings
+from ..models import database as models
+
+
+@dataclass(frozen=True)
+class WorkspaceRef:
+    id: uuid.UUID
+    owner_id: uuid.UUID
+    opening_balance_cents: int
+    opening_balance_date: Optional[date]
+    recurring_processed_through: Optional[date]
+
+    @classmethod
+    def from_workspace(cls, workspace: models.Workspace) -> "WorkspaceRef":
+        return cls(
+            id=workspace.id,
+            owner_id=workspace.owner_id,
+            opening_balance_cents=workspace.opening_balance_cents or 0,
+            opening_balance_date=workspace.opening_balance_date,
+            recurring_processed_through=workspace.recurring_processed_through,
+        )
+
+
+_cache = TTLCache(maxsize=settings.WORKSPACE_CACHE_MAX_SIZE, ttl_seconds=settings.WORKSPACE_CACHE_TTL_SECONDS)
+
+_PENDING_KEY = 'workspace_cache_pending_invalidation'
+
+
+def get_ref(owner_id: uuid.UUID) -> Optional[WorkspaceRef]:
+    return _cache.get(owner_id)
+
+
+def store_workspace(workspace: models.Workspace) -> WorkspaceRef:
+    ref = WorkspaceRef.from_workspace(workspace)
+    _cache.set(workspace.owner_id, ref)
+    return ref
+
+
+def mark_recurring_processed(owner_id: uuid.UUID, through: date) -> None:
+    """Atualiza o marcador de recorrentes na entrada em cache (se existir), sem nova query."""
+    ref = _cache.get(owner_id)
+    if ref is not None and (ref.recurring_processed_through is None or ref.recurring_processed_through < through):
+        _cache.set(owner_id, replace(ref, recurring_processed_through=through))
+
+
+def invalidate_owner(owner_id: uuid.UUID, db: Optional[Session] = None) -> None:
+    """
+    Remove o workspace do utilizador da cache. Com `db`, volta a invalidar depois do commit
+    dessa sessão (o workspace novo só fica visível aos outros pedidos depois do commit).
+    """
+    _cache.pop(owner_id)
+    if db is not None:
+        db.info.setdefault(_PENDING_KEY, set()).add(owner_id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session: Session) -> None:
+    pending = session.info.pop(_PENDING_KEY, None)
+    for owner_id in pending or ():
+        _cache.pop(owner_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
+
+
+def clear() -> None:
+    _cache.clear()
+
+
+def stats() -> dict:
+    return _cache.stats()
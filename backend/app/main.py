@@ -5,10 +5,12 @@ from fastapi.responses import JSONResponse, Response
 from .routes import auth, categories, transactions, stripe as stripe_routes, insights, recurring, admin, goals, dashboard, affiliate, support
 from .routes.auth import create_default_categories
 from .webhooks import stripe as stripe_webhooks, whatsapp as whatsapp_webhooks, telegram as telegram_webhooks
-from .webhooks.telegram import setup_bot_commands
-from .models.database import Base, SystemSetting, User, Workspace
-from .core.dependencies import engine, get_db, SessionLocal
+from .models.database import SystemSetting, User, Workspace
+from .core.dependencies import async_engine, get_db, SessionLocal
 from .core import security
+from .core.concurrency import configure_threadpool
+from .core.telegram_client import telegram_client
+from .core.telegram_queue import telegram_queue
 from .core.limiter import limiter
 from slowapi.errors import RateLimitExceeded
 from slowapi import _rate_limit_exceeded_handler
@@ -41,8 +43,7 @@ if sys.platform == 'win32':
     asyncio_logger = logging.getLogger('asyncio')
     asyncio_logger.setLevel(logging.CRITICAL)  # Só mostra erros críticos do asyncio
 
-# Criar tabelas no banco de dados
-Base.metadata.create_all(bind=engine)
+# Esquema da BD: bootstrap_db.py no start.sh (BD vazia: create_all + stamp head; senão alembic upgrade head)
 
 # Admin criado ao arrancar (se CREATE_DEFAULT_ADMIN=true e não existir)
 # No Render: define DEFAULT_ADMIN_EMAIL e DEFAULT_ADMIN_PASSWORD e altera a password após 1º login.
@@ -126,13 +127,54 @@ app.include_router(stripe_webhooks.router)
 app.include_router(whatsapp_webhooks.router)
 app.include_router(telegram_webhooks.router)
 
-# Configurar comandos e informações do bot Telegram ao iniciar
-try:
-    from .webhooks.telegram import setup_bot_commands, setup_bot_info
-    setup_bot_commands()
-    setup_bot_info()
-except Exception as e:
-    logger.warning(f"Não foi possível configurar bot Telegram: {e}")
+# Comandos e descrição do bot Telegram: uma vez por deploy (setup_telegram_bot.py no start.sh)
+# ou via POST /admin/telegram/setup-bot, não a cada import/worker
+
+
+def _job_purge_shared_state():
+    """Job periódico: apaga as chaves expiradas do estado partilhado (core.shared_state)."""
+    from .core.shared_state import get_store
+    try:
+        deleted = get_store().purge_expired()
+        if deleted:
+            logger.info("[Job] %d chave(s) expirada(s) removida(s) do estado partilhado", deleted)
+    except Exception as e:
+        logger.exception(f"Erro no job purge-shared-state: {e}")
+
+
+@app.on_event("startup")
+async def configure_execution_model():
+    """Dimensiona o threadpool onde correm os handlers síncronos (THREADPOOL_SIZE)."""
+    configure_threadpool()
+
+
+@app.on_event("shutdown")
+async def dispose_async_engine():
+    """Fecha as ligações do pool asyncpg ao terminar o worker."""
+    await async_engine.dispose()
+
+
+@app.on_event("startup")
+async def start_telegram_client():
+    """Cliente da Bot API do Telegram partilhado pelo worker (ligações keep-alive, limites de envio)."""
+    await telegram_client.start()
+
+
+@app.on_event("startup")
+async def start_telegram_queue():
+    """Workers que processam os updates do webhook Telegram em segundo plano (core.telegram_queue)."""
+    await telegram_webhooks.start_update_queue()
+
+
+@app.on_event("shutdown")
+async def stop_telegram_queue():
+    # Antes de fechar o cliente: os updates por acabar ficam 'pending'/'processing' e são recuperados
+    await telegram_queue.stop()
+
+
+@app.on_event("shutdown")
+async def close_telegram_client():
+    await telegram_client.aclose()
 
 
 @app.on_event("startup")
@@ -195,33 +237,50 @@ def _job_affiliate_first_invoices_pending():
 
 
 def _job_recurring_transactions():
-    """Job diário: cria transações automáticas para todas as recorrentes (despesas/receitas mensais)."""
-    from .routes.transactions import process_automatic_recurring
+    """
+    Job diário: cria transações automáticas para todas as recorrentes (despesas/receitas mensais).
+    É o mecanismo principal: as leituras só processam se o workspace ficou por pôr em dia.
+    Um INSERT ... SELECT por mês para todos os workspaces (core.recurring_engine), com
+    recuperação dos meses em falta se o serviço esteve em baixo.
+    """
+    from .core.recurring_engine import generate_recurring_transactions
     db = SessionLocal()
     try:
-        workspaces = db.query(Workspace).with_entities(Workspace.id).all()
-        for (ws_id,) in workspaces:
-            try:
-                process_automatic_recurring(db, ws_id)
-            except Exception as e:
-                logger.exception(f"Erro ao processar recorrentes do workspace {ws_id}: {e}")
-        logger.info("[Job diário] Recorrentes processadas para %d workspace(s)", len(workspaces))
+        generate_recurring_transactions(db)
     except Exception as e:
         logger.exception(f"Erro no job recurring-transactions: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+def _job_purge_unverified_users():
+    """Job periódico: apaga contas não verificadas cujo prazo de verificação expirou."""
+    from .routes.auth import purge_expired_unverified_users
+    db = SessionLocal()
+    try:
+        deleted = purge_expired_unverified_users(db)
+        if deleted:
+            logger.info("[Job] %d conta(s) não verificada(s) expirada(s) removida(s)", deleted)
+    except Exception as e:
+        logger.exception(f"Erro no job purge-unverified-users: {e}")
+        db.rollback()
     finally:
         db.close()
 
 
 @app.on_event("startup")
 def start_scheduler():
-    """Agenda jobs diários: 1ª invoices pendentes (9:00 UTC), recorrentes (2:00 UTC)."""
+    """Agenda jobs: 1ª invoices pendentes (9:00 UTC), recorrentes (0:05 UTC), contas não verificadas (10 min)."""
     try:
         from apscheduler.schedulers.background import BackgroundScheduler
         scheduler = BackgroundScheduler()
         scheduler.add_job(_job_affiliate_first_invoices_pending, "cron", hour=9, minute=0)
-        scheduler.add_job(_job_recurring_transactions, "cron", hour=2, minute=0)
+        scheduler.add_job(_job_recurring_transactions, "cron", hour=0, minute=5)
+        scheduler.add_job(_job_purge_unverified_users, "interval", minutes=10, max_instances=1, coalesce=True)
+        scheduler.add_job(_job_purge_shared_state, "interval", minutes=10, max_instances=1, coalesce=True)
         scheduler.start()
-        logger.info("Jobs diários agendados: first-invoices-pending (9:00 UTC), recurring-transactions (2:00 UTC)")
+        logger.info("Jobs agendados: first-invoices-pending (9:00 UTC), recurring-transactions (0:05 UTC), purge-unverified-users (10 min)")
     except Exception as e:
         logger.warning(f"Não foi possível iniciar scheduler: {e}")
 
@@ -1,7 +1,7 @@
-from sqlalchemy import Column, String, Boolean, DateTime, ForeignKey, Integer, Date, CheckConstraint, UniqueConstraint, Numeric, Text, BigInteger
+from sqlalchemy import Column, String, Boolean, DateTime, ForeignKey, Integer, Date, CheckConstraint, UniqueConstraint, Numeric, Text, BigInteger, Index, literal_column, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import JSONB, UUID
 import uuid
 from ..core.dependencies import Base
 
@@ -52,6 +52,13 @@ class User(Base):
     referrals = relationship('AffiliateReferral', foreign_keys='AffiliateReferral.referrer_id', back_populates='referrer')
     commissions = relationship('AffiliateCommission', back_populates='affiliate')
 
+    __table_args__ = (
+        # Job de limpeza de contas não verificadas expiradas (purge_expired_unverified_users)
+        Index('ix_users_unverified_created_at', 'created_at', postgresql_where=text('is_email_verified = false')),
+        # Lookup do utilizador autenticado é por lower(email) (get_current_user)
+        Index('ix_users_email_lower', func.lower(email)),
+    )
+
     @property
     def has_password(self) -> bool:
         """True se a conta foi criada com email/password; False se entrou só por Google/social."""
@@ -76,6 +83,8 @@ class Workspace(Base):
     name = Column(String(100), nullable=False, server_default='Meu Workspace')
     opening_balance_cents = Column(Integer, nullable=False, default=0)  # Saldo inicial em cêntimos
     opening_balance_date = Column(Date, nullable=True)  # Data do saldo inicial
+    recurring_processed_through = Column(Date, nullable=True)  # Recorrentes já geradas até esta data (inclusive)
+    data_version = Column(BigInteger, nullable=False, server_default='0')  # Incrementado a cada escrita nos dados do workspace (core.data_version)
     created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
     updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), onupdate=func.now())
     
@@ -142,11 +151,17 @@ class Transaction(Base):
     installment_group_id = Column(UUID(as_uuid=True), ForeignKey('installment_groups.id', ondelete='SET NULL'), nullable=True)
     amount_cents = Column(BigInteger, nullable=False)
     description = Column(String(255), nullable=True)
+    # canonicalize(description), mantida em cada escrita (core.description_index): similaridade com o histórico
+    description_canonical = Column(String(255), nullable=True)
     transaction_date = Column(Date, nullable=False, index=True)
     inference_source = Column(String(50), nullable=True)
     decision_reason = Column(String(255), nullable=True)
     needs_review = Column(Boolean, nullable=False, default=False)
     is_installment = Column(Boolean, nullable=False, default=False)
+    is_seed = Column(Boolean, nullable=False, default=False, server_default='false')  # Exemplo criado no registo (auth.create_seed_transactions)
+    # Ocorrência gerada por uma recorrente: (recurring_id, recurring_period) é a chave de idempotência
+    recurring_id = Column(UUID(as_uuid=True), ForeignKey('recurring_transactions.id', ondelete='SET NULL'), nullable=True)
+    recurring_period = Column(Date, nullable=True)  # 1º dia do mês da ocorrência
     created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
     updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), onupdate=func.now())
     
@@ -156,8 +171,42 @@ class Transaction(Base):
     
     __table_args__ = (
         CheckConstraint('amount_cents <> 0'),
+        Index(
+            'uq_transactions_recurring_period', 'recurring_id', 'recurring_period',
+            unique=True, postgresql_where=text('recurring_id IS NOT NULL'),
+        ),
+        # Paginação por cursor de GET /transactions/ (ORDER BY created_at DESC, id DESC)
+        Index('idx_transactions_workspace_created_id', 'workspace_id', 'created_at', 'id'),
+        Index('idx_transactions_workspace_date', 'workspace_id', 'transaction_date'),
+        Index('idx_transactions_workspace_category_date', 'workspace_id', 'category_id', 'transaction_date'),
+        # Leituras por período sem as transações de seed
+        Index(
+            'idx_transactions_workspace_date_not_seed', 'workspace_id', text('transaction_date DESC'),
+            postgresql_where=text('NOT is_seed'),
+        ),
+        # Índice invertido dos tokens da descrição canónica (&& = partilha pelo menos um token)
+        Index(
+            'idx_transactions_description_tokens', func.string_to_array(description_canonical, literal_column("' '")),
+            postgresql_using='gin',
+        ),
     )
 
+class WorkspaceCategoryMonth(Base):
+    """
+    Rollup mensal por workspace/categoria (core.month_rollup), mantido incrementalmente.
+    Somas separadas por sinal; receita/despesa/cofre (depósito vs resgate) resultam do tipo
+    da categoria na leitura. Transações sem categoria usam month_rollup.NO_CATEGORY.
+    """
+    __tablename__ = 'workspace_category_month'
+    workspace_id = Column(UUID(as_uuid=True), ForeignKey('workspaces.id', ondelete='CASCADE'), nullable=False, primary_key=True)
+    category_id = Column(UUID(as_uuid=True), nullable=False, primary_key=True)
+    month = Column(Date, nullable=False, primary_key=True)  # 1º dia do mês
+    credit_cents = Column(BigInteger, nullable=False, default=0)  # soma dos valores > 0
+    credit_count = Column(Integer, nullable=False, default=0)
+    debit_cents = Column(BigInteger, nullable=False, default=0)  # soma dos valores < 0 (negativa)
+    debit_count = Column(Integer, nullable=False, default=0)
+
+
 class SystemSetting(Base):
     __tablename__ = 'system_settings'
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
@@ -230,6 +279,10 @@ class AuditLog(Base):
     created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
     
     user = relationship('User')
+    
+    __table_args__ = (
+        Index('idx_audit_logs_user_created', 'user_id', 'created_at'),
+    )
 
 class SavingsGoal(Base):
     __tablename__ = 'savings_goals'
@@ -265,6 +318,46 @@ class TelegramPendingTransaction(Base):
     
     workspace = relationship('Workspace')
     category = relationship('Category')
+    
+    __table_args__ = (
+        Index('idx_telegram_pending_chat_batch', 'chat_id', 'batch_id'),
+    )
+
+class TelegramUpdate(Base):
+    """
+    Updates recebidos no webhook do Telegram: gravados antes de responder 200 e processados em
+    segundo plano (core.telegram_queue). A PK update_id deduplica os reenvios do Telegram.
+    """
+    __tablename__ = 'telegram_updates'
+    update_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    chat_id = Column(String, nullable=True)
+    payload = Column(JSONB, nullable=False)
+    status = Column(String(20), nullable=False, server_default='pending')  # pending | processing | done | failed
+    attempts = Column(Integer, nullable=False, server_default='0')
+    last_error = Column(Text, nullable=True)
+    received_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    claimed_at = Column(DateTime(timezone=True), nullable=True)
+    processed_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        # Varrimento de recuperação (pendentes/presos) e limpeza dos antigos
+        Index('idx_telegram_updates_status_received', 'status', 'received_at'),
+    )
+
+class SharedStateEntry(Base):
+    """
+    Contadores e chaves com expiração partilhados entre workers (core.shared_state, backend postgres):
+    dedupe do webhook, rate limits do Telegram e da API. UNLOGGED: sem WAL, esvazia num crash.
+    """
+    __tablename__ = 'shared_state'
+    key = Column(String, primary_key=True)
+    value = Column(BigInteger, nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        Index('idx_shared_state_expires_at', 'expires_at'),
+        {'prefixes': ['UNLOGGED']},
+    )
 
 class CategoryMappingCache(Base):
     """
@@ -311,6 +404,7 @@ class TokenScore(Base):
 
     __table_args__ = (
         UniqueConstraint('workspace_id', 'token', 'category_id', 'transaction_type', name='unique_token_score'),
+        Index('idx_token_scores_workspace_type_token', 'workspace_id', 'transaction_type', 'token'),
     )
 
 
@@ -326,6 +420,10 @@ class GeminiEvent(Base):
     status_code = Column(Integer, nullable=True)
     timestamp = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
 
+    __table_args__ = (
+        Index('idx_gemini_events_workspace_timestamp', 'workspace_id', 'timestamp'),
+    )
+
 
 class MerchantRegistry(Base):
     """
@@ -461,4 +559,11 @@ class AdminErrorLog(Base):
     path = Column(String(500), nullable=False)
     message = Column(Text, nullable=False)
     exc_type = Column(String(100), nullable=False)
-    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
\ No newline at end of file
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+
+# Hooks before_flush da Session que mantêm os dados derivados das transações (workspace_category_month,
+# workspaces.data_version, transactions.description_canonical): registados com os modelos para valerem
+# em qualquer processo que escreva transações (app, scripts, migrações de dados, workers), não só
+# quando app.main é importado.
+from ..core import data_version, description_index, month_rollup  # noqa: E402,F401
@@ -5,18 +5,21 @@ from typing import List, Optional
 from uuid import UUID
 from datetime import datetime, date, timedelta, timezone
 from decimal import Decimal
-from ..core.dependencies import get_db, conf
+from ..core.dependencies import get_db, get_mail_conf
 from ..models import database as models
 from .. import schemas
 from .auth import get_current_user
 from ..core.audit import log_action
+from ..core.concurrency import run_blocking
+from ..core import user_cache, workspace_cache
 from ..core.affiliate_commission import get_commission_percentage_for_price_id
-import stripe
+from ..core.lazy_import import lazy_module
+stripe = lazy_module('stripe')  # só importado no primeiro uso, não no arranque do worker
 from ..core.config import settings
-from fastapi_mail import FastMail, MessageSchema, MessageType
+fastapi_mail = lazy_module('fastapi_mail')  # só importado no primeiro uso, não no arranque do worker
 from ..core.email_translations import get_email_translation
 import logging
-import requests
+requests = lazy_module('requests')  # só importado no primeiro uso, não no arranque do worker
 import secrets
 
 import json
@@ -27,7 +30,7 @@ stripe.api_key = settings.STRIPE_API_KEY
 
 router = APIRouter(prefix='/admin', tags=['admin'])
 
-async def check_admin(current_user: models.User = Depends(get_current_user)):
+def check_admin(current_user: models.User = Depends(get_current_user)):
     if not current_user.is_admin:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -54,7 +57,7 @@ def _invoice_net_paid(inv) -> int:
 
 
 @router.get('/finance/stats')
-async def get_admin_finance_stats(db: Session = Depends(get_db), admin: models.User = Depends(check_admin)):
+def get_admin_finance_stats(db: Session = Depends(get_db), admin: models.User = Depends(check_admin)):
     try:
         from datetime import datetime, timedelta
         from collections import defaultdict
@@ -116,7 +119,7 @@ async def get_admin_finance_stats(db: Session = Depends(get_db), admin: models.U
         raise HTTPException(status_code=500, detail=f'Stripe error: {str(e)}')
 
 @router.get('/stats', response_model=schemas.AdminStats)
-async def get_admin_stats(db: Session = Depends(get_db), admin: models.User = Depends(check_admin)):
+def get_admin_stats(db: Session = Depends(get_db), admin: models.User = Depends(check_admin)):
     total_users = db.query(func.count(models.User.id)).scalar()
     total_transactions = db.query(func.count(models.Transaction.id)).scalar()
     total_recurring = db.query(func.count(models.RecurringTransaction.id)).scalar()
@@ -146,7 +149,7 @@ async def get_admin_stats(db: Session = Depends(get_db), admin: models.User = De
 
 # --- Despesas do projeto e manutenção ---
 @router.get('/health')
-async def get_health_dashboard(db: Session = Depends(get_db), admin: models.User = Depends(check_admin)):
+def get_health_dashboard(db: Session = Depends(get_db), admin: models.User = Depends(check_admin)):
     """Dashboard de saúde: estado das integrações e últimos erros."""
     from ..core.error_buffer import get_recent_errors_from_db
     from sqlalchemy import text
@@ -258,14 +261,32 @@ async def get_health_dashboard(db: Session = Depends(get_db), admin: models.User
     # Erros recentes (BD)
     recent_errors = get_recent_errors_from_db(db, limit=20)
 
+    # Última execução do job de recorrentes neste processo (transações geradas, duração)
+    from ..core.recurring_engine import last_run_stats
+    from ..core import dashboard_cache
+    from ..core.telegram_client import telegram_client
+    from ..core import telegram_queue
+    from ..core.merchant_index import merchant_index
+    from ..core.categorization_engine import canonicalize_cache_stats
+    from ..core import token_model
+    from ..webhooks.telegram import state_stats as telegram_state_stats
+
     return {
         "integrations": integrations,
         "recent_errors": recent_errors,
+        "recurring_job": last_run_stats(),
+        "dashboard_cache": dashboard_cache.stats(),
+        "telegram_client": telegram_client.stats(),
+        "telegram_queue": {**telegram_queue.telegram_queue.stats(), "backlog": telegram_queue.backlog(db)},
+        "telegram_state": telegram_state_stats(),
+        "merchant_index": merchant_index.stats(),
+        "canonicalize_cache": canonicalize_cache_stats(),
+        "token_model_cache": token_model.stats(),
     }
 
 
 @router.post('/health/clear-errors')
-async def clear_health_errors(db: Session = Depends(get_db), admin: models.User = Depends(check_admin)):
+def clear_health_errors(db: Session = Depends(get_db), admin: models.User = Depends(check_admin)):
     """Limpa os erros recentes da BD e memória."""
     from ..core.error_buffer import clear_memory_errors
 
@@ -275,8 +296,20 @@ async def clear_health_errors(db: Session = Depends(get_db), admin: models.User
     return {"message": "Erros limpos."}
 
 
+@router.post('/telegram/setup-bot')
+def setup_telegram_bot(admin: models.User = Depends(check_admin)):
+    """Regista no Telegram os comandos (menu /) e a descrição do bot. Corre após alterar a lista de comandos."""
+    from ..webhooks.telegram import setup_bot_commands, setup_bot_info
+
+    if not settings.TELEGRAM_BOT_TOKEN:
+        raise HTTPException(status_code=400, detail='TELEGRAM_BOT_TOKEN não configurado.')
+    setup_bot_commands()
+    setup_bot_info()
+    return {"message": "Comandos e informações do bot Telegram configurados."}
+
+
 @router.get('/project-expenses')
-async def get_project_expenses(db: Session = Depends(get_db), admin: models.User = Depends(check_admin)):
+def get_project_expenses(db: Session = Depends(get_db), admin: models.User = Depends(check_admin)):
     """Lista todas as despesas do projeto (apenas admins)."""
     rows = db.query(models.AdminProjectExpense).order_by(models.AdminProjectExpense.expense_date.desc()).all()
     return [
@@ -292,7 +325,7 @@ async def get_project_expenses(db: Session = Depends(get_db), admin: models.User
 
 
 @router.post('/project-expenses')
-async def create_project_expense(
+def create_project_expense(
     data: schemas.ProjectExpenseCreate,
     request: Request,
     db: Session = Depends(get_db),
@@ -309,12 +342,12 @@ async def create_project_expense(
     db.add(exp)
     db.commit()
     db.refresh(exp)
-    await log_action(db, action='project_expense_create', user_id=admin.id, details=f'Despesa: {data.description}', request=request)
+    log_action(db, action='project_expense_create', user_id=admin.id, details=f'Despesa: {data.description}', request=request)
     return {"id": str(exp.id), "description": exp.description, "amount_cents": exp.amount_cents, "date": exp.expense_date.isoformat(), "created_at": exp.created_at.isoformat()}
 
 
 @router.delete('/project-expenses/{expense_id}')
-async def delete_project_expense(
+def delete_project_expense(
     expense_id: UUID,
     request: Request,
     db: Session = Depends(get_db),
@@ -326,12 +359,12 @@ async def delete_project_expense(
         raise HTTPException(status_code=404, detail="Despesa não encontrada.")
     db.delete(exp)
     db.commit()
-    await log_action(db, action='project_expense_delete', user_id=admin.id, details=f'Removida despesa: {exp.description}', request=request)
+    log_action(db, action='project_expense_delete', user_id=admin.id, details=f'Removida despesa: {exp.description}', request=request)
     return {"message": "Despesa removida."}
 
 
 @router.get('/audit-logs')
-async def get_audit_logs(
+def get_audit_logs(
     page: int = 1, 
     limit: int = 20, 
     action: str = None, 
@@ -371,11 +404,11 @@ async def get_audit_logs(
     }
 
 @router.get('/users', response_model=List[schemas.AdminUserResponse])
-async def get_admin_users(db: Session = Depends(get_db), admin: models.User = Depends(check_admin)):
+def get_admin_users(db: Session = Depends(get_db), admin: models.User = Depends(check_admin)):
     return db.query(models.User).order_by(models.User.created_at.desc()).all()
 
 @router.get('/users/{user_id}', response_model=schemas.AdminUserDetail)
-async def get_user_detail(user_id: UUID, db: Session = Depends(get_db), admin: models.User = Depends(check_admin)):
+def get_user_detail(user_id: UUID, db: Session = Depends(get_db), admin: models.User = Depends(check_admin)):
     user = db.query(models.User).filter(models.User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail='Utilizador não encontrado')
@@ -390,7 +423,7 @@ async def get_user_detail(user_id: UUID, db: Session = Depends(get_db), admin: m
     )
 
 @router.post('/users/{user_id}/toggle-admin')
-async def toggle_admin_status(user_id: UUID, db: Session = Depends(get_db), admin: models.User = Depends(check_admin)):
+def toggle_admin_status(user_id: UUID, db: Session = Depends(get_db), admin: models.User = Depends(check_admin)):
     if user_id == admin.id:
         raise HTTPException(status_code=400, detail='Não podes alterar o teu próprio estado de admin.')
     user = db.query(models.User).filter(models.User.id == user_id).first()
@@ -398,12 +431,13 @@ async def toggle_admin_status(user_id: UUID, db: Session = Depends(get_db), admi
         raise HTTPException(status_code=404, detail='Utilizador não encontrado')
     
     user.is_admin = not user.is_admin
+    user_cache.invalidate_user(user, db)
     db.commit()
     return {'message': f"Admin status for {user.email} updated to {user.is_admin}"}
 
 
 @router.post('/users/{user_id}/grant-pro')
-async def grant_pro_to_user(
+def grant_pro_to_user(
     user_id: UUID,
     body: schemas.GrantProRequest,
     request: Request,
@@ -422,13 +456,14 @@ async def grant_pro_to_user(
     if until <= datetime.now(timezone.utc):
         raise HTTPException(status_code=400, detail='A data deve ser no futuro.')
     user.pro_granted_until = until
+    user_cache.invalidate_user(user, db)
     db.commit()
-    await log_action(db, action='admin_grant_pro', user_id=admin_user.id, details=f'Pro concedido a {user.email} até {until.isoformat()}', request=request)
+    log_action(db, action='admin_grant_pro', user_id=admin_user.id, details=f'Pro concedido a {user.email} até {until.isoformat()}', request=request)
     return {'success': True, 'pro_granted_until': until.isoformat(), 'message': f'Pro concedido até {until.strftime("%Y-%m-%d")}'}
 
 
 @router.post('/users/{user_id}/revoke-pro')
-async def revoke_granted_pro(
+def revoke_granted_pro(
     user_id: UUID,
     request: Request,
     db: Session = Depends(get_db),
@@ -439,12 +474,13 @@ async def revoke_granted_pro(
     if not user:
         raise HTTPException(status_code=404, detail='Utilizador não encontrado')
     user.pro_granted_until = None
+    user_cache.invalidate_user(user, db)
     db.commit()
-    await log_action(db, action='admin_revoke_pro', user_id=admin_user.id, details=f'Pro concedido revogado para {user.email}', request=request)
+    log_action(db, action='admin_revoke_pro', user_id=admin_user.id, details=f'Pro concedido revogado para {user.email}', request=request)
     return {'success': True, 'message': 'Pro concedido revogado.'}
 
 @router.put('/users/{user_id}', response_model=schemas.AdminUserResponse)
-async def update_user_admin(request: Request, user_id: UUID, user_update: schemas.AdminUserUpdate, db: Session = Depends(get_db), admin: models.User = Depends(check_admin)):
+def update_user_admin(request: Request, user_id: UUID, user_update: schemas.AdminUserUpdate, db: Session = Depends(get_db), admin: models.User = Depends(check_admin)):
     user = db.query(models.User).filter(models.User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail='Utilizador não encontrado')
@@ -466,14 +502,15 @@ async def update_user_admin(request: Request, user_id: UUID, user_update: schema
                 raise HTTPException(status_code=409, detail='Email já está em uso.')
         setattr(user, field, value)
     
+    user_cache.invalidate_user(user, db)
     db.commit()
     db.refresh(user)
     
-    await log_action(db, action='admin_user_update', user_id=admin.id, details=f'Updated user: {user.email}', request=request)
+    log_action(db, action='admin_user_update', user_id=admin.id, details=f'Updated user: {user.email}', request=request)
     return user
 
 @router.delete('/users/{user_id}')
-async def delete_user_admin(request: Request, user_id: UUID, db: Session = Depends(get_db), admin: models.User = Depends(check_admin)):
+def delete_user_admin(request: Request, user_id: UUID, db: Session = Depends(get_db), admin: models.User = Depends(check_admin)):
     if user_id == admin.id:
         raise HTTPException(status_code=400, detail='Não podes eliminar o teu próprio utilizador.')
     user = db.query(models.User).filter(models.User.id == user_id).first()
@@ -481,14 +518,16 @@ async def delete_user_admin(request: Request, user_id: UUID, db: Session = Depen
         raise HTTPException(status_code=404, detail='Utilizador não encontrado')
     
     email = user.email
+    user_cache.invalidate_user(user, db)
+    workspace_cache.invalidate_owner(user.id, db)
     db.delete(user)
     db.commit()
     
-    await log_action(db, action='admin_user_delete', user_id=admin.id, details=f'Deleted user: {email}', request=request)
+    log_action(db, action='admin_user_delete', user_id=admin.id, details=f'Deleted user: {email}', request=request)
     return {'message': 'Utilizador eliminado com sucesso'}
 
 @router.get('/settings')
-async def get_system_settings(db: Session = Depends(get_db), admin: models.User = Depends(check_admin)):
+def get_system_settings(db: Session = Depends(get_db), admin: models.User = Depends(check_admin)):
     settings_list = db.query(models.SystemSetting).all()
     return {s.key: s.value for s in settings_list}
 
@@ -507,7 +546,7 @@ ALLOWED_SYSTEM_SETTING_KEYS = {
 
 
 @router.post('/settings')
-async def update_system_setting(data: dict, db: Session = Depends(get_db), admin: models.User = Depends(check_admin)):
+def update_system_setting(data: dict, db: Session = Depends(get_db), admin: models.User = Depends(check_admin)):
     invalid_keys = [k for k in data.keys() if k not in ALLOWED_SYSTEM_SETTING_KEYS]
     if invalid_keys:
         raise HTTPException(
@@ -538,7 +577,7 @@ def _get_commission_setting(db: Session, key: str, default: float, description:
 
 
 @router.get('/affiliates/commission-percentage')
-async def get_commission_percentage(
+def get_commission_percentage(
     db: Session = Depends(get_db),
     admin: models.User = Depends(check_admin)
 ):
@@ -566,8 +605,11 @@ async def update_commission_percentage(
 ):
     """Atualiza as percentagens de comissão por plano (Plus e/ou Pro). Body: { "plus": 20, "pro": 25 }."""
     body = await request.json() if request else {}
-    plus_val = body.get('plus')
-    pro_val = body.get('pro')
+    return await run_blocking(_update_commission_percentages, body.get('plus'), body.get('pro'), db, admin)
+
+
+def _update_commission_percentages(plus_val, pro_val, db: Session, admin: models.User) -> dict:
+    """Valida e grava as percentagens de comissão (threadpool)."""
     if plus_val is None and pro_val is None:
         raise HTTPException(status_code=400, detail='Envia "plus" e/ou "pro" no body (0-100).')
     details_parts = []
@@ -590,7 +632,7 @@ async def update_commission_percentage(
         pro_s.value = str(float(pro_val))
         details_parts.append(f'Pro={pro_val}%')
     db.commit()
-    await log_action(
+    log_action(
         db,
         action='admin_update_commission_percentage',
         user_id=admin.id,
@@ -607,6 +649,11 @@ async def update_commission_percentage(
     pro = float(pro_s.value) if pro_s and pro_s.value else 25.0
     return {"message": "Comissões atualizadas.", "plus": plus, "pro": pro}
 
+def _marketing_recipients(db: Session) -> list:
+    """(email, language) dos utilizadores com marketing opt-in."""
+    return db.query(models.User.email, models.User.language).filter(models.User.marketing_opt_in == True).all()
+
+
 @router.post('/marketing/broadcast')
 async def send_marketing_broadcast(
     request: Request,
@@ -614,21 +661,21 @@ async def send_marketing_broadcast(
     db: Session = Depends(get_db),
     admin: models.User = Depends(check_admin)
 ):
-    # Find all users who opted in for marketing
-    users = db.query(models.User).filter(models.User.marketing_opt_in == True).all()
+    # Find all users who opted in for marketing (só email e idioma; query no threadpool)
+    users = await run_blocking(_marketing_recipients, db)
     
     if not users:
         return {"message": "Nenhum utilizador com marketing opt-in encontrado.", "count": 0}
 
     sent_count = 0
     
-    fm = FastMail(conf)
+    fm = fastapi_mail.FastMail(get_mail_conf())
     
     for user in users:
         try:
             logger.info(f"A preparar envio de broadcast para: {user.email}")
-            # Get user language preference from user model or default to 'pt'
-            user_lang = getattr(user, 'language', 'pt') or 'pt'
+            # Get user language preference or default to 'pt'
+            user_lang = user.language or 'pt'
             # Validate language (only 'pt' or 'en' supported)
             if user_lang not in ['pt', 'en']:
                 user_lang = 'pt'
@@ -653,11 +700,11 @@ async def send_marketing_broadcast(
             </body>
             </html>
             """
-            message = MessageSchema(
+            message = fastapi_mail.MessageSchema(
                 subject=broadcast.subject,
                 recipients=[user.email],
                 body=html,
-                subtype=MessageType.html
+                subtype=fastapi_mail.MessageType.html
             )
             await fm.send_message(message)
             logger.info(f"SUCCESS: Email de broadcast enviado para: {user.email}")
@@ -672,7 +719,8 @@ async def send_marketing_broadcast(
         "sent_count": sent_count
     }, ensure_ascii=False)
 
-    await log_action(
+    await run_blocking(
+        log_action,
         db, 
         action='marketing_broadcast', 
         user_id=admin.id, 
@@ -696,7 +744,7 @@ def generate_affiliate_code() -> str:
             return code
 
 @router.get('/affiliates/users')
-async def get_all_users_for_promotion(
+def get_all_users_for_promotion(
     db: Session = Depends(get_db),
     admin: models.User = Depends(check_admin),
     search: Optional[str] = Query(None, description="Pesquisar por email ou nome")
@@ -721,7 +769,7 @@ async def get_all_users_for_promotion(
     } for u in users]
 
 @router.get('/affiliates', response_model=List[schemas.AdminAffiliateResponse])
-async def get_all_affiliates(
+def get_all_affiliates(
     db: Session = Depends(get_db),
     admin: models.User = Depends(check_admin)
 ):
@@ -760,7 +808,7 @@ async def get_all_affiliates(
     return result
 
 @router.get('/affiliates/top', response_model=List[schemas.AdminAffiliateResponse])
-async def get_top_affiliates(
+def get_top_affiliates(
     limit: int = 3,
     db: Session = Depends(get_db),
     admin: models.User = Depends(check_admin)
@@ -804,7 +852,7 @@ async def get_top_affiliates(
     return result
 
 @router.get('/affiliates/stats')
-async def get_affiliates_stats(
+def get_affiliates_stats(
     affiliate_id: Optional[str] = Query(default=None, description="ID do afiliado para filtrar (opcional)"),
     db: Session = Depends(get_db),
     admin: models.User = Depends(check_admin)
@@ -886,7 +934,7 @@ async def get_affiliates_stats(
         raise HTTPException(status_code=500, detail=f'Erro ao buscar estatísticas: {str(e)}')
 
 @router.get('/affiliates/revenue-timeline')
-async def get_affiliates_revenue_timeline(
+def get_affiliates_revenue_timeline(
     affiliate_id: Optional[str] = Query(default=None, description="ID do afiliado para filtrar (opcional)"),
     db: Session = Depends(get_db),
     admin: models.User = Depends(check_admin)
@@ -969,7 +1017,7 @@ async def get_affiliates_revenue_timeline(
         raise HTTPException(status_code=500, detail=f'Erro ao buscar timeline: {str(e)}')
 
 @router.get('/affiliates/revenue-by-affiliate')
-async def get_revenue_by_affiliate(
+def get_revenue_by_affiliate(
     db: Session = Depends(get_db),
     admin: models.User = Depends(check_admin)
 ):
@@ -1061,7 +1109,7 @@ async def get_revenue_by_affiliate(
         raise HTTPException(status_code=500, detail=f'Erro ao buscar receita: {str(e)}')
 
 @router.get('/affiliates/{user_id}', response_model=schemas.AdminAffiliateDetail)
-async def get_affiliate_detail(
+def get_affiliate_detail(
     user_id: UUID,
     db: Session = Depends(get_db),
     admin: models.User = Depends(check_admin)
@@ -1264,7 +1312,7 @@ def get_affiliate_first_invoices_pending_list(db: Session, limit: int = 80) -> l
 
 
 @router.get('/affiliates/first-invoices-pending')
-async def get_affiliate_first_invoices_pending(
+def get_affiliate_first_invoices_pending(
     limit: int = Query(80, ge=1, le=200),
     db: Session = Depends(get_db),
     admin: models.User = Depends(check_admin)
@@ -1282,7 +1330,7 @@ async def get_affiliate_first_invoices_pending(
 
 
 @router.post('/affiliates/promote', response_model=schemas.AdminAffiliateResponse)
-async def promote_to_affiliate(
+def promote_to_affiliate(
     request: Request,
     promote_data: schemas.PromoteToAffiliateRequest,
     db: Session = Depends(get_db),
@@ -1306,7 +1354,7 @@ async def promote_to_affiliate(
     db.commit()
     db.refresh(user)
     
-    await log_action(
+    log_action(
         db,
         action='admin_promote_affiliate',
         user_id=admin.id,
@@ -1327,7 +1375,7 @@ async def promote_to_affiliate(
     )
 
 @router.post('/affiliates/calculate-monthly')
-async def calculate_monthly_commissions(
+def calculate_monthly_commissions(
     request: Request,
     month: Optional[str] = None,  # Formato: YYYY-MM
     db: Session = Depends(get_db),
@@ -1415,7 +1463,7 @@ async def calculate_monthly_commissions(
     
     db.commit()
     
-    await log_action(
+    log_action(
         db,
         action='admin_calculate_commissions',
         user_id=admin.id,
@@ -1429,6 +1477,45 @@ async def calculate_monthly_commissions(
         'month': month
     }
 
+def _monthly_affiliate_report(db: Session, month_date: date) -> Optional[list]:
+    """
+    Dados dos emails mensais: por comissão do mês com afiliado existente, os totais e as referências
+    que subscreveram no mês ("email - dd/mm/aaaa"). None se não houver comissões no mês.
+    """
+    commissions = db.query(models.AffiliateCommission).filter(
+        models.AffiliateCommission.month == month_date
+    ).all()
+    if not commissions:
+        return None
+    report = []
+    for comm in commissions:
+        affiliate = db.query(models.User).filter(models.User.id == comm.affiliate_id).first()
+        if not affiliate:
+            continue
+        # Buscar referências do mês
+        referrals = db.query(models.AffiliateReferral).filter(
+            and_(
+                models.AffiliateReferral.referrer_id == affiliate.id,
+                models.AffiliateReferral.has_subscribed == True,
+                func.date_trunc('month', models.AffiliateReferral.subscription_date) == month_date
+            )
+        ).all()
+        referral_lines = []
+        for ref in referrals:
+            referred_user = db.query(models.User).filter(models.User.id == ref.referred_user_id).first()
+            referral_lines.append(f"{referred_user.email if referred_user else 'N/A'} - {ref.subscription_date.strftime('%d/%m/%Y') if ref.subscription_date else 'N/A'}")
+        report.append({
+            'email': affiliate.email,
+            'full_name': affiliate.full_name,
+            'code': affiliate.affiliate_code,
+            'revenue_cents': comm.total_revenue_cents,
+            'commission_cents': comm.commission_amount_cents,
+            'conversions': comm.conversions_count,
+            'referrals': referral_lines,
+        })
+    return report
+
+
 @router.post('/affiliates/send-monthly-emails')
 async def send_monthly_affiliate_emails(
     request: Request,
@@ -1449,32 +1536,18 @@ async def send_monthly_affiliate_emails(
     # Buscar email do admin
     admin_email = settings.ADMIN_EMAIL or admin.email
     
-    # Buscar todas as comissões do mês
-    commissions = db.query(models.AffiliateCommission).filter(
-        models.AffiliateCommission.month == month_date
-    ).all()
+    # Comissões do mês, afiliados e referências (BD no threadpool; os emails são enviados aqui)
+    commissions = await run_blocking(_monthly_affiliate_report, db, month_date)
     
-    if not commissions:
+    if commissions is None:
         return {'message': f'Nenhuma comissão encontrada para {month}'}
     
     # Preparar dados para email do admin
-    admin_data = []
-    total_payout = 0
-    for comm in commissions:
-        affiliate = db.query(models.User).filter(models.User.id == comm.affiliate_id).first()
-        if affiliate:
-            admin_data.append({
-                'email': affiliate.email,
-                'full_name': affiliate.full_name or 'N/A',
-                'code': affiliate.affiliate_code,
-                'revenue_cents': comm.total_revenue_cents,
-                'commission_cents': comm.commission_amount_cents,
-                'conversions': comm.conversions_count
-            })
-            total_payout += comm.commission_amount_cents
+    admin_data = [{**data, 'full_name': data['full_name'] or 'N/A'} for data in commissions]
+    total_payout = sum(data['commission_cents'] for data in commissions)
     
     # Enviar email para admin
-    fm = FastMail(conf)
+    fm = fastapi_mail.FastMail(get_mail_conf())
     
     admin_html = f"""
     <!DOCTYPE html>
@@ -1512,11 +1585,11 @@ async def send_monthly_affiliate_emails(
     """
     
     try:
-        admin_message = MessageSchema(
+        admin_message = fastapi_mail.MessageSchema(
             subject=f'Relatório Mensal de Afiliados - {month}',
             recipients=[admin_email],
             body=admin_html,
-            subtype=MessageType.html
+            subtype=fastapi_mail.MessageType.html
         )
         await fm.send_message(admin_message)
         logger.info(f'Email mensal enviado para admin: {admin_email}')
@@ -1525,28 +1598,8 @@ async def send_monthly_affiliate_emails(
     
     # Enviar emails para cada afiliado
     sent_count = 0
-    for comm in commissions:
-        affiliate = db.query(models.User).filter(models.User.id == comm.affiliate_id).first()
-        if not affiliate:
-            continue
-        
-        # Buscar referências do mês
-        referrals = db.query(models.AffiliateReferral).filter(
-            and_(
-                models.AffiliateReferral.referrer_id == affiliate.id,
-                models.AffiliateReferral.has_subscribed == True,
-                func.date_trunc('month', models.AffiliateReferral.subscription_date) == month_date
-            )
-        ).all()
-        
-        user_lang = getattr(affiliate, 'language', 'pt') or 'pt'
-        if user_lang not in ['pt', 'en']:
-            user_lang = 'pt'
-        
-        referrals_list = ""
-        for ref in referrals:
-            referred_user = db.query(models.User).filter(models.User.id == ref.referred_user_id).first()
-            referrals_list += f"<li>{referred_user.email if referred_user else 'N/A'} - {ref.subscription_date.strftime('%d/%m/%Y') if ref.subscription_date else 'N/A'}</li>"
+    for data in commissions:
+        referrals_list = "".join(f"<li>{referral}</li>" for referral in data['referrals'])
         
         affiliate_html = f"""
         <!DOCTYPE html>
@@ -1554,12 +1607,12 @@ async def send_monthly_affiliate_emails(
         <body style="font-family: sans-serif; background-color: #020617; color: #94a3b8; padding: 40px;">
             <div style="max-width: 600px; margin: 0 auto; background-color: #0f172a; border-radius: 24px; padding: 40px; border: 1px solid #1e293b;">
                 <h2 style="color: #ffffff; margin-top: 0;">Relatório Mensal de Afiliado - {month}</h2>
-                <p>Olá {affiliate.full_name or 'Afiliado'},</p>
+                <p>Olá {data['full_name'] or 'Afiliado'},</p>
                 <p>Este é o teu relatório mensal de afiliado:</p>
                 <ul>
-                    <li><strong>Total de conversões:</strong> {comm.conversions_count}</li>
-                    <li><strong>Receita gerada:</strong> €{comm.total_revenue_cents / 100:.2f}</li>
-                    <li><strong>Comissão a receber:</strong> €{comm.commission_amount_cents / 100:.2f}</li>
+                    <li><strong>Total de conversões:</strong> {data['conversions']}</li>
+                    <li><strong>Receita gerada:</strong> €{data['revenue_cents'] / 100:.2f}</li>
+                    <li><strong>Comissão a receber:</strong> €{data['commission_cents'] / 100:.2f}</li>
                 </ul>
                 <h3 style="color: #ffffff;">Utilizadores que subscreveram:</h3>
                 <ul>
@@ -1574,19 +1627,20 @@ async def send_monthly_affiliate_emails(
         """
         
         try:
-            affiliate_message = MessageSchema(
+            affiliate_message = fastapi_mail.MessageSchema(
                 subject=f'Relatório Mensal de Afiliado - {month}',
-                recipients=[affiliate.email],
+                recipients=[data['email']],
                 body=affiliate_html,
-                subtype=MessageType.html
+                subtype=fastapi_mail.MessageType.html
             )
             await fm.send_message(affiliate_message)
             sent_count += 1
-            logger.info(f'Email mensal enviado para afiliado: {affiliate.email}')
+            logger.info(f'Email mensal enviado para afiliado: {data["email"]}')
         except Exception as e:
-            logger.error(f'Erro ao enviar email para afiliado {affiliate.email}: {e}')
+            logger.error(f'Erro ao enviar email para afiliado {data["email"]}: {e}')
     
-    await log_action(
+    await run_blocking(
+        log_action,
         db,
         action='admin_send_monthly_emails',
         user_id=admin.id,
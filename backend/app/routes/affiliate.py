@@ -16,7 +16,8 @@ from ..core.audit import log_action
 from ..core.config import settings
 import secrets
 import logging
-import stripe
+from ..core.lazy_import import lazy_module
+stripe = lazy_module('stripe')  # só importado no primeiro uso, não no arranque do worker
 
 logger = logging.getLogger(__name__)
 
@@ -222,7 +223,7 @@ def generate_affiliate_code() -> str:
             return code
 
 @router.get('/status', response_model=schemas.AffiliateResponse)
-async def get_affiliate_status(
+def get_affiliate_status(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
@@ -290,7 +291,7 @@ async def get_affiliate_status(
     )
 
 @router.post('/request', response_model=schemas.AffiliateResponse)
-async def request_affiliate_status(
+def request_affiliate_status(
     request: Request,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
@@ -363,7 +364,7 @@ async def request_affiliate_status(
     db.commit()
     db.refresh(current_user)
     
-    await log_action(
+    log_action(
         db,
         action='affiliate_approved',
         user_id=current_user.id,
@@ -390,7 +391,7 @@ async def request_affiliate_status(
     )
 
 @router.get('/stats', response_model=schemas.AffiliateStats)
-async def get_affiliate_stats(
+def get_affiliate_stats(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
@@ -640,7 +641,7 @@ async def get_affiliate_stats(
 
 
 @router.get('/export/csv')
-async def export_affiliate_csv(
+def export_affiliate_csv(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
@@ -686,7 +687,7 @@ async def export_affiliate_csv(
 # =====================================================
 
 @router.get('/stripe-connect/onboard')
-async def create_stripe_connect_onboard(
+def create_stripe_connect_onboard(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
@@ -773,7 +774,7 @@ async def create_stripe_connect_onboard(
 
 
 @router.get('/stripe-connect/status')
-async def get_stripe_connect_status(
+def get_stripe_connect_status(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
@@ -853,7 +854,7 @@ async def get_stripe_connect_status(
 
 
 @router.get('/stripe-connect/dashboard')
-async def get_stripe_connect_dashboard(
+def get_stripe_connect_dashboard(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
@@ -901,7 +902,7 @@ async def get_stripe_connect_dashboard(
 
 
 @router.post('/stripe-connect/disconnect')
-async def disconnect_stripe_connect(
+def disconnect_stripe_connect(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
@@ -1,23 +1,25 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request, BackgroundTasks
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, func
+from sqlalchemy import and_, func, select
 from datetime import datetime, timedelta, timezone, date
 from typing import Optional
 import secrets
 import re
 import uuid
-import requests
+from ..core.lazy_import import lazy_module
+requests = lazy_module('requests')  # só importado no primeiro uso, não no arranque do worker
 from jose import jwt, JWTError
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
+fastapi_mail = lazy_module('fastapi_mail')  # só importado no primeiro uso, não no arranque do worker
 import logging
-from ..core import security
+from ..core import security, user_cache, workspace_cache
 from ..core.config import settings
 from ..core.dependencies import get_db
 from ..models import database as models
 from ..schemas import schemas
 from ..core.limiter import limiter
 from ..core.audit import log_action
+from ..core.concurrency import run_blocking
 from ..core.email_translations import get_email_translation
 
 logger = logging.getLogger(__name__)
@@ -44,7 +46,7 @@ async def _send_verification_email_background(to_email: str, subject: str, body_
         return
     mail_user = (getattr(settings, 'MAIL_USERNAME', '') or '').strip()
     mail_from = (getattr(settings, 'MAIL_FROM', '') or '').strip() or mail_user
-    conf = ConnectionConfig(
+    conf = fastapi_mail.ConnectionConfig(
         MAIL_USERNAME=mail_user,
         MAIL_PASSWORD=(getattr(settings, 'MAIL_PASSWORD', '') or '').strip(),
         MAIL_FROM=mail_from,
@@ -56,8 +58,8 @@ async def _send_verification_email_background(to_email: str, subject: str, body_
         VALIDATE_CERTS=True,
         MAIL_FROM_NAME=getattr(settings, 'MAIL_FROM_NAME', 'Finly') or 'Finly',
     )
-    msg = MessageSchema(subject=subject.strip(), recipients=[to_email.strip()], body=body_html, subtype=MessageType.html)
-    fm = FastMail(conf)
+    msg = fastapi_mail.MessageSchema(subject=subject.strip(), recipients=[to_email.strip()], body=body_html, subtype=fastapi_mail.MessageType.html)
+    fm = fastapi_mail.FastMail(conf)
     try:
         await fm.send_message(msg)
         logger.info(f'Email de verificação enviado para {to_email}')
@@ -65,19 +67,24 @@ async def _send_verification_email_background(to_email: str, subject: str, body_
         logger.error(f'Erro ao enviar email de verificação para {to_email}: {e}')
 
 
-def purge_expired_unverified_users(db: Session):
-    """Remove contas não verificadas expiradas (30 min)."""
-    from datetime import datetime, timedelta, timezone
+def purge_expired_unverified_users(db: Session) -> int:
+    """
+    Remove contas não verificadas expiradas (30 min) com DELETE set-based.
+    Usa o índice parcial ix_users_unverified_created_at; corre no job agendado (main.start_scheduler).
+    Workspaces e restantes dependências caem por ON DELETE CASCADE.
+    """
     cutoff = datetime.now(timezone.utc) - timedelta(minutes=VERIFICATION_EXPIRY_MINUTES)
-    expired = db.query(models.User).filter(
+    expired_filter = and_(
         models.User.is_email_verified == False,
         models.User.created_at < cutoff
-    ).all()
-    for u in expired:
-        db.query(models.EmailVerification).filter(models.EmailVerification.email == u.email).delete(synchronize_session=False)
-        db.delete(u)
-    if expired:
-        db.commit()
+    )
+    expired_emails = select(models.User.email).where(expired_filter)
+    db.query(models.EmailVerification).filter(
+        models.EmailVerification.email.in_(expired_emails)
+    ).delete(synchronize_session=False)
+    deleted = db.query(models.User).filter(expired_filter).delete(synchronize_session=False)
+    db.commit()
+    return deleted
 
 def normalize_email(email: str) -> str:
     """Normaliza email: trim, minúsculas e remove ponto final (typo comum)."""
@@ -105,8 +112,8 @@ def validate_password(password: str) -> tuple[bool, str]:
         return False, "A senha deve conter pelo menos um número"
     return True, ""
 
-async def get_current_user(request: Request, db: Session = Depends(get_db), token: str = Depends(security.oauth2_scheme)):
-    purge_expired_unverified_users(db)
+def _token_subject(request: Request, token: str) -> str:
+    """Valida o access token e devolve o subject (email normalizado)."""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail='Could not validate credentials',
@@ -132,13 +139,27 @@ async def get_current_user(request: Request, db: Session = Depends(get_db), toke
     except JWTError as e:
         logger.warning(f'❌ JWTError ao validar token: {str(e)}')
         raise credentials_exception
-    
-    # Lookup por email insensível a maiúsculas (evita contas duplicadas Telegram vs Google)
-    email_normalized = normalize_email(email or "")
+    return normalize_email(email or "")
+
+
+def _load_authenticated_user(db: Session, email_normalized: str) -> models.User:
+    # Lookup por email insensível a maiúsculas (evita contas duplicadas Telegram vs Google); usa ix_users_email_lower
     user = db.query(models.User).filter(func.lower(models.User.email) == email_normalized).first()
     if user is None:
-        logger.warning(f'❌ Token válido mas utilizador não encontrado: {email}')
-        raise credentials_exception
+        logger.warning(f'❌ Token válido mas utilizador não encontrado: {email_normalized}')
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail='Could not validate credentials',
+            headers={'WWW-Authenticate': 'Bearer'}
+        )
+    return user
+
+
+def get_current_user(request: Request, db: Session = Depends(get_db), token: str = Depends(security.oauth2_scheme)):
+    """Utilizador autenticado como objeto ORM (rotas que alteram o utilizador ou precisam de todos os campos)."""
+    email = _token_subject(request, token)
+    user = _load_authenticated_user(db, email)
+    user_cache.store_user(email, user)
     # Block deactivated users
     if not getattr(user, 'is_active', True):
         logger.warning(f'❌ Conta desativada: {email}')
@@ -146,6 +167,43 @@ async def get_current_user(request: Request, db: Session = Depends(get_db), toke
     logger.info(f'✅ Utilizador autenticado: {email}')
     return user
 
+
+def get_current_user_snapshot(request: Request, db: Session = Depends(get_db), token: str = Depends(security.oauth2_scheme)) -> user_cache.UserSnapshot:
+    """
+    Utilizador autenticado como snapshot imutável (core.user_cache) para rotas de leitura:
+    num cache hit não toca na BD. A sessão só abre ligação num miss.
+    """
+    email = _token_subject(request, token)
+    snapshot = user_cache.get_snapshot(email)
+    if snapshot is None:
+        snapshot = user_cache.store_user(email, _load_authenticated_user(db, email))
+    if not snapshot.is_active:
+        logger.warning(f'❌ Conta desativada: {email}')
+        raise HTTPException(status_code=403, detail='Account deactivated')
+    return snapshot
+
+
+def get_current_workspace(
+    current_user: user_cache.UserSnapshot = Depends(get_current_user_snapshot),
+    db: Session = Depends(get_db),
+) -> workspace_cache.WorkspaceRef:
+    """
+    Workspace principal do utilizador (o primeiro por created_at, o mesmo que o import usa),
+    resolvido via core.workspace_cache: num cache hit não há query.
+    """
+    ref = workspace_cache.get_ref(current_user.id)
+    if ref is not None:
+        return ref
+    workspace = (
+        db.query(models.Workspace)
+        .filter(models.Workspace.owner_id == current_user.id)
+        .order_by(models.Workspace.created_at)
+        .first()
+    )
+    if not workspace:
+        raise HTTPException(status_code=404, detail='Workspace not found')
+    return workspace_cache.store_workspace(workspace)
+
 def _purge_expired_registration_verifications(db: Session):
     """Remove códigos de verificação de registo expirados."""
     cutoff = datetime.now(timezone.utc) - timedelta(minutes=15)
@@ -172,50 +230,56 @@ def _get_referrer_by_code(db: Session, code: Optional[str]):
     return referrer, referrer.affiliate_code
 
 
+def _create_registration_verification(user_in: schemas.UserCreate, db: Session):
+    """Valida o pedido de registo e grava o código de verificação (threadpool: BD e hash bcrypt). Devolve (email, código, idioma)."""
+    purge_expired_unverified_users(db)
+    _purge_expired_registration_verifications(db)
+
+    email_normalized = normalize_email(user_in.email)
+    if not validate_email(email_normalized):
+        raise HTTPException(status_code=400, detail='Formato de email inválido.')
+    is_valid, error_msg = validate_password(user_in.password)
+    if not is_valid:
+        raise HTTPException(status_code=400, detail=error_msg)
+
+    db_user = db.query(models.User).filter(models.User.email == email_normalized).first()
+    if db_user:
+        logger.warning(f'Tentativa de registo com email já existente: {email_normalized}')
+        raise HTTPException(status_code=400, detail='Este email já está registado. Inicia sessão na página de login.')
+
+    hashed_pw = security.get_password_hash(user_in.password)
+    referral_code_raw = getattr(user_in, 'referral_code', None)
+    referral_code = (referral_code_raw or '').strip() or None  # guardar limpo
+    user_lang = getattr(user_in, 'language', 'pt') or 'pt'
+    if user_lang not in ['pt', 'en']:
+        user_lang = 'pt'
+
+    # Remover verificação anterior para este email (novo pedido)
+    db.query(models.RegistrationVerification).filter(
+        models.RegistrationVerification.email == email_normalized
+    ).delete(synchronize_session=False)
+
+    code = ''.join([str(secrets.randbelow(10)) for _ in range(6)])
+    expires_at = datetime.now(timezone.utc) + timedelta(minutes=15)
+    rv = models.RegistrationVerification(
+        email=email_normalized,
+        password_hash=hashed_pw,
+        language=user_lang,
+        referral_code=referral_code,
+        code=code,
+        expires_at=expires_at,
+    )
+    db.add(rv)
+    db.commit()
+    return email_normalized, code, user_lang
+
+
 @router.post('/register', response_model=schemas.RegisterPendingResponse)
 @limiter.limit('30/hour')
 async def register(request: Request, user_in: schemas.UserCreate, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
     """Registo: envia código de 6 dígitos por email. O utilizador confirma em POST /register/confirm."""
     try:
-        purge_expired_unverified_users(db)
-        _purge_expired_registration_verifications(db)
-
-        email_normalized = normalize_email(user_in.email)
-        if not validate_email(email_normalized):
-            raise HTTPException(status_code=400, detail='Formato de email inválido.')
-        is_valid, error_msg = validate_password(user_in.password)
-        if not is_valid:
-            raise HTTPException(status_code=400, detail=error_msg)
-
-        db_user = db.query(models.User).filter(models.User.email == email_normalized).first()
-        if db_user:
-            logger.warning(f'Tentativa de registo com email já existente: {email_normalized}')
-            raise HTTPException(status_code=400, detail='Este email já está registado. Inicia sessão na página de login.')
-
-        hashed_pw = security.get_password_hash(user_in.password)
-        referral_code_raw = getattr(user_in, 'referral_code', None)
-        referral_code = (referral_code_raw or '').strip() or None  # guardar limpo
-        user_lang = getattr(user_in, 'language', 'pt') or 'pt'
-        if user_lang not in ['pt', 'en']:
-            user_lang = 'pt'
-
-        # Remover verificação anterior para este email (novo pedido)
-        db.query(models.RegistrationVerification).filter(
-            models.RegistrationVerification.email == email_normalized
-        ).delete(synchronize_session=False)
-
-        code = ''.join([str(secrets.randbelow(10)) for _ in range(6)])
-        expires_at = datetime.now(timezone.utc) + timedelta(minutes=15)
-        rv = models.RegistrationVerification(
-            email=email_normalized,
-            password_hash=hashed_pw,
-            language=user_lang,
-            referral_code=referral_code,
-            code=code,
-            expires_at=expires_at,
-        )
-        db.add(rv)
-        db.commit()
+        email_normalized, code, user_lang = await run_blocking(_create_registration_verification, user_in, db)
 
         t = get_email_translation(user_lang, 'register_verify')
         html = f'''<!DOCTYPE html><html lang="pt"><head><meta charset="utf-8"><meta name="viewport" content="width=device-width,initial-scale=1.0"><style>body,table,td{{margin:0;padding:0;-webkit-text-size-adjust:100%}}img{{border:0;display:block}}table{{border-collapse:collapse}}@media only screen and (max-width:600px){{.mpad{{padding:16px 12px!important}}.card{{max-width:100%!important;width:100%!important;border-radius:20px!important}}.hpad{{padding:28px 20px!important}}.ctpad{{padding:24px 20px 28px!important}}.ctpad h2{{font-size:20px!important}}.codebox{{padding:28px 20px!important}}.code{{font-size:40px!important;letter-spacing:8px!important}}.fpad{{padding:20px 16px!important;font-size:9px!important}}}}</style></head><body style="margin:0;background:#0f172a;font-family:-apple-system,BlinkMacSystemFont,'Segoe UI',Roboto,sans-serif;"><table role="presentation" width="100%" cellspacing="0" cellpadding="0" border="0" style="background:#0f172a;min-height:100vh"><tr><td align="center" class="mpad" style="padding:32px 20px"><table role="presentation" class="card" width="520" cellspacing="0" cellpadding="0" border="0" style="max-width:520px;width:100%;background:#0f172a;border-radius:24px;overflow:hidden;border:1px solid #1e293b;box-shadow:0 25px 50px -12px rgba(0,0,0,.5)"><tr><td style="height:4px;background:linear-gradient(90deg,#10b981 0%,#3b82f6 100%)"></td></tr><tr><td class="hpad" style="background:#020617;padding:36px 28px;text-align:center;border-bottom:1px solid #1e293b"><img src="https://app.finlybot.com/images/logo/logo-semfundo.png" alt="" width="72" height="72" style="display:block;margin:0 auto 8px;width:72px;height:72px;object-fit:contain" /><p style="margin:0;font-size:22px;font-weight:700;color:#fff;letter-spacing:-0.02em">Finly</p></td></tr><tr><td class="ctpad" style="padding:32px 28px 36px;color:#94a3b8;line-height:1.65;font-size:15px;text-align:center"><h2 style="color:#fff;font-size:22px;font-weight:700;margin:0 0 16px;letter-spacing:-0.02em">{t['title']}</h2><p style="margin:0 0 24px;color:#94a3b8">{t['message']}</p><div class="codebox" style="background:#020617;border:2px dashed #1e293b;border-radius:20px;padding:36px 24px;text-align:center;margin:0 0 24px"><p style="margin:0 0 12px;font-size:11px;text-transform:uppercase;letter-spacing:.15em;color:#64748b;font-weight:700">{t['code_label']}</p><p class="code" style="font-size:48px;font-weight:800;color:#10b981;letter-spacing:10px;margin:0;font-family:ui-monospace,monospace">{code}</p></div><p style="margin:0;font-size:12px;color:#64748b;font-style:italic">{t['security_notice']}</p></td></tr><tr><td class="fpad" style="background:#020617;padding:24px 28px;text-align:center;border-top:1px solid #1e293b;color:#475569;font-size:10px;font-weight:700;text-transform:uppercase;letter-spacing:.12em">{t['footer']}</td></tr></table></td></tr></table></body></html>'''
@@ -223,7 +287,7 @@ async def register(request: Request, user_in: schemas.UserCreate, background_tas
         if not (getattr(settings, 'MAIL_USERNAME', '') or '').strip() or not (getattr(settings, 'MAIL_PASSWORD', '') or '').strip():
             logger.warning('MAIL_USERNAME ou MAIL_PASSWORD vazios no .env – o email de verificação pode não ser enviado.')
 
-        conf = ConnectionConfig(
+        conf = fastapi_mail.ConnectionConfig(
             MAIL_USERNAME=(getattr(settings, 'MAIL_USERNAME', '') or '').strip(),
             MAIL_PASSWORD=(getattr(settings, 'MAIL_PASSWORD', '') or '').strip(),
             MAIL_FROM=(getattr(settings, 'MAIL_FROM', '') or '').strip() or (getattr(settings, 'MAIL_USERNAME', '') or '').strip(),
@@ -235,8 +299,8 @@ async def register(request: Request, user_in: schemas.UserCreate, background_tas
             VALIDATE_CERTS=True,
             MAIL_FROM_NAME=getattr(settings, 'MAIL_FROM_NAME', 'Finly') or 'Finly',
         )
-        msg = MessageSchema(subject=t['subject'], recipients=[email_normalized], body=html, subtype=MessageType.html)
-        fm = FastMail(conf)
+        msg = fastapi_mail.MessageSchema(subject=t['subject'], recipients=[email_normalized], body=html, subtype=fastapi_mail.MessageType.html)
+        fm = fastapi_mail.FastMail(conf)
         email_sent = False
         try:
             await fm.send_message(msg)
@@ -254,7 +318,7 @@ async def register(request: Request, user_in: schemas.UserCreate, background_tas
         raise
     except Exception as e:
         logger.error(f'Erro ao processar registo para {user_in.email}: {str(e)}', exc_info=True)
-        db.rollback()
+        await run_blocking(db.rollback)
         raise HTTPException(
             status_code=500,
             detail='Erro interno ao processar registo. Por favor, tente novamente mais tarde.'
@@ -263,7 +327,7 @@ async def register(request: Request, user_in: schemas.UserCreate, background_tas
 
 @router.post('/register/confirm', response_model=schemas.Token)
 @limiter.limit('20/hour')
-async def register_confirm(request: Request, data: schemas.RegisterConfirmRequest, db: Session = Depends(get_db)):
+def register_confirm(request: Request, data: schemas.RegisterConfirmRequest, db: Session = Depends(get_db)):
     """Confirma o registo com email + código de 6 dígitos. Cria o utilizador e devolve tokens."""
     _purge_expired_registration_verifications(db)
     email_normalized = normalize_email(data.email or '')
@@ -328,7 +392,7 @@ async def register_confirm(request: Request, data: schemas.RegisterConfirmReques
     rv.is_used = True
     db.commit()
 
-    await log_action(db, action='register', user_id=user.id, details=f'Registo confirmado: {user.email}', request=request)
+    log_action(db, action='register', user_id=user.id, details=f'Registo confirmado: {user.email}', request=request)
     access_token = security.create_access_token(subject=user.email)
     refresh_token = security.create_refresh_token(subject=user.email)
     return {
@@ -340,7 +404,7 @@ async def register_confirm(request: Request, data: schemas.RegisterConfirmReques
 
 @router.post('/resend-verification')
 @limiter.limit('3/hour')
-async def resend_verification(
+def resend_verification(
     request: Request,
     data: schemas.ResendVerificationRequest,
     background_tasks: BackgroundTasks,
@@ -395,7 +459,7 @@ async def resend_verification(
 
 
 @router.get('/verification-status/{email}')
-async def check_verification_status(email: str, db: Session = Depends(get_db)):
+def check_verification_status(email: str, db: Session = Depends(get_db)):
     purge_expired_unverified_users(db)
     email_norm = normalize_email(email or '')
     user = db.query(models.User).filter(models.User.email == email_norm).first()
@@ -567,7 +631,8 @@ def create_seed_transactions(db: Session, workspace_id: uuid.UUID, categories_ma
                 category_id=category.id,
                 amount_cents=trans_data["amount_cents"],
                 description=trans_data["description"],
-                transaction_date=transaction_date
+                transaction_date=transaction_date,
+                is_seed=True
             )
             db.add(new_transaction)
     
@@ -575,7 +640,7 @@ def create_seed_transactions(db: Session, workspace_id: uuid.UUID, categories_ma
     logger.info(f'Transações de exemplo criadas para workspace {workspace_id}')
 
 @router.get('/verify-email')
-async def verify_email(request: Request, token: str, ref: str = None, db: Session = Depends(get_db)):
+def verify_email(request: Request, token: str, ref: str = None, db: Session = Depends(get_db)):
     token_clean = (token or '').strip()
     if not token_clean:
         raise HTTPException(status_code=400, detail='Link inválido: falta o token de verificação.')
@@ -677,7 +742,7 @@ async def verify_email(request: Request, token: str, ref: str = None, db: Sessio
         categories_map = create_default_categories(db, new_workspace.id, user_lang)
         create_seed_transactions(db, new_workspace.id, categories_map)
         logger.info(f'Utilizador criado e verificado: {user.email}')
-        await log_action(db, action='register_success', user_id=user.id, details=f'Novo utilizador registado: {user.email}', request=request)
+        log_action(db, action='register_success', user_id=user.id, details=f'Novo utilizador registado: {user.email}', request=request)
     else:
         # Usuário já existe - referências só podem ser criadas para contas novas
         user.is_email_verified = True
@@ -700,12 +765,12 @@ async def verify_email(request: Request, token: str, ref: str = None, db: Sessio
     }
 
 @router.get('/me', response_model=schemas.UserResponse)
-async def get_me(current_user: models.User = Depends(get_current_user)):
+def get_me(current_user: models.User = Depends(get_current_user)):
     return current_user
 
 
 @router.post('/spotlight-seen', response_model=schemas.UserResponse)
-async def set_spotlight_seen(
+def set_spotlight_seen(
     current_user: models.User = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
@@ -717,7 +782,7 @@ async def set_spotlight_seen(
 
 
 @router.post('/onboarding', response_model=schemas.UserResponse)
-async def complete_onboarding(request: Request, onboarding_data: schemas.UserUpdateOnboarding, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def complete_onboarding(request: Request, onboarding_data: schemas.UserUpdateOnboarding, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
     # Verificar se o número de telefone já existe noutra conta
     if onboarding_data.phone_number:
         existing_user = db.query(models.User).filter(
@@ -766,6 +831,7 @@ async def complete_onboarding(request: Request, onboarding_data: schemas.UserUpd
         else:
             logger.info(f'ℹ️ Referência já existe para {current_user.email}, não criando duplicado no onboarding')
     
+    user_cache.invalidate_user(current_user, db)
     db.commit()
     db.refresh(current_user)
     
@@ -773,7 +839,7 @@ async def complete_onboarding(request: Request, onboarding_data: schemas.UserUpd
     return current_user
 
 @router.patch('/profile', response_model=schemas.UserResponse)
-async def update_profile(request: Request, onboarding_data: schemas.UserUpdateOnboarding, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def update_profile(request: Request, onboarding_data: schemas.UserUpdateOnboarding, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
     # Verificar se o número de telefone já existe noutra conta
     if onboarding_data.phone_number:
         existing_user = db.query(models.User).filter(
@@ -794,16 +860,17 @@ async def update_profile(request: Request, onboarding_data: schemas.UserUpdateOn
     current_user.marketing_opt_in = onboarding_data.marketing_opt_in
     current_user.is_onboarded = True
     
+    user_cache.invalidate_user(current_user, db)
     db.commit()
     db.refresh(current_user)
     
-    await log_action(db, action='profile_update', user_id=current_user.id, details=f'Perfil atualizado: {current_user.email}', request=request)
+    log_action(db, action='profile_update', user_id=current_user.id, details=f'Perfil atualizado: {current_user.email}', request=request)
     logger.info(f'Utilizador atualizou perfil: {current_user.email}')
     return current_user
 
 
 @router.patch('/email', response_model=schemas.UserResponse)
-async def update_email(request: Request, data: schemas.UserUpdateEmail, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def update_email(request: Request, data: schemas.UserUpdateEmail, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
     if not current_user.password_hash:
         raise HTTPException(status_code=400, detail='Alteração de email não disponível para contas ligadas a redes sociais.')
     if not security.verify_password(data.current_password, current_user.password_hash):
@@ -818,15 +885,16 @@ async def update_email(request: Request, data: schemas.UserUpdateEmail, current_
         raise HTTPException(status_code=400, detail='Este email já está associado a outra conta.')
     current_user.email = new_email_normalized
     current_user.is_email_verified = False
+    user_cache.invalidate_user(current_user, db)
     db.commit()
     db.refresh(current_user)
-    await log_action(db, action='email_update', user_id=current_user.id, details=f'Email alterado para {new_email_normalized}', request=request)
+    log_action(db, action='email_update', user_id=current_user.id, details=f'Email alterado para {new_email_normalized}', request=request)
     logger.info(f'Utilizador alterou email para: {new_email_normalized}')
     return current_user
 
 
 @router.post('/change-password')
-async def change_password(request: Request, data: schemas.UserChangePassword, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def change_password(request: Request, data: schemas.UserChangePassword, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
     if not current_user.password_hash:
         raise HTTPException(status_code=400, detail='Alteração de password não disponível para contas ligadas a redes sociais.')
     if not security.verify_password(data.current_password, current_user.password_hash):
@@ -838,27 +906,28 @@ async def change_password(request: Request, data: schemas.UserChangePassword, cu
         raise HTTPException(status_code=400, detail='A nova password deve ser diferente da atual.')
     current_user.password_hash = security.get_password_hash(data.new_password)
     db.commit()
-    await log_action(db, action='password_change', user_id=current_user.id, details='Password alterada', request=request)
+    log_action(db, action='password_change', user_id=current_user.id, details='Password alterada', request=request)
     logger.info(f'Utilizador alterou password: {current_user.email}')
     return {'message': 'Password alterada com sucesso!'}
 
 
 @router.patch('/language', response_model=schemas.UserResponse)
-async def update_language(request: Request, language_data: schemas.UserUpdateLanguage, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def update_language(request: Request, language_data: schemas.UserUpdateLanguage, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
     # Validate language (only 'pt' or 'en' supported)
     if language_data.language not in ['pt', 'en']:
         raise HTTPException(status_code=400, detail='Idioma não suportado. Use "pt" ou "en".')
     
     current_user.language = language_data.language
+    user_cache.invalidate_user(current_user, db)
     db.commit()
     db.refresh(current_user)
     
-    await log_action(db, action='language_update', user_id=current_user.id, details=f'Idioma atualizado para {language_data.language}: {current_user.email}', request=request)
+    log_action(db, action='language_update', user_id=current_user.id, details=f'Idioma atualizado para {language_data.language}: {current_user.email}', request=request)
     logger.info(f'Utilizador atualizou idioma para {language_data.language}: {current_user.email}')
     return current_user
 
 @router.post('/accept-terms', response_model=schemas.UserResponse)
-async def accept_terms(request: Request, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def accept_terms(request: Request, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
     from datetime import datetime, timezone
     
     current_user.terms_accepted = True
@@ -867,7 +936,7 @@ async def accept_terms(request: Request, current_user: models.User = Depends(get
     db.commit()
     db.refresh(current_user)
     
-    await log_action(db, action='terms_accepted', user_id=current_user.id, details=f'Termos aceites: {current_user.email}', request=request)
+    log_action(db, action='terms_accepted', user_id=current_user.id, details=f'Termos aceites: {current_user.email}', request=request)
     logger.info(f'Utilizador aceitou termos: {current_user.email}')
     return current_user
 
@@ -881,7 +950,7 @@ def _safe_isoformat(d):
 
 
 @router.get('/export-data')
-async def export_user_data(
+def export_user_data(
     current_user: models.User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -939,6 +1008,7 @@ async def export_user_data(
                         'description': t.description if t.description is not None else '',
                         'transaction_date': _safe_isoformat(t.transaction_date),
                         'category_name': category_id_to_name.get(str(t.category_id)) if t.category_id else None,
+                        'is_seed': bool(t.is_seed),
                     }
                     for t in transactions
                 ],
@@ -1016,6 +1086,12 @@ async def import_user_data(
             status_code=400,
             detail='Formato não reconhecido. Usa um ficheiro exportado pelo Finly (Exportar dados da conta).'
         )
+    # Import pode ter milhares de linhas: inserir fora do event loop
+    return await run_blocking(_import_workspaces_data, workspaces_data, current_user, db)
+
+
+def _import_workspaces_data(workspaces_data: list, current_user: models.User, db: Session) -> dict:
+    """Faz merge dos workspaces exportados no primeiro workspace do utilizador (corre no threadpool)."""
     ws = db.query(models.Workspace).filter(models.Workspace.owner_id == current_user.id).order_by(models.Workspace.created_at).first()
     if not ws:
         ws = models.Workspace(owner_id=current_user.id, name='Meu Workspace')
@@ -1065,6 +1141,8 @@ async def import_user_data(
                 amount_cents=amount,
                 description=(t.get('description') or '')[:255],
                 transaction_date=td,
+                # Exportações anteriores ao is_seed: as transações de exemplo eram as de 1 cêntimo
+                is_seed=bool(t['is_seed']) if 'is_seed' in t else abs(amount) == 1,
             )
             db.add(tr)
             stats['transactions'] += 1
@@ -1104,16 +1182,22 @@ async def import_user_data(
             db.add(goal)
             stats['goals'] += 1
     db.commit()
+    if stats['recurring']:
+        # Regras novas: gerar já as do mês corrente (as leituras só o fazem se o marcador estiver atrasado)
+        from .transactions import process_automatic_recurring
+        process_automatic_recurring(db, ws.id)
     logger.info(f'Importação concluída para {current_user.email}: {stats}')
     return {'ok': True, 'message': 'Dados importados com sucesso.', 'imported': stats}
 
 
 @router.delete('/account')
-async def delete_user_account(request: Request, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def delete_user_account(request: Request, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
     try:
         user_email = current_user.email
         # user_id=None: o user vai ser apagado; audit_logs.user_id tem FK CASCADE — gravar com NULL evita violação e o log não é apagado
-        await log_action(db, action='account_delete', user_id=None, details=f'Conta eliminada por utilizador: {user_email}', request=request)
+        log_action(db, action='account_delete', user_id=None, details=f'Conta eliminada por utilizador: {user_email}', request=request)
+        user_cache.invalidate_user(current_user, db)
+        workspace_cache.invalidate_owner(current_user.id, db)
         db.delete(current_user)
         db.commit()
         logger.info(f'Utilizador eliminou a conta: {user_email}')
@@ -1124,7 +1208,7 @@ async def delete_user_account(request: Request, current_user: models.User = Depe
         raise HTTPException(status_code=500, detail='Erro ao eliminar a conta.')
 
 @router.post('/purge-data')
-async def purge_user_data(request: Request, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def purge_user_data(request: Request, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
     try:
         user_email = current_user.email
         user_id = current_user.id
@@ -1132,6 +1216,7 @@ async def purge_user_data(request: Request, current_user: models.User = Depends(
         workspaces = db.query(models.Workspace).filter(models.Workspace.owner_id == user_id).all()
         for ws in workspaces:
             db.delete(ws)
+        workspace_cache.invalidate_owner(user_id, db)
         db.commit()
 
         # Recriar workspace limpo com categorias padrão e seed
@@ -1143,7 +1228,7 @@ async def purge_user_data(request: Request, current_user: models.User = Depends(
         categories_map = create_default_categories(db, new_workspace.id, user_lang)
         create_seed_transactions(db, new_workspace.id, categories_map)
 
-        await log_action(db, action='data_purge', user_id=user_id, details=f'Dados apagados pelo utilizador: {user_email}', request=request)
+        log_action(db, action='data_purge', user_id=user_id, details=f'Dados apagados pelo utilizador: {user_email}', request=request)
         logger.info(f'Dados apagados e workspace recriado para: {user_email}')
         return {'message': 'Data purged successfully'}
     except Exception as e:
@@ -1152,7 +1237,7 @@ async def purge_user_data(request: Request, current_user: models.User = Depends(
         raise HTTPException(status_code=500, detail='Erro ao apagar dados da conta.')
 
 @router.get('/referral-code/validate')
-async def validate_referral_code(code: Optional[str] = None, db: Session = Depends(get_db)):
+def validate_referral_code(code: Optional[str] = None, db: Session = Depends(get_db)):
     """Valida se um código de afiliado existe e está ativo. Público (sem auth)."""
     code_clean = (code or '').strip()
     if not code_clean:
@@ -1163,7 +1248,7 @@ async def validate_referral_code(code: Optional[str] = None, db: Session = Depen
 
 @router.post('/login', response_model=schemas.Token)
 @limiter.limit('5/minute')
-async def login(request: Request, db: Session = Depends(get_db), form_data: OAuth2PasswordRequestForm = Depends()):
+def login(request: Request, db: Session = Depends(get_db), form_data: OAuth2PasswordRequestForm = Depends()):
     email_lower = normalize_email(form_data.username or '')
     user = db.query(models.User).filter(models.User.email == email_lower).first()
     if not user or not user.password_hash or not security.verify_password(form_data.password, user.password_hash):
@@ -1178,7 +1263,7 @@ async def login(request: Request, db: Session = Depends(get_db), form_data: OAut
     user.last_login = datetime.now(timezone.utc)
     db.commit()
     
-    await log_action(db, action='login', user_id=user.id, details=f'Login bem-sucedido: {user.email}', request=request)
+    log_action(db, action='login', user_id=user.id, details=f'Login bem-sucedido: {user.email}', request=request)
     
     access_token = security.create_access_token(subject=user.email)
     refresh_token = security.create_refresh_token(subject=user.email)
@@ -1190,9 +1275,8 @@ async def login(request: Request, db: Session = Depends(get_db), form_data: OAut
         'token_type': 'bearer'
     }
 
-@router.post('/password-reset/request')
-@limiter.limit('3/hour')
-async def request_password_reset(request: Request, data: schemas.PasswordResetRequest, db: Session = Depends(get_db)):
+def _create_password_reset(request: Request, data: schemas.PasswordResetRequest, db: Session):
+    """Grava o código de reset e o log de auditoria (threadpool). Devolve (email, código, idioma do utilizador)."""
     email_norm = normalize_email(data.email or '')
     user = db.query(models.User).filter(models.User.email == email_norm).first()
     if not user:
@@ -1207,11 +1291,16 @@ async def request_password_reset(request: Request, data: schemas.PasswordResetRe
     db.add(reset_obj)
     db.commit()
     
-    await log_action(db, action='password_reset_request', user_id=user.id, details=f'Pedido de reset: {email_norm}', request=request)
-    
+    log_action(db, action='password_reset_request', user_id=user.id, details=f'Pedido de reset: {email_norm}', request=request)
     # Get user language preference from user model (already in database)
     # If language field doesn't exist yet (before migration), default to 'pt'
-    user_lang = getattr(user, 'language', None) or 'pt'
+    return email_norm, code, getattr(user, 'language', None) or 'pt'
+
+
+@router.post('/password-reset/request')
+@limiter.limit('3/hour')
+async def request_password_reset(request: Request, data: schemas.PasswordResetRequest, db: Session = Depends(get_db)):
+    email_norm, code, user_lang = await run_blocking(_create_password_reset, request, data, db)
     # Validate language (only 'pt' or 'en' supported)
     if user_lang not in ['pt', 'en']:
         user_lang = 'pt'
@@ -1220,7 +1309,7 @@ async def request_password_reset(request: Request, data: schemas.PasswordResetRe
     html = f'''<!DOCTYPE html><html lang="pt"><head><meta charset="utf-8"><meta name="viewport" content="width=device-width,initial-scale=1.0"><style>body,table,td{{margin:0;padding:0;-webkit-text-size-adjust:100%}}img{{border:0;display:block}}table{{border-collapse:collapse}}@media only screen and (max-width:600px){{.mpad{{padding:16px 12px!important}}.card{{max-width:100%!important;width:100%!important;border-radius:20px!important}}.hpad{{padding:28px 20px!important}}.ctpad{{padding:24px 20px 28px!important}}.ctpad h2{{font-size:20px!important}}.codebox{{padding:28px 20px!important}}.code{{font-size:40px!important;letter-spacing:8px!important}}.fpad{{padding:20px 16px!important;font-size:9px!important}}}}</style></head><body style="margin:0;background:#0f172a;font-family:-apple-system,BlinkMacSystemFont,'Segoe UI',Roboto,sans-serif;"><table role="presentation" width="100%" cellspacing="0" cellpadding="0" border="0" style="background:#0f172a;min-height:100vh"><tr><td align="center" class="mpad" style="padding:32px 20px"><table role="presentation" class="card" width="520" cellspacing="0" cellpadding="0" border="0" style="max-width:520px;width:100%;background:#0f172a;border-radius:24px;overflow:hidden;border:1px solid #1e293b;box-shadow:0 25px 50px -12px rgba(0,0,0,.5)"><tr><td style="height:4px;background:linear-gradient(90deg,#3b82f6 0%,#6366f1 100%)"></td></tr><tr><td class="hpad" style="background:#020617;padding:36px 28px;text-align:center;border-bottom:1px solid #1e293b"><img src="https://app.finlybot.com/images/logo/logo-semfundo.png" alt="" width="72" height="72" style="display:block;margin:0 auto 8px;width:72px;height:72px;object-fit:contain" /><p style="margin:0;font-size:22px;font-weight:700;color:#fff;letter-spacing:-0.02em">Finly</p></td></tr><tr><td class="ctpad" style="padding:32px 28px 36px;color:#94a3b8;line-height:1.65;font-size:15px;text-align:center"><h2 style="color:#fff;font-size:22px;font-weight:700;margin:0 0 16px;letter-spacing:-0.02em">{t['title']}</h2><p style="margin:0 0 24px;color:#94a3b8">{t['message']}</p><div class="codebox" style="background:#020617;border:2px dashed #1e293b;border-radius:20px;padding:36px 24px;text-align:center;margin:0 0 24px"><p style="margin:0 0 12px;font-size:11px;text-transform:uppercase;letter-spacing:.15em;color:#64748b;font-weight:700">{t['code_label']}</p><p class="code" style="font-size:48px;font-weight:800;color:#3b82f6;letter-spacing:10px;margin:0;font-family:ui-monospace,monospace">{code}</p></div><p style="margin:0;font-size:12px;color:#64748b;font-style:italic">{t['security_notice']}</p></td></tr><tr><td class="fpad" style="background:#020617;padding:24px 28px;text-align:center;border-top:1px solid #1e293b;color:#475569;font-size:10px;font-weight:700;text-transform:uppercase;letter-spacing:.12em">{t['footer']}</td></tr></table></td></tr></table></body></html>'''
     
     _mail_user = (getattr(settings, 'MAIL_USERNAME', '') or '').strip()
-    current_conf = ConnectionConfig(
+    current_conf = fastapi_mail.ConnectionConfig(
         MAIL_USERNAME=_mail_user,
         MAIL_PASSWORD=(getattr(settings, 'MAIL_PASSWORD', '') or '').strip(),
         MAIL_FROM=(getattr(settings, 'MAIL_FROM', '') or '').strip() or _mail_user,
@@ -1233,14 +1322,14 @@ async def request_password_reset(request: Request, data: schemas.PasswordResetRe
         MAIL_FROM_NAME=getattr(settings, 'MAIL_FROM_NAME', 'Finly') or 'Finly',
     )
     
-    message = MessageSchema(
+    message = fastapi_mail.MessageSchema(
         subject=t['subject'],
         recipients=[email_norm],
         body=html,
-        subtype=MessageType.html
+        subtype=fastapi_mail.MessageType.html
     )
     
-    fm = FastMail(current_conf)
+    fm = fastapi_mail.FastMail(current_conf)
     try:
         await fm.send_message(message)
     except Exception as e:
@@ -1249,7 +1338,7 @@ async def request_password_reset(request: Request, data: schemas.PasswordResetRe
     return {'message': 'Código de recuperação enviado para o email.'}
 
 @router.post('/password-reset/verify')
-async def verify_reset_code(request: Request, data: schemas.PasswordResetVerify, db: Session = Depends(get_db)):
+def verify_reset_code(request: Request, data: schemas.PasswordResetVerify, db: Session = Depends(get_db)):
     email_norm = normalize_email(data.email or '')
     reset_obj = db.query(models.PasswordReset).filter(
         models.PasswordReset.email == email_norm,
@@ -1263,12 +1352,12 @@ async def verify_reset_code(request: Request, data: schemas.PasswordResetVerify,
     
     user = db.query(models.User).filter(models.User.email == email_norm).first()
     if user:
-        await log_action(db, action='password_reset_verify', user_id=user.id, details=f'Código verificado: {email_norm}', request=request)
+        log_action(db, action='password_reset_verify', user_id=user.id, details=f'Código verificado: {email_norm}', request=request)
     
     return {'message': 'Código verificado com sucesso.'}
 
 @router.post('/password-reset/confirm')
-async def confirm_password_reset(request: Request, data: schemas.PasswordResetConfirm, db: Session = Depends(get_db)):
+def confirm_password_reset(request: Request, data: schemas.PasswordResetConfirm, db: Session = Depends(get_db)):
     email_norm = normalize_email(data.email or '')
     reset_obj = db.query(models.PasswordReset).filter(
         models.PasswordReset.email == email_norm,
@@ -1293,11 +1382,11 @@ async def confirm_password_reset(request: Request, data: schemas.PasswordResetCo
     reset_obj.is_used = True
     db.commit()
     
-    await log_action(db, action='password_reset_confirm', user_id=user.id, details=f'Password redefinida: {user.email}', request=request)
+    log_action(db, action='password_reset_confirm', user_id=user.id, details=f'Password redefinida: {user.email}', request=request)
     return {'message': 'Password alterada com sucesso!'}
 
 @router.post('/social-login', response_model=schemas.Token)
-async def social_login(request: Request, data: schemas.SocialLoginRequest, db: Session = Depends(get_db)):
+def social_login(request: Request, data: schemas.SocialLoginRequest, db: Session = Depends(get_db)):
     try:
         email = None
         social_id = None
@@ -1412,7 +1501,7 @@ async def social_login(request: Request, data: schemas.SocialLoginRequest, db: S
             db.commit()
         
         try:
-            await log_action(db, action='login_social', user_id=user.id, details=f'Login via {data.provider}: {user.email}', request=request)
+            log_action(db, action='login_social', user_id=user.id, details=f'Login via {data.provider}: {user.email}', request=request)
         except Exception as e:
             logger.warning(f'Erro ao logar ação (não crítico): {str(e)}')
         
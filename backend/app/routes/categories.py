@@ -1,12 +1,15 @@
 from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
 from typing import List
-from ..core.dependencies import get_db
+from ..core.dependencies import get_db, get_async_db
 from ..core.audit import log_action
 from ..models import database as models
 from .. import schemas
-from .auth import get_current_user
+from .auth import get_current_user_snapshot, get_current_workspace
+from ..core.user_cache import UserSnapshot
+from ..core.workspace_cache import WorkspaceRef
 from uuid import UUID
 from datetime import date
 
@@ -24,17 +27,15 @@ def _is_protected_system_category(category_name: str) -> bool:
 
 
 @router.get('/suggestions')
-async def get_category_suggestions(
+def get_category_suggestions(
     request: Request,
     description: str = "",
     tipo: str = "expense",
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: UserSnapshot = Depends(get_current_user_snapshot),
+    workspace: WorkspaceRef = Depends(get_current_workspace),
 ):
     """Retorna scoring detalhado por categoria para debug/UX (motor de categorização)."""
-    workspace = getattr(request.state, 'workspace', None) or db.query(models.Workspace).filter(models.Workspace.owner_id == current_user.id).first()
-    if not workspace:
-        raise HTTPException(status_code=404, detail='Workspace not found')
     categories = db.query(models.Category).filter(models.Category.workspace_id == workspace.id, models.Category.type == tipo).all()
     if not categories:
         return {"scores": [], "inference": None}
@@ -49,7 +50,7 @@ async def get_category_suggestions(
     from ..core.config import settings
     canonical = canonicalize(description)
     tokens = extract_tokens(canonical, n=3)
-    merchant_match = lookup_merchant_registry(description, tipo, db, models)
+    merchant_match = lookup_merchant_registry(description, tipo)
     rule_cat = apply_deterministic_rules(description, tipo)
     category_scores, _ = compute_category_scores_from_tokens(tokens, workspace.id, tipo, db, models)
     cat_id, source, needs_review, conf, reason, explain = infer_category(description, workspace.id, tipo, categories, db, models, settings, use_gemini=False)
@@ -64,54 +65,44 @@ async def get_category_suggestions(
 
 
 @router.get('/', response_model=List[schemas.CategoryResponse])
-async def get_categories(request: Request, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    # Usar workspace cacheado se disponível
-    workspace = getattr(request.state, 'workspace', None)
-    if not workspace:
-        workspace = db.query(models.Workspace).filter(models.Workspace.owner_id == current_user.id).first()
-        if not workspace:
-            raise HTTPException(status_code=404, detail='Workspace not found')
-        request.state.workspace = workspace
-    
-    return db.query(models.Category).filter(models.Category.workspace_id == workspace.id).all()
+async def get_categories(request: Request, db: AsyncSession = Depends(get_async_db), current_user: UserSnapshot = Depends(get_current_user_snapshot), workspace: WorkspaceRef = Depends(get_current_workspace)):
+    return (await db.execute(
+        select(models.Category).where(models.Category.workspace_id == workspace.id)
+    )).scalars().all()
 
 @router.get('/stats', response_model=List[schemas.CategoryStats])
-async def get_category_stats(request: Request, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    # Usar workspace cacheado se disponível
-    workspace = getattr(request.state, 'workspace', None)
-    if not workspace:
-        workspace = db.query(models.Workspace).filter(models.Workspace.owner_id == current_user.id).first()
-        if not workspace:
-            raise HTTPException(status_code=404, detail='Workspace not found')
-        request.state.workspace = workspace
-    
+def get_category_stats(request: Request, db: Session = Depends(get_db), current_user: UserSnapshot = Depends(get_current_user_snapshot), workspace: WorkspaceRef = Depends(get_current_workspace)):
     today = date.today()
     start_of_month = date(today.year, today.month, 1)
     
-    transactions = db.query(models.Transaction).join(models.Category).filter(
-        models.Transaction.workspace_id == workspace.id,
-        models.Transaction.transaction_date >= start_of_month,
+    # Totais do mês por categoria a partir do rollup mensal: O(categorias), não O(transações)
+    rollup = models.WorkspaceCategoryMonth
+    rows = db.query(
+        models.Category,
+        (rollup.credit_cents + rollup.debit_cents).label('total_cents'),
+        (rollup.credit_count + rollup.debit_count).label('tx_count'),
+    ).join(
+        models.Category, models.Category.id == rollup.category_id
+    ).filter(
+        rollup.workspace_id == workspace.id,
+        rollup.month == start_of_month,
         models.Category.type == 'expense',
-        func.abs(models.Transaction.amount_cents) != 1  # Filtrar transações de seed (1 cêntimo)
+        (rollup.credit_count + rollup.debit_count) > 0
     ).all()
     
     # Despesas têm amount_cents negativo; total_monthly_cents será negativo
-    total_monthly_cents = sum(t.amount_cents for t in transactions)
+    total_monthly_cents = sum(int(total_cents) for _, total_cents, _ in rows)
     
     stats = {}
-    for t in transactions:
-        cat_id = str(t.category_id)
-        if cat_id not in stats:
-            stats[cat_id] = {
-                'category_id': t.category_id,
-                'name': t.category.name,
-                'total_spent_cents': 0,
-                'count': 0,
-                'color': t.category.color_hex,
-                'icon': t.category.icon
-            }
-        stats[cat_id]['total_spent_cents'] += t.amount_cents
-        stats[cat_id]['count'] += 1
+    for category, total_cents, tx_count in rows:
+        stats[str(category.id)] = {
+            'category_id': category.id,
+            'name': category.name,
+            'total_spent_cents': int(total_cents),
+            'count': int(tx_count),
+            'color': category.color_hex,
+            'icon': category.icon
+        }
     
     result = []
     total_abs = abs(total_monthly_cents)
@@ -127,13 +118,9 @@ async def get_category_stats(request: Request, db: Session = Depends(get_db), cu
     return result
 
 @router.post('/', response_model=schemas.CategoryResponse)
-async def create_category(request: Request, category_in: schemas.CategoryBase, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def create_category(request: Request, category_in: schemas.CategoryBase, db: Session = Depends(get_db), current_user: UserSnapshot = Depends(get_current_user_snapshot), workspace: WorkspaceRef = Depends(get_current_workspace)):
     if not current_user.has_effective_pro():
         raise HTTPException(status_code=403, detail="Funcionalidade disponível apenas para utilizadores Pro.")
-    workspace = db.query(models.Workspace).filter(models.Workspace.owner_id == current_user.id).first()
-    if not workspace:
-        raise HTTPException(status_code=404, detail='Workspace not found')
-    
     # Bloquear criação de novas categorias de Investimento ou Fundo de Emergência
     if category_in.vault_type in ['investment', 'emergency']:
         existing_special = db.query(models.Category).filter(
@@ -155,7 +142,7 @@ async def create_category(request: Request, category_in: schemas.CategoryBase, d
         db.commit()
         db.refresh(new_category)
         
-        await log_action(db, action='create_category', user_id=current_user.id, details=f'name: {new_category.name}', request=request)
+        log_action(db, action='create_category', user_id=current_user.id, details=f'name: {new_category.name}', request=request)
         return new_category
     except Exception as e:
         db.rollback()
@@ -165,12 +152,9 @@ async def create_category(request: Request, category_in: schemas.CategoryBase, d
         raise HTTPException(status_code=400, detail=f'Erro ao criar categoria: {error_msg}')
 
 @router.patch('/{category_id}', response_model=schemas.CategoryResponse)
-async def update_category(request: Request, category_id: UUID, category_in: schemas.CategoryUpdate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def update_category(request: Request, category_id: UUID, category_in: schemas.CategoryUpdate, db: Session = Depends(get_db), current_user: UserSnapshot = Depends(get_current_user_snapshot), workspace: WorkspaceRef = Depends(get_current_workspace)):
     if not current_user.has_effective_pro():
         raise HTTPException(status_code=403, detail="Funcionalidade disponível apenas para utilizadores Pro.")
-    workspace = db.query(models.Workspace).filter(models.Workspace.owner_id == current_user.id).first()
-    if not workspace:
-        raise HTTPException(status_code=404, detail='Workspace não encontrado')
     db_category = db.query(models.Category).filter(
         models.Category.id == category_id,
         models.Category.workspace_id == workspace.id
@@ -209,16 +193,13 @@ async def update_category(request: Request, category_id: UUID, category_in: sche
     db.commit()
     db.refresh(db_category)
     
-    await log_action(db, action='update_category', user_id=current_user.id, details=f'id: {category_id}', request=request)
+    log_action(db, action='update_category', user_id=current_user.id, details=f'id: {category_id}', request=request)
     return db_category
 
 @router.delete('/{category_id}')
-async def delete_category(request: Request, category_id: UUID, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def delete_category(request: Request, category_id: UUID, db: Session = Depends(get_db), current_user: UserSnapshot = Depends(get_current_user_snapshot), workspace: WorkspaceRef = Depends(get_current_workspace)):
     if not current_user.has_effective_pro():
         raise HTTPException(status_code=403, detail="Funcionalidade disponível apenas para utilizadores Pro.")
-    workspace = db.query(models.Workspace).filter(models.Workspace.owner_id == current_user.id).first()
-    if not workspace:
-        raise HTTPException(status_code=404, detail='Workspace não encontrado')
     db_category = db.query(models.Category).filter(
         models.Category.id == category_id,
         models.Category.workspace_id == workspace.id
@@ -246,17 +227,13 @@ async def delete_category(request: Request, category_id: UUID, db: Session = Dep
     db.delete(db_category)
     db.commit()
     
-    await log_action(db, action='delete_category', user_id=current_user.id, details=f'name: {name}', request=request)
+    log_action(db, action='delete_category', user_id=current_user.id, details=f'name: {name}', request=request)
     return {'message': 'Categoria eliminada com sucesso'}
 
 @router.post('/bulk-delete')
-async def bulk_delete_categories(request: Request, category_ids: List[UUID], db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def bulk_delete_categories(request: Request, category_ids: List[UUID], db: Session = Depends(get_db), current_user: UserSnapshot = Depends(get_current_user_snapshot), workspace: WorkspaceRef = Depends(get_current_workspace)):
     if not current_user.has_effective_pro():
         raise HTTPException(status_code=403, detail="Funcionalidade disponível apenas para utilizadores Pro.")
-    workspace = db.query(models.Workspace).filter(models.Workspace.owner_id == current_user.id).first()
-    if not workspace:
-        raise HTTPException(status_code=404, detail='Workspace not found')
-    
     categories = db.query(models.Category).filter(
         models.Category.id.in_(category_ids),
         models.Category.workspace_id == workspace.id
@@ -292,7 +269,7 @@ async def bulk_delete_categories(request: Request, category_ids: List[UUID], db:
     
     db.commit()
     
-    await log_action(db, action='bulk_delete_categories', user_id=current_user.id, details=f'deleted: {deleted_count}, errors: {len(errors)}', request=request)
+    log_action(db, action='bulk_delete_categories', user_id=current_user.id, details=f'deleted: {deleted_count}, errors: {len(errors)}', request=request)
     
     return {
         'message': f'{deleted_count} categorias eliminadas com sucesso.',
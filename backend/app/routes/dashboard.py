@@ -1,17 +1,20 @@
 """
 Dashboard endpoints - Endpoints otimizados para o dashboard
 """
-from fastapi import APIRouter, Depends, HTTPException, Request
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func
+from fastapi import APIRouter, Depends, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
 from typing import List
 from datetime import datetime, timedelta, date
-from ..core.dependencies import get_db
+from ..core.dependencies import get_async_db
 from ..models import database as models
 from .. import schemas
 from ..core.financial_engine import FinancialEngine, FinancialSnapshot
-from .auth import get_current_user
-from .transactions import process_automatic_recurring
+from .auth import get_current_user_snapshot, get_current_workspace
+from ..core.user_cache import UserSnapshot
+from ..core.workspace_cache import WorkspaceRef
+from ..core import dashboard_cache, data_version
+from .transactions import ensure_recurring_processed
 
 router = APIRouter(prefix='/dashboard', tags=['dashboard'])
 
@@ -31,8 +34,10 @@ def _last_day_of_month(y: int, m: int) -> date:
 @router.get('/snapshot', response_model=schemas.DashboardSnapshotResponse)
 async def get_dashboard_snapshot(
     request: Request,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserSnapshot = Depends(get_current_user_snapshot),
+    workspace: WorkspaceRef = Depends(get_current_workspace),
     include_collections: bool = True,  # Parâmetro para controlar se retorna collections
     year: int | None = None,   # Ano do mês a filtrar (ex: 2025)
     month: int | None = None   # Mês 1-12
@@ -47,55 +52,55 @@ async def get_dashboard_snapshot(
     Parâmetros:
     - include_collections: Se False, retorna apenas snapshot (útil para mobile/analytics)
     - year, month: Se ambos presentes, snapshot e collections limitam-se a esse mês (1-12).
+    
+    Cache: a resposta é guardada por (workspace, versão dos dados, ano, mês, include_collections);
+    a ETag vem da mesma chave e If-None-Match igual devolve 304 sem recalcular.
     """
-    # Buscar workspace (com cache se disponível)
-    workspace = getattr(request.state, 'workspace', None)
-    if not workspace:
-        workspace = db.query(models.Workspace).filter(
-            models.Workspace.owner_id == current_user.id
-        ).first()
-        if not workspace:
-            raise HTTPException(status_code=404, detail='Workspace not found')
-        request.state.workspace = workspace  # Cache no request
+    # Recorrentes: só processa se o job noturno ainda não pôs o workspace em dia
+    await db.run_sync(ensure_recurring_processed, workspace)
     
-    # Processar recurring automático
-    process_automatic_recurring(db, workspace.id)
+    # Versão lida depois das recorrentes (que a podem incrementar)
+    version = await db.run_sync(data_version.current, workspace.id)
+    selected_month = year is not None and month is not None and 1 <= month <= 12
+    cache_key = dashboard_cache.DashboardKey(
+        workspace_id=workspace.id,
+        version=version,
+        year=year if selected_month else None,
+        month=month if selected_month else None,
+        include_collections=include_collections,
+        today=date.today(),
+        currency=current_user.currency,
+    )
+    cache_headers = {'ETag': cache_key.etag, 'Cache-Control': 'private, no-cache'}
+    if dashboard_cache.etag_matches(request.headers.get('if-none-match'), cache_key.etag):
+        dashboard_cache.record_not_modified()
+        return Response(status_code=304, headers=cache_headers)
+    response.headers.update(cache_headers)
+    cached = dashboard_cache.get(cache_key)
+    if cached is not None:
+        return cached
     
     # Período opcional (mês selecionado)
     period_start_arg: date | None = None
     period_end_arg: date | None = None
-    if year is not None and month is not None and 1 <= month <= 12:
+    if selected_month:
         period_start_arg = _first_day_of_month(year, month)
         period_end_arg = _last_day_of_month(year, month)
     
-    base_q = (
-        db.query(models.Transaction)
-        .options(joinedload(models.Transaction.category))
-        .filter(
-            models.Transaction.workspace_id == workspace.id,
-            func.abs(models.Transaction.amount_cents) != 1
-        )
-    )
-    if period_start_arg is not None and period_end_arg is not None:
-        base_q = base_q.filter(
-            models.Transaction.transaction_date >= period_start_arg,
-            models.Transaction.transaction_date <= period_end_arg
-        )
-    
-    transactions = base_q.order_by(models.Transaction.transaction_date.desc()).limit(500).all()
-    
     # Buscar todas as categorias
-    categories = db.query(models.Category).filter(
-        models.Category.workspace_id == workspace.id
-    ).all()
+    categories = (await db.execute(
+        select(models.Category).where(models.Category.workspace_id == workspace.id)
+    )).scalars().all()
     
-    # Calcular snapshot financeiro (fonte única de verdade)
-    snapshot = FinancialEngine.calculate_snapshot(
-        transactions=transactions,
-        categories=categories,
-        workspace=workspace,
-        period_start=period_start_arg,
-        period_end=period_end_arg
+    # Calcular snapshot financeiro (fonte única de verdade): somas na BD sobre todo o histórico
+    # do período, sem carregar transações (antes limitado às últimas 500)
+    snapshot = await db.run_sync(
+        lambda sync_db: FinancialEngine.calculate_snapshot_sql(
+            sync_db,
+            workspace,
+            period_start=period_start_arg,
+            period_end=period_end_arg
+        )
     )
     
     # Dias restantes e daily allowance (só faz sentido para o mês atual)
@@ -141,12 +146,23 @@ async def get_dashboard_snapshot(
     collections = None
     if include_collections:
         # Buscar recurring transactions (apenas se necessário)
-        recurring = db.query(models.RecurringTransaction).filter(
-            models.RecurringTransaction.workspace_id == workspace.id
-        ).all()
+        recurring = (await db.execute(
+            select(models.RecurringTransaction).where(models.RecurringTransaction.workspace_id == workspace.id)
+        )).scalars().all()
         
-        # Retornar apenas últimas 10 transações para o dashboard (UI específica)
-        recent_transactions = transactions[:10]
+        # Apenas as últimas 10 transações para o dashboard (UI específica)
+        recent_q = select(models.Transaction).where(
+            models.Transaction.workspace_id == workspace.id,
+            ~models.Transaction.is_seed
+        )
+        if period_start_arg is not None and period_end_arg is not None:
+            recent_q = recent_q.where(
+                models.Transaction.transaction_date >= period_start_arg,
+                models.Transaction.transaction_date <= period_end_arg
+            )
+        recent_transactions = (await db.execute(
+            recent_q.order_by(models.Transaction.transaction_date.desc()).limit(10)
+        )).scalars().all()
         
         collections = schemas.DashboardCollectionsResponse(
             recent_transactions=recent_transactions,
@@ -161,10 +177,12 @@ async def get_dashboard_snapshot(
             recurring=[]
         )
     
-    return schemas.DashboardSnapshotResponse(
+    result = schemas.DashboardSnapshotResponse(
         version="1.0",
         snapshot=snapshot_response,
         collections=collections,
         currency=current_user.currency
     )
+    dashboard_cache.store(cache_key, result)
+    return result
 
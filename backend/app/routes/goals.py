@@ -5,27 +5,21 @@ from datetime import date
 from ..core.dependencies import get_db
 from ..models import database as models
 from .. import schemas
-from .auth import get_current_user
+from .auth import get_current_user_snapshot, get_current_workspace
+from ..core.user_cache import UserSnapshot
+from ..core.workspace_cache import WorkspaceRef
 from uuid import UUID
 
 router = APIRouter(prefix='/goals', tags=['goals'])
 
 @router.get('/', response_model=List[schemas.SavingsGoalResponse])
-async def get_goals(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    workspace = db.query(models.Workspace).filter(models.Workspace.owner_id == current_user.id).order_by(models.Workspace.created_at).first()
-    if not workspace:
-        raise HTTPException(status_code=404, detail='Workspace not found')
-    
+def get_goals(db: Session = Depends(get_db), current_user: UserSnapshot = Depends(get_current_user_snapshot), workspace: WorkspaceRef = Depends(get_current_workspace)):
     return db.query(models.SavingsGoal).filter(models.SavingsGoal.workspace_id == workspace.id).all()
 
 @router.post('/', response_model=schemas.SavingsGoalResponse)
-async def create_goal(goal: schemas.SavingsGoalCreate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def create_goal(goal: schemas.SavingsGoalCreate, db: Session = Depends(get_db), current_user: UserSnapshot = Depends(get_current_user_snapshot), workspace: WorkspaceRef = Depends(get_current_workspace)):
     if not current_user.has_effective_pro():
         raise HTTPException(status_code=403, detail="Funcionalidade disponível apenas para utilizadores Pro.")
-    workspace = db.query(models.Workspace).filter(models.Workspace.owner_id == current_user.id).order_by(models.Workspace.created_at).first()
-    if not workspace:
-        raise HTTPException(status_code=404, detail='Workspace not found')
-    
     db_goal = models.SavingsGoal(**goal.model_dump(), workspace_id=workspace.id)
     db.add(db_goal)
     db.commit()
@@ -33,12 +27,9 @@ async def create_goal(goal: schemas.SavingsGoalCreate, db: Session = Depends(get
     return db_goal
 
 @router.patch('/{goal_id}', response_model=schemas.SavingsGoalResponse)
-async def update_goal(goal_id: UUID, goal_update: schemas.SavingsGoalUpdate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def update_goal(goal_id: UUID, goal_update: schemas.SavingsGoalUpdate, db: Session = Depends(get_db), current_user: UserSnapshot = Depends(get_current_user_snapshot), workspace: WorkspaceRef = Depends(get_current_workspace)):
     if not current_user.has_effective_pro():
         raise HTTPException(status_code=403, detail="Funcionalidade disponível apenas para utilizadores Pro.")
-    workspace = db.query(models.Workspace).filter(models.Workspace.owner_id == current_user.id).order_by(models.Workspace.created_at).first()
-    if not workspace:
-        raise HTTPException(status_code=404, detail='Workspace not found')
     db_goal = db.query(models.SavingsGoal).filter(models.SavingsGoal.id == goal_id, models.SavingsGoal.workspace_id == workspace.id).first()
     
     if not db_goal:
@@ -53,12 +44,9 @@ async def update_goal(goal_id: UUID, goal_update: schemas.SavingsGoalUpdate, db:
     return db_goal
 
 @router.delete('/{goal_id}')
-async def delete_goal(goal_id: UUID, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def delete_goal(goal_id: UUID, db: Session = Depends(get_db), current_user: UserSnapshot = Depends(get_current_user_snapshot), workspace: WorkspaceRef = Depends(get_current_workspace)):
     if not current_user.has_effective_pro():
         raise HTTPException(status_code=403, detail="Funcionalidade disponível apenas para utilizadores Pro.")
-    workspace = db.query(models.Workspace).filter(models.Workspace.owner_id == current_user.id).order_by(models.Workspace.created_at).first()
-    if not workspace:
-        raise HTTPException(status_code=404, detail='Workspace not found')
     db_goal = db.query(models.SavingsGoal).filter(models.SavingsGoal.id == goal_id, models.SavingsGoal.workspace_id == workspace.id).first()
     
     if not db_goal:
@@ -70,18 +58,16 @@ async def delete_goal(goal_id: UUID, db: Session = Depends(get_db), current_user
 
 
 @router.post('/{goal_id}/deposit', response_model=schemas.SavingsGoalResponse)
-async def deposit_into_goal(
+def deposit_into_goal(
     goal_id: UUID,
     body: dict,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: UserSnapshot = Depends(get_current_user_snapshot),
+    workspace: WorkspaceRef = Depends(get_current_workspace),
     ):
     if not current_user.has_effective_pro():
         raise HTTPException(status_code=403, detail="Funcionalidade disponível apenas para utilizadores Pro.")
     """Adicionar dinheiro à meta (cofre). Cria uma despesa para refletir o valor retirado do saldo disponível."""
-    workspace = db.query(models.Workspace).filter(models.Workspace.owner_id == current_user.id).order_by(models.Workspace.created_at).first()
-    if not workspace:
-        raise HTTPException(status_code=404, detail='Workspace not found')
     db_goal = db.query(models.SavingsGoal).filter(
         models.SavingsGoal.id == goal_id,
         models.SavingsGoal.workspace_id == workspace.id,
@@ -106,11 +92,12 @@ async def deposit_into_goal(
 
 
 @router.post('/{goal_id}/close')
-async def close_goal(
+def close_goal(
     goal_id: UUID,
     body: dict = Body(default=None),
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: UserSnapshot = Depends(get_current_user_snapshot),
+    workspace: WorkspaceRef = Depends(get_current_workspace),
     ):
     if not current_user.has_effective_pro():
         raise HTTPException(status_code=403, detail="Funcionalidade disponível apenas para utilizadores Pro.")
@@ -120,9 +107,6 @@ async def close_goal(
     transaction_type = (body.get('transaction_type') or 'income').lower()
     if transaction_type not in ('income', 'expense'):
         transaction_type = 'income'
-    workspace = db.query(models.Workspace).filter(models.Workspace.owner_id == current_user.id).order_by(models.Workspace.created_at).first()
-    if not workspace:
-        raise HTTPException(status_code=404, detail='Workspace not found')
     db_goal = db.query(models.SavingsGoal).filter(
         models.SavingsGoal.id == goal_id,
         models.SavingsGoal.workspace_id == workspace.id,
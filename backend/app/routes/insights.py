@@ -1,24 +1,28 @@
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, Request
 from starlette.requests import Request
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
 from datetime import datetime, timedelta, date
 from typing import List, Dict, Tuple, Optional
 import random
 from collections import defaultdict
-from ..core.dependencies import get_db
+from ..core.dependencies import get_db, get_async_db
 from ..models import database as models
 from .. import schemas
-from .auth import get_current_user
-from .transactions import process_automatic_recurring
+from .auth import get_current_user_snapshot, get_current_workspace
+from ..core.user_cache import UserSnapshot
+from ..core.workspace_cache import WorkspaceRef
+from .transactions import ensure_recurring_processed
 
 router = APIRouter(prefix='/insights', tags=['insights'])
 
 @router.get('/', response_model=schemas.ZenInsightsResponse)
-async def get_zen_insights(
+def get_zen_insights(
     request: Request,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: UserSnapshot = Depends(get_current_user_snapshot),
+    workspace: WorkspaceRef = Depends(get_current_workspace)
 ):
     header_lang = (request.headers.get('accept-language') or '').lower()
     user_lang = (getattr(current_user, 'language', None) or 'pt').lower()
@@ -27,19 +31,15 @@ async def get_zen_insights(
     def tr(pt: str, en: str) -> str:
         return en if is_en else pt
 
-    workspace = db.query(models.Workspace).filter(models.Workspace.owner_id == current_user.id).first()
-    if not workspace:
-        raise HTTPException(status_code=404, detail='Workspace not found')
-    
-    process_automatic_recurring(db, workspace.id)
+    ensure_recurring_processed(db, workspace)
     
     thirty_days_ago = datetime.now() - timedelta(days=30)
     
-    # Filtrar transações de seed (1 cêntimo) diretamente na query SQL - muito mais rápido
+    # Filtrar transações de seed diretamente na query SQL (índice parcial WHERE NOT is_seed)
     transactions = db.query(models.Transaction).filter(
         models.Transaction.workspace_id == workspace.id,
         models.Transaction.transaction_date >= thirty_days_ago.date(),
-        func.abs(models.Transaction.amount_cents) != 1
+        ~models.Transaction.is_seed
     ).all()
     
     categories = db.query(models.Category).filter(
@@ -80,18 +80,18 @@ async def get_zen_insights(
     this_month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
     last_month_start = (this_month_start - timedelta(days=1)).replace(day=1)
     
-    # Filtrar transações de seed (1 cêntimo) diretamente na query SQL - muito mais rápido
+    # Filtrar transações de seed diretamente na query SQL (índice parcial WHERE NOT is_seed)
     this_month_transactions = db.query(models.Transaction).filter(
         models.Transaction.workspace_id == workspace.id,
         models.Transaction.transaction_date >= this_month_start.date(),
-        func.abs(models.Transaction.amount_cents) != 1
+        ~models.Transaction.is_seed
     ).all()
     
     last_month_transactions = db.query(models.Transaction).filter(
         models.Transaction.workspace_id == workspace.id,
         models.Transaction.transaction_date >= last_month_start.date(),
         models.Transaction.transaction_date < this_month_start.date(),
-        func.abs(models.Transaction.amount_cents) != 1
+        ~models.Transaction.is_seed
     ).all()
     
     this_income, this_expenses, this_vault, this_expenses_by_cat = calculate_totals(this_month_transactions)
@@ -357,7 +357,7 @@ async def get_zen_insights(
     historical_transactions = db.query(models.Transaction).filter(
         models.Transaction.workspace_id == workspace.id,
         models.Transaction.transaction_date >= twelve_months_ago.date(),
-        func.abs(models.Transaction.amount_cents) != 1
+        ~models.Transaction.is_seed
     ).order_by(models.Transaction.transaction_date.asc()).all()
     
     # Obter transações recorrentes para incluir nas previsões
@@ -912,38 +912,30 @@ async def get_zen_insights(
 @router.get('/composite', response_model=schemas.AnalyticsCompositeResponse)
 async def get_analytics_composite(
     request: Request,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserSnapshot = Depends(get_current_user_snapshot),
+    workspace: WorkspaceRef = Depends(get_current_workspace)
 ):
-    # Usar workspace cacheado se disponível
-    workspace = getattr(request.state, 'workspace', None)
-    if not workspace:
-        workspace = db.query(models.Workspace).filter(models.Workspace.owner_id == current_user.id).first()
-        if not workspace:
-            raise HTTPException(status_code=404, detail='Workspace not found')
-        request.state.workspace = workspace
-    
-    process_automatic_recurring(db, workspace.id)
-    
-    zen_insights = await get_zen_insights(request, db, current_user)
-    
-    # Filtrar transações de seed (1 cêntimo) diretamente na query SQL - muito mais rápido
-    # Usar eager loading para evitar N+1 queries; limitar a 2000 transações para performance
-    from sqlalchemy.orm import joinedload
-    transactions = db.query(models.Transaction).options(
-        joinedload(models.Transaction.category)
-    ).filter(
-        models.Transaction.workspace_id == workspace.id,
-        func.abs(models.Transaction.amount_cents) != 1
-    ).order_by(models.Transaction.transaction_date.desc()).limit(2000).all()
-    
-    categories = db.query(models.Category).filter(
-        models.Category.workspace_id == workspace.id
-    ).all()
-    
-    recurring = db.query(models.RecurringTransaction).filter(
-        models.RecurringTransaction.workspace_id == workspace.id
-    ).all()
+    # get_zen_insights usa a API ORM síncrona; run_sync corre-a sobre a ligação asyncpg.
+    # Também põe as recorrentes em dia (ensure_recurring_processed), não repetir aqui.
+    zen_insights = await db.run_sync(lambda sync_db: get_zen_insights(request, sync_db, current_user, workspace))
+    
+    # Filtrar transações de seed diretamente na query SQL (índice parcial WHERE NOT is_seed)
+    # Limitar a 2000 transações para performance
+    transactions = (await db.execute(
+        select(models.Transaction).where(
+            models.Transaction.workspace_id == workspace.id,
+            ~models.Transaction.is_seed
+        ).order_by(models.Transaction.transaction_date.desc()).limit(2000)
+    )).scalars().all()
+    
+    categories = (await db.execute(
+        select(models.Category).where(models.Category.workspace_id == workspace.id)
+    )).scalars().all()
+    
+    recurring = (await db.execute(
+        select(models.RecurringTransaction).where(models.RecurringTransaction.workspace_id == workspace.id)
+    )).scalars().all()
     
     return schemas.AnalyticsCompositeResponse(
         transactions=transactions,
@@ -952,4 +944,3 @@ async def get_analytics_composite(
         recurring=recurring,
         currency=current_user.currency
     )
-
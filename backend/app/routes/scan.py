@@ -4,9 +4,10 @@ import json
 import re
 from datetime import datetime
 from ..core.config import settings
+from ..core.concurrency import run_blocking
 from ..core.dependencies import get_db
-from .auth import get_current_user
-from ..models.database import User
+from .auth import get_current_user_snapshot
+from ..core.user_cache import UserSnapshot
 from typing import Literal
 from pydantic import BaseModel, Field
 
@@ -27,10 +28,31 @@ class ScanResponse(BaseModel):
     category_suggestion: str = Field(..., description="Sugestão de categoria")
 
 
+def _call_openai_vision(prompt: str, data_url: str):
+    """Chamada bloqueante ao modelo de visão; corre no threadpool."""
+    from openai import OpenAI
+    client = OpenAI(api_key=settings.OPENAI_API_KEY)
+
+    return client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=[
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": prompt},
+                    {"type": "image_url", "image_url": {"url": data_url}},
+                ],
+            }
+        ],
+        max_tokens=500,
+        temperature=0.1,
+    )
+
+
 @router.post("/", response_model=ScanResponse)
 async def scan_receipt(
     file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user)
+    current_user: UserSnapshot = Depends(get_current_user_snapshot)
 ) -> ScanResponse:
     if not current_user.has_effective_pro():
         raise HTTPException(status_code=403, detail="Funcionalidade disponível apenas para utilizadores Pro.")
@@ -71,23 +93,8 @@ RESPONDE APENAS COM UM JSON PURO. NÃO ADICIONES COMENTÁRIOS OU MARKDOWN.
         b64 = base64.b64encode(content).decode("utf-8")
         data_url = f"data:{file.content_type};base64,{b64}"
 
-        from openai import OpenAI
-        client = OpenAI(api_key=settings.OPENAI_API_KEY)
-
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt},
-                        {"type": "image_url", "image_url": {"url": data_url}},
-                    ],
-                }
-            ],
-            max_tokens=500,
-            temperature=0.1,
-        )
+        # Chamada síncrona ao OpenAI (pode demorar vários segundos) fora do event loop
+        response = await run_blocking(_call_openai_vision, prompt, data_url)
 
         text_response = ""
         if response.choices and response.choices[0].message.content:
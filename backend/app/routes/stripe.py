@@ -1,8 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException, Request, Header
 from sqlalchemy.orm import Session
-import stripe
+from ..core.lazy_import import lazy_module
+stripe = lazy_module('stripe')  # só importado no primeiro uso, não no arranque do worker
 from datetime import datetime, timezone, timedelta
 from ..core.config import settings
+from ..core import user_cache
 from ..core.dependencies import get_db
 from ..core.affiliate_commission import get_commission_percentage_for_price_id
 from ..models import database as models
@@ -25,7 +27,7 @@ def _charge_amount_with_stripe_fee(base_cents: int) -> int:
     return int(math.ceil((base_cents + 25) / 0.985))
 
 @router.post('/create-checkout-session')
-async def create_checkout_session(price_id: str, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def create_checkout_session(price_id: str, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
     try:
         logger.info(f'[Checkout] Início: user_id={current_user.id} email={current_user.email} referrer_id={current_user.referrer_id} price_id={price_id}')
         customer_id = current_user.stripe_customer_id
@@ -280,7 +282,7 @@ def _get_connect_params_for_subscription(user: models.User, price_id: str, db: S
 
 
 @router.post('/change-plan')
-async def change_plan(price_id: str, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def change_plan(price_id: str, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
     """Altera o plano da subscrição ativa do utilizador para o novo price_id (upgrade/downgrade com proration)."""
     try:
         if not current_user.stripe_subscription_id:
@@ -312,6 +314,7 @@ async def change_plan(price_id: str, db: Session = Depends(get_db), current_user
         # Atualizar localmente para resposta imediata (o webhook subscription.updated também atualiza)
         sub_after = stripe.Subscription.retrieve(current_user.stripe_subscription_id)
         current_user.subscription_status = sub_after.status
+        user_cache.invalidate_user(current_user, db)
         db.commit()
         logger.info(f'Plano alterado para price_id={price_id} para user {current_user.email}')
         return {'success': True, 'message': 'Plano alterado.', 'subscription_status': sub_after.status}
@@ -325,7 +328,7 @@ async def change_plan(price_id: str, db: Session = Depends(get_db), current_user
         raise HTTPException(status_code=500, detail='Erro ao alterar plano.')
 
 @router.post('/portal')
-async def customer_portal(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def customer_portal(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
     try:
         if not current_user.stripe_customer_id:
             raise HTTPException(
@@ -361,7 +364,7 @@ async def customer_portal(db: Session = Depends(get_db), current_user: models.Us
         )
 
 @router.get('/verify-session/{session_id}')
-async def verify_checkout_session(session_id: str, current_user: models.User = Depends(get_current_user)):
+def verify_checkout_session(session_id: str, current_user: models.User = Depends(get_current_user)):
     """Verifica o status de uma sessão de checkout e atualiza a subscrição do utilizador"""
     try:
         # Buscar a sessão do Stripe
@@ -394,6 +397,7 @@ async def verify_checkout_session(session_id: str, current_user: models.User = D
                     if user:
                         user.stripe_subscription_id = subscription_id
                         user.subscription_status = subscription_status
+                        user_cache.invalidate_user(user, db)
                         session_customer = getattr(session, 'customer', None)
                         if not user.stripe_customer_id and session_customer:
                             user.stripe_customer_id = session_customer
@@ -440,7 +444,7 @@ async def verify_checkout_session(session_id: str, current_user: models.User = D
         raise HTTPException(status_code=500, detail='Erro ao verificar sessão')
 
 @router.get('/subscription-details')
-async def get_subscription_details(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def get_subscription_details(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
     """Retorna os detalhes da subscrição atual, incluindo o price_id. Admins e Pro concedido têm Pro ativo."""
     try:
         if current_user.has_effective_pro() and not current_user.stripe_subscription_id:
@@ -506,7 +510,7 @@ def _subscription_within_refund_window(subscription) -> bool:
 
 
 @router.post('/cancel-subscription')
-async def cancel_subscription(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def cancel_subscription(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
     """Cancela a subscrição: se passaram menos de 7 dias desde o início do período, cancela de imediato; senão, cancela só no fim do período (sem cobrança no próximo mês)."""
     try:
         logger.info(f'Tentativa de cancelar subscrição para {current_user.email}, subscription_id: {current_user.stripe_subscription_id}')
@@ -534,6 +538,7 @@ async def cancel_subscription(db: Session = Depends(get_db), current_user: model
         if current_user.stripe_customer_id and (current_user.stripe_customer_id.startswith('sim_') or current_user.stripe_customer_id.startswith('test_')):
             logger.info(f'Subscrição de simulação - marcando como cancelada: {current_user.email}')
             current_user.subscription_status = 'canceled'
+            user_cache.invalidate_user(current_user, db)
             db.commit()
             return {
                 'success': True,
@@ -553,6 +558,7 @@ async def cancel_subscription(db: Session = Depends(get_db), current_user: model
                 if getattr(e, 'code', None) == 'resource_missing':
                     logger.warning(f'Subscrição não encontrada no Stripe, atualizando apenas na BD: {current_user.email}')
                     current_user.subscription_status = 'canceled'
+                    user_cache.invalidate_user(current_user, db)
                     db.commit()
                     return {
                         'success': True,
@@ -561,6 +567,7 @@ async def cancel_subscription(db: Session = Depends(get_db), current_user: model
                     }
                 raise
             current_user.subscription_status = 'canceled'
+            user_cache.invalidate_user(current_user, db)
             db.commit()
             return {
                 'success': True,
@@ -574,6 +581,7 @@ async def cancel_subscription(db: Session = Depends(get_db), current_user: model
             cancel_at_period_end=True
         )
         current_user.subscription_status = 'cancel_at_period_end'
+        user_cache.invalidate_user(current_user, db)
         db.commit()
         period_end_ts = subscription.get('current_period_end')
         logger.info(f'Subscrição marcada para terminar no fim do período: {current_user.email}')
@@ -593,7 +601,7 @@ async def cancel_subscription(db: Session = Depends(get_db), current_user: model
         raise HTTPException(status_code=500, detail='Erro ao cancelar subscrição. Tenta novamente.')
 
 @router.get('/invoices')
-async def get_stripe_invoices(current_user: models.User = Depends(get_current_user)):
+def get_stripe_invoices(current_user: models.User = Depends(get_current_user)):
     try:
         if not current_user.stripe_customer_id:
             return []
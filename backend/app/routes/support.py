@@ -1,10 +1,11 @@
 import html as html_module
 from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Form
 from ..core.config import settings
-from ..core.dependencies import conf
+from ..core.dependencies import get_mail_conf
 from ..models import database as models
 from .auth import get_current_user
-from fastapi_mail import FastMail, MessageSchema, MessageType
+from ..core.lazy_import import lazy_module
+fastapi_mail = lazy_module('fastapi_mail')  # só importado no primeiro uso, não no arranque do worker
 import logging
 
 logger = logging.getLogger(__name__)
@@ -53,13 +54,13 @@ async def contact_support(
         if hasattr(f.file, 'seek'):
             f.file.seek(0)
         valid_files.append(f)
-    fm = FastMail(conf)
+    fm = fastapi_mail.FastMail(get_mail_conf())
     subject_tag = "[Finly Suporte]"
-    msg = MessageSchema(
+    msg = fastapi_mail.MessageSchema(
         subject=f"{subject_tag} Contacto – {current_user.email or 'utilizador'}",
         recipients=[support_email],
         body=html,
-        subtype=MessageType.html,
+        subtype=fastapi_mail.MessageType.html,
         attachments=valid_files,
     )
     try:
@@ -1,15 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
-from sqlalchemy import func, or_
-from typing import List
-from ..core.dependencies import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select, tuple_
+from typing import List, Optional
+from ..core.config import settings
+from ..core.dependencies import get_db, get_async_db
 from ..core.audit import log_action
+from ..core.recurring_engine import generate_recurring_transactions
 from ..models import database as models
 from .. import schemas
-from .auth import get_current_user
+from .auth import get_current_user_snapshot, get_current_workspace
+from ..core.user_cache import UserSnapshot
+from ..core import data_version, month_rollup, workspace_cache
+from ..core.workspace_cache import WorkspaceRef
 from uuid import UUID
-from datetime import date
+from datetime import date, datetime, timedelta
+import base64
 import calendar
 
 router = APIRouter(prefix='/transactions', tags=['transactions'])
@@ -24,96 +31,152 @@ def _effective_day_for_month(year: int, month: int, day_of_month: int) -> int:
     return min(day_of_month, _last_day_of_month(year, month))
 
 
-def process_automatic_recurring(db: Session, workspace_id: UUID):
-    """Cria transações automáticas para regras recorrentes do mês atual (se já passou o dia)."""
-    today = date.today()
-    start_of_month = date(today.year, today.month, 1)
-
-    rules = db.query(models.RecurringTransaction).filter(
-        models.RecurringTransaction.workspace_id == workspace_id,
-        models.RecurringTransaction.is_active == True
-    ).all()
-
-    for rule in rules:
-        effective_day = _effective_day_for_month(today.year, today.month, rule.day_of_month)
-        target_date = date(today.year, today.month, effective_day)
-
-        if today < target_date:
-            continue
-
-        # Evitar duplicado: já existe transação este mês com mesma descrição (ou "(R) descrição") e valor
-        existing = db.query(models.Transaction).filter(
-            models.Transaction.workspace_id == workspace_id,
-            or_(
-                models.Transaction.description == rule.description,
-                models.Transaction.description == f"(R) {rule.description}"
-            ),
-            models.Transaction.amount_cents == rule.amount_cents,
-            models.Transaction.transaction_date >= start_of_month
-        ).first()
+def process_automatic_recurring(db: Session, workspace_id: UUID, today: date | None = None):
+    """
+    Cria transações automáticas para regras recorrentes do workspace (mês atual e, se o
+    workspace ficou parado, meses em falta) e marca-o como processado até `today`.
+    Usa o mesmo gerador em lote do job noturno (core.recurring_engine), filtrado ao workspace.
+    """
+    generate_recurring_transactions(db, today=today, workspace_id=workspace_id)
 
-        if existing:
-            continue
 
-        # Mesmo formato da confirmação manual para consistência
-        new_t = models.Transaction(
-            workspace_id=workspace_id,
-            category_id=rule.category_id,
-            amount_cents=rule.amount_cents,
-            description=f"(R) {rule.description}",
-            transaction_date=target_date,
-            is_installment=False
-        )
-        db.add(new_t)
+def _recurring_fresh_from(now: datetime) -> date:
+    """
+    Marcador mínimo para uma leitura não processar recorrentes: hoje, ou ontem nos primeiros
+    RECURRING_READ_GRACE_MINUTES do dia (o job das 00:05 ainda não pôs os workspaces em dia).
+    """
+    return (now - timedelta(minutes=settings.RECURRING_READ_GRACE_MINUTES)).date()
+
+
+def ensure_recurring_processed(db: Session, workspace: WorkspaceRef) -> None:
+    """
+    Usado nas leituras: normalmente o job noturno já pôs o workspace em dia e não há
+    query nem escrita. Só processa se o marcador ficou para trás (job falhou ou não correu).
+    """
+    now = datetime.now()
+    today, fresh_from = now.date(), _recurring_fresh_from(now)
+    if workspace.recurring_processed_through is not None and workspace.recurring_processed_through >= fresh_from:
+        return
+    # O marcador em cache pode estar desatualizado: confirmar na BD antes de processar
+    processed_through = db.query(models.Workspace.recurring_processed_through).filter(
+        models.Workspace.id == workspace.id
+    ).scalar()
+    if processed_through is None or processed_through < fresh_from:
+        process_automatic_recurring(db, workspace.id, today)
+        processed_through = today
+    workspace_cache.mark_recurring_processed(workspace.owner_id, processed_through)
+
+_TRANSACTION_TYPES = ('income', 'expense', 'vault')
+
+
+def _category_type_conditions(tx_type: str) -> tuple:
+    """Filtro por tipo, com a mesma regra do FinancialEngine (cofre conta à parte)."""
+    if tx_type == 'vault':
+        return (models.Category.vault_type != 'none',)
+    return (models.Category.type == tx_type, models.Category.vault_type == 'none')
+
+
+def _encode_cursor(created_at: datetime, transaction_id: UUID) -> str:
+    raw = f'{created_at.isoformat()}|{transaction_id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, UUID]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, transaction_id = raw.split('|')
+        return datetime.fromisoformat(created_at), UUID(transaction_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail='Cursor inválido.')
+
+
+def _whole_months(start_date: Optional[date], end_date: Optional[date]) -> bool:
+    """O intervalo cobre meses completos (pode ser respondido pelo rollup mensal)?"""
+    if start_date is not None and start_date.day != 1:
+        return False
+    return end_date is None or end_date.day == _last_day_of_month(end_date.year, end_date.month)
 
-    db.commit()
 
 @router.get('/', response_model=List[schemas.TransactionResponse])
-async def get_transactions(request: Request, skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+async def get_transactions(
+    request: Request,
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    category_id: Optional[UUID] = None,
+    tx_type: Optional[str] = Query(None, alias='type'),
+    include_count: bool = False,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserSnapshot = Depends(get_current_user_snapshot),
+    workspace: WorkspaceRef = Depends(get_current_workspace),
+):
+    """
+    Transações do workspace, mais recentes primeiro (created_at, id).
+    
+    Paginação por cursor: a resposta traz X-Next-Cursor quando há mais páginas; passar esse valor
+    em `cursor` custa o mesmo em qualquer página (índice (workspace_id, created_at, id)).
+    `skip` continua aceite para clientes antigos. Filtros: start_date/end_date (transaction_date),
+    category_id e type (income | expense | vault). include_count=true devolve X-Total-Count,
+    lido do rollup mensal quando o intervalo cobre meses completos.
+    """
     limit = min(max(limit, 1), 500)  # Cap entre 1 e 500
-    import logging
-    logger = logging.getLogger("transactions")
+    if tx_type is not None and tx_type not in _TRANSACTION_TYPES:
+        raise HTTPException(status_code=400, detail='Tipo inválido. Usa income, expense ou vault.')
     
-    # Usar workspace cacheado se disponível; senão o primeiro por created_at (igual ao import)
-    workspace = getattr(request.state, 'workspace', None)
-    if not workspace:
-        workspace = db.query(models.Workspace).filter(models.Workspace.owner_id == current_user.id).order_by(models.Workspace.created_at).first()
-        if not workspace:
-            raise HTTPException(status_code=404, detail='Workspace not found')
-        request.state.workspace = workspace
+    await db.run_sync(ensure_recurring_processed, workspace)
     
-    process_automatic_recurring(db, workspace.id)
+    T = models.Transaction
+    # Transações de seed ficam de fora (índice parcial WHERE NOT is_seed)
+    conditions = [T.workspace_id == workspace.id, ~T.is_seed]
+    if start_date is not None:
+        conditions.append(T.transaction_date >= start_date)
+    if end_date is not None:
+        conditions.append(T.transaction_date <= end_date)
+    if category_id is not None:
+        conditions.append(T.category_id == category_id)
+    category_conditions = _category_type_conditions(tx_type) if tx_type else ()
     
-    # Filtrar transações de seed (1 cêntimo) diretamente na query SQL - muito mais rápido
-    # Usar eager loading para evitar N+1 queries
-    from sqlalchemy.orm import joinedload
-    transactions = db.query(models.Transaction).options(
-        joinedload(models.Transaction.category)
-    ).filter(
-        models.Transaction.workspace_id == workspace.id,
-        func.abs(models.Transaction.amount_cents) != 1
-    ).order_by(models.Transaction.created_at.desc()).offset(skip).limit(limit).all()
+    query = select(T).where(*conditions)
+    if category_conditions:
+        query = query.join(models.Category, models.Category.id == T.category_id).where(*category_conditions)
+    if cursor:
+        last_created_at, last_id = _decode_cursor(cursor)
+        query = query.where(tuple_(T.created_at, T.id) < tuple_(last_created_at, last_id))
+    elif skip > 0:
+        query = query.offset(skip)
     
-    # Contar total para logging (sem paginação)
-    total_count = db.query(models.Transaction).filter(
-        models.Transaction.workspace_id == workspace.id,
-        func.abs(models.Transaction.amount_cents) != 1
-    ).count()
+    # Uma linha a mais diz se existe página seguinte sem contar
+    rows = (await db.execute(
+        query.order_by(T.created_at.desc(), T.id.desc()).limit(limit + 1)
+    )).scalars().all()
+    transactions = rows[:limit]
+    if len(rows) > limit:
+        response.headers['X-Next-Cursor'] = _encode_cursor(transactions[-1].created_at, transactions[-1].id)
     
-    logger.info(f"GET /transactions/ - workspace_id: {workspace.id}, user_id: {current_user.id}, total: {total_count}, returned: {len(transactions)}")
-    if transactions:
-        logger.info(f"Primeira transacao: id={transactions[0].id}, description={transactions[0].description}, amount_cents={transactions[0].amount_cents}, created_at={transactions[0].created_at}")
+    if include_count:
+        if _whole_months(start_date, end_date):
+            total_count = await db.run_sync(
+                lambda sync_db: month_rollup.count(
+                    sync_db, workspace.id, *category_conditions,
+                    first_month=start_date, last_month=end_date, category_id=category_id,
+                )
+            )
+        else:
+            count_query = select(func.count()).select_from(T).where(*conditions)
+            if category_conditions:
+                count_query = count_query.join(models.Category, models.Category.id == T.category_id).where(*category_conditions)
+            total_count = (await db.execute(count_query)).scalar_one()
+        response.headers['X-Total-Count'] = str(total_count)
     
     return transactions
 
 @router.post('/', response_model=schemas.TransactionResponse)
-async def create_transaction(request: Request, transaction_in: schemas.TransactionCreate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def create_transaction(request: Request, transaction_in: schemas.TransactionCreate, db: Session = Depends(get_db), current_user: UserSnapshot = Depends(get_current_user_snapshot), workspace: WorkspaceRef = Depends(get_current_workspace)):
     if not current_user.has_effective_pro():
         raise HTTPException(status_code=403, detail="Funcionalidade disponível apenas para utilizadores Pro.")
-    workspace = db.query(models.Workspace).filter(models.Workspace.owner_id == current_user.id).order_by(models.Workspace.created_at).first()
-    if not workspace:
-        raise HTTPException(status_code=404, detail='Workspace not found')
-    
     # Validar que a data não é no futuro
     if transaction_in.transaction_date > date.today():
         raise HTTPException(status_code=400, detail='Não são permitidas transações com data no futuro.')
@@ -173,7 +236,7 @@ async def create_transaction(request: Request, transaction_in: schemas.Transacti
         vault_transactions = db.query(models.Transaction).filter(
             models.Transaction.workspace_id == workspace.id,
             models.Transaction.category_id == category.id,
-            func.abs(models.Transaction.amount_cents) != 1  # Excluir seed transactions
+            ~models.Transaction.is_seed  # Excluir seed transactions
         ).all()
         
         # Calcular saldo: depósitos (positivos) aumentam, resgates (negativos) diminuem
@@ -212,7 +275,7 @@ async def create_transaction(request: Request, transaction_in: schemas.Transacti
     db.commit()
     db.refresh(new_transaction)
     
-    await log_action(db, action='create_transaction', user_id=current_user.id, details=f'amount: {new_transaction.amount_cents}, category_id: {new_transaction.category_id}', request=request)
+    log_action(db, action='create_transaction', user_id=current_user.id, details=f'amount: {new_transaction.amount_cents}, category_id: {new_transaction.category_id}', request=request)
     return new_transaction
 
 
@@ -221,38 +284,37 @@ class BulkDeleteRequest(BaseModel):
 
 
 @router.post('/bulk-delete')
-async def bulk_delete_transactions(request: Request, body: BulkDeleteRequest, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def bulk_delete_transactions(request: Request, body: BulkDeleteRequest, db: Session = Depends(get_db), current_user: UserSnapshot = Depends(get_current_user_snapshot), workspace: WorkspaceRef = Depends(get_current_workspace)):
     if not current_user.has_effective_pro():
         raise HTTPException(status_code=403, detail="Funcionalidade disponível apenas para utilizadores Pro.")
     if not body.ids or len(body.ids) == 0:
         raise HTTPException(status_code=400, detail='Nenhuma transação selecionada.')
     if len(body.ids) > 500:
         raise HTTPException(status_code=400, detail='Máximo de 500 transações por operação.')
-    workspace = db.query(models.Workspace).filter(models.Workspace.owner_id == current_user.id).order_by(models.Workspace.created_at).first()
-    if not workspace:
-        raise HTTPException(status_code=404, detail='Workspace não encontrado')
     uuids = []
     for tid in body.ids:
         try:
             uuids.append(UUID(str(tid).strip()))
         except ValueError:
             raise HTTPException(status_code=400, detail=f'ID inválido: {tid}')
-    deleted = db.query(models.Transaction).filter(
+    selected = (
         models.Transaction.id.in_(uuids),
         models.Transaction.workspace_id == workspace.id
-    ).delete(synchronize_session=False)
+    )
+    # DELETE em lote não passa pelo ORM: retirar do rollup mensal antes de apagar
+    month_rollup.remove_matching(db, *selected)
+    deleted = db.query(models.Transaction).filter(*selected).delete(synchronize_session=False)
+    if deleted:
+        data_version.bump(db, workspace.id)
     db.commit()
-    await log_action(db, action='bulk_delete_transactions', user_id=current_user.id, details=f'count: {deleted}, ids: {body.ids[:10]}', request=request)
+    log_action(db, action='bulk_delete_transactions', user_id=current_user.id, details=f'count: {deleted}, ids: {body.ids[:10]}', request=request)
     return {'message': f'{deleted} transações eliminadas.', 'deleted_count': deleted}
 
 
 @router.patch('/{transaction_id}', response_model=schemas.TransactionResponse)
-async def update_transaction(request: Request, transaction_id: UUID, transaction_in: schemas.TransactionUpdate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def update_transaction(request: Request, transaction_id: UUID, transaction_in: schemas.TransactionUpdate, db: Session = Depends(get_db), current_user: UserSnapshot = Depends(get_current_user_snapshot), workspace: WorkspaceRef = Depends(get_current_workspace)):
     if not current_user.has_effective_pro():
         raise HTTPException(status_code=403, detail="Funcionalidade disponível apenas para utilizadores Pro.")
-    workspace = db.query(models.Workspace).filter(models.Workspace.owner_id == current_user.id).order_by(models.Workspace.created_at).first()
-    if not workspace:
-        raise HTTPException(status_code=404, detail='Workspace não encontrado')
     db_transaction = db.query(models.Transaction).filter(
         models.Transaction.id == transaction_id,
         models.Transaction.workspace_id == workspace.id
@@ -295,16 +357,13 @@ async def update_transaction(request: Request, transaction_id: UUID, transaction
                 import logging
                 logging.getLogger("transactions").warning(f"Aprendizagem falhou: {e}")
     
-    await log_action(db, action='update_transaction', user_id=current_user.id, details=f'id: {transaction_id}', request=request)
+    log_action(db, action='update_transaction', user_id=current_user.id, details=f'id: {transaction_id}', request=request)
     return db_transaction
 
 @router.delete('/{transaction_id}')
-async def delete_transaction(request: Request, transaction_id: UUID, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def delete_transaction(request: Request, transaction_id: UUID, db: Session = Depends(get_db), current_user: UserSnapshot = Depends(get_current_user_snapshot), workspace: WorkspaceRef = Depends(get_current_workspace)):
     if not current_user.has_effective_pro():
         raise HTTPException(status_code=403, detail="Funcionalidade disponível apenas para utilizadores Pro.")
-    workspace = db.query(models.Workspace).filter(models.Workspace.owner_id == current_user.id).order_by(models.Workspace.created_at).first()
-    if not workspace:
-        raise HTTPException(status_code=404, detail='Workspace não encontrado')
     db_transaction = db.query(models.Transaction).filter(
         models.Transaction.id == transaction_id,
         models.Transaction.workspace_id == workspace.id
@@ -316,6 +375,6 @@ async def delete_transaction(request: Request, transaction_id: UUID, db: Session
     db.delete(db_transaction)
     db.commit()
     
-    await log_action(db, action='delete_transaction', user_id=current_user.id, details=f'id: {transaction_id}', request=request)
+    log_action(db, action='delete_transaction', user_id=current_user.id, details=f'id: {transaction_id}', request=request)
     return {'message': 'Transação eliminada com sucesso'}
 
@@ -1,11 +1,14 @@
 from fastapi import APIRouter, Request, HTTPException, Depends
 from sqlalchemy.orm import Session
-import stripe
+from ..core.lazy_import import lazy_module
+stripe = lazy_module('stripe')  # só importado no primeiro uso, não no arranque do worker
 import uuid
 import logging
 from uuid import UUID
 from datetime import datetime, date, timezone
 from ..core.config import settings
+from ..core import user_cache
+from ..core.concurrency import run_blocking
 from ..core.dependencies import get_db
 from ..core.affiliate_commission import get_commission_percentage_for_price_id
 from ..models import database as models
@@ -83,6 +86,13 @@ async def stripe_webhook(request: Request, db: Session = Depends(get_db)):
         )
         raise HTTPException(status_code=400, detail='Invalid signature')
 
+    # Handlers usam a BD e a API Stripe (síncronas): correr fora do event loop
+    await run_blocking(_dispatch_stripe_event, event, db)
+    return {'status': 'success'}
+
+
+def _dispatch_stripe_event(event, db: Session):
+    """Encaminha o evento Stripe para o handler respetivo (corre no threadpool)."""
     event_type = event['type']
     logger.info(f'Evento Stripe recebido: {event_type}')
 
@@ -127,7 +137,6 @@ async def stripe_webhook(request: Request, db: Session = Depends(get_db)):
         # Devolver 500 para que o Stripe faça retry (em vez de engolir o erro)
         raise HTTPException(status_code=500, detail=f'Webhook handler error: {event_type}')
 
-    return {'status': 'success'}
 
 def handle_checkout_completed(session: dict, db: Session):
     """Processa checkout.session.completed"""
@@ -169,12 +178,15 @@ def handle_checkout_completed(session: dict, db: Session):
             try:
                 subscription = stripe.Subscription.retrieve(subscription_id)
                 user.subscription_status = subscription.status  # 'active', 'trialing', etc.
+                user_cache.invalidate_user(user, db)
                 logger.info(f'Status da subscrição do Stripe: {subscription.status}')
             except Exception as e:
                 logger.warning(f'Erro ao buscar subscrição do Stripe: {str(e)}, usando status "active"')
                 user.subscription_status = 'active'
+                user_cache.invalidate_user(user, db)
         else:
             user.subscription_status = 'active'
+            user_cache.invalidate_user(user, db)
         
         if not user.stripe_customer_id:
             user.stripe_customer_id = customer_id
@@ -213,6 +225,7 @@ def handle_subscription_created(subscription: dict, db: Session):
     if user:
         user.stripe_subscription_id = subscription_id
         user.subscription_status = status
+        user_cache.invalidate_user(user, db)
         
         # Marcar conversão de afiliado se aplicável
         if user.referrer_id:
@@ -244,8 +257,10 @@ def handle_subscription_updated(subscription: dict, db: Session):
         # Se cancel_at_period_end é True, usar status especial
         if cancel_at_period_end and status == 'active':
             user.subscription_status = 'cancel_at_period_end'
+            user_cache.invalidate_user(user, db)
         else:
             user.subscription_status = status
+            user_cache.invalidate_user(user, db)
         db.commit()
         logger.info(f'Status da subscrição atualizado para {user.email}: {user.subscription_status}')
     else:
@@ -260,6 +275,7 @@ def handle_subscription_deleted(subscription: dict, db: Session):
     user = db.query(models.User).filter(models.User.stripe_subscription_id == subscription_id).first()
     if user:
         user.subscription_status = 'canceled'
+        user_cache.invalidate_user(user, db)
         # Atualizar referência de afiliado: deixar de contar como conversão e registar cancelamento
         referral = db.query(models.AffiliateReferral).filter(
             models.AffiliateReferral.referred_user_id == user.id
@@ -326,6 +342,7 @@ def handle_charge_refunded(charge: dict, db: Session):
             if sub_id and user.stripe_subscription_id == sub_id:
                 sub = stripe.Subscription.retrieve(sub_id)
                 user.subscription_status = sub.status  # 'canceled', 'incomplete_expired', etc.
+                user_cache.invalidate_user(user, db)
                 logger.info(f'Reembolso: acesso atualizado para {user.email} → subscription_status={sub.status}')
         except Exception as e:
             logger.warning(f'Erro ao obter subscription no reembolso: {e}')
@@ -459,6 +476,7 @@ def handle_invoice_payment_failed(invoice: dict, db: Session):
                     # Só atualizar se for fatura do período atual ou se o período já terminou
                     if is_current_period_invoice or period_has_ended:
                         user.subscription_status = subscription.status
+                        user_cache.invalidate_user(user, db)
                         db.commit()
                         logger.warning(f'Status da subscrição atualizado para {subscription.status} devido a pagamento falhado: {user.email}')
                     else:
@@ -486,6 +504,7 @@ def handle_invoice_paid(invoice: dict, db: Session):
                     subscription = stripe.Subscription.retrieve(subscription_id)
                     if subscription.status == 'active':
                         user.subscription_status = 'active'
+                        user_cache.invalidate_user(user, db)
                         logger.info(f'Subscrição reativada após pagamento: {user.email}')
                 except Exception as e:
                     logger.error(f'Erro ao verificar subscrição após pagamento: {str(e)}')
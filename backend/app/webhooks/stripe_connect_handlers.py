@@ -5,7 +5,8 @@ from datetime import datetime, date, timezone, timedelta
 from ..models import database as models
 from ..core.affiliate_commission import get_commission_percentage_for_price_id
 import logging
-import stripe
+from ..core.lazy_import import lazy_module
+stripe = lazy_module('stripe')  # só importado no primeiro uso, não no arranque do worker
 from ..core.config import settings
 
 logger = logging.getLogger(__name__)
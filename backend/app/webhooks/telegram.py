@@ -1,25 +1,31 @@
 from fastapi import APIRouter, Request, HTTPException, Depends, Header
 from sqlalchemy.orm import Session
-from sqlalchemy import func, case
-import requests
+from sqlalchemy import func, case, false
+from ..core.lazy_import import lazy_module
+# Fotos, documentos e voz: módulo carregado só quando chega o primeiro ficheiro
+telegram_media = lazy_module(__package__ + '.telegram_media')
 import json
 import logging
 import re
 import hmac
 import hashlib
 import uuid
-from collections import defaultdict
 from datetime import datetime, timedelta, date, timezone
 from typing import Optional, Dict, List
 from concurrent.futures import ThreadPoolExecutor
 from types import SimpleNamespace
-import io
-import tempfile
 import time
 import unicodedata
 from difflib import SequenceMatcher
 
 from ..core.config import settings
+from ..core import month_rollup, user_cache
+from ..core.telegram_client import telegram_client
+from ..core.ttl_store import TTLMap
+from ..core.shared_state import get_store
+from ..core.telegram_queue import handler_committed, persist as persist_update, telegram_queue, update_chat_id
+from ..core.concurrency import run_blocking
+from ..core.description_index import best_similar_category
 from ..core.dependencies import get_db, SessionLocal
 from ..models import database as models
 from ..core.limiter import limiter
@@ -30,25 +36,27 @@ logger = logging.getLogger("telegram_webhook")
 # Limite da API Telegram: 4096 caracteres por mensagem
 TELEGRAM_MAX_MESSAGE_LENGTH = 4090
 
+# Estado por chat em memória (core.ttl_store): chats inativos expiram, tamanho limitado
+_MAX_TRACKED_CHATS = 50000
+
 # Memória de conversa: últimas mensagens por chat_id (max 5, TTL ~30min)
-_conversation_memory: Dict[str, List[Dict]] = defaultdict(list)
 _CONVERSATION_MAX = 5
 _CONVERSATION_TTL = 1800  # 30 min
+_conversation_memory = TTLMap(maxsize=_MAX_TRACKED_CHATS, ttl_seconds=_CONVERSATION_TTL)
 
 
 def _add_to_memory(chat_id: str, role: str, content: str):
     """Adiciona mensagem à memória de conversa."""
-    now = time.time()
-    mem = _conversation_memory[chat_id]
-    mem.append({"role": role, "content": content[:500], "ts": now})
-    # Limpar antigas
-    _conversation_memory[chat_id] = [m for m in mem if now - m["ts"] < _CONVERSATION_TTL][-_CONVERSATION_MAX:]
+    message = {"role": role, "content": content[:500], "ts": time.time()}
+    _conversation_memory.update(
+        chat_id, lambda mem: ((mem or ()) + (message,))[-_CONVERSATION_MAX:]
+    )
 
 
 def _get_memory(chat_id: str) -> List[Dict]:
     """Devolve histórico de conversa recente (role, content)."""
     now = time.time()
-    mem = _conversation_memory.get(chat_id, [])
+    mem = _conversation_memory.get(chat_id, ())
     return [{"role": m["role"], "content": m["content"]} for m in mem if now - m["ts"] < _CONVERSATION_TTL]
 
 
@@ -112,17 +120,9 @@ def _check_budget_alerts(workspace_id, category_id, db, t) -> Optional[str]:
     cat = db.query(models.Category).filter(models.Category.id == category_id).first()
     if not cat or not cat.monthly_limit_cents or cat.monthly_limit_cents <= 0:
         return None
+    # Gasto do mês na categoria até hoje, a partir do rollup mensal (sem varrer transações)
     today = date.today()
-    first_day = today.replace(day=1)
-    spent_cents = db.query(
-        func.sum(func.abs(models.Transaction.amount_cents))
-    ).filter(
-        models.Transaction.workspace_id == workspace_id,
-        models.Transaction.category_id == category_id,
-        models.Transaction.amount_cents < 0,
-        models.Transaction.transaction_date >= first_day,
-        models.Transaction.transaction_date <= today,
-    ).scalar() or 0
+    spent_cents = -month_rollup.totals(db, workspace_id, today, category_id=category_id, through=today).debit_cents
     spent = int(spent_cents) / 100
     limit_val = cat.monthly_limit_cents / 100
     percent = int((spent / limit_val) * 100) if limit_val > 0 else 0
@@ -144,17 +144,17 @@ def _check_budget_alerts(workspace_id, category_id, db, t) -> Optional[str]:
 def _check_streak(workspace_id, db, t) -> Optional[str]:
     """Verifica se o user tem uma streak de dias seguidos a registar transações."""
     today = date.today()
+    # Uma só query: dias distintos com transações no último ano (idx_transactions_workspace_date)
+    days = db.query(models.Transaction.transaction_date).filter(
+        models.Transaction.workspace_id == workspace_id,
+        models.Transaction.transaction_date > today - timedelta(days=365),
+        models.Transaction.transaction_date <= today,
+    ).distinct().order_by(models.Transaction.transaction_date.desc()).all()
     streak = 0
-    for i in range(365):
-        check_date = today - timedelta(days=i)
-        has_tx = db.query(models.Transaction.id).filter(
-            models.Transaction.workspace_id == workspace_id,
-            models.Transaction.transaction_date == check_date,
-        ).first()
-        if has_tx:
-            streak += 1
-        else:
+    for (day,) in days:
+        if day != today - timedelta(days=streak):
             break
+        streak += 1
     if streak == 0:
         return None
     if streak == 100:
@@ -174,36 +174,20 @@ def _check_month_comparison(workspace_id, db, t, language='pt') -> Optional[str]
     if today.day > 3:
         return None
     first_day = today.replace(day=1)
-    curr_count = db.query(func.count(models.Transaction.id)).filter(
-        models.Transaction.workspace_id == workspace_id,
-        models.Transaction.transaction_date >= first_day,
-    ).scalar() or 0
+    # Contagens e despesas por mês a partir do rollup mensal
+    curr_count = month_rollup.totals(db, workspace_id, first_day).count
     if curr_count > 1:
         return None
     if first_day.month == 1:
         prev_first = first_day.replace(year=first_day.year - 1, month=12)
     else:
         prev_first = first_day.replace(month=first_day.month - 1)
-    prev_last = first_day - timedelta(days=1)
-    prev_expenses = abs(int(db.query(
-        func.sum(case((models.Transaction.amount_cents < 0, models.Transaction.amount_cents), else_=0))
-    ).filter(
-        models.Transaction.workspace_id == workspace_id,
-        models.Transaction.transaction_date >= prev_first,
-        models.Transaction.transaction_date <= prev_last,
-    ).scalar() or 0)) / 100
+    prev_expenses = abs(month_rollup.totals(db, workspace_id, prev_first).debit_cents) / 100
     if prev_first.month == 1:
         prev2_first = prev_first.replace(year=prev_first.year - 1, month=12)
     else:
         prev2_first = prev_first.replace(month=prev_first.month - 1)
-    prev2_last = prev_first - timedelta(days=1)
-    prev2_expenses = abs(int(db.query(
-        func.sum(case((models.Transaction.amount_cents < 0, models.Transaction.amount_cents), else_=0))
-    ).filter(
-        models.Transaction.workspace_id == workspace_id,
-        models.Transaction.transaction_date >= prev2_first,
-        models.Transaction.transaction_date <= prev2_last,
-    ).scalar() or 0)) / 100
+    prev2_expenses = abs(month_rollup.totals(db, workspace_id, prev2_first).debit_cents) / 100
     if prev_expenses == 0 and prev2_expenses == 0:
         return None
     month_names_pt = {1: 'Janeiro', 2: 'Fevereiro', 3: 'Março', 4: 'Abril', 5: 'Maio', 6: 'Junho', 7: 'Julho', 8: 'Agosto', 9: 'Setembro', 10: 'Outubro', 11: 'Novembro', 12: 'Dezembro'}
@@ -236,30 +220,14 @@ def _generate_insight(workspace_id, category_id, db, t) -> Optional[str]:
         return None
     today = date.today()
     first_day = today.replace(day=1)
-    # Current month
-    curr = db.query(
-        func.sum(func.abs(models.Transaction.amount_cents))
-    ).filter(
-        models.Transaction.workspace_id == workspace_id,
-        models.Transaction.category_id == category_id,
-        models.Transaction.amount_cents < 0,
-        models.Transaction.transaction_date >= first_day,
-    ).scalar() or 0
+    # Current month (rollup mensal)
+    curr = -month_rollup.totals(db, workspace_id, first_day, category_id=category_id).debit_cents
     # Previous month
     if first_day.month == 1:
         prev_first = first_day.replace(year=first_day.year - 1, month=12)
     else:
         prev_first = first_day.replace(month=first_day.month - 1)
-    prev_last = first_day - timedelta(days=1)
-    prev = db.query(
-        func.sum(func.abs(models.Transaction.amount_cents))
-    ).filter(
-        models.Transaction.workspace_id == workspace_id,
-        models.Transaction.category_id == category_id,
-        models.Transaction.amount_cents < 0,
-        models.Transaction.transaction_date >= prev_first,
-        models.Transaction.transaction_date <= prev_last,
-    ).scalar() or 0
+    prev = -month_rollup.totals(db, workspace_id, prev_first, category_id=category_id).debit_cents
     if prev == 0:
         return None
     percent_change = int(((int(curr) - int(prev)) / int(prev)) * 100)
@@ -339,65 +307,67 @@ def _date_line(transaction_date: date, t) -> str:
 
 router = APIRouter(prefix='/telegram', tags=['webhooks'])
 
-# Rate Limiting
-_rate_limit_store = defaultdict(list)  # chat_id -> [timestamps]
-_rate_limit_window = timedelta(minutes=1)
-_rate_limit_max_messages = 10  # Máximo 10 mensagens por minuto
+# Rate Limiting: máximo 10 mensagens por minuto por chat (partilhado entre workers: core.shared_state)
+_RATE_LIMIT = 10
+_RATE_WINDOW_SECONDS = 60
 
-# Idempotência: update_id já processados (TTL ~5 min)
-_processed_updates: Dict[int, datetime] = {}
-_processed_updates_ttl = timedelta(minutes=5)
+# Idempotência: update_id já recebidos (TTL ~5 min)
+_PROCESSED_UPDATE_TTL_SECONDS = 300
 PENDING_STALE_HOURS = 24
 
 
 def _is_duplicate_update(update_id: int) -> bool:
-    """True se este update_id já foi processado (evitar duplicados)."""
+    """True se este update_id já foi recebido por algum worker (evitar duplicados)."""
     if update_id is None:
         return False
-    now = datetime.now()
-    for uid, ts in list(_processed_updates.items()):
-        if now - ts > _processed_updates_ttl:
-            del _processed_updates[uid]
-    if update_id in _processed_updates:
+    try:
+        return not get_store().add(f"tg_update:{update_id}", _PROCESSED_UPDATE_TTL_SECONDS)
+    except Exception as e:
+        # Sem estado partilhado a PK de telegram_updates continua a deduplicar
+        logger.warning("Dedupe de updates indisponível: %s", e)
+        return False
+
+
+def _forget_update(update_id: int) -> None:
+    try:
+        get_store().delete(f"tg_update:{update_id}")
+    except Exception as e:
+        logger.warning("Dedupe de updates indisponível: %s", e)
+
+
+def _hit_rate_limit(key: str, limit: int) -> bool:
+    try:
+        return get_store().hit(key, limit, _RATE_WINDOW_SECONDS)
+    except Exception as e:
+        logger.warning("Rate limit indisponível, a deixar passar: %s", e)
         return True
-    _processed_updates[update_id] = now
-    return False
+
 
 def check_rate_limit(chat_id: str) -> bool:
     """Verifica se o chat_id está dentro do limite de rate"""
-    now = datetime.now()
-    # Limpar timestamps antigos
-    _rate_limit_store[chat_id] = [
-        ts for ts in _rate_limit_store[chat_id]
-        if now - ts < _rate_limit_window
-    ]
-    
-    # Verificar limite
-    if len(_rate_limit_store[chat_id]) >= _rate_limit_max_messages:
-        return False  # Limite excedido
-    
-    _rate_limit_store[chat_id].append(now)
-    return True
+    return _hit_rate_limit(f"tg_rate:{chat_id}", _RATE_LIMIT)
 
 # ==================== AI ROUTER: GPT-4o-mini conversational assistant ====================
 
 # Rate limit separado para chamadas GPT (5/min por user)
-_gpt_rate_limit_store: Dict[str, list] = defaultdict(list)
-_gpt_rate_limit_window = timedelta(minutes=1)
-_gpt_rate_limit_max = 5
+_GPT_RATE_LIMIT = 5
 
 
 def _check_gpt_rate_limit(chat_id: str) -> bool:
     """True se o user pode fazer mais chamadas GPT neste minuto."""
-    now = datetime.now()
-    _gpt_rate_limit_store[chat_id] = [
-        ts for ts in _gpt_rate_limit_store[chat_id]
-        if now - ts < _gpt_rate_limit_window
-    ]
-    if len(_gpt_rate_limit_store[chat_id]) >= _gpt_rate_limit_max:
-        return False
-    _gpt_rate_limit_store[chat_id].append(now)
-    return True
+    return _hit_rate_limit(f"tg_gpt:{chat_id}", _GPT_RATE_LIMIT)
+
+
+def state_stats() -> dict:
+    """Estado por chat deste worker e do store partilhado (dedupe, rate limits) (health)."""
+    try:
+        shared = get_store().stats()
+    except Exception as e:
+        shared = {'error': str(e)}
+    return {
+        'conversation_memory': _conversation_memory.stats(),
+        'shared_state': shared,
+    }
 
 
 def _is_obvious_transaction(text: str) -> bool:
@@ -431,18 +401,10 @@ def _build_financial_context(user: models.User, workspace: models.Workspace, db:
     # Totais do mes
     # Nota: SQLAlchemy 2.x exige que os "whens" sejam passados como argumentos posicionais,
     # não como lista. Usamos tuplos individuais em vez de lista de tuplos.
-    q = db.query(
-        func.sum(case((models.Transaction.amount_cents < 0, models.Transaction.amount_cents), else_=0)),
-        func.sum(case((models.Transaction.amount_cents > 0, models.Transaction.amount_cents), else_=0)),
-        func.count(models.Transaction.id),
-    ).filter(
-        models.Transaction.workspace_id == workspace.id,
-        models.Transaction.transaction_date >= first_day,
-        models.Transaction.transaction_date <= today,
-    ).first()
-    expenses_cents = abs(int(q[0] or 0))
-    income_cents = int(q[1] or 0)
-    tx_count = int(q[2] or 0)
+    month_totals = month_rollup.totals(db, workspace.id, first_day, through=today)
+    expenses_cents = abs(month_totals.debit_cents)
+    income_cents = month_totals.credit_cents
+    tx_count = month_totals.count
     balance_cents = income_cents - expenses_cents
 
     # Top 5 categorias de despesa do mes
@@ -642,7 +604,7 @@ REGRAS:
 """
 
 
-async def ai_route_message(
+def ai_route_message(
     text: str,
     chat_id: str,
     user: models.User,
@@ -1048,53 +1010,16 @@ def find_similar_transaction(text: str, workspace_id: uuid.UUID, db: Session, ti
     Busca transações similares no histórico (dados históricos).
     Prioridade máxima antes de IA: quanto mais hits, menos chamadas à OpenAI.
     Usa chave canonical (igual ao motor) para consistência.
-    NÃO usa transações de seed (1 cêntimo).
+    NÃO usa transações de seed (is_seed).
     """
     cache_key = _description_cache_key(text)
     if not cache_key:
         return None
-    words = set(cache_key.split())
-    if not words:
+    best = best_similar_category(db, workspace_id, tipo, cache_key)
+    if not best:
         return None
-
-    cutoff_date = date.today() - timedelta(days=180)
-    transactions = db.query(models.Transaction).filter(
-        models.Transaction.workspace_id == workspace_id,
-        models.Transaction.transaction_date >= cutoff_date,
-        models.Transaction.category_id.isnot(None),
-    ).order_by(models.Transaction.transaction_date.desc()).limit(500).all()
-
-    if tipo == "expense":
-        transactions = [t for t in transactions if t.amount_cents < 0 and abs(t.amount_cents) != 1]
-    else:
-        transactions = [t for t in transactions if t.amount_cents > 0 and abs(t.amount_cents) != 1]
-
-    best_match = None
-    best_score = 0
-    best_description = None
-
-    for trans in transactions:
-        if not trans.description:
-            continue
-        desc_can = _description_cache_key(trans.description)
-        desc_words = set(desc_can.split())
-        common = words.intersection(desc_words)
-        if not common:
-            continue
-        score = len(common) + sum(2 for w in common if len(w) > 4)
-        days_ago = (date.today() - trans.transaction_date).days
-        score += 3 if days_ago <= 7 else (2 if days_ago <= 30 else (1 if days_ago <= 90 else 0))
-        has_important = any(len(w) > 4 for w in common)
-        # Relaxado: 1 palavra importante OU 2+ palavras em comum (favorece histórico antes de IA)
-        accept = (has_important and len(common) >= 1) or len(common) >= 2
-        if accept and score >= 2 and score > best_score:
-            best_score = score
-            best_match = trans.category_id
-            best_description = trans.description
-
-    if best_match:
-        logger.info("Histórico similar: '%s' -> category_id (score=%s)", best_description, best_score)
-    return best_match
+    logger.info("Histórico similar: '%s' -> category_id (score=%s)", best[2], best[1])
+    return best[0]
 
 def validate_email(email: str) -> bool:
     """Valida formato de email"""
@@ -1401,7 +1326,8 @@ def parse_transaction(
     # Limites de valor (evitar input acidental)
     MAX_AMOUNT = 999_999.99
 
-    # Processar cada valor encontrado
+    # 1) Valor, tipo e descrição de cada valor encontrado
+    lines = []
     for i, valor_match in enumerate(valor_matches):
         # Extrair valor (suporta -15€)
         valor_str = valor_match.group(1).replace(' ', '').replace('.', '').replace(',', '.')
@@ -1472,7 +1398,19 @@ def parse_transaction(
         description = _strip_date_from_description(description)[:255]
         if not description:
             description = "Transação Telegram"
-        
+        lines.append((amount, tipo, description))
+
+    # Token scoring de todas as linhas num só lote (as que chegam ao motor usam-no em infer_category)
+    line_scores = [None] * len(lines)
+    if not specified_category and len(lines) > 1:
+        try:
+            from ..core.categorization_engine import score_descriptions
+            line_scores = score_descriptions([(d, t) for _, t, d in lines], workspace.id, db, models)
+        except Exception as e:
+            logger.warning("Token scoring em lote falhou: %s", e)
+
+    # 2) Categoria de cada linha
+    for (amount, tipo, description), token_scores in zip(lines, line_scores):
         inference_source = "fallback"
         needs_review = True
         decision_reason = ""
@@ -1536,6 +1474,7 @@ def parse_transaction(
                         settings,
                         explicit_category_id=None,
                         use_gemini=False,  # IA só para imagens; texto não chama OpenAI
+                        token_scores=token_scores,
                     )
                     category_id = cat_id
                     inference_source = source
@@ -2069,6 +2008,17 @@ def _build_parsed_from_photo_result(
             "income": [c for c in all_cats if c.type == "income"],
         }
         transactions = []
+        # Token scoring de todas as linhas do documento num só lote (usado se chegarem ao motor)
+        items = photo_result["transactions"]
+        item_scores = [None] * raw_count
+        try:
+            from ..core.categorization_engine import score_descriptions
+            item_scores = score_descriptions(
+                [((item.get("description") or "").strip()[:255], _photo_item_type(item)) for item in items],
+                workspace.id, db, models,
+            )
+        except Exception as e:
+            logger.warning("[_build_parsed_from_photo_result] Token scoring em lote falhou: %s", e)
         # A partir de 4 transações, processar em paralelo (categorização IA é o gargalo)
         if raw_count >= 4:
             def _cat_ref(c):
@@ -2081,22 +2031,22 @@ def _build_parsed_from_photo_result(
                 for t, cats in categories_by_type.items()
             }
 
-            def _process_one(item):
+            def _process_one(item, token_scores):
                 session = SessionLocal()
                 try:
                     return _parsed_from_photo(
-                        item, workspace.id, session, categories_by_type=refs
+                        item, workspace.id, session, categories_by_type=refs, token_scores=token_scores
                     )
                 finally:
                     session.close()
 
             with ThreadPoolExecutor(max_workers=4) as executor:
-                results = list(executor.map(_process_one, photo_result["transactions"]))
+                results = list(executor.map(_process_one, items, item_scores))
             transactions = [r for r in results if r]
         else:
-            for item in photo_result["transactions"]:
+            for item, token_scores in zip(items, item_scores):
                 parsed_one = _parsed_from_photo(
-                    item, workspace, db, categories_by_type=categories_by_type
+                    item, workspace, db, categories_by_type=categories_by_type, token_scores=token_scores
                 )
                 if parsed_one:
                     transactions.append(parsed_one)
@@ -2114,17 +2064,24 @@ def _build_parsed_from_photo_result(
     return _parsed_from_photo(photo_result, workspace, db)
 
 
+def _photo_item_type(photo_data: Dict) -> str:
+    tipo = (photo_data.get("type") or "expense").lower()
+    return tipo if tipo in ("expense", "income") else "expense"
+
+
 def _parsed_from_photo(
     photo_data: Dict,
     workspace: models.Workspace,
     db: Session,
     *,
     categories_by_type: Optional[Dict[str, List[models.Category]]] = None,
+    token_scores=None,
 ) -> Optional[Dict]:
     """
     Constrói um dict 'parsed' (mesmo formato que parse_transaction para transação única)
     a partir de um item (amount, description, type, date, category) devolvido pela Vision.
     Se categories_by_type for passado, evita query de categorias e reutiliza a lista para category_obj.
+    token_scores: token scoring do item já calculado em lote (score_descriptions) para o motor.
     workspace pode ser objeto Workspace ou UUID (path paralelo).
     """
     workspace_id = getattr(workspace, "id", None) or workspace
@@ -2134,9 +2091,7 @@ def _parsed_from_photo(
     except (TypeError, ValueError) as e:
         logger.warning("[_parsed_from_photo] amount inválido: %s", e)
         return None
-    tipo = (photo_data.get("type") or "expense").lower()
-    if tipo not in ("expense", "income"):
-        tipo = "expense"
+    tipo = _photo_item_type(photo_data)
     if not description or amount <= 0:
         logger.warning("[_parsed_from_photo] Dados inválidos: description vazia ou amount<=0 (description=%r amount=%s)", description or "(vazio)", amount)
         return None
@@ -2194,6 +2149,7 @@ def _parsed_from_photo(
                 _settings,
                 explicit_category_id=None,
                 use_gemini=True,
+                token_scores=token_scores,
             )
             category_id = cat_id
             inference_source = source
@@ -2226,471 +2182,6 @@ def _parsed_from_photo(
     return result
 
 
-# Redimensionar/comprimir imagem para Vision: menos tokens = resposta mais rápida
-VISION_MAX_PIXELS = 1024
-VISION_JPEG_QUALITY = 82
-VISION_MIN_BYTES_TO_COMPRESS = 80 * 1024  # Só comprimir se > ~80KB
-
-
-def _compress_image_for_vision(content: bytes, file_path: str, content_len: int):
-    """
-    Redimensiona e comprime a imagem para reduzir payload e tokens na Vision.
-    Retorna (bytes_finais, mime). Se falhar ou imagem já pequena, devolve original.
-    """
-    mime = "image/jpeg"
-    if file_path and file_path.lower().endswith(".png"):
-        mime = "image/png"
-    elif file_path and file_path.lower().endswith(".webp"):
-        mime = "image/webp"
-    if content_len < VISION_MIN_BYTES_TO_COMPRESS:
-        return content, mime
-    try:
-        from io import BytesIO
-        from PIL import Image
-        img = Image.open(BytesIO(content))
-        if img.mode in ("RGBA", "P"):
-            img = img.convert("RGB")
-        w, h = img.size
-        if w <= VISION_MAX_PIXELS and h <= VISION_MAX_PIXELS and content_len < 200 * 1024:
-            return content, mime
-        ratio = min(VISION_MAX_PIXELS / w, VISION_MAX_PIXELS / h, 1.0)
-        if ratio < 1.0:
-            new_w, new_h = int(w * ratio), int(h * ratio)
-            img = img.resize((new_w, new_h), Image.Resampling.LANCZOS)
-        buf = BytesIO()
-        img.save(buf, format="JPEG", quality=VISION_JPEG_QUALITY, optimize=True)
-        out = buf.getvalue()
-        logger.info("[OpenAI Vision] Imagem comprimida: %s -> %s bytes (%.0f%%)", content_len, len(out), 100 * len(out) / max(1, content_len))
-        return out, "image/jpeg"
-    except Exception as e:
-        logger.warning("[OpenAI Vision] Compressão falhou, usa original: %s", e)
-        return content, mime
-
-
-def _download_telegram_file(file_id: str, max_size_mb: int = 20) -> Optional[bytes]:
-    """Descarrega um ficheiro do Telegram por file_id. Devolve o conteúdo em bytes ou None."""
-    if not settings.TELEGRAM_BOT_TOKEN:
-        return None
-    try:
-        get_file_url = f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/getFile?file_id={file_id}"
-        r = requests.get(get_file_url, timeout=10)
-        r.raise_for_status()
-        data = r.json()
-        if not data.get("ok") or "result" not in data:
-            return None
-        file_path = data["result"].get("file_path")
-        if not file_path:
-            return None
-        download_url = f"https://api.telegram.org/file/bot{settings.TELEGRAM_BOT_TOKEN}/{file_path}"
-        resp = requests.get(download_url, timeout=30)
-        resp.raise_for_status()
-        content = resp.content
-        if not content or len(content) > max_size_mb * 1024 * 1024:
-            return None
-        return content
-    except Exception as e:
-        logger.warning("[Telegram] Download de ficheiro falhou: %s", e)
-        return None
-
-
-def _extract_text_from_pdf(content: bytes) -> Optional[str]:
-    """Extrai texto de um PDF. Devolve string com newlines ou None se falhar."""
-    try:
-        from pypdf import PdfReader
-        reader = PdfReader(io.BytesIO(content))
-        parts = []
-        for page in reader.pages:
-            try:
-                t = page.extract_text()
-                if t and t.strip():
-                    parts.append(t.strip())
-            except Exception:
-                continue
-        if not parts:
-            return None
-        return "\n".join(parts)
-    except Exception as e:
-        logger.warning("[Telegram] Extração de texto do PDF falhou: %s", e)
-        return None
-
-
-def _extract_text_from_csv(content: bytes) -> Optional[str]:
-    """Extrai linhas tipo 'descrição valor€' de CSV (; ou ,). Devolve texto para parse_transaction."""
-    import csv
-    raw = None
-    for enc in ('utf-8', 'utf-8-sig', 'latin-1', 'cp1252'):
-        try:
-            raw = content.decode(enc)
-            break
-        except Exception:
-            continue
-    if not raw or not raw.strip():
-        return None
-    lines = raw.strip().splitlines()
-    if not lines:
-        return None
-    # Detetar delimitador (; ou , ou tab)
-    first = lines[0]
-    delim = ';' if ';' in first and first.count(';') >= 1 else (',' if ',' in first else '\t')
-    reader = csv.reader(io.StringIO(raw), delimiter=delim)
-    rows = list(reader)
-    if not rows:
-        return None
-    # Primeira linha pode ser cabeçalho: se segunda linha tiver número, primeira é header
-    start = 0
-    if len(rows) > 1:
-        second = rows[1]
-        has_num = any(re.search(r'-?\d+[.,]\d*', str(c)) for c in second)
-        if has_num and not any(re.search(r'-?\d+[.,]\d*', str(c)) for c in rows[0]):
-            start = 1
-    amount_pattern = re.compile(r'(-?\d{1,3}(?:[.\s]\d{3})*(?:[.,]\d+)?)\s*(?:€|eur|euros?|e)?\s*$', re.IGNORECASE)
-    parts = []
-    for row in rows[start:]:
-        if not row:
-            continue
-        row = [str(c).strip() for c in row if c is not None]
-        amount_val = None
-        desc_parts = []
-        for i, cell in enumerate(row):
-            if not cell:
-                continue
-            m = amount_pattern.search(cell.replace(' ', ''))
-            if m:
-                try:
-                    v = float(m.group(1).replace(' ', '').replace('.', '').replace(',', '.'))
-                    if abs(v) < 1e9:
-                        amount_val = v
-                        desc_parts = [c for j, c in enumerate(row) if j != i and c and not amount_pattern.search(str(c).replace(' ', ''))]
-                        if not desc_parts:
-                            desc_parts = [c for j, c in enumerate(row) if j != i and c]
-                        break
-                except ValueError:
-                    pass
-            desc_parts.append(cell)
-        if amount_val is not None and (desc_parts or row):
-            desc = ' '.join(desc_parts) if desc_parts else (row[0] if row else 'Movimento')
-            desc = re.sub(r'\s+', ' ', desc).strip()[:200]
-            if desc:
-                parts.append(f"{desc} {amount_val}€")
-    if not parts:
-        return None
-    return ' '.join(parts)
-
-
-def _extract_text_from_xlsx(content: bytes) -> Optional[str]:
-    """Extrai linhas tipo 'descrição valor€' de Excel (.xlsx)."""
-    try:
-        from openpyxl import load_workbook
-        wb = load_workbook(io.BytesIO(content), read_only=True, data_only=True)
-        ws = wb.active
-        if not ws:
-            return None
-        rows = list(ws.iter_rows(values_only=True))
-        wb.close()
-    except Exception as e:
-        logger.warning("[Telegram] Extração Excel falhou: %s", e)
-        return None
-    if not rows:
-        return None
-    start = 0
-    if len(rows) > 1:
-        second = rows[1]
-        has_num = any(v is not None and re.search(r'-?\d+[.,]\d*', str(v)) for v in (second or []))
-        first_vals = rows[0] or []
-        if has_num and not any(v is not None and re.search(r'-?\d+[.,]\d*', str(v)) for v in first_vals):
-            start = 1
-    amount_pattern = re.compile(r'(-?\d{1,3}(?:[.\s]\d{3})*(?:[.,]\d+)?)\s*(?:€|eur|euros?|e)?\s*$', re.IGNORECASE)
-    parts = []
-    for row in rows[start:]:
-        if not row:
-            continue
-        row = [str(v).strip() if v is not None else '' for v in row]
-        amount_val = None
-        desc_parts = []
-        for i, cell in enumerate(row):
-            if not cell:
-                continue
-            cell_clean = cell.replace(' ', '')
-            m = amount_pattern.search(cell_clean)
-            if m:
-                try:
-                    v = float(m.group(1).replace(' ', '').replace('.', '').replace(',', '.'))
-                    if abs(v) < 1e9:
-                        amount_val = v
-                        desc_parts = [c for j, c in enumerate(row) if j != i and c and not amount_pattern.search(str(c).replace(' ', ''))]
-                        if not desc_parts:
-                            desc_parts = [c for j, c in enumerate(row) if j != i and c]
-                        break
-                except ValueError:
-                    pass
-            desc_parts.append(cell)
-        if amount_val is not None and (desc_parts or any(row)):
-            desc = ' '.join(desc_parts) if desc_parts else (row[0] or 'Movimento')
-            desc = re.sub(r'\s+', ' ', desc).strip()[:200]
-            if desc:
-                parts.append(f"{desc} {amount_val}€")
-    if not parts:
-        return None
-    return ' '.join(parts)
-
-
-def process_photo_with_openai(file_id: str, categories: List[models.Category]) -> Optional[Dict]:
-    """
-    Descarrega a foto do Telegram, comprime se necessário, e envia para OpenAI vision
-    para extrair transações (uma ou lista para extratos).
-    """
-    logger.info("[OpenAI Vision] Início process_photo_with_openai file_id=%s categories_count=%s", file_id[:20] if file_id else None, len(categories) if categories else 0)
-    if not settings.TELEGRAM_BOT_TOKEN:
-        logger.warning("[OpenAI Vision] TELEGRAM_BOT_TOKEN não configurado")
-        return None
-    if not settings.OPENAI_API_KEY:
-        logger.warning("[OpenAI Vision] OPENAI_API_KEY não configurado")
-        return None
-    try:
-        # 1. Obter file_path do Telegram
-        get_file_url = f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/getFile?file_id={file_id}"
-        r = requests.get(get_file_url, timeout=10)
-        r.raise_for_status()
-        data = r.json()
-        if not data.get("ok") or "result" not in data:
-            logger.warning("[OpenAI Vision] Telegram getFile falhou: ok=%s result_present=%s body=%s", data.get("ok"), "result" in data, data)
-            return None
-        file_path = data["result"].get("file_path")
-        if not file_path:
-            logger.warning("[OpenAI Vision] getFile sem file_path: %s", data.get("result"))
-            return None
-        logger.info("[OpenAI Vision] file_path obtido: %s", file_path)
-        # 2. Descarregar o ficheiro
-        download_url = f"https://api.telegram.org/file/bot{settings.TELEGRAM_BOT_TOKEN}/{file_path}"
-        img_resp = requests.get(download_url, timeout=15)
-        img_resp.raise_for_status()
-        content = img_resp.content
-        content_len = len(content) if content else 0
-        if not content:
-            logger.warning("[OpenAI Vision] Download vazio")
-            return None
-        if content_len > 20 * 1024 * 1024:
-            logger.warning("[OpenAI Vision] Imagem demasiado grande: %s bytes (máx 20MB)", content_len)
-            return None
-        logger.info("[OpenAI Vision] Imagem descarregada: %s bytes", content_len)
-        content, mime = _compress_image_for_vision(content, file_path, content_len)
-        import base64
-        from openai import OpenAI
-        from datetime import datetime as dt
-        b64 = base64.b64encode(content).decode("utf-8")
-        data_url = f"data:{mime};base64,{b64}"
-        logger.info("[OpenAI Vision] Payload após compressão: %s bytes", len(content))
-
-        expense_names = [c.name for c in categories if getattr(c, "type", "expense") == "expense"]
-        income_names = [c.name for c in categories if getattr(c, "type", "income") == "income"]
-        cats_expense = ", ".join(expense_names) if expense_names else "(nenhuma)"
-        cats_income = ", ".join(income_names) if income_names else "(nenhuma)"
-
-        prompt = f"""Extrai transações desta imagem.
-
-Se for EXTRATO/TABELA (Data, Descrição, Valor, Categoria, Comerciante): lista TODAS as linhas. Cada linha = uma transação. Data→YYYY-MM-DD. Valor negativo→amount positivo, type expense. Categoria na tabela ou infere. Ignora ID e Saldo.
-Se for RECIBO único: uma transação.
-
-Data hoje: {dt.now().strftime('%Y-%m-%d')}
-Categorias (nome EXATO): expense={cats_expense} | income={cats_income}
-
-JSON só, sem markdown:
-{{"transactions":[{{"amount":n,"description":"...","type":"expense","date":"YYYY-MM-DD","category":"NomeExato"}}]}}"""
-        client = OpenAI(api_key=settings.OPENAI_API_KEY)
-        logger.info("[OpenAI Vision] A chamar OpenAI (imagem %s bytes)...", len(content))
-        VISION_RETRY_DELAYS = [2, 5]
-        text_response = ""
-        for attempt in range(1 + len(VISION_RETRY_DELAYS)):
-            try:
-                response = client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    messages=[
-                        {
-                            "role": "user",
-                            "content": [
-                                {"type": "text", "text": prompt},
-                                {"type": "image_url", "image_url": {"url": data_url}},
-                            ],
-                        }
-                    ],
-                    max_tokens=1500,
-                    temperature=0.05,
-                )
-                if response.choices and response.choices[0].message.content:
-                    text_response = response.choices[0].message.content.strip()
-                break
-            except OpenAIRateLimitError:
-                raise
-            except Exception as api_err:
-                err_str = str(api_err).lower()
-                is_429 = (
-                    getattr(api_err, "status_code", None) == 429
-                    or "429" in str(api_err)
-                    or "rate_limit" in err_str
-                    or "too many requests" in err_str
-                )
-                is_timeout = "timeout" in err_str or "timed out" in err_str
-                if (is_429 or is_timeout) and attempt < len(VISION_RETRY_DELAYS):
-                    delay = VISION_RETRY_DELAYS[attempt]
-                    logger.warning("[OpenAI Vision] Tentativa %s falhou (%s), retry em %ss", attempt + 1, api_err, delay)
-                    time.sleep(delay)
-                    continue
-                if is_429:
-                    raise OpenAIRateLimitError(api_err) from api_err
-                raise
-        if not text_response:
-            logger.warning("[OpenAI Vision] OpenAI respondeu sem content. choices=%s", len(response.choices) if response.choices else 0)
-            return None
-        logger.info("[OpenAI Vision] Resposta bruta (primeiros 500 chars): %s", (text_response[:500] + "..." if len(text_response) > 500 else text_response))
-        clean = re.search(r"\{[\s\S]*\}", text_response)
-        if clean:
-            text_response = clean.group(0)
-        try:
-            parsed = json.loads(text_response)
-        except json.JSONDecodeError as je:
-            logger.warning("[OpenAI Vision] JSON inválido: %s. raw=%s", je, text_response[:300])
-            return None
-        transactions_raw = parsed.get("transactions")
-        if isinstance(transactions_raw, list) and len(transactions_raw) > 0:
-            out = []
-            for item in transactions_raw:
-                amount = float(item.get("amount", 0))
-                description = (item.get("description") or "").strip()[:255]
-                tipo = (item.get("type") or "expense").lower()
-                if tipo not in ("expense", "income"):
-                    tipo = "expense"
-                date_str = item.get("date") or dt.now().strftime("%Y-%m-%d")
-                category_name = (item.get("category") or "").strip()
-                if not description:
-                    description = "Transação"
-                if amount <= 0 and tipo == "expense":
-                    amount = abs(amount)
-                out.append({
-                    "amount": amount,
-                    "description": description,
-                    "type": tipo,
-                    "date": date_str,
-                    "category": category_name or None,
-                })
-            logger.info("[OpenAI Vision] Extraídas %s transações da imagem", len(out))
-            return {"transactions": out}
-        if isinstance(parsed.get("amount"), (int, float)):
-            amount = float(parsed.get("amount", 0))
-            description = (parsed.get("description") or "").strip()[:255]
-            tipo = (parsed.get("type") or "expense").lower()
-            if tipo not in ("expense", "income"):
-                tipo = "expense"
-            date_str = parsed.get("date") or dt.now().strftime("%Y-%m-%d")
-            category_name = (parsed.get("category") or "").strip()
-            if not description or amount <= 0:
-                logger.warning("[OpenAI Vision] Dados inválidos: description=%r amount=%s", description or "(vazio)", amount)
-                return None
-            return {
-                "amount": amount,
-                "description": description,
-                "type": tipo,
-                "date": date_str,
-                "category": category_name or None,
-            }
-        logger.warning("[OpenAI Vision] Resposta sem 'transactions' nem campos de uma transação: %s", list(parsed.keys()) if isinstance(parsed, dict) else type(parsed))
-        return None
-    except OpenAIRateLimitError:
-        raise
-    except Exception as e:
-        err_str = str(e).lower()
-        is_rate_limit = (
-            getattr(e, "status_code", None) == 429
-            or "429" in str(e)
-            or "rate_limit" in err_str
-            or "too many requests" in err_str
-            or "quota" in err_str
-        )
-        if is_rate_limit:
-            logger.warning("[OpenAI Vision] Rate limit (429) - demasiados pedidos ou quota excedida: %s", e)
-            raise OpenAIRateLimitError(e) from e
-        logger.exception("[OpenAI Vision] Erro ao processar foto: %s", e)
-        return None
-
-
-def _ogg_to_mp3_bytes(content: bytes) -> Optional[bytes]:
-    """Converte áudio OGG (ex.: mensagem de voz Telegram) para MP3 para compatibilidade com Whisper."""
-    try:
-        from pydub import AudioSegment
-        seg = AudioSegment.from_file(io.BytesIO(content), format="ogg")
-        buf = io.BytesIO()
-        seg.export(buf, format="mp3")
-        buf.seek(0)
-        return buf.read()
-    except Exception as e:
-        logger.warning("[Whisper] Conversão OGG->MP3 falhou: %s", e)
-        return None
-
-
-def transcribe_audio_from_telegram(message: dict) -> Optional[str]:
-    """
-    Obtém file_id de message['voice'] ou message['audio'], descarrega o ficheiro,
-    converte OGG para MP3 se necessário, e envia para OpenAI Whisper. Devolve o texto transcrito ou None.
-    """
-    voice = message.get("voice") or message.get("audio")
-    if not voice:
-        return None
-    file_id = voice.get("file_id")
-    if not file_id:
-        return None
-    if not settings.TELEGRAM_BOT_TOKEN or not settings.OPENAI_API_KEY:
-        logger.warning("[Whisper] TELEGRAM_BOT_TOKEN ou OPENAI_API_KEY não configurado")
-        return None
-    try:
-        get_file_url = f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/getFile?file_id={file_id}"
-        r = requests.get(get_file_url, timeout=10)
-        r.raise_for_status()
-        data = r.json()
-        if not data.get("ok") or "result" not in data:
-            logger.warning("[Whisper] getFile falhou: %s", data)
-            return None
-        file_path = data["result"].get("file_path")
-        if not file_path:
-            return None
-        download_url = f"https://api.telegram.org/file/bot{settings.TELEGRAM_BOT_TOKEN}/{file_path}"
-        resp = requests.get(download_url, timeout=15)
-        resp.raise_for_status()
-        content = resp.content
-        if not content or len(content) > 25 * 1024 * 1024:
-            logger.warning("[Whisper] Áudio vazio ou >25MB: %s bytes", len(content) if content else 0)
-            return None
-        # Whisper suporta mp3, m4a, wav, webm; Telegram voice é normalmente .ogg
-        ext = (file_path or "").lower().split(".")[-1] if "." in (file_path or "") else ""
-        if ext == "ogg":
-            mp3_content = _ogg_to_mp3_bytes(content)
-            if mp3_content:
-                content = mp3_content
-                ext = "mp3"
-            else:
-                logger.warning("[Whisper] Áudio OGG sem conversão (instala ffmpeg para voz Telegram)")
-                return None
-        suffix = f".{ext}" if ext in ("mp3", "mp4", "mpeg", "mpga", "m4a", "wav", "webm") else ".mp3"
-        with tempfile.NamedTemporaryFile(suffix=suffix, delete=True) as tmp:
-            tmp.write(content)
-            tmp.flush()
-            from openai import OpenAI
-            client = OpenAI(api_key=settings.OPENAI_API_KEY)
-            with open(tmp.name, "rb") as f:
-                transcript = client.audio.transcriptions.create(model="whisper-1", file=f)
-        text = (transcript.text or "").strip()
-        if not text:
-            return None
-        logger.info("[Whisper] Transcrição: %s...", text[:80] if len(text) > 80 else text)
-        return text
-    except OpenAIRateLimitError:
-        raise
-    except Exception as e:
-        err_str = str(e).lower()
-        if "429" in err_str or "rate" in err_str or "quota" in err_str:
-            raise OpenAIRateLimitError(e) from e
-        logger.exception("[Whisper] Erro ao transcrever áudio: %s", e)
-        return None
-
-
 def _chunk_text_for_telegram(text: str, max_len: int = TELEGRAM_MAX_MESSAGE_LENGTH) -> List[str]:
     """Divide texto em blocos <= max_len, cortando preferencialmente em newline."""
     if len(text) <= max_len:
@@ -2721,7 +2212,6 @@ def send_telegram_msg(chat_id: int, text: str, reply_markup: Optional[Dict] = No
     if not (text or text.strip()):
         return None
 
-    url = f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/sendMessage"
     chunks = _chunk_text_for_telegram(text.strip())
     last_result = None
 
@@ -2739,35 +2229,18 @@ def send_telegram_msg(chat_id: int, text: str, reply_markup: Optional[Dict] = No
         if reply_markup and i == len(chunks) - 1:
             payload["reply_markup"] = reply_markup
 
-        try:
-            response = requests.post(url, json=payload, timeout=5)
-            response.raise_for_status()
-            last_result = response.json()
-        except requests.exceptions.HTTPError as e:
-            if getattr(e, "response", None) and getattr(e.response, "status_code", None) == 400:
-                try:
-                    err_body = e.response.json() if e.response.text else {}
-                    err_desc = (err_body.get("description") or "").lower()
-                except Exception:
-                    err_desc = ""
-                if "too long" in err_desc or "message is too long" in err_desc:
-                    logger.warning("Mensagem ainda longa após chunking, a truncar: %s", err_desc)
-                    payload["text"] = chunk[:TELEGRAM_MAX_MESSAGE_LENGTH - 50] + "\n\n(… truncado)"
-                if "parse_mode" in payload:
-                    payload.pop("parse_mode", None)
-                try:
-                    response = requests.post(url, json=payload, timeout=5)
-                    response.raise_for_status()
-                    last_result = response.json()
-                except Exception as e2:
-                    logger.error("Erro ao enviar mensagem Telegram (sem parse_mode): %s", e2)
-                    return last_result
-            else:
-                logger.error("Erro HTTP ao enviar mensagem Telegram: %s - %s", getattr(e.response, "status_code", ""), getattr(e.response, "text", ""))
-                return last_result
-        except Exception as e:
-            logger.error("Erro ao enviar mensagem Telegram: %s", e)
+        result = telegram_client.call_sync("sendMessage", payload)
+        if result is not None and not result.get("ok") and result.get("error_code") == 400:
+            err_desc = (result.get("description") or "").lower()
+            if "too long" in err_desc or "message is too long" in err_desc:
+                logger.warning("Mensagem ainda longa após chunking, a truncar: %s", err_desc)
+                payload["text"] = chunk[:TELEGRAM_MAX_MESSAGE_LENGTH - 50] + "\n\n(… truncado)"
+            payload.pop("parse_mode", None)
+            result = telegram_client.call_sync("sendMessage", payload)
+        if not result or not result.get("ok"):
+            logger.error("Erro ao enviar mensagem Telegram: %s", (result or {}).get("description", "sem resposta"))
             return last_result
+        last_result = result
 
     sent_message_id = None
     if last_result:
@@ -2777,11 +2250,9 @@ def send_telegram_msg(chat_id: int, text: str, reply_markup: Optional[Dict] = No
         try:
             message_id = sent_message_id
             if message_id:
-                pin_url = f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/pinChatMessage"
-                requests.post(
-                    pin_url,
-                    json={"chat_id": chat_id, "message_id": message_id, "disable_notification": True},
-                    timeout=5,
+                telegram_client.call_sync(
+                    "pinChatMessage",
+                    {"chat_id": chat_id, "message_id": message_id, "disable_notification": True},
                 )
                 logger.info("Mensagem fixada: message_id=%s", message_id)
         except Exception as e:
@@ -2791,29 +2262,25 @@ def send_telegram_msg(chat_id: int, text: str, reply_markup: Optional[Dict] = No
 
 
 def _send_typing_action(chat_id: int) -> bool:
-    """Envia indicador 'a escrever...' (três pontos) no Telegram."""
+    """Envia indicador 'a escrever...' (três pontos) no Telegram, sem esperar pela resposta."""
     if not settings.TELEGRAM_BOT_TOKEN:
         return False
-    url = f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/sendChatAction"
-    try:
-        r = requests.post(url, json={"chat_id": chat_id, "action": "typing"}, timeout=5)
-        return r.ok
-    except Exception as e:
-        logger.warning("Erro ao enviar typing action: %s", e)
-        return False
+    telegram_client.send_nowait("sendChatAction", {"chat_id": chat_id, "action": "typing"})
+    return True
+
+
+def _answer_callback_query(callback_query_id: str) -> None:
+    """Fecha o 'a carregar' do botão inline, sem esperar pela resposta."""
+    if settings.TELEGRAM_BOT_TOKEN:
+        telegram_client.send_nowait("answerCallbackQuery", {"callback_query_id": callback_query_id})
 
 
 def _delete_telegram_msg(chat_id: int, message_id: int) -> bool:
     """Apaga uma mensagem no Telegram (ex: indicador 'a pensar...')."""
     if not settings.TELEGRAM_BOT_TOKEN or not message_id:
         return False
-    url = f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/deleteMessage"
-    try:
-        r = requests.post(url, json={"chat_id": chat_id, "message_id": message_id}, timeout=5)
-        return r.ok
-    except Exception as e:
-        logger.warning("Erro ao apagar mensagem Telegram: %s", e)
-        return False
+    result = telegram_client.call_sync("deleteMessage", {"chat_id": chat_id, "message_id": message_id})
+    return bool(result and result.get("ok"))
 
 
 def edit_telegram_message(chat_id: int, message_id: int, text: str, reply_markup: Optional[Dict] = None) -> bool:
@@ -2824,17 +2291,28 @@ def edit_telegram_message(chat_id: int, message_id: int, text: str, reply_markup
         text = text[: TELEGRAM_MAX_MESSAGE_LENGTH - 30] + "\n\n(… truncado)"
     # Telegram HTML não suporta <br>; usar \n
     text = text.replace("<br>", "\n").replace("<br/>", "\n").replace("<br />", "\n")
-    url = f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/editMessageText"
     payload = {"chat_id": chat_id, "message_id": message_id, "text": text, "parse_mode": "HTML"}
     if reply_markup:
         payload["reply_markup"] = reply_markup
+    # Edições seguidas da mesma mensagem (ex.: lista do batch) são agrupadas pelo cliente
+    result = telegram_client.edit_message_sync(payload)
+    return bool(result and result.get("ok"))
+
+
+def _pending_batch_filter(chat_id, batch_id_hex: str) -> tuple:
+    """
+    Filtro SQL dos pendentes de um batch pelos 16 primeiros hex do batch_id (o que vai no botão):
+    intervalo [prefixo000..., prefixofff...], servido pelo índice (chat_id, batch_id).
+    """
+    pending = models.TelegramPendingTransaction
     try:
-        r = requests.post(url, json=payload, timeout=5)
-        r.raise_for_status()
-        return True
-    except Exception as e:
-        logger.warning("[Telegram] editMessageText falhou: %s", e)
-        return False
+        if len(batch_id_hex) != 16:
+            raise ValueError(batch_id_hex)
+        low = uuid.UUID(batch_id_hex + '0' * 16)
+        high = uuid.UUID(batch_id_hex + 'f' * 16)
+    except ValueError:
+        return (false(),)
+    return (pending.chat_id == str(chat_id), pending.batch_id >= low, pending.batch_id <= high)
 
 
 def _build_batch_message_and_keyboard(
@@ -2846,14 +2324,10 @@ def _build_batch_message_and_keyboard(
     """Constrói texto e inline_keyboard para a lista de pendentes do batch. Devolve (message_text, reply_markup) ou (None, None) se não houver pendentes."""
     pendents_batch = (
         db.query(models.TelegramPendingTransaction)
-        .filter(
-            models.TelegramPendingTransaction.chat_id == chat_id,
-            models.TelegramPendingTransaction.batch_id.isnot(None),
-        )
+        .filter(*_pending_batch_filter(chat_id, batch_id_hex))
         .order_by(models.TelegramPendingTransaction.created_at)
         .all()
     )
-    pendents_batch = [p for p in pendents_batch if p.batch_id and p.batch_id.hex[:16] == batch_id_hex]
     if not pendents_batch:
         return None, None
     lines = []
@@ -2908,13 +2382,11 @@ def setup_bot_commands():
         {"command": "categoria", "description": "🏷️ Categoria por defeito (nome ou stop)"},
     ]
     
-    url = f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/setMyCommands"
-    try:
-        response = requests.post(url, json={"commands": commands}, timeout=5)
-        response.raise_for_status()
+    result = telegram_client.call_sync("setMyCommands", {"commands": commands})
+    if result and result.get("ok"):
         logger.info("Comandos do bot configurados com sucesso (menu /)")
-    except Exception as e:
-        logger.error("Erro ao configurar comandos do bot: %s", e)
+    else:
+        logger.error("Erro ao configurar comandos do bot: %s", (result or {}).get("description", "sem resposta"))
 
 def setup_bot_info():
     """Configura informações adicionais do bot (descrição, about, etc.)"""
@@ -2922,16 +2394,10 @@ def setup_bot_info():
         logger.warning("TELEGRAM_BOT_TOKEN não configurado - não é possível configurar informações")
         return
     
-    base_url = f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}"
-    
     # Configurar descrição curta (aparece no perfil do bot)
     try:
         short_desc = "🧘‍♂️ O teu ecossistema financeiro inteligente. Regista transações em segundos."
-        requests.post(
-            f"{base_url}/setMyShortDescription",
-            json={'short_description': short_desc},
-            timeout=5
-        )
+        telegram_client.call_sync("setMyShortDescription", {'short_description': short_desc})
         logger.info("Descrição curta do bot configurada")
     except Exception as e:
         logger.warning(f"Erro ao configurar descrição curta: {str(e)}")
@@ -2948,11 +2414,7 @@ def setup_bot_info():
             "• Confirmação opcional de transações\n\n"
             "🧘‍♂️ Domina o teu dinheiro com simplicidade."
         )
-        requests.post(
-            f"{base_url}/setMyDescription",
-            json={'description': full_desc},
-            timeout=5
-        )
+        telegram_client.call_sync("setMyDescription", {'description': full_desc})
         logger.info("Descrição completa do bot configurada")
     except Exception as e:
         logger.warning(f"Erro ao configurar descrição completa: {str(e)}")
@@ -2960,11 +2422,7 @@ def setup_bot_info():
     # Configurar nome do bot (se ainda não estiver configurado)
     try:
         bot_name = "Finly Bot"
-        requests.post(
-            f"{base_url}/setMyName",
-            json={'name': bot_name},
-            timeout=5
-        )
+        telegram_client.call_sync("setMyName", {'name': bot_name})
         logger.info("Nome do bot configurado")
     except Exception as e:
         logger.warning(f"Erro ao configurar nome do bot: {str(e)}")
@@ -2981,26 +2439,82 @@ async def telegram_webhook(
     logger.info("Webhook Telegram recebido")
     logger.info(f"Headers: X-Telegram-Bot-Api-Secret-Token presente: {x_telegram_bot_api_secret_token is not None}")
     
+    # Validação do secret token
+    if settings.TELEGRAM_WEBHOOK_SECRET:
+        logger.info(f"Validando secret token... (configurado: {bool(settings.TELEGRAM_WEBHOOK_SECRET)})")
+        if not x_telegram_bot_api_secret_token or x_telegram_bot_api_secret_token != settings.TELEGRAM_WEBHOOK_SECRET:
+            logger.warning(f"Tentativa de acesso ao webhook sem token válido. Recebido: {x_telegram_bot_api_secret_token is not None}, Esperado: {settings.TELEGRAM_WEBHOOK_SECRET[:10]}...")
+            raise HTTPException(status_code=403, detail="Invalid secret token")
+        logger.info("Secret token valido [OK]")
+    else:
+        logger.warning("TELEGRAM_WEBHOOK_SECRET não configurado - validação desativada")
+    
     try:
-        # Validação do secret token
-        if settings.TELEGRAM_WEBHOOK_SECRET:
-            logger.info(f"Validando secret token... (configurado: {bool(settings.TELEGRAM_WEBHOOK_SECRET)})")
-            if not x_telegram_bot_api_secret_token or x_telegram_bot_api_secret_token != settings.TELEGRAM_WEBHOOK_SECRET:
-                logger.warning(f"Tentativa de acesso ao webhook sem token válido. Recebido: {x_telegram_bot_api_secret_token is not None}, Esperado: {settings.TELEGRAM_WEBHOOK_SECRET[:10]}...")
-                raise HTTPException(status_code=403, detail="Invalid secret token")
-            logger.info("Secret token valido [OK]")
-        else:
-            logger.warning("TELEGRAM_WEBHOOK_SECRET não configurado - validação desativada")
-        
         data = await request.json()
+    except Exception as e:
+        logger.error(f"Payload Telegram inválido: {str(e)}")
+        return {'status': 'error'}
+    
+    # Idempotência: reenvio já visto (por qualquer worker); a PK de telegram_updates cobre os restantes
+    update_id = data.get('update_id')
+    if await run_blocking(_is_duplicate_update, update_id):
+        logger.info("Update %s já recebido (idempotência), ignorar", update_id)
+        return {'status': 'duplicate'}
+
+    if update_id is None or not telegram_queue.running:
+        # Sem fila (update inválido, ou app sem startup: scripts/testes): processar já, no threadpool
+        return await run_blocking(_process_telegram_update, data, db)
+
+    # Gravar e responder já; os workers da fila processam (BD, OpenAI, Whisper, Vision) em segundo plano
+    chat_id = update_chat_id(data)
+    try:
+        is_new = await run_blocking(persist_update, db, update_id, chat_id, data)
+    except Exception:
+        await run_blocking(_forget_update, update_id)  # não gravado: aceitar o reenvio do Telegram
+        raise
+    if not is_new:
+        return {'status': 'duplicate'}
+    telegram_queue.enqueue(update_id, chat_id)
+    return {'status': 'queued'}
+
+
+async def start_update_queue():
+    """Arranca os workers da fila de updates (startup da app)."""
+    await telegram_queue.start(_process_queued_update)
+
+
+def _process_queued_update(data: dict, db: Session, last_attempt: bool):
+    """
+    Worker da fila: lança a exceção em caso de erro (a fila faz rollback e decide se volta a tentar) e
+    só envia a mensagem de erro ao utilizador quando não há nova tentativa: última tentativa, ou falha
+    depois de um commit do handler (não se repete para não duplicar pendentes/transações).
+    """
+    try:
+        return _process_telegram_update(data, db, raise_errors=True, notify_errors=False)
+    except Exception:
+        if last_attempt or handler_committed(db):
+            _notify_update_error(data, db)
+        raise
+
+
+def _notify_update_error(data: dict, db: Session) -> None:
+    """Mensagem de erro genérica no idioma do utilizador do chat do update (best effort)."""
+    try:
+        chat_id = (data.get('message') or {}).get('chat', {}).get('id') or (data.get('callback_query') or {}).get('message', {}).get('chat', {}).get('id') if data else None
+        if chat_id and db:
+            user_temp = db.query(models.User).filter(models.User.phone_number == str(chat_id)).first()
+            lang = (user_temp.language if user_temp and user_temp.language else None) or 'pt'
+            t_err = get_telegram_t(lang)
+            send_telegram_msg(chat_id, t_err('generic_error'))
+    except Exception:
+        pass
+
+
+def _process_telegram_update(data: dict, db: Session, raise_errors: bool = False, notify_errors: bool = True):
+    """Processa um update do Telegram já validado e deduplicado (threadpool: worker da fila ou inline)."""
+    try:
         logger.info(f"Payload recebido: {json.dumps(data, indent=2, ensure_ascii=False)[:500]}...")  # Primeiros 500 chars
         
-        # Idempotência: ignorar update já processado (reenvios do Telegram)
-        update_id = data.get('update_id')
-        if _is_duplicate_update(update_id):
-            logger.info("Update %s já processado (idempotência), ignorar", update_id)
-            return {'status': 'duplicate'}
-        
         # Processar callback_query (botões inline)
         if 'callback_query' in data:
             logger.info("Processando callback_query (botão inline)")
@@ -3034,22 +2548,14 @@ async def telegram_webhook(
             if callback_data.startswith("confirm_batch_"):
                 batch_id_hex = callback_data.replace("confirm_batch_", "").strip()[:16]
                 logger.info("[Telegram] confirm_batch: batch_id_hex=%r chat_id=%s", batch_id_hex, chat_id)
-                all_pending = db.query(models.TelegramPendingTransaction).filter(
-                    models.TelegramPendingTransaction.chat_id == str(chat_id),
-                ).all()
                 # Match exato pelos 16 primeiros chars do batch_id (como no botão)
-                batch_pendents = [p for p in all_pending if p.batch_id and p.batch_id.hex[:16] == batch_id_hex]
-                logger.info("[Telegram] confirm_batch: all_pending=%s batch_pendents=%s", len(all_pending), len(batch_pendents))
+                batch_pendents = db.query(models.TelegramPendingTransaction).filter(
+                    *_pending_batch_filter(chat_id, batch_id_hex)
+                ).all()
+                logger.info("[Telegram] confirm_batch: batch_pendents=%s", len(batch_pendents))
                 if not batch_id_hex or not batch_pendents:
                     send_telegram_msg(chat_id, t('transaction_not_found'))
-                    try:
-                        requests.post(
-                            f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/answerCallbackQuery",
-                            json={'callback_query_id': callback_query['id']},
-                            timeout=5,
-                        )
-                    except Exception:
-                        pass
+                    _answer_callback_query(callback_query['id'])
                     return {'status': 'not_found'}
                 for pending in batch_pendents:
                     transaction = models.Transaction(
@@ -3073,14 +2579,7 @@ async def telegram_webhook(
                     db.delete(pending)
                 db.commit()
                 logger.info("[Telegram] confirm_batch: criadas %s transações para chat_id=%s", len(batch_pendents), chat_id)
-                try:
-                    requests.post(
-                        f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/answerCallbackQuery",
-                        json={'callback_query_id': callback_query['id']},
-                        timeout=5,
-                    )
-                except Exception:
-                    pass
+                _answer_callback_query(callback_query['id'])
                 send_telegram_msg(chat_id, t('list_confirmed'))
                 return {'status': 'confirmed'}
             elif callback_data.startswith("create_cat_"):
@@ -3096,14 +2595,7 @@ async def telegram_webhook(
                         break
                 if not pending:
                     send_telegram_msg(chat_id, t('transaction_not_found'))
-                    try:
-                        requests.post(
-                            f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/answerCallbackQuery",
-                            json={'callback_query_id': callback_query['id']},
-                            timeout=5,
-                        )
-                    except Exception:
-                        pass
+                    _answer_callback_query(callback_query['id'])
                     return {'status': 'not_found'}
                 suggested_name = (pending.suggested_category_name or "").strip()[:100]
                 if not suggested_name:
@@ -3137,14 +2629,7 @@ async def telegram_webhook(
                 pending.category_id = new_category_id
                 pending.suggested_category_name = None
                 db.commit()
-                try:
-                    requests.post(
-                        f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/answerCallbackQuery",
-                        json={'callback_query_id': callback_query['id']},
-                        timeout=5,
-                    )
-                except Exception:
-                    pass
+                _answer_callback_query(callback_query['id'])
                 msg = t('category_created_confirm').format(name=new_category_name)
                 tipo_emoji = "" if pending.amount_cents < 0 else "💰"
                 tipo_texto = t('type_expense') if pending.amount_cents < 0 else t('type_income')
@@ -3180,14 +2665,7 @@ async def telegram_webhook(
                 if pending:
                     db.delete(pending)
                     db.commit()
-                try:
-                    requests.post(
-                        f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/answerCallbackQuery",
-                        json={'callback_query_id': callback_query['id']},
-                        timeout=5,
-                    )
-                except Exception:
-                    pass
+                _answer_callback_query(callback_query['id'])
                 send_telegram_msg(chat_id, t('transaction_cancelled'))
                 return {'status': 'cancelled'}
             elif callback_data.startswith("changecat_"):
@@ -3197,14 +2675,7 @@ async def telegram_webhook(
                 ).all()
                 pending = next((p for p in all_p if p.id.hex[:16] == pending_id_hex), None)
                 if not pending or pending.batch_id:
-                    try:
-                        requests.post(
-                            f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/answerCallbackQuery",
-                            json={'callback_query_id': callback_query['id']},
-                            timeout=5,
-                        )
-                    except Exception:
-                        pass
+                    _answer_callback_query(callback_query['id'])
                     return {'status': 'not_found'}
                 tipo = "expense" if pending.amount_cents < 0 else "income"
                 categories = db.query(models.Category).filter(
@@ -3220,14 +2691,7 @@ async def telegram_webhook(
                         row = []
                 if row:
                     keyboard.append(row)
-                try:
-                    requests.post(
-                        f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/answerCallbackQuery",
-                        json={'callback_query_id': callback_query['id']},
-                        timeout=5,
-                    )
-                except Exception:
-                    pass
+                _answer_callback_query(callback_query['id'])
                 edit_telegram_message(
                     chat_id,
                     callback_query["message"]["message_id"],
@@ -3245,14 +2709,7 @@ async def telegram_webhook(
                 ).all()
                 pending = next((p for p in all_p if p.id.hex[:16] == pending_id_hex), None)
                 if not pending or pending.batch_id:
-                    try:
-                        requests.post(
-                            f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/answerCallbackQuery",
-                            json={'callback_query_id': callback_query['id']},
-                            timeout=5,
-                        )
-                    except Exception:
-                        pass
+                    _answer_callback_query(callback_query['id'])
                     return {'status': 'not_found'}
                 try:
                     cat_uuid = uuid.UUID(category_id_str)
@@ -3276,14 +2733,7 @@ async def telegram_webhook(
                     )
                 except Exception as lc_err:
                     logger.warning("learn_from_correction falhou: %s", lc_err)
-                try:
-                    requests.post(
-                        f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/answerCallbackQuery",
-                        json={'callback_query_id': callback_query['id']},
-                        timeout=5,
-                    )
-                except Exception:
-                    pass
+                _answer_callback_query(callback_query['id'])
                 tipo_emoji = "" if pending.amount_cents < 0 else "💰"
                 tipo_texto = t('type_expense') if pending.amount_cents < 0 else t('type_income')
                 msg = t('transaction_pending').format(
@@ -3305,21 +2755,13 @@ async def telegram_webhook(
                 return {'status': 'category_updated'}
             elif callback_data.startswith("cancel_batch_"):
                 batch_id_hex = callback_data.replace("cancel_batch_", "")
-                all_pending = db.query(models.TelegramPendingTransaction).filter(
-                    models.TelegramPendingTransaction.chat_id == str(chat_id),
+                batch_pendents = db.query(models.TelegramPendingTransaction).filter(
+                    *_pending_batch_filter(chat_id, batch_id_hex)
                 ).all()
-                batch_pendents = [p for p in all_pending if p.batch_id and p.batch_id.hex[:16] == batch_id_hex]
                 for pending in batch_pendents:
                     db.delete(pending)
                 db.commit()
-                try:
-                    requests.post(
-                        f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/answerCallbackQuery",
-                        json={'callback_query_id': callback_query['id']},
-                        timeout=5,
-                    )
-                except Exception:
-                    pass
+                _answer_callback_query(callback_query['id'])
                 send_telegram_msg(chat_id, t('list_cancelled'))
                 return {'status': 'cancelled'}
             elif callback_data.startswith("confirm_"):
@@ -3380,14 +2822,7 @@ async def telegram_webhook(
                 db.commit()
                 logger.info("Transacao confirmada e commitada com sucesso")
                 
-                try:
-                    requests.post(
-                        f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/answerCallbackQuery",
-                        json={'callback_query_id': callback_query['id']},
-                        timeout=5,
-                    )
-                except Exception as e:
-                    logger.error(f"Erro ao responder callback: {str(e)}")
+                _answer_callback_query(callback_query['id'])
                 
                 if from_batch and batch_id_hex:
                     message_id = callback_query.get("message", {}).get("message_id")
@@ -3463,14 +2898,7 @@ async def telegram_webhook(
                     db.delete(pending)
                     db.commit()
                     logger.info(f"Transação pendente eliminada com sucesso: id={pending.id}")
-                    try:
-                        requests.post(
-                            f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/answerCallbackQuery",
-                            json={'callback_query_id': callback_query['id']},
-                            timeout=5,
-                        )
-                    except Exception as e:
-                        logger.error(f"Erro ao responder callback query: {str(e)}")
+                    _answer_callback_query(callback_query['id'])
                     if batch_id_hex:
                         message_id = callback_query.get("message", {}).get("message_id")
                         if message_id is not None:
@@ -3505,7 +2933,7 @@ async def telegram_webhook(
             t_audio = get_telegram_t(language)
             _send_typing_action(chat_id)
             try:
-                text = transcribe_audio_from_telegram(message) or ""
+                text = telegram_media.transcribe_audio_from_telegram(message) or ""
             except OpenAIRateLimitError as e:
                 logger.warning("[Telegram] Whisper rate limit (429): %s", e)
                 send_telegram_msg(chat_id, t_audio('photo_rate_limit'))
@@ -3615,18 +3043,10 @@ async def telegram_webhook(
                 return {'status': 'error'}
             today = date.today()
             first_day = today.replace(day=1)
-            q = db.query(
-                func.sum(case((models.Transaction.amount_cents < 0, models.Transaction.amount_cents), else_=0)),
-                func.sum(case((models.Transaction.amount_cents > 0, models.Transaction.amount_cents), else_=0)),
-                func.count(models.Transaction.id),
-            ).filter(
-                models.Transaction.workspace_id == workspace.id,
-                models.Transaction.transaction_date >= first_day,
-                models.Transaction.transaction_date <= today,
-            ).first()
-            expenses_cents = int(q[0] or 0)
-            income_cents = int(q[1] or 0)
-            count = int(q[2] or 0)
+            month_totals = month_rollup.totals(db, workspace.id, first_day, through=today)
+            expenses_cents = month_totals.debit_cents
+            income_cents = month_totals.credit_cents
+            count = month_totals.count
             expenses = abs(expenses_cents) / 100
             income = income_cents / 100
             balance = income - abs(expenses_cents) / 100
@@ -3779,11 +3199,13 @@ async def telegram_webhook(
             lang_arg = (part[1].strip().lower() if len(part) > 1 else "") or "pt"
             if lang_arg in ("en", "english"):
                 user.language = "en"
+                user_cache.invalidate_user(user, db)
                 db.commit()
                 t_lang = get_telegram_t("en")
                 send_telegram_msg(chat_id, t_lang('language_set_en'))
             else:
                 user.language = "pt"
+                user_cache.invalidate_user(user, db)
                 db.commit()
                 t_lang = get_telegram_t("pt")
                 send_telegram_msg(chat_id, t_lang('language_set'))
@@ -3898,13 +3320,12 @@ async def telegram_webhook(
                 desc = (tx.description or "").replace(",", ";").replace('"', "'")
                 csv_lines.append(f"{tx.transaction_date},{desc},{abs(tx.amount_cents)/100:.2f},{cat_name},{tx_type}")
             csv_content = "\n".join(csv_lines)
-            try:
-                csv_bytes = csv_content.encode('utf-8-sig')
-                files = {'document': (f"finly_{period_label}_{today.isoformat()}.csv", io.BytesIO(csv_bytes), 'text/csv')}
-                url_doc = f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/sendDocument"
-                requests.post(url_doc, data={"chat_id": chat_id}, files=files, timeout=15)
-            except Exception as e:
-                logger.error(f"Erro ao enviar CSV: {e}")
+            csv_bytes = csv_content.encode('utf-8-sig')
+            # bytes (não BytesIO): o cliente pode ter de reenviar o ficheiro num retry
+            files = {'document': (f"finly_{period_label}_{today.isoformat()}.csv", csv_bytes, 'text/csv')}
+            result = telegram_client.call_sync("sendDocument", {"chat_id": str(chat_id)}, files=files, timeout=15)
+            if not result or not result.get("ok"):
+                logger.error("Erro ao enviar CSV: %s", (result or {}).get("description", "sem resposta"))
                 send_telegram_msg(chat_id, t_exp('export_error'))
             return {'status': 'ok'}
         
@@ -3985,6 +3406,8 @@ async def telegram_webhook(
             )
             db.add(new_recurring)
             db.commit()
+            from ..routes.transactions import process_automatic_recurring
+            process_automatic_recurring(db, workspace_rec.id)
             send_telegram_msg(chat_id, t_rec('recurring_created').format(
                 description=desc_text[:100],
                 amount=f"{amount_val:.2f}",
@@ -4122,7 +3545,7 @@ async def telegram_webhook(
                 _send_typing_action(chat_id)
                 all_categories = db.query(models.Category).filter(models.Category.workspace_id == workspace.id).all()
                 try:
-                    photo_result = process_photo_with_openai(file_id, all_categories)
+                    photo_result = telegram_media.process_photo_with_openai(file_id, all_categories)
                 except OpenAIRateLimitError as e:
                     logger.warning("[Telegram] OpenAI rate limit (document image): %s", e)
                     send_telegram_msg(chat_id, t('photo_rate_limit'))
@@ -4146,16 +3569,16 @@ async def telegram_webhook(
 
             elif is_pdf or is_csv or is_xlsx:
                 _send_typing_action(chat_id)
-                content = _download_telegram_file(file_id)
+                content = telegram_media.download_telegram_file(file_id)
                 if not content:
                     send_telegram_msg(chat_id, t('document_not_supported'))
                     return {'status': 'error'}
                 if is_pdf:
-                    extracted = _extract_text_from_pdf(content)
+                    extracted = telegram_media.extract_text_from_pdf(content)
                 elif is_csv:
-                    extracted = _extract_text_from_csv(content)
+                    extracted = telegram_media.extract_text_from_csv(content)
                 else:
-                    extracted = _extract_text_from_xlsx(content)
+                    extracted = telegram_media.extract_text_from_xlsx(content)
                 if not extracted or len(extracted.strip()) < 5:
                     send_telegram_msg(chat_id, t('document_no_data'))
                     return {'status': 'error'}
@@ -4207,7 +3630,7 @@ async def telegram_webhook(
             ).all()
             logger.info("[Telegram] Foto recebida file_id=%s workspace_id=%s categorias=%s", file_id[:20] if file_id else None, workspace.id, len(all_categories))
             try:
-                photo_result = process_photo_with_openai(file_id, all_categories)
+                photo_result = telegram_media.process_photo_with_openai(file_id, all_categories)
             except OpenAIRateLimitError as e:
                 logger.warning("[Telegram] OpenAI rate limit (429): %s -> enviando photo_rate_limit", e)
                 send_telegram_msg(chat_id, t('photo_rate_limit'))
@@ -4277,7 +3700,7 @@ async def telegram_webhook(
                 # Guardar mensagem do user na memória de conversa
                 _add_to_memory(str(chat_id), "user", text)
 
-                result = await ai_route_message(text, str(chat_id), user, workspace, db, t)
+                result = ai_route_message(text, str(chat_id), user, workspace, db, t)
                 intent = result.get("intent", "fallback")
                 logger.info("[AI Router] intent=%s para texto='%s'", intent, text[:60])
 
@@ -4451,10 +3874,10 @@ async def telegram_webhook(
                 models.TelegramPendingTransaction.amount_cents == amount_cents,
                 models.TelegramPendingTransaction.batch_id.is_(None),
             ).all()
-            for ex in existing:
-                if _description_cache_key(ex.description) == cache_key:
-                    send_telegram_msg(chat_id, t('pending_duplicate'))
-                    return {'status': 'duplicate_pending'}
+            from ..core.categorization_engine import canonicalize_many
+            if cache_key in canonicalize_many(ex.description for ex in existing):
+                send_telegram_msg(chat_id, t('pending_duplicate'))
+                return {'status': 'duplicate_pending'}
         
         # Se a IA sugeriu uma categoria que não existe: perguntar se quer criar
         if suggested_category_name and not parsed.get('category_id'):
@@ -4583,12 +4006,11 @@ async def telegram_webhook(
         import traceback
         logger.error(f"Traceback completo: {traceback.format_exc()}")
         try:
-            chat_id = (data.get('message') or {}).get('chat', {}).get('id') or (data.get('callback_query') or {}).get('message', {}).get('chat', {}).get('id') if data else None
-            if chat_id and db:
-                user_temp = db.query(models.User).filter(models.User.phone_number == str(chat_id)).first()
-                lang = (user_temp.language if user_temp and user_temp.language else None) or 'pt'
-                t_err = get_telegram_t(lang)
-                send_telegram_msg(chat_id, t_err('generic_error'))
+            db.rollback()  # um erro de BD deixa a transação abortada: a query do idioma falharia
         except Exception:
             pass
+        if notify_errors:
+            _notify_update_error(data, db)
+        if raise_errors:
+            raise
         return {'status': 'error'}
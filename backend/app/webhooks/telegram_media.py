@@ -0,0 +1,436 @@
+"""
+Telegram: processamento de ficheiros (fotos, PDF, CSV, Excel, voz).
+
+Separado de telegram.py para que o caminho de texto (a maioria das mensagens) não carregue
+este código nem as dependências de media (Pillow, pypdf, openpyxl, pydub, OpenAI Vision/Whisper),
+que continuam importadas só dentro das funções que as usam. telegram.py importa este módulo
+de forma diferida (lazy_module) no primeiro ficheiro recebido.
+"""
+import io
+import json
+import re
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+from ..core.config import settings
+from ..core.telegram_client import telegram_client
+from ..models import database as models
+from .telegram import OpenAIRateLimitError, logger
+
+
+# Redimensionar/comprimir imagem para Vision: menos tokens = resposta mais rápida
+VISION_MAX_PIXELS = 1024
+VISION_JPEG_QUALITY = 82
+VISION_MIN_BYTES_TO_COMPRESS = 80 * 1024  # Só comprimir se > ~80KB
+
+
+def _compress_image_for_vision(content: bytes, file_path: str, content_len: int):
+    """
+    Redimensiona e comprime a imagem para reduzir payload e tokens na Vision.
+    Retorna (bytes_finais, mime). Se falhar ou imagem já pequena, devolve original.
+    """
+    mime = "image/jpeg"
+    if file_path and file_path.lower().endswith(".png"):
+        mime = "image/png"
+    elif file_path and file_path.lower().endswith(".webp"):
+        mime = "image/webp"
+    if content_len < VISION_MIN_BYTES_TO_COMPRESS:
+        return content, mime
+    try:
+        from io import BytesIO
+        from PIL import Image
+        img = Image.open(BytesIO(content))
+        if img.mode in ("RGBA", "P"):
+            img = img.convert("RGB")
+        w, h = img.size
+        if w <= VISION_MAX_PIXELS and h <= VISION_MAX_PIXELS and content_len < 200 * 1024:
+            return content, mime
+        ratio = min(VISION_MAX_PIXELS / w, VISION_MAX_PIXELS / h, 1.0)
+        if ratio < 1.0:
+            new_w, new_h = int(w * ratio), int(h * ratio)
+            img = img.resize((new_w, new_h), Image.Resampling.LANCZOS)
+        buf = BytesIO()
+        img.save(buf, format="JPEG", quality=VISION_JPEG_QUALITY, optimize=True)
+        out = buf.getvalue()
+        logger.info("[OpenAI Vision] Imagem comprimida: %s -> %s bytes (%.0f%%)", content_len, len(out), 100 * len(out) / max(1, content_len))
+        return out, "image/jpeg"
+    except Exception as e:
+        logger.warning("[OpenAI Vision] Compressão falhou, usa original: %s", e)
+        return content, mime
+
+
+def download_telegram_file(file_id: str, max_size_mb: int = 20) -> Optional[bytes]:
+    """Descarrega um ficheiro do Telegram por file_id. Devolve o conteúdo em bytes ou None."""
+    if not settings.TELEGRAM_BOT_TOKEN:
+        return None
+    downloaded = telegram_client.download_file_sync(file_id, max_bytes=max_size_mb * 1024 * 1024)
+    return downloaded[0] if downloaded else None
+
+
+def extract_text_from_pdf(content: bytes) -> Optional[str]:
+    """Extrai texto de um PDF. Devolve string com newlines ou None se falhar."""
+    try:
+        from pypdf import PdfReader
+        reader = PdfReader(io.BytesIO(content))
+        parts = []
+        for page in reader.pages:
+            try:
+                t = page.extract_text()
+                if t and t.strip():
+                    parts.append(t.strip())
+            except Exception:
+                continue
+        if not parts:
+            return None
+        return "\n".join(parts)
+    except Exception as e:
+        logger.warning("[Telegram] Extração de texto do PDF falhou: %s", e)
+        return None
+
+
+def extract_text_from_csv(content: bytes) -> Optional[str]:
+    """Extrai linhas tipo 'descrição valor€' de CSV (; ou ,). Devolve texto para parse_transaction."""
+    import csv
+    raw = None
+    for enc in ('utf-8', 'utf-8-sig', 'latin-1', 'cp1252'):
+        try:
+            raw = content.decode(enc)
+            break
+        except Exception:
+            continue
+    if not raw or not raw.strip():
+        return None
+    lines = raw.strip().splitlines()
+    if not lines:
+        return None
+    # Detetar delimitador (; ou , ou tab)
+    first = lines[0]
+    delim = ';' if ';' in first and first.count(';') >= 1 else (',' if ',' in first else '\t')
+    reader = csv.reader(io.StringIO(raw), delimiter=delim)
+    rows = list(reader)
+    if not rows:
+        return None
+    # Primeira linha pode ser cabeçalho: se segunda linha tiver número, primeira é header
+    start = 0
+    if len(rows) > 1:
+        second = rows[1]
+        has_num = any(re.search(r'-?\d+[.,]\d*', str(c)) for c in second)
+        if has_num and not any(re.search(r'-?\d+[.,]\d*', str(c)) for c in rows[0]):
+            start = 1
+    amount_pattern = re.compile(r'(-?\d{1,3}(?:[.\s]\d{3})*(?:[.,]\d+)?)\s*(?:€|eur|euros?|e)?\s*$', re.IGNORECASE)
+    parts = []
+    for row in rows[start:]:
+        if not row:
+            continue
+        row = [str(c).strip() for c in row if c is not None]
+        amount_val = None
+        desc_parts = []
+        for i, cell in enumerate(row):
+            if not cell:
+                continue
+            m = amount_pattern.search(cell.replace(' ', ''))
+            if m:
+                try:
+                    v = float(m.group(1).replace(' ', '').replace('.', '').replace(',', '.'))
+                    if abs(v) < 1e9:
+                        amount_val = v
+                        desc_parts = [c for j, c in enumerate(row) if j != i and c and not amount_pattern.search(str(c).replace(' ', ''))]
+                        if not desc_parts:
+                            desc_parts = [c for j, c in enumerate(row) if j != i and c]
+                        break
+                except ValueError:
+                    pass
+            desc_parts.append(cell)
+        if amount_val is not None and (desc_parts or row):
+            desc = ' '.join(desc_parts) if desc_parts else (row[0] if row else 'Movimento')
+            desc = re.sub(r'\s+', ' ', desc).strip()[:200]
+            if desc:
+                parts.append(f"{desc} {amount_val}€")
+    if not parts:
+        return None
+    return ' '.join(parts)
+
+
+def extract_text_from_xlsx(content: bytes) -> Optional[str]:
+    """Extrai linhas tipo 'descrição valor€' de Excel (.xlsx)."""
+    try:
+        from openpyxl import load_workbook
+        wb = load_workbook(io.BytesIO(content), read_only=True, data_only=True)
+        ws = wb.active
+        if not ws:
+            return None
+        rows = list(ws.iter_rows(values_only=True))
+        wb.close()
+    except Exception as e:
+        logger.warning("[Telegram] Extração Excel falhou: %s", e)
+        return None
+    if not rows:
+        return None
+    start = 0
+    if len(rows) > 1:
+        second = rows[1]
+        has_num = any(v is not None and re.search(r'-?\d+[.,]\d*', str(v)) for v in (second or []))
+        first_vals = rows[0] or []
+        if has_num and not any(v is not None and re.search(r'-?\d+[.,]\d*', str(v)) for v in first_vals):
+            start = 1
+    amount_pattern = re.compile(r'(-?\d{1,3}(?:[.\s]\d{3})*(?:[.,]\d+)?)\s*(?:€|eur|euros?|e)?\s*$', re.IGNORECASE)
+    parts = []
+    for row in rows[start:]:
+        if not row:
+            continue
+        row = [str(v).strip() if v is not None else '' for v in row]
+        amount_val = None
+        desc_parts = []
+        for i, cell in enumerate(row):
+            if not cell:
+                continue
+            cell_clean = cell.replace(' ', '')
+            m = amount_pattern.search(cell_clean)
+            if m:
+                try:
+                    v = float(m.group(1).replace(' ', '').replace('.', '').replace(',', '.'))
+                    if abs(v) < 1e9:
+                        amount_val = v
+                        desc_parts = [c for j, c in enumerate(row) if j != i and c and not amount_pattern.search(str(c).replace(' ', ''))]
+                        if not desc_parts:
+                            desc_parts = [c for j, c in enumerate(row) if j != i and c]
+                        break
+                except ValueError:
+                    pass
+            desc_parts.append(cell)
+        if amount_val is not None and (desc_parts or any(row)):
+            desc = ' '.join(desc_parts) if desc_parts else (row[0] or 'Movimento')
+            desc = re.sub(r'\s+', ' ', desc).strip()[:200]
+            if desc:
+                parts.append(f"{desc} {amount_val}€")
+    if not parts:
+        return None
+    return ' '.join(parts)
+
+
+def process_photo_with_openai(file_id: str, categories: List[models.Category]) -> Optional[Dict]:
+    """
+    Descarrega a foto do Telegram, comprime se necessário, e envia para OpenAI vision
+    para extrair transações (uma ou lista para extratos).
+    """
+    logger.info("[OpenAI Vision] Início process_photo_with_openai file_id=%s categories_count=%s", file_id[:20] if file_id else None, len(categories) if categories else 0)
+    if not settings.TELEGRAM_BOT_TOKEN:
+        logger.warning("[OpenAI Vision] TELEGRAM_BOT_TOKEN não configurado")
+        return None
+    if not settings.OPENAI_API_KEY:
+        logger.warning("[OpenAI Vision] OPENAI_API_KEY não configurado")
+        return None
+    try:
+        # 1-2. getFile + download da imagem (máx 20MB)
+        downloaded = telegram_client.download_file_sync(file_id, max_bytes=20 * 1024 * 1024, timeout=15)
+        if not downloaded:
+            logger.warning("[OpenAI Vision] Download da imagem falhou ou excede 20MB")
+            return None
+        content, file_path = downloaded
+        content_len = len(content)
+        logger.info("[OpenAI Vision] Imagem descarregada: %s bytes (%s)", content_len, file_path)
+        content, mime = _compress_image_for_vision(content, file_path, content_len)
+        import base64
+        from openai import OpenAI
+        from datetime import datetime as dt
+        b64 = base64.b64encode(content).decode("utf-8")
+        data_url = f"data:{mime};base64,{b64}"
+        logger.info("[OpenAI Vision] Payload após compressão: %s bytes", len(content))
+
+        expense_names = [c.name for c in categories if getattr(c, "type", "expense") == "expense"]
+        income_names = [c.name for c in categories if getattr(c, "type", "income") == "income"]
+        cats_expense = ", ".join(expense_names) if expense_names else "(nenhuma)"
+        cats_income = ", ".join(income_names) if income_names else "(nenhuma)"
+
+        prompt = f"""Extrai transações desta imagem.
+
+Se for EXTRATO/TABELA (Data, Descrição, Valor, Categoria, Comerciante): lista TODAS as linhas. Cada linha = uma transação. Data→YYYY-MM-DD. Valor negativo→amount positivo, type expense. Categoria na tabela ou infere. Ignora ID e Saldo.
+Se for RECIBO único: uma transação.
+
+Data hoje: {dt.now().strftime('%Y-%m-%d')}
+Categorias (nome EXATO): expense={cats_expense} | income={cats_income}
+
+JSON só, sem markdown:
+{{"transactions":[{{"amount":n,"description":"...","type":"expense","date":"YYYY-MM-DD","category":"NomeExato"}}]}}"""
+        client = OpenAI(api_key=settings.OPENAI_API_KEY)
+        logger.info("[OpenAI Vision] A chamar OpenAI (imagem %s bytes)...", len(content))
+        VISION_RETRY_DELAYS = [2, 5]
+        text_response = ""
+        for attempt in range(1 + len(VISION_RETRY_DELAYS)):
+            try:
+                response = client.chat.completions.create(
+                    model="gpt-4o-mini",
+                    messages=[
+                        {
+                            "role": "user",
+                            "content": [
+                                {"type": "text", "text": prompt},
+                                {"type": "image_url", "image_url": {"url": data_url}},
+                            ],
+                        }
+                    ],
+                    max_tokens=1500,
+                    temperature=0.05,
+                )
+                if response.choices and response.choices[0].message.content:
+                    text_response = response.choices[0].message.content.strip()
+                break
+            except OpenAIRateLimitError:
+                raise
+            except Exception as api_err:
+                err_str = str(api_err).lower()
+                is_429 = (
+                    getattr(api_err, "status_code", None) == 429
+                    or "429" in str(api_err)
+                    or "rate_limit" in err_str
+                    or "too many requests" in err_str
+                )
+                is_timeout = "timeout" in err_str or "timed out" in err_str
+                if (is_429 or is_timeout) and attempt < len(VISION_RETRY_DELAYS):
+                    delay = VISION_RETRY_DELAYS[attempt]
+                    logger.warning("[OpenAI Vision] Tentativa %s falhou (%s), retry em %ss", attempt + 1, api_err, delay)
+                    time.sleep(delay)
+                    continue
+                if is_429:
+                    raise OpenAIRateLimitError(api_err) from api_err
+                raise
+        if not text_response:
+            logger.warning("[OpenAI Vision] OpenAI respondeu sem content. choices=%s", len(response.choices) if response.choices else 0)
+            return None
+        logger.info("[OpenAI Vision] Resposta bruta (primeiros 500 chars): %s", (text_response[:500] + "..." if len(text_response) > 500 else text_response))
+        clean = re.search(r"\{[\s\S]*\}", text_response)
+        if clean:
+            text_response = clean.group(0)
+        try:
+            parsed = json.loads(text_response)
+        except json.JSONDecodeError as je:
+            logger.warning("[OpenAI Vision] JSON inválido: %s. raw=%s", je, text_response[:300])
+            return None
+        transactions_raw = parsed.get("transactions")
+        if isinstance(transactions_raw, list) and len(transactions_raw) > 0:
+            out = []
+            for item in transactions_raw:
+                amount = float(item.get("amount", 0))
+                description = (item.get("description") or "").strip()[:255]
+                tipo = (item.get("type") or "expense").lower()
+                if tipo not in ("expense", "income"):
+                    tipo = "expense"
+                date_str = item.get("date") or dt.now().strftime("%Y-%m-%d")
+                category_name = (item.get("category") or "").strip()
+                if not description:
+                    description = "Transação"
+                if amount <= 0 and tipo == "expense":
+                    amount = abs(amount)
+                out.append({
+                    "amount": amount,
+                    "description": description,
+                    "type": tipo,
+                    "date": date_str,
+                    "category": category_name or None,
+                })
+            logger.info("[OpenAI Vision] Extraídas %s transações da imagem", len(out))
+            return {"transactions": out}
+        if isinstance(parsed.get("amount"), (int, float)):
+            amount = float(parsed.get("amount", 0))
+            description = (parsed.get("description") or "").strip()[:255]
+            tipo = (parsed.get("type") or "expense").lower()
+            if tipo not in ("expense", "income"):
+                tipo = "expense"
+            date_str = parsed.get("date") or dt.now().strftime("%Y-%m-%d")
+            category_name = (parsed.get("category") or "").strip()
+            if not description or amount <= 0:
+                logger.warning("[OpenAI Vision] Dados inválidos: description=%r amount=%s", description or "(vazio)", amount)
+                return None
+            return {
+                "amount": amount,
+                "description": description,
+                "type": tipo,
+                "date": date_str,
+                "category": category_name or None,
+            }
+        logger.warning("[OpenAI Vision] Resposta sem 'transactions' nem campos de uma transação: %s", list(parsed.keys()) if isinstance(parsed, dict) else type(parsed))
+        return None
+    except OpenAIRateLimitError:
+        raise
+    except Exception as e:
+        err_str = str(e).lower()
+        is_rate_limit = (
+            getattr(e, "status_code", None) == 429
+            or "429" in str(e)
+            or "rate_limit" in err_str
+            or "too many requests" in err_str
+            or "quota" in err_str
+        )
+        if is_rate_limit:
+            logger.warning("[OpenAI Vision] Rate limit (429) - demasiados pedidos ou quota excedida: %s", e)
+            raise OpenAIRateLimitError(e) from e
+        logger.exception("[OpenAI Vision] Erro ao processar foto: %s", e)
+        return None
+
+
+def _ogg_to_mp3_bytes(content: bytes) -> Optional[bytes]:
+    """Converte áudio OGG (ex.: mensagem de voz Telegram) para MP3 para compatibilidade com Whisper."""
+    try:
+        from pydub import AudioSegment
+        seg = AudioSegment.from_file(io.BytesIO(content), format="ogg")
+        buf = io.BytesIO()
+        seg.export(buf, format="mp3")
+        buf.seek(0)
+        return buf.read()
+    except Exception as e:
+        logger.warning("[Whisper] Conversão OGG->MP3 falhou: %s", e)
+        return None
+
+
+def transcribe_audio_from_telegram(message: dict) -> Optional[str]:
+    """
+    Obtém file_id de message['voice'] ou message['audio'], descarrega o ficheiro,
+    converte OGG para MP3 se necessário, e envia para OpenAI Whisper. Devolve o texto transcrito ou None.
+    """
+    voice = message.get("voice") or message.get("audio")
+    if not voice:
+        return None
+    file_id = voice.get("file_id")
+    if not file_id:
+        return None
+    if not settings.TELEGRAM_BOT_TOKEN or not settings.OPENAI_API_KEY:
+        logger.warning("[Whisper] TELEGRAM_BOT_TOKEN ou OPENAI_API_KEY não configurado")
+        return None
+    try:
+        downloaded = telegram_client.download_file_sync(file_id, max_bytes=25 * 1024 * 1024, timeout=15)
+        if not downloaded:
+            logger.warning("[Whisper] Download do áudio falhou (vazio ou >25MB)")
+            return None
+        content, file_path = downloaded
+        # Whisper suporta mp3, m4a, wav, webm; Telegram voice é normalmente .ogg
+        ext = (file_path or "").lower().split(".")[-1] if "." in (file_path or "") else ""
+        if ext == "ogg":
+            mp3_content = _ogg_to_mp3_bytes(content)
+            if mp3_content:
+                content = mp3_content
+                ext = "mp3"
+            else:
+                logger.warning("[Whisper] Áudio OGG sem conversão (instala ffmpeg para voz Telegram)")
+                return None
+        suffix = f".{ext}" if ext in ("mp3", "mp4", "mpeg", "mpga", "m4a", "wav", "webm") else ".mp3"
+        with tempfile.NamedTemporaryFile(suffix=suffix, delete=True) as tmp:
+            tmp.write(content)
+            tmp.flush()
+            from openai import OpenAI
+            client = OpenAI(api_key=settings.OPENAI_API_KEY)
+            with open(tmp.name, "rb") as f:
+                transcript = client.audio.transcriptions.create(model="whisper-1", file=f)
+        text = (transcript.text or "").strip()
+        if not text:
+            return None
+        logger.info("[Whisper] Transcrição: %s...", text[:80] if len(text) > 80 else text)
+        return text
+    except OpenAIRateLimitError:
+        raise
+    except Exception as e:
+        err_str = str(e).lower()
+        if "429" in err_str or "rate" in err_str or "quota" in err_str:
+            raise OpenAIRateLimitError(e) from e
+        logger.exception("[Whisper] Erro ao transcrever áudio: %s", e)
+        return None
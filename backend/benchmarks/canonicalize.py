@@ -0,0 +1,80 @@
+"""
+Chamadas por segundo de categorization_engine.canonicalize: implementação anterior (regex
+recompiladas a cada chamada, sem cache), a atual sem cache (regex pré-compiladas) e a atual com a
+cache LRU quente, que é o caso real (histórico, aliases e pendentes repetem descrições).
+
+Verifica também que as três dão o mesmo resultado (sai com 1 se divergirem).
+
+Uso (de dentro de backend/):
+    python benchmarks/canonicalize.py [--seconds 1.0]
+"""
+import argparse
+import os
+import re
+import sys
+import time
+import unicodedata
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core import categorization_engine as ce  # noqa: E402
+from keyword_matching import CORPUS  # noqa: E402
+
+# Variações com valores, datas e acentos, como chegam do Telegram e dos extratos
+DESCRIPTIONS = CORPUS + [f"{d} {i},{i * 7 % 100:02d}€ 0{i % 9 + 1}/03/2026" for i, d in enumerate(CORPUS)] + [
+    "Almoço no café São João", "Farmácia Avenida — medicamentos", "Condomínio março", "Ginásio Fitness Up",
+]
+
+
+def previous_canonicalize(description: str) -> str:
+    """canonicalize() antes da cache e das regex pré-compiladas (referência)."""
+    if not description or not isinstance(description, str):
+        return ""
+    text = description.strip().lower()
+    text = unicodedata.normalize('NFD', text)
+    text = ''.join(c for c in text if unicodedata.category(c) != 'Mn')
+    text = re.sub(r'\d+[.,\s]*\d*\s*(?:€|eur|euros?|e)?', ' ', text, flags=re.IGNORECASE)
+    text = re.sub(r'\d{1,2}[-/]\d{1,2}[-/]\d{2,4}', ' ', text)
+    text = re.sub(r'\\b[a-z0-9]{10,}\\b', ' ', text, flags=re.IGNORECASE)
+    tokens = re.findall(r'[a-z0-9]+', text)
+    tokens = [t for t in tokens if t not in ce.STOPWORDS and len(t) >= 2 and not t.isdigit()]
+    tokens = [ce._stem_simple(t) for t in tokens]
+    return ' '.join(sorted(set(tokens)))
+
+
+def uncached_canonicalize(description: str) -> str:
+    return ce._canonicalize_cached.__wrapped__(description)
+
+
+def calls_per_second(fn, seconds: float) -> float:
+    calls = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        for description in DESCRIPTIONS:
+            fn(description)
+        calls += len(DESCRIPTIONS)
+    return calls / (time.perf_counter() - started)
+
+
+def main(args) -> int:
+    expected = [previous_canonicalize(d) for d in DESCRIPTIONS]
+    ok = expected == [uncached_canonicalize(d) for d in DESCRIPTIONS] == ce.canonicalize_many(DESCRIPTIONS)
+    if not ok:
+        print("DIVERGE: resultado diferente da implementação anterior")
+
+    before = calls_per_second(previous_canonicalize, args.seconds)
+    for label, fn in (
+        ('anterior', previous_canonicalize),
+        ('regex compiladas', uncached_canonicalize),
+        ('com cache LRU', ce.canonicalize),
+    ):
+        rate = before if fn is previous_canonicalize else calls_per_second(fn, args.seconds)
+        print(f"{label:<18} {rate:>12,.0f} chamadas/s ({rate / before:.1f}x)")
+    print(f"cache: {ce.canonicalize_cache_stats()}")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=1.0)
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,135 @@
+"""
+EXPLAIN ANALYZE das queries quentes: confirma que cada uma usa o índice da migração
+hot_path_indexes (e dos índices de transações anteriores) e mede o tempo de execução.
+
+Os parâmetros (workspace, categoria, chat, utilizador) são os das linhas com mais dados na BD,
+para o plano refletir o caso real. Em BDs pequenas (dev) o planner prefere seq scan; usar
+--force-index para desligar enable_seqscan e ver o índice escolhido.
+
+Uso (de dentro de backend/, com DATABASE_URL definido):
+    python benchmarks/explain_hot_queries.py [--force-index] [--runs 5]
+Sai com código 1 se alguma query não usar o índice esperado.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+from datetime import date, timedelta
+
+from sqlalchemy import text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.dependencies import engine  # noqa: E402
+
+# (nome, índices aceites, SQL); os parâmetros vêm de _sample_params
+QUERIES = [
+    (
+        'transações do mês (sem seed)',
+        {'idx_transactions_workspace_date_not_seed', 'idx_transactions_workspace_date'},
+        "SELECT * FROM transactions WHERE workspace_id = :ws AND NOT is_seed "
+        "AND transaction_date >= :start AND transaction_date <= :end",
+    ),
+    (
+        'transações do período (todas)',
+        {'idx_transactions_workspace_date'},
+        "SELECT id, amount_cents FROM transactions WHERE workspace_id = :ws "
+        "AND transaction_date >= :start AND transaction_date <= :end",
+    ),
+    (
+        'categoria no período',
+        {'idx_transactions_workspace_category_date'},
+        "SELECT sum(amount_cents) FROM transactions WHERE workspace_id = :ws AND category_id = :cat "
+        "AND transaction_date >= :start",
+    ),
+    (
+        'página de transações (cursor)',
+        {'idx_transactions_workspace_created_id'},
+        "SELECT * FROM transactions WHERE workspace_id = :ws AND NOT is_seed "
+        "ORDER BY created_at DESC, id DESC LIMIT 100",
+    ),
+    (
+        'token scores',
+        {'idx_token_scores_workspace_type_token', 'unique_token_score'},
+        "SELECT category_id, token, count, score FROM token_scores WHERE workspace_id = :ws "
+        "AND transaction_type = 'expense' AND token IN ('continente', 'uber', 'netflix')",
+    ),
+    (
+        'cache de categorização',
+        {'unique_workspace_mapping'},
+        "SELECT * FROM category_mapping_cache WHERE workspace_id = :ws "
+        "AND description_normalized = 'continente' AND transaction_type = 'expense'",
+    ),
+    (
+        'pendentes do batch (Telegram)',
+        {'idx_telegram_pending_chat_batch'},
+        "SELECT * FROM telegram_pending_transactions WHERE chat_id = :chat "
+        "AND batch_id >= '00000000-0000-0000-0000-000000000000' "
+        "AND batch_id <= '7fffffff-ffff-ffff-ffff-ffffffffffff'",
+    ),
+    (
+        'circuit-breaker Gemini',
+        {'idx_gemini_events_workspace_timestamp'},
+        "SELECT count(*) FROM gemini_events WHERE workspace_id = :ws AND timestamp >= now() - interval '10 minutes'",
+    ),
+    (
+        'auditoria do utilizador',
+        {'idx_audit_logs_user_created'},
+        "SELECT * FROM audit_logs WHERE user_id = :user ORDER BY created_at DESC LIMIT 50",
+    ),
+]
+
+
+def _sample_params(conn) -> dict:
+    def top(sql):
+        return conn.execute(text(sql)).scalar()
+
+    today = date.today()
+    return {
+        'ws': top("SELECT workspace_id FROM transactions GROUP BY 1 ORDER BY count(*) DESC LIMIT 1"),
+        'cat': top("SELECT category_id FROM transactions WHERE category_id IS NOT NULL GROUP BY 1 ORDER BY count(*) DESC LIMIT 1"),
+        'chat': top("SELECT chat_id FROM telegram_pending_transactions GROUP BY 1 ORDER BY count(*) DESC LIMIT 1") or '0',
+        'user': top("SELECT user_id FROM audit_logs WHERE user_id IS NOT NULL GROUP BY 1 ORDER BY count(*) DESC LIMIT 1"),
+        'start': today.replace(day=1) - timedelta(days=60),
+        'end': today,
+    }
+
+
+def _indexes_in_plan(node: dict) -> set:
+    found = {node['Index Name']} if 'Index Name' in node else set()
+    for child in node.get('Plans', []):
+        found |= _indexes_in_plan(child)
+    return found
+
+
+def main(args) -> int:
+    failures = 0
+    with engine.connect() as conn:
+        params = _sample_params(conn)
+        if args.force_index:
+            conn.execute(text("SET enable_seqscan = off"))
+        print(f"{'query':<32} {'índice usado':<44} {'mediana':>9}")
+        for label, expected, sql in QUERIES:
+            timings = []
+            used = set()
+            for _ in range(args.runs):
+                plan = conn.execute(text(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}"), params).scalar()
+                plan = plan if isinstance(plan, list) else json.loads(plan)
+                used = _indexes_in_plan(plan[0]['Plan'])
+                timings.append(plan[0]['Execution Time'])
+            ok = bool(used & expected)
+            failures += 0 if ok else 1
+            shown = ', '.join(sorted(used)) or 'seq scan'
+            print(f"{label:<32} {shown:<44} {statistics.median(timings):7.2f}ms {'OK' if ok else 'FALHA'}")
+        conn.rollback()
+    if failures:
+        print(f"{failures} query(s) sem o índice esperado (BD pequena? experimenta --force-index).")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--force-index', action='store_true')
+    parser.add_argument('--runs', type=int, default=5)
+    sys.exit(main(parser.parse_args()))
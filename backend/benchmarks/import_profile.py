@@ -0,0 +1,77 @@
+"""
+Perfil de `python -X importtime -c "import app.main"`: tempo cumulativo por pacote de topo
+(fastapi, sqlalchemy, app, ...) e verificação de que as dependências pesadas continuam
+diferidas (lazy_module / imports dentro das funções) e não entram no arranque do worker.
+
+Uso (de dentro de backend/, com as variáveis de ambiente da app definidas):
+    python benchmarks/import_profile.py [--top 15] [--module app.main]
+Sai com código 1 se algum módulo de DEFERRED for importado no arranque.
+"""
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Só devem ser importados no primeiro uso (pagamento, email, ficheiros do Telegram, ...)
+DEFERRED = (
+    'stripe',
+    'requests',
+    'fastapi_mail',
+    'openai',
+    'PIL',
+    'pydub',
+    'pypdf',
+    'openpyxl',
+    'app.webhooks.telegram_media',
+)
+
+
+def profile(module: str) -> list[tuple[str, int, int]]:
+    """(módulo, self µs, cumulativo µs) de cada import, pela ordem do -X importtime."""
+    out = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def main(args) -> int:
+    rows = profile(args.module)
+    by_package = defaultdict(int)
+    for name, self_us, _ in rows:
+        by_package[name.split('.')[0]] += self_us
+    total_us = sum(by_package.values())
+
+    print(f"{'pacote':<28} {'ms':>9} {'%':>6}")
+    for package, us in sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"{package:<28} {us / 1000:9.1f} {us * 100 / total_us:5.1f}%")
+    print(f"{'total':<28} {total_us / 1000:9.1f} ({len(rows)} módulos)")
+
+    imported = {name for name, _, _ in rows}
+    eager = sorted(
+        name for name in imported
+        if any(name == deferred or name.startswith(deferred + '.') for deferred in DEFERRED)
+    )
+    if eager:
+        print('Importados no arranque (deviam ser diferidos): ' + ', '.join(eager))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--module', type=str, default='app.main')
+    sys.exit(main(parser.parse_args()))
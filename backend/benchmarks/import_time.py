@@ -0,0 +1,71 @@
+"""
+Custo de `import app.main` (arranque de cada worker uvicorn e de cada sessão pytest).
+
+Cada medição corre num processo Python novo (sem cache de módulos em memória). Com --compare,
+mede também outra revisão git num worktree temporário, para comparar antes/depois.
+
+Uso (de dentro de backend/, com as variáveis de ambiente da app definidas):
+    python benchmarks/import_time.py [--runs 7] [--compare <git-ref>] [--module app.main]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_SNIPPET = (
+    "import time, importlib; t0 = time.perf_counter(); importlib.import_module({module!r}); "
+    "print((time.perf_counter() - t0) * 1000)"
+)
+
+
+def measure(backend_dir: str, module: str, runs: int) -> list[float]:
+    timings = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, '-c', _SNIPPET.format(module=module)],
+            cwd=backend_dir,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        timings.append(float(out.stdout.strip().splitlines()[-1]))
+    return timings
+
+
+def _report(label: str, timings: list[float]) -> float:
+    median = statistics.median(timings)
+    print(f"{label:<24} n={len(timings):<3} mediana={median:8.1f}ms min={min(timings):8.1f}ms max={max(timings):8.1f}ms")
+    return median
+
+
+def main(args) -> int:
+    current = _report('atual', measure(BACKEND_DIR, args.module, args.runs))
+    if not args.compare:
+        return 0
+
+    repo_root = subprocess.run(
+        ['git', 'rev-parse', '--show-toplevel'], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+    ).stdout.strip()
+    backend_rel = os.path.relpath(BACKEND_DIR, repo_root)
+    with tempfile.TemporaryDirectory() as tmp:
+        worktree = os.path.join(tmp, 'wt')
+        subprocess.run(['git', 'worktree', 'add', '--detach', worktree, args.compare], cwd=repo_root, check=True,
+                       capture_output=True)
+        try:
+            baseline = _report(args.compare, measure(os.path.join(worktree, backend_rel), args.module, args.runs))
+        finally:
+            subprocess.run(['git', 'worktree', 'remove', '--force', worktree], cwd=repo_root, check=False)
+    print(f"atual / {args.compare} = {current / baseline:.2f}")
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=7)
+    parser.add_argument('--compare', type=str, default=None)
+    parser.add_argument('--module', type=str, default='app.main')
+    sys.exit(main(parser.parse_args()))
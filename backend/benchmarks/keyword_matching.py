@@ -0,0 +1,109 @@
+"""
+Micro-benchmark das palavras-chave do motor de categorização: ciclos `in` por entrada (como era)
+contra os autómatos de core.keyword_matcher, sobre descrições com cara de extrato bancário.
+
+Verifica também que ambos dão o mesmo resultado para todo o corpus (sai com 1 se divergirem).
+
+Uso (de dentro de backend/):
+    python benchmarks/keyword_matching.py [--repeat 2000]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core import categorization_engine as ce  # noqa: E402
+
+CORPUS = [
+    "COMPRA 4512 CONTINENTE MODELO LISBOA 12/03",
+    "COMPRA PINGO DOCE AMADORA CARTAO 1234",
+    "PAG SERV 10297 EDP COMERCIAL REF 123456789",
+    "TRF MB WAY PARA JOAO SILVA",
+    "DD PT12345678901234567890123 VODAFONE PORTUGAL",
+    "COMPRA UBER *TRIP HELP.UBER.COM",
+    "Uber Eats pedido 8842",
+    "UBEREATS AMSTERDAM",
+    "LEVANTAMENTO ATM MULTIBANCO AV REPUBLICA",
+    "COMPRA NETFLIX.COM 866-579-7172",
+    "SPOTIFY P1A2B3C4D5 STOCKHOLM",
+    "COMPRA FARMACIA CENTRAL PORTO",
+    "GALP ENERGIA POSTO A2 ALMADA",
+    "VIA VERDE PORTUGAL PORTAGENS",
+    "TRANSFERENCIA RECEBIDA SALARIO EMPRESA XYZ LDA",
+    "Vencimento março",
+    "REEMBOLSO IRS AT AUTORIDADE TRIBUTARIA",
+    "COMPRA IKEA ALFRAGIDE",
+    "AMAZON EU SARL AMAZON.ES",
+    "COMPRA MCDONALDS RESTAURANTE COLOMBO",
+    "jantar com amigos no restaurante",
+    "gasolina bomba bp",
+    "renda casa abril",
+    "Pagamento consulta médico dentista",
+    "bilhete cinema nos amoreiras",
+    "COMPRA CAFE A BRASILEIRA",
+    "SUPERMERCADO EL CORTE INGLES",
+    "ESTACIONAMENTO EMEL PARQUE",
+    "COMPRA 0453 LOJA DO CIDADAO TAXA",
+    "PAGAMENTO DE SERVICOS AGUA EPAL",
+    "Compra online decathlon.pt",
+    "ginasio solinca mensalidade",
+    "HOLMES PLACE LISBOA",
+    "COMPRA TALHO DO BAIRRO",
+    "COMISSAO MANUTENCAO CONTA",
+]
+
+
+def loops_deterministic(description: str, tipo: str):
+    text_lower = description.lower().strip()
+    text_canon = ce.canonicalize(description)
+    if tipo == 'income':
+        for kw in ce.INCOME_KEYWORDS:
+            if kw in text_lower or kw in text_canon:
+                return 'Salário'
+    for merchant, cat in ce.KNOWN_MERCHANTS.items():
+        if merchant in text_lower or merchant.replace(' ', '') in text_lower.replace(' ', ''):
+            return cat
+    return None
+
+
+def loops_keywords(description: str):
+    text_lower = description.lower().strip()
+    return [(kw, cat) for kw, cat in ce.CATEGORY_KEYWORDS.items() if kw in text_lower]
+
+
+def matcher_keywords(description: str):
+    return ce._category_keyword_matcher.matches(description.lower().strip())
+
+
+def _time(fn, cases, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for case in cases:
+            fn(*case)
+    return (time.perf_counter() - started) / (repeat * len(cases)) * 1e6
+
+
+def main(args) -> int:
+    det_cases = [(d, tipo) for d in CORPUS for tipo in ('expense', 'income')]
+    kw_cases = [(d,) for d in CORPUS]
+    mismatches = [c for c in det_cases if loops_deterministic(*c) != ce.apply_deterministic_rules(*c)]
+    mismatches += [c for c in kw_cases if loops_keywords(*c) != matcher_keywords(*c)]
+    for case in mismatches:
+        print(f"DIVERGE: {case}")
+
+    for label, loops, matcher, cases in (
+        ('regras determinísticas', loops_deterministic, ce.apply_deterministic_rules, det_cases),
+        ('keywords de categoria', loops_keywords, matcher_keywords, kw_cases),
+    ):
+        before = _time(loops, cases, args.repeat)
+        after = _time(matcher, cases, args.repeat)
+        print(f"{label:<24} ciclos={before:7.2f}µs autómato={after:7.2f}µs ({before / after:.1f}x)")
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=2000)
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,108 @@
+"""
+Teste de carga: latência p99 de /dashboard/snapshot com e sem pedidos /scan/ em curso.
+
+Antes do modelo de execução em threadpool, uma chamada OpenAI no /scan/ bloqueava o event loop
+e o p99 do dashboard subia para a duração da chamada. Agora o p99 deve manter-se estável.
+
+Uso (servidor a correr, utilizador Pro com workspace):
+    BENCH_BASE_URL=http://localhost:8000 BENCH_TOKEN=<jwt> python benchmarks/load_snapshot_during_scan.py
+    [--requests 200] [--concurrency 10] [--scans 4] [--image recibo.jpg] [--max-ratio 1.5]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import httpx
+
+# PNG 1x1 (suficiente para exercitar o caminho completo do /scan/)
+_TINY_PNG = bytes.fromhex(
+    '89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+    '1f15c4890000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082'
+)
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+async def _snapshot_load(client: httpx.AsyncClient, total: int, concurrency: int) -> list[float]:
+    latencies: list[float] = []
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with sem:
+            t0 = time.perf_counter()
+            r = await client.get('/dashboard/snapshot', params={'include_collections': 'false'})
+            latencies.append((time.perf_counter() - t0) * 1000)
+            r.raise_for_status()
+
+    await asyncio.gather(*(one() for _ in range(total)))
+    return latencies
+
+
+async def _scan_loop(client: httpx.AsyncClient, image: bytes, content_type: str, stop: asyncio.Event) -> int:
+    done = 0
+    while not stop.is_set():
+        await client.post('/scan/', files={'file': ('recibo', image, content_type)}, timeout=120)
+        done += 1
+    return done
+
+
+def _report(label: str, latencies: list[float]) -> float:
+    p99 = _percentile(latencies, 99)
+    print(
+        f"{label:<22} n={len(latencies):<5} p50={_percentile(latencies, 50):8.1f}ms "
+        f"p99={p99:8.1f}ms mean={statistics.mean(latencies):8.1f}ms"
+    )
+    return p99
+
+
+async def main(args) -> int:
+    base_url = os.getenv('BENCH_BASE_URL', 'http://localhost:8000')
+    token = os.getenv('BENCH_TOKEN')
+    if not token:
+        print('Define BENCH_TOKEN com um access token válido.')
+        return 2
+    image, content_type = _TINY_PNG, 'image/png'
+    if args.image:
+        with open(args.image, 'rb') as f:
+            image = f.read()
+        content_type = 'image/png' if args.image.lower().endswith('.png') else 'image/jpeg'
+
+    headers = {'Authorization': f'Bearer {token}'}
+    limits = httpx.Limits(max_connections=args.concurrency + args.scans + 4)
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, limits=limits, timeout=60) as client:
+        await _snapshot_load(client, min(20, args.requests), args.concurrency)  # aquecimento
+
+        baseline = await _snapshot_load(client, args.requests, args.concurrency)
+        base_p99 = _report('snapshot (idle)', baseline)
+
+        stop = asyncio.Event()
+        scanners = [asyncio.create_task(_scan_loop(client, image, content_type, stop)) for _ in range(args.scans)]
+        await asyncio.sleep(0.5)  # garantir que os scans já estão em curso
+        loaded = await _snapshot_load(client, args.requests, args.concurrency)
+        stop.set()
+        scans_done = sum(await asyncio.gather(*scanners))
+        loaded_p99 = _report(f'snapshot ({args.scans} scans)', loaded)
+        print(f"scans concluídos durante a medição: {scans_done}")
+
+    ratio = loaded_p99 / base_p99 if base_p99 else 0.0
+    print(f"p99 com scans / p99 idle = {ratio:.2f} (limite {args.max_ratio})")
+    return 0 if ratio <= args.max_ratio else 1
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--scans', type=int, default=4)
+    parser.add_argument('--image', type=str, default=None)
+    parser.add_argument('--max-ratio', type=float, default=1.5)
+    sys.exit(asyncio.run(main(parser.parse_args())))
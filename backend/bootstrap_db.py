@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Prepara o esquema da BD antes do arranque (start.sh / render.yaml).
+
+O histórico do Alembic não cria o esquema de raiz: a revisão inicial (298ac05a2c6f) só altera
+tabelas que já existem (users, transactions, ...). Três casos:
+
+- BD vazia (sem alembic_version nem tabelas da app): cria o esquema atual a partir dos modelos
+  (Base.metadata.create_all) e marca-o como `head` (alembic stamp head);
+- BD sem versão (tabelas da app mas sem alembic_version): criada pelo create_all que a app fazia ao
+  arrancar, antes de o deploy correr o Alembic. Corresponde aos modelos de PRE_ALEMBIC_REVISION:
+  marca essa revisão e aplica só as seguintes (correr desde a 298ac05a2c6f repetiria alterações
+  já feitas, p.ex. users.language);
+- BD versionada: alembic upgrade head.
+
+Sai com código != 0 se falhar, para não arrancar o uvicorn sobre uma BD sem esquema.
+
+Uso (de dentro de backend/):
+    python bootstrap_db.py
+"""
+import sys
+from pathlib import Path
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import inspect
+
+from app.core.dependencies import engine
+from app.models.database import Base
+
+BACKEND_DIR = Path(__file__).resolve().parent
+
+# Última revisão cujo esquema coincide com o create_all da app (antes de o deploy correr o Alembic)
+PRE_ALEMBIC_REVISION = 'add_salary_general_expense_ws'
+
+
+def schema_state(bind) -> str:
+    """'empty', 'unversioned' ou 'versioned' (ver docstring do módulo)."""
+    tables = set(inspect(bind).get_table_names())
+    if 'alembic_version' in tables:
+        return 'versioned'
+    if tables & set(Base.metadata.tables):
+        return 'unversioned'
+    return 'empty'
+
+
+def alembic_config() -> Config:
+    config = Config(str(BACKEND_DIR / 'alembic.ini'))
+    config.set_main_option('script_location', str(BACKEND_DIR / 'alembic'))
+    return config
+
+
+def bootstrap(bind, config: Config) -> str:
+    """Prepara o esquema conforme o estado da BD; devolve o estado encontrado."""
+    state = schema_state(bind)
+    if state == 'empty':
+        print("[*] BD vazia: a criar o esquema a partir dos modelos e a marcar como head...")
+        Base.metadata.create_all(bind=bind)
+        command.stamp(config, 'head')
+        return state
+    if state == 'unversioned':
+        print(f"[*] BD sem alembic_version: a marcar {PRE_ALEMBIC_REVISION} (esquema do create_all)...")
+        command.stamp(config, PRE_ALEMBIC_REVISION)
+    print("[*] A aplicar migrações (alembic upgrade head)...")
+    command.upgrade(config, 'head')
+    return state
+
+
+def main() -> int:
+    bootstrap(engine, alembic_config())
+    print("[OK] Esquema da BD atualizado.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Verifica (e opcionalmente reconstrói) o rollup mensal workspace_category_month
+contra a agregação das transações.
+
+Uso:
+    python rebuild_month_rollup.py                      # só verifica todos os workspaces
+    python rebuild_month_rollup.py <workspace_id>       # só verifica um workspace
+    python rebuild_month_rollup.py --rebuild [<workspace_id>]
+
+Usa a DATABASE_URL da app. Sai com código 1 se, no fim, existirem divergências.
+"""
+import sys
+import uuid
+
+from app.core import month_rollup
+from app.core.dependencies import SessionLocal
+
+
+def main() -> int:
+    args = [a for a in sys.argv[1:] if a != '--rebuild']
+    rebuild = '--rebuild' in sys.argv[1:]
+    workspace_id = uuid.UUID(args[0]) if args else None
+
+    db = SessionLocal()
+    try:
+        if rebuild:
+            print("[*] A reconstruir o rollup mensal...")
+            month_rollup.rebuild(db, workspace_id)
+            db.commit()
+
+        print("[*] A verificar o rollup contra as transações...")
+        mismatches = month_rollup.verify(db, workspace_id)
+        for m in mismatches:
+            print(f"  [!] ws={m['workspace_id']} cat={m['category_id']} mês={m['month']}: "
+                  f"esperado={m['expected']} atual={m['actual']}")
+        if mismatches:
+            print(f"[ERRO] {len(mismatches)} divergência(s). Corre com --rebuild para corrigir.")
+            return 1
+        print("[OK] Rollup consistente.")
+        return 0
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""
+Regista no Telegram os comandos (menu /) e a descrição do bot.
+
+Corre uma vez por deploy (start.sh) em vez de em cada import de app.main / worker.
+Também disponível como POST /admin/telegram/setup-bot.
+
+Uso (de dentro de backend/):
+    python setup_telegram_bot.py
+"""
+import sys
+
+from app.core.config import settings
+from app.webhooks.telegram import setup_bot_commands, setup_bot_info
+
+
+def main() -> int:
+    if not settings.TELEGRAM_BOT_TOKEN:
+        print("TELEGRAM_BOT_TOKEN não configurado; nada a fazer.")
+        return 0
+    setup_bot_commands()
+    setup_bot_info()
+    print("[OK] Comandos e informações do bot Telegram configurados.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
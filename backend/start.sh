@@ -3,11 +3,13 @@
 
 echo "Iniciando FinanZen Backend..."
 
-# Executar migrações do Alembic se existirem
-if [ -d "alembic" ] && [ -f "alembic.ini" ]; then
-    echo "📦 Executando migrações do banco de dados..."
-    alembic upgrade head
-fi
+# Esquema da BD: BD vazia -> create_all + alembic stamp head; senão alembic upgrade head.
+# Se falhar, não arrancar o servidor sobre uma BD sem esquema.
+echo "📦 Preparando o esquema do banco de dados..."
+python bootstrap_db.py || { echo "❌ Falha ao preparar o esquema da BD"; exit 1; }
+
+# Comandos/descrição do bot Telegram: uma vez por deploy, em segundo plano (não atrasa o arranque)
+python setup_telegram_bot.py || echo "⚠️ Não foi possível configurar o bot Telegram" &
 
 # Iniciar o servidor
 echo "✅ Iniciando servidor FastAPI..."
@@ -1,5 +1,5 @@
 """
-Fixtures para testes: DB com rollback por teste, client com override de get_db.
+Fixtures para testes: DB com rollback por teste, client com override de get_db e get_async_db.
 Executar de dentro de backend/: pytest tests/ -v
 """
 import pytest
@@ -9,9 +9,47 @@ from sqlalchemy import create_engine
 
 # Importar app depois de eventual configuração de test env
 from app.main import app
-from app.core.dependencies import get_db, engine
+from app.core.dependencies import get_db, get_async_db, engine, SessionLocal as AppSessionLocal
 from app.models import database as models
-from app.core import security
+from app.core import dashboard_cache, security, user_cache, workspace_cache
+from app.core.merchant_index import merchant_index
+
+
+class _AsyncSessionAdapter:
+    """
+    Expõe a sessão síncrona do teste com a interface de AsyncSession usada pelas rotas async,
+    para que leiam os dados do mesmo transaction (rollback no fim).
+    """
+
+    def __init__(self, session):
+        self._session = session
+
+    async def execute(self, *args, **kwargs):
+        return self._session.execute(*args, **kwargs)
+
+    async def scalar(self, *args, **kwargs):
+        return self._session.scalar(*args, **kwargs)
+
+    async def get(self, *args, **kwargs):
+        return self._session.get(*args, **kwargs)
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return fn(self._session, *args, **kwargs)
+
+    async def commit(self):
+        self._session.commit()
+
+    async def rollback(self):
+        self._session.rollback()
+
+    def add(self, instance):
+        self._session.add(instance)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _schema():
+    """A app já não cria tabelas ao importar (produção usa Alembic): criar o esquema da BD de testes aqui."""
+    models.Base.metadata.create_all(bind=engine)
 
 
 @pytest.fixture(scope="function")
@@ -21,7 +59,12 @@ def db_session():
     transaction = connection.begin()
     SessionLocal = sessionmaker(bind=connection, expire_on_commit=False)
     session = SessionLocal()
+    # Índice de merchants é global ao processo: lê pela ligação do teste (savepoint) e começa/acaba vazio
+    merchant_index.clear()
+    merchant_index.session_factory = sessionmaker(bind=connection, join_transaction_mode='create_savepoint')
     yield session
+    merchant_index.clear()
+    merchant_index.session_factory = AppSessionLocal
     session.close()
     transaction.rollback()
     connection.close()
@@ -29,17 +72,28 @@ def db_session():
 
 @pytest.fixture(scope="function")
 def client(db_session):
-    """TestClient com get_db override para usar a sessão do fixture (rollback no fim)."""
+    """TestClient com get_db/get_async_db override para usar a sessão do fixture (rollback no fim)."""
     def override_get_db():
         try:
             yield db_session
         finally:
             pass
 
+    async def override_get_async_db():
+        yield _AsyncSessionAdapter(db_session)
+
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    # Cada teste cria o seu utilizador e workspace (ids diferentes para o mesmo email): não reutilizar caches
+    user_cache.clear()
+    workspace_cache.clear()
+    dashboard_cache.clear()
     with TestClient(app) as c:
         yield c
     app.dependency_overrides.clear()
+    user_cache.clear()
+    workspace_cache.clear()
+    dashboard_cache.clear()
 
 
 @pytest.fixture
@@ -0,0 +1,67 @@
+"""
+Testes da engine async (core.dependencies): conversão do DATABASE_URL para asyncpg e leituras reais
+numa AsyncSession (o client dos outros testes usa um adaptador sobre a sessão síncrona).
+"""
+import asyncio
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.core import security
+from app.core.config import settings
+from app.core.dependencies import _async_database_url
+from app.core.workspace_cache import WorkspaceRef
+from app.models import database as models
+from app.routes.categories import get_categories
+
+
+def test_async_database_url_uses_asyncpg_and_moves_sslmode_to_connect_args():
+    assert _async_database_url('postgresql://u:p@db:5432/app') == ('postgresql+asyncpg://u:p@db:5432/app', {})
+    assert _async_database_url('postgres://u:p@db/app?sslmode=require&application_name=api') == (
+        'postgresql+asyncpg://u:p@db/app?application_name=api', {'ssl': 'require'},
+    )
+    assert _async_database_url('postgresql+psycopg2://u@db/app?sslmode=disable')[0] == 'postgresql+asyncpg://u@db/app'
+
+
+def test_async_session_reads_through_asyncpg():
+    """Rota async e run_sync sobre uma AsyncSession real; tudo numa transação com rollback no fim."""
+    url, connect_args = _async_database_url(settings.DATABASE_URL)
+    engine = create_async_engine(url, connect_args=connect_args, poolclass=NullPool)
+
+    async def scenario():
+        async with engine.connect() as connection:
+            transaction = await connection.begin()
+            db = AsyncSession(bind=connection, autoflush=False, expire_on_commit=False)
+            try:
+                user = models.User(
+                    email="async@example.com",
+                    password_hash=security.get_password_hash("TestPass123"),
+                    is_email_verified=True,
+                )
+                db.add(user)
+                await db.flush()
+                workspace = models.Workspace(owner_id=user.id, name="Async WS", opening_balance_cents=0)
+                db.add(workspace)
+                await db.flush()
+                db.add(models.Category(workspace_id=workspace.id, name="Alimentação", type="expense"))
+                await db.flush()
+
+                categories = await get_categories(None, db, None, WorkspaceRef.from_workspace(workspace))
+                count = await db.run_sync(
+                    lambda sync_db: sync_db.query(models.Category).filter_by(workspace_id=workspace.id).count()
+                )
+                total = await db.scalar(select(func.count()).select_from(models.Category).where(
+                    models.Category.workspace_id == workspace.id
+                ))
+                return [c.name for c in categories], count, total
+            finally:
+                await db.close()
+                await transaction.rollback()
+
+    try:
+        names, count, total = asyncio.run(scenario())
+    finally:
+        asyncio.run(engine.dispose())
+    assert names == ["Alimentação"]
+    assert count == total == 1
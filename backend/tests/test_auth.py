@@ -49,3 +49,33 @@ def test_protected_route_with_token(client, test_user_token):
     )
     # 200 com lista ou 404 se não houver workspace
     assert r.status_code in (status.HTTP_200_OK, status.HTTP_404_NOT_FOUND)
+
+
+def test_export_import_keeps_seed_transactions_as_seed(client, db_session, test_user, test_user_token):
+    """Transações de exemplo continuam is_seed após exportar e importar (e em exportações antigas, sem o campo)."""
+    from datetime import date
+    from app.models import database as models
+
+    ws = models.Workspace(owner_id=test_user.id, name='WS')
+    db_session.add(ws)
+    db_session.flush()
+    db_session.add_all([
+        models.Transaction(workspace_id=ws.id, amount_cents=-1, description='Exemplo', transaction_date=date.today(), is_seed=True),
+        models.Transaction(workspace_id=ws.id, amount_cents=-2500, description='Jantar', transaction_date=date.today()),
+    ])
+    db_session.commit()
+    headers = {"Authorization": f"Bearer {test_user_token}"}
+
+    exported = client.get("/auth/export-data", headers=headers).json()
+    assert sorted(t['is_seed'] for t in exported['workspaces'][0]['transactions']) == [False, True]
+    legacy = {'version': 1, 'workspaces': [{'transactions': [
+        {'amount_cents': 1, 'description': 'Exemplo antigo', 'transaction_date': date.today().isoformat()},
+    ]}]}
+    for body in (exported, legacy):
+        r = client.post("/auth/import-data", headers=headers, json=body)
+        assert r.status_code == status.HTTP_200_OK
+
+    rows = db_session.query(models.Transaction.amount_cents, models.Transaction.is_seed).filter(
+        models.Transaction.workspace_id == ws.id
+    ).all()
+    assert sorted(rows) == [(-2500, False), (-2500, False), (-1, True), (-1, True), (1, True)]
@@ -0,0 +1,63 @@
+"""
+Testes do bootstrap_db: BD vazia, BD sem alembic_version (create_all antigo) e BD versionada.
+"""
+from alembic.script import ScriptDirectory
+from sqlalchemy import create_engine, text
+
+import bootstrap_db
+
+
+def _database(*tables):
+    engine = create_engine('sqlite://')
+    with engine.begin() as connection:
+        for table in tables:
+            connection.execute(text(f'CREATE TABLE {table} (id INTEGER PRIMARY KEY)'))
+    return engine
+
+
+def _record_commands(monkeypatch):
+    calls = []
+
+    class _Command:
+        @staticmethod
+        def stamp(config, revision):
+            calls.append(('stamp', revision))
+
+        @staticmethod
+        def upgrade(config, revision):
+            calls.append(('upgrade', revision))
+
+    monkeypatch.setattr(bootstrap_db, 'command', _Command)
+    return calls
+
+
+def test_empty_database_gets_the_model_schema_stamped_head(monkeypatch):
+    calls = _record_commands(monkeypatch)
+    created = []
+    monkeypatch.setattr(bootstrap_db.Base.metadata, 'create_all', lambda bind: created.append(bind))
+    engine = _database()
+
+    assert bootstrap_db.bootstrap(engine, None) == 'empty'
+    assert created == [engine]
+    assert calls == [('stamp', 'head')]
+
+
+def test_unversioned_database_is_stamped_before_the_series_then_upgraded(monkeypatch):
+    calls = _record_commands(monkeypatch)
+    engine = _database('users', 'transactions')
+
+    assert bootstrap_db.bootstrap(engine, None) == 'unversioned'
+    assert calls == [('stamp', bootstrap_db.PRE_ALEMBIC_REVISION), ('upgrade', 'head')]
+
+
+def test_versioned_database_is_only_upgraded(monkeypatch):
+    calls = _record_commands(monkeypatch)
+    engine = _database('alembic_version', 'users')
+
+    assert bootstrap_db.bootstrap(engine, None) == 'versioned'
+    assert calls == [('upgrade', 'head')]
+
+
+def test_pre_alembic_revision_exists_in_the_history():
+    script = ScriptDirectory.from_config(bootstrap_db.alembic_config())
+    assert script.get_revision(bootstrap_db.PRE_ALEMBIC_REVISION) is not None
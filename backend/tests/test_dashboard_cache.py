@@ -0,0 +1,55 @@
+"""
+Testes do cache de /dashboard/snapshot: ETag/304 e invalidação pela versão dos dados.
+"""
+import pytest
+from datetime import date
+
+from app.core import dashboard_cache
+from app.models import database as models
+
+
+@pytest.fixture
+def workspace_with_category(db_session, test_user):
+    ws = models.Workspace(owner_id=test_user.id, name="Test WS", opening_balance_cents=0)
+    db_session.add(ws)
+    db_session.commit()
+    db_session.refresh(ws)
+    cat = models.Category(workspace_id=ws.id, name="Comida", type="expense", vault_type="none")
+    db_session.add(cat)
+    db_session.commit()
+    db_session.refresh(cat)
+    return ws, cat
+
+
+def test_etag_returns_304_until_data_changes(client, test_user_token, workspace_with_category, db_session):
+    """Mesma ETag -> 304; depois de uma escrita a versão muda e a resposta volta a 200."""
+    ws, cat = workspace_with_category
+    auth = {"Authorization": f"Bearer {test_user_token}"}
+
+    first = client.get("/dashboard/snapshot", headers=auth)
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+
+    cached = client.get("/dashboard/snapshot", headers=auth)
+    assert cached.status_code == 200
+    assert cached.headers["ETag"] == etag
+    assert dashboard_cache.stats()["hits"] == 1
+
+    not_modified = client.get("/dashboard/snapshot", headers={**auth, "If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert dashboard_cache.stats()["not_modified"] == 1
+
+    db_session.add(models.Transaction(
+        workspace_id=ws.id,
+        category_id=cat.id,
+        amount_cents=-1500,
+        description="Almoço",
+        transaction_date=date.today(),
+        is_installment=False,
+    ))
+    db_session.commit()
+
+    changed = client.get("/dashboard/snapshot", headers={**auth, "If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert changed.json()["snapshot"]["expenses"] == 15.0
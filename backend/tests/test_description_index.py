@@ -0,0 +1,70 @@
+"""
+Testes de core.description_index: coluna description_canonical mantida nas escritas e
+similaridade com o histórico pela query indexada.
+"""
+import subprocess
+import sys
+from datetime import date, timedelta
+from pathlib import Path
+
+import pytest
+
+from app.core import description_index
+from app.core.categorization_engine import canonicalize
+from app.models import database as models
+
+
+@pytest.fixture
+def workspace_with_categories(db_session, test_user):
+    ws = models.Workspace(owner_id=test_user.id, name="Test WS", opening_balance_cents=0)
+    db_session.add(ws)
+    db_session.commit()
+    food = models.Category(workspace_id=ws.id, name="Alimentação", type="expense")
+    health = models.Category(workspace_id=ws.id, name="Saúde", type="expense")
+    db_session.add_all([food, health])
+    db_session.commit()
+    return ws, food, health
+
+
+def _tx(ws, cat, description, days_ago=1, amount_cents=-1000):
+    return models.Transaction(
+        workspace_id=ws.id, category_id=cat.id, amount_cents=amount_cents, description=description,
+        transaction_date=date.today() - timedelta(days=days_ago), is_installment=False,
+    )
+
+
+def test_canonical_description_follows_orm_writes(db_session, workspace_with_categories):
+    ws, food, _ = workspace_with_categories
+    tx = _tx(ws, food, "Almoço Restaurante Tasca 12,50€")
+    db_session.add(tx)
+    db_session.commit()
+    assert tx.description_canonical == canonicalize("Almoço Restaurante Tasca 12,50€")
+
+    tx.description = "Jantar Tasca"
+    db_session.commit()
+    assert tx.description_canonical == canonicalize("Jantar Tasca")
+
+
+def test_best_similar_category_uses_shared_tokens(db_session, workspace_with_categories):
+    ws, food, health = workspace_with_categories
+    db_session.add_all([
+        _tx(ws, food, "Pastelaria Aurora", days_ago=3),
+        _tx(ws, health, "Farmácia Aurora medicamentos", days_ago=40),
+        _tx(ws, health, "Farmácia Central", days_ago=2, amount_cents=500),  # receita: outro tipo
+    ])
+    db_session.commit()
+
+    best = description_index.best_similar_category(db_session, ws.id, 'expense', canonicalize("farmácia aurora"))
+    assert best is not None and best[0] == health.id
+    assert description_index.best_similar_category(db_session, ws.id, 'expense', canonicalize("cinema")) is None
+
+
+def test_hook_is_registered_by_importing_the_models_alone():
+    """Sem app.main nem categorização prévia: transações gravadas por scripts/workers também levam a forma canónica."""
+    check = (
+        "import sys; from sqlalchemy import event; from sqlalchemy.orm import Session; "
+        "import app.models.database; assert 'app.main' not in sys.modules; "
+        "from app.core import description_index; "
+        "assert event.contains(Session, 'before_flush', description_index._track_description_changes)"
+    )
+    subprocess.run([sys.executable, '-c', check], cwd=Path(__file__).resolve().parents[1], check=True)
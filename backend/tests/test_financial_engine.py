@@ -98,3 +98,45 @@ def test_snapshot_unknown_category_treated_as_expense():
     snap = FinancialEngine.calculate_snapshot(transactions=[t], categories=[])
     assert snap.expenses == 10.0
     assert snap.income == 0.0
+
+
+def test_snapshot_sql_matches_python(db_session, test_user):
+    """calculate_snapshot_sql dá o mesmo resultado que calculate_snapshot (seed excluído)."""
+    from app.models import database as models
+
+    ws = models.Workspace(owner_id=test_user.id, name="Test WS", opening_balance_cents=2500)
+    db_session.add(ws)
+    db_session.commit()
+    cats = [
+        models.Category(workspace_id=ws.id, name="Salário", type="income", vault_type="none"),
+        models.Category(workspace_id=ws.id, name="Comida", type="expense", vault_type="none"),
+        models.Category(workspace_id=ws.id, name="Fundo", type="expense", vault_type="emergency"),
+    ]
+    db_session.add_all(cats)
+    db_session.commit()
+    income_cat, expense_cat, vault_cat = cats
+    today = date.today()
+    txs = [
+        models.Transaction(workspace_id=ws.id, category_id=income_cat.id, amount_cents=200000, transaction_date=today),
+        models.Transaction(workspace_id=ws.id, category_id=expense_cat.id, amount_cents=-4550, transaction_date=today),
+        models.Transaction(workspace_id=ws.id, category_id=expense_cat.id, amount_cents=-1250, transaction_date=today),
+        models.Transaction(workspace_id=ws.id, category_id=vault_cat.id, amount_cents=30000, transaction_date=today),
+        models.Transaction(workspace_id=ws.id, category_id=None, amount_cents=-700, transaction_date=today),
+        models.Transaction(workspace_id=ws.id, category_id=expense_cat.id, amount_cents=-1, transaction_date=today, is_seed=True),  # seed
+    ]
+    db_session.add_all(txs)
+    db_session.commit()
+
+    expected = FinancialEngine.calculate_snapshot(
+        transactions=[t for t in txs if not t.is_seed], categories=cats, workspace=ws
+    )
+    snap = FinancialEngine.calculate_snapshot_sql(db_session, ws)
+
+    assert snap.income == expected.income
+    assert snap.expenses == expected.expenses
+    assert snap.vault_emergency == expected.vault_emergency
+    assert snap.available_cash == expected.available_cash
+    assert snap.cumulative_balance == expected.cumulative_balance
+    assert snap.saving_rate == expected.saving_rate
+    assert snap.transaction_count == expected.transaction_count == 5
+    assert snap.category_totals == expected.category_totals
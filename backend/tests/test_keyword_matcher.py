@@ -0,0 +1,23 @@
+"""
+Testes de core.keyword_matcher: mesmos resultados que os ciclos `in`, pela mesma prioridade.
+"""
+from app.core import categorization_engine as ce
+from app.core.keyword_matcher import KeywordMatcher
+
+
+def test_overlapping_patterns_follow_priority_order():
+    matcher = KeywordMatcher([('hers', 1), ('he', 2), ('she', 3), ('his', 4), ('he', 5)])
+    assert matcher.matches('ushers') == [('hers', 1), ('he', 2), ('she', 3)]
+    assert matcher.first('ushe') == ('he', 2)
+    assert matcher.first('xyz') is None and matcher.matches('') == []
+    assert len(matcher) == 4  # o 'he' repetido fica com o valor do primeiro
+
+
+def test_engine_matchers_agree_with_substring_loops():
+    texts = ['compra uber eats lisboa', 'ubereats', 'galp gás natural', 'jantar restaurante café', 'bar do bairro']
+    for text in texts:
+        expected = [(kw, cat) for kw, cat in ce.CATEGORY_KEYWORDS.items() if kw in text]
+        assert ce._category_keyword_matcher.matches(text) == expected
+    assert ce.apply_deterministic_rules('COMPRA UBEREATS', 'expense') == 'Alimentação'
+    assert ce.apply_deterministic_rules('Galp Gás fatura', 'expense') == 'Transportes'  # 'galp' vem primeiro
+    assert ce.apply_deterministic_rules('Reembolso despesas', 'income') == 'Salário'
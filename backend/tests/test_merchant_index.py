@@ -0,0 +1,73 @@
+"""
+Testes de core.merchant_index: carga inicial, alterações via marca d'água, prioridade e sessão própria.
+"""
+from datetime import datetime, timedelta, timezone
+
+from app.core.dependencies import SessionLocal
+from app.core.merchant_index import MerchantIndex, merchant_index
+from app.models import database as models
+
+
+def _alias(db, alias, category, tipo='expense', active=True, **extra):
+    entry = models.MerchantRegistry(
+        alias=alias, canonical_name=alias, category_name=category, transaction_type=tipo, is_active=active, **extra,
+    )
+    db.add(entry)
+    db.commit()
+    return entry
+
+
+def test_index_loads_and_follows_registry_changes(db_session):
+    # Verificar alterações em todas as procuras; sessões pela ligação do teste (conftest)
+    index = MerchantIndex(refresh_seconds=0, session_factory=merchant_index.session_factory)
+    talho = _alias(db_session, 'Talho Central', 'Alimentação')
+    _alias(db_session, 'ginasio zen', 'Saúde', active=False)
+    _alias(db_session, 'empresa xyz', 'Salário', tipo='income')
+
+    assert index.lookup('central talho', 'expense') == ('Alimentação', 'Talho Central')
+    assert index.lookup('ginasio zen', 'expense') is None  # inativo
+    assert index.lookup('central talho', 'income') is None  # outro tipo
+
+    talho.category_name = 'Compras'
+    _alias(db_session, 'ginasio zen', 'Saúde')
+    db_session.commit()
+    assert index.lookup('central talho', 'expense') == ('Compras', 'Talho Central')
+    assert index.lookup('ginasio zen', 'expense') == ('Saúde', 'ginasio zen')
+
+    stats = index.stats()
+    assert stats['aliases'] == 3 and stats['loads'] == 1 and stats['refreshes'] >= 2
+    assert stats['refresh_lag_seconds'] is not None
+
+
+def test_index_does_not_read_through_uncommitted_transactions(db_session):
+    """O refresh usa a sua própria sessão: linhas de uma transação por confirmar (aqui, a do teste) não entram."""
+    _alias(db_session, 'talho fantasma', 'Alimentação')
+    index = MerchantIndex(refresh_seconds=0, session_factory=SessionLocal)
+    assert index.lookup('fantasma talho', 'expense') is None
+
+
+def test_oldest_alias_wins_when_several_match(db_session):
+    """Aliases sobrepostos no mesmo texto: ganha o mais antigo (created_at), não a ordem de inserção."""
+    index = MerchantIndex(refresh_seconds=0, session_factory=merchant_index.session_factory)
+    now = datetime.now(timezone.utc)
+    _alias(db_session, 'talho', 'Compras', created_at=now - timedelta(days=1))
+    _alias(db_session, 'central talho', 'Alimentação', created_at=now - timedelta(days=30))
+    assert index.lookup('central talho', 'expense') == ('Alimentação', 'central talho')
+    assert index.lookup('talho bairro', 'expense') == ('Compras', 'talho')
+
+    # Um alias mais recente que entra por refresh não passa à frente
+    _alias(db_session, 'talho central lisboa', 'Lazer', created_at=now)
+    assert index.lookup('central lisboa talho', 'expense') == ('Compras', 'talho')
+    assert index.stats()['loads'] == 1
+
+
+def test_alias_deactivated_in_a_refresh_stops_matching(db_session):
+    index = MerchantIndex(refresh_seconds=0, session_factory=merchant_index.session_factory)
+    talho = _alias(db_session, 'Talho Central', 'Alimentação')
+    assert index.lookup('central talho', 'expense') == ('Alimentação', 'Talho Central')
+
+    talho.is_active = False
+    db_session.commit()
+    assert index.lookup('central talho', 'expense') is None
+    stats = index.stats()
+    assert stats['loads'] == 1 and stats['refreshes'] >= 1 and stats['aliases'] == 0
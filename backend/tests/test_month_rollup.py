@@ -0,0 +1,119 @@
+"""
+Testes do rollup mensal (core.month_rollup): manutenção incremental via ORM e via SQL em lote.
+"""
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+from datetime import date
+
+from app.core import month_rollup
+from app.models import database as models
+
+
+@pytest.fixture
+def workspace_with_category(db_session, test_user):
+    ws = models.Workspace(owner_id=test_user.id, name="Test WS", opening_balance_cents=0)
+    db_session.add(ws)
+    db_session.commit()
+    db_session.refresh(ws)
+
+    cat = models.Category(workspace_id=ws.id, name="Supermercado", type="expense")
+    db_session.add(cat)
+    db_session.commit()
+    db_session.refresh(cat)
+    return ws, cat
+
+
+def _tx(ws, cat, amount_cents, tx_date):
+    return models.Transaction(
+        workspace_id=ws.id,
+        category_id=cat.id if cat else None,
+        amount_cents=amount_cents,
+        description="Teste",
+        transaction_date=tx_date,
+        is_installment=False,
+    )
+
+
+def test_orm_writes_keep_rollup_in_sync(db_session, workspace_with_category):
+    """Criar, alterar (valor e mês) e apagar transações mantém o rollup igual aos dados brutos."""
+    ws, cat = workspace_with_category
+    this_month = date.today().replace(day=1)
+    expense = _tx(ws, cat, -2500, this_month)
+    income = _tx(ws, None, 100000, this_month)
+    seed = _tx(ws, cat, -1, this_month)
+    seed.is_seed = True
+    db_session.add_all([expense, income, seed])
+    db_session.commit()
+
+    totals = month_rollup.totals(db_session, ws.id, this_month)
+    assert totals.debit_cents == -2500
+    assert totals.credit_cents == 100000
+    assert totals.count == 2
+    assert month_rollup.totals(db_session, ws.id, this_month, cat.id).debit_count == 1
+
+    expense.amount_cents = -4000
+    income.transaction_date = date(2020, 1, 15)
+    db_session.commit()
+    assert month_rollup.totals(db_session, ws.id, this_month).debit_cents == -4000
+    assert month_rollup.totals(db_session, ws.id, this_month).credit_cents == 0
+    assert month_rollup.totals(db_session, ws.id, date(2020, 1, 1)).credit_cents == 100000
+
+    db_session.delete(expense)
+    db_session.commit()
+    assert month_rollup.totals(db_session, ws.id, this_month).count == 0
+    assert month_rollup.verify(db_session, ws.id) == []
+
+
+def test_bulk_remove_and_rebuild(db_session, workspace_with_category):
+    """remove_matching antes de um DELETE em lote e rebuild deixam o rollup consistente."""
+    ws, cat = workspace_with_category
+    this_month = date.today().replace(day=1)
+    db_session.add_all([_tx(ws, cat, -1000, this_month), _tx(ws, cat, -3000, this_month)])
+    db_session.commit()
+
+    condition = models.Transaction.amount_cents == -1000
+    month_rollup.remove_matching(db_session, models.Transaction.workspace_id == ws.id, condition)
+    db_session.query(models.Transaction).filter(models.Transaction.workspace_id == ws.id, condition).delete(
+        synchronize_session=False
+    )
+    db_session.commit()
+    assert month_rollup.totals(db_session, ws.id, this_month).debit_cents == -3000
+    assert month_rollup.verify(db_session, ws.id) == []
+
+    month_rollup.rebuild(db_session, ws.id)
+    db_session.commit()
+    assert month_rollup.verify(db_session, ws.id) == []
+
+
+def test_totals_through_a_day_leave_out_later_rows_of_the_month(db_session, workspace_with_category):
+    """through=hoje: transações do mês com data futura não contam (como o antigo `transaction_date <= today`)."""
+    ws, cat = workspace_with_category
+    march = date(2026, 3, 1)
+    db_session.add_all([
+        _tx(ws, cat, -1000, date(2026, 3, 10)),
+        _tx(ws, cat, -2500, date(2026, 3, 20)),
+        _tx(ws, None, 5000, date(2026, 3, 25)),
+    ])
+    db_session.commit()
+
+    assert month_rollup.totals(db_session, ws.id, march).debit_cents == -3500
+    through = month_rollup.totals(db_session, ws.id, march, through=date(2026, 3, 15))
+    assert (through.debit_cents, through.debit_count, through.credit_cents) == (-1000, 1, 0)
+    assert month_rollup.totals(db_session, ws.id, march, cat.id, through=date(2026, 3, 20)).debit_cents == -3500
+    assert month_rollup.totals(db_session, ws.id, march, month_rollup.NO_CATEGORY, through=date(2026, 3, 24)).count == 0
+    # Dia fora do mês pedido: mês inteiro
+    assert month_rollup.totals(db_session, ws.id, march, through=date(2026, 4, 2)).count == 3
+
+
+def test_hooks_are_registered_by_importing_the_models_alone():
+    """Scripts e workers que só importam os modelos também mantêm o rollup e o data_version."""
+    check = (
+        "from sqlalchemy import event; from sqlalchemy.orm import Session; "
+        "import app.models.database; from app.core import data_version, month_rollup; "
+        "assert event.contains(Session, 'before_flush', month_rollup._track_transaction_changes); "
+        "assert event.contains(Session, 'before_flush', data_version._bump_on_write)"
+    )
+    subprocess.run([sys.executable, '-c', check], cwd=Path(__file__).resolve().parents[1], check=True)
@@ -0,0 +1,118 @@
+"""
+Testes do gerador de recorrentes (core.recurring_engine): idempotência e recuperação de meses.
+"""
+import pytest
+from datetime import date, datetime, timedelta, timezone
+
+from app.core.recurring_engine import generate_recurring_transactions
+from app.models import database as models
+
+
+@pytest.fixture
+def workspace_with_rule(db_session, test_user):
+    """Workspace com uma recorrente ativa no dia 1, criada há meses."""
+    ws = models.Workspace(owner_id=test_user.id, name="Test WS", opening_balance_cents=0)
+    db_session.add(ws)
+    db_session.commit()
+    db_session.refresh(ws)
+
+    rule = models.RecurringTransaction(
+        workspace_id=ws.id,
+        description="Renda",
+        amount_cents=-50000,
+        day_of_month=1,
+        is_active=True,
+        created_at=datetime.now(timezone.utc) - timedelta(days=400),
+    )
+    db_session.add(rule)
+    db_session.commit()
+    db_session.refresh(rule)
+    return ws, rule
+
+
+def _generated(db_session, rule):
+    return db_session.query(models.Transaction).filter(models.Transaction.recurring_id == rule.id).all()
+
+
+def test_generation_is_idempotent(db_session, workspace_with_rule):
+    """Correr duas vezes no mesmo dia cria uma única ocorrência, com a chave do mês."""
+    ws, rule = workspace_with_rule
+    today = date.today()
+
+    first = generate_recurring_transactions(db_session, today=today, workspace_id=ws.id, catch_up_months=0)
+    second = generate_recurring_transactions(db_session, today=today, workspace_id=ws.id, catch_up_months=0)
+
+    assert first.generated == 1
+    assert second.generated == 0
+    rows = _generated(db_session, rule)
+    assert len(rows) == 1
+    assert rows[0].recurring_period == date(today.year, today.month, 1)
+    assert rows[0].description == "(R) Renda"
+    db_session.refresh(ws)
+    assert ws.recurring_processed_through == today
+
+
+def test_legacy_occurrence_without_key_is_not_duplicated(db_session, workspace_with_rule):
+    """Transação "(R) ..." criada antes da chave de idempotência conta como já gerada."""
+    ws, rule = workspace_with_rule
+    today = date.today()
+    db_session.add(models.Transaction(
+        workspace_id=ws.id,
+        amount_cents=rule.amount_cents,
+        description="(R) Renda",
+        transaction_date=date(today.year, today.month, 1),
+        is_installment=False,
+    ))
+    db_session.commit()
+
+    stats = generate_recurring_transactions(db_session, today=today, workspace_id=ws.id, catch_up_months=0)
+
+    assert stats.generated == 0
+
+
+def test_catch_up_fills_months_missed_since_marker(db_session, workspace_with_rule):
+    """Marcador parado no fim de há dois meses: gera o mês anterior (em falta) e o atual."""
+    ws, rule = workspace_with_rule
+    today = date.today()
+    this_month = date(today.year, today.month, 1)
+    ws.recurring_processed_through = (this_month - timedelta(days=1)).replace(day=1) - timedelta(days=1)
+    db_session.commit()
+
+    stats = generate_recurring_transactions(db_session, today=today, workspace_id=ws.id, catch_up_months=3)
+
+    periods = sorted(t.recurring_period for t in _generated(db_session, rule))
+    assert stats.generated == 2
+    assert periods[-1] == this_month
+    assert len(periods) == 2
+
+
+def test_reads_accept_yesterdays_marker_until_the_midnight_job_runs(db_session, workspace_with_rule, monkeypatch):
+    """Entre a meia-noite e o job das 00:05 a leitura não gera nem escreve; depois da janela, sim."""
+    from app.routes import transactions
+    from app.core.workspace_cache import WorkspaceRef
+
+    ws, _ = workspace_with_rule
+    today = date.today()
+    ws.recurring_processed_through = today - timedelta(days=1)
+    db_session.commit()
+    calls = []
+    monkeypatch.setattr(transactions, 'process_automatic_recurring', lambda db, workspace_id, day: calls.append(day))
+    monkeypatch.setattr(transactions.settings, 'RECURRING_READ_GRACE_MINUTES', 30)
+
+    assert transactions._recurring_fresh_from(datetime.combine(today, datetime.min.time()) + timedelta(minutes=10)) == today - timedelta(days=1)
+    assert transactions._recurring_fresh_from(datetime.combine(today, datetime.min.time()) + timedelta(minutes=31)) == today
+
+    class _Clock(datetime):
+        minutes = 10
+
+        @classmethod
+        def now(cls, tz=None):
+            return datetime.combine(today, datetime.min.time()) + timedelta(minutes=cls.minutes)
+
+    monkeypatch.setattr(transactions, 'datetime', _Clock)
+    transactions.ensure_recurring_processed(db_session, WorkspaceRef.from_workspace(ws))
+    assert calls == []
+
+    _Clock.minutes = 120
+    transactions.ensure_recurring_processed(db_session, WorkspaceRef.from_workspace(ws))
+    assert calls == [today]
@@ -0,0 +1,43 @@
+"""
+Testes de core.shared_state: dois processos (workers) sobre o mesmo store SQLite local.
+"""
+import multiprocessing
+import time
+
+from app.core.shared_state import MemoryStore, SQLiteStore
+
+
+def _worker(path, barrier, results):
+    store = SQLiteStore(path)
+    barrier.wait()
+    allowed = sum(store.hit('tg_rate:chat-1', limit=10, window_seconds=3600) for _ in range(25))
+    added = sum(store.add(f"tg_update:{update_id}", ttl_seconds=300) for update_id in range(50))
+    results.put((allowed, added))
+
+
+def test_limits_and_dedupe_hold_across_two_workers(tmp_path):
+    ctx = multiprocessing.get_context('spawn')
+    path = str(tmp_path / 'shared_state.sqlite3')
+    barrier, results = ctx.Barrier(2), ctx.Queue()
+    workers = [ctx.Process(target=_worker, args=(path, barrier, results)) for _ in range(2)]
+    for worker in workers:
+        worker.start()
+    outcomes = [results.get(timeout=60) for _ in workers]
+    for worker in workers:
+        worker.join(timeout=60)
+        assert worker.exitcode == 0
+
+    # O limite é global (10 no total, não 10 por worker) e cada update é aceite por um só worker
+    assert sum(allowed for allowed, _ in outcomes) == 10
+    assert sum(added for _, added in outcomes) == 50
+
+
+def test_counters_restart_after_expiry(tmp_path):
+    for store in (SQLiteStore(str(tmp_path / 'state.sqlite3')), MemoryStore(maxsize=100)):
+        assert store.incr('api:key', ttl_seconds=0.05)[0] == 1
+        assert store.incr('api:key', ttl_seconds=0.05, amount=2)[0] == 3
+        assert store.add('update:1', ttl_seconds=0.05) and not store.add('update:1', ttl_seconds=0.05)
+        time.sleep(0.1)
+        assert store.get('api:key') == (0, 0.0)
+        assert store.incr('api:key', ttl_seconds=0.05)[0] == 1
+        assert store.add('update:1', ttl_seconds=0.05)
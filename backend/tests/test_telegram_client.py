@@ -0,0 +1,61 @@
+"""
+Testes do cliente da Bot API do Telegram (core.telegram_client): 429/retry_after e agrupamento de edições.
+"""
+import asyncio
+import json
+
+import httpx
+
+from app.core.telegram_client import TelegramClient
+
+
+def _client(handler) -> TelegramClient:
+    return TelegramClient('test-token', transport=httpx.MockTransport(handler), max_retries=2)
+
+
+def test_flood_control_waits_retry_after_and_retries():
+    """Um 429 bloqueia o chat durante retry_after e a chamada é repetida com sucesso."""
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        if len(calls) == 1:
+            return httpx.Response(429, json={'ok': False, 'error_code': 429, 'parameters': {'retry_after': 0}})
+        return httpx.Response(200, json={'ok': True, 'result': {'message_id': 7}})
+
+    async def scenario():
+        client = _client(handler)
+        try:
+            return client, await client.call('sendMessage', {'chat_id': 42, 'text': 'olá'})
+        finally:
+            await client.aclose()
+
+    client, result = asyncio.run(scenario())
+    assert result['result']['message_id'] == 7
+    assert calls == ['/bottest-token/sendMessage'] * 2
+    assert client.stats()['flood_waits'] == 1
+
+
+def test_edits_to_same_message_are_coalesced():
+    """Edições da mesma mensagem que esperam pela vez resultam num só editMessageText, com o último texto."""
+    sent = []
+
+    def handler(request):
+        sent.append(json.loads(request.content)['text'])
+        return httpx.Response(200, json={'ok': True, 'result': True})
+
+    async def scenario():
+        client = _client(handler)
+        client._block(42, 0.05)
+        try:
+            results = await asyncio.gather(*(
+                client.edit_message_text({'chat_id': 42, 'message_id': 1, 'text': f'v{i}'}) for i in range(3)
+            ))
+        finally:
+            await client.aclose()
+        return client, results
+
+    client, results = asyncio.run(scenario())
+    assert sent == ['v2']
+    assert all(r['ok'] for r in results)
+    assert client.stats()['edits_coalesced'] == 2
@@ -0,0 +1,131 @@
+"""
+Testes da fila de updates do Telegram (core.telegram_queue): ordem por chat, falhas e métricas.
+"""
+import asyncio
+import time
+from datetime import date
+
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+from app.core import telegram_queue
+from app.core.config import settings
+from app.core.telegram_queue import UpdateQueue, update_chat_id
+from app.models import database as models
+
+
+def test_update_chat_id_covers_messages_and_callbacks():
+    assert update_chat_id({'message': {'chat': {'id': 5}}}) == '5'
+    assert update_chat_id({'callback_query': {'message': {'chat': {'id': -7}}}}) == '-7'
+    assert update_chat_id({'my_chat_member': {}}) is None
+
+
+def test_updates_of_the_same_chat_are_processed_in_order(monkeypatch):
+    """Vários workers em paralelo, mas cada chat é processado pela ordem de chegada."""
+    queue = UpdateQueue(workers=4, lane_size=50)
+    seen = []
+
+    def fake_process_now(update_id):
+        time.sleep(0.002 * (update_id % 3))  # durações diferentes para baralhar se a ordem não fosse garantida
+        seen.append(update_id)
+        return True, 0.01, 0.002
+
+    monkeypatch.setattr(queue, 'process_now', fake_process_now)
+    monkeypatch.setattr(queue, '_due_updates', lambda: [])
+
+    async def scenario():
+        await queue.start(lambda payload, db, last_attempt: None)
+        for update_id in range(1, 41):
+            assert queue.enqueue(update_id, 'chat-a' if update_id % 2 else 'chat-b')
+        for _ in range(500):
+            if queue.processed == 40:
+                break
+            await asyncio.sleep(0.01)
+        stats = queue.stats()
+        await queue.stop()
+        return stats
+
+    stats = asyncio.run(scenario())
+    assert [u for u in seen if u % 2] == list(range(1, 41, 2))
+    assert [u for u in seen if not u % 2] == list(range(2, 41, 2))
+    assert stats['processed'] == 40
+    assert stats['depth'] == 0
+    assert stats['latency_ms']['p50'] == 10.0
+
+
+def test_failed_update_is_retried_and_holds_back_newer_updates_of_the_chat(db_session, monkeypatch):
+    """Erro de BD no handler: rollback, volta a pending e o update seguinte do chat espera por ele."""
+    # Sessões da fila dentro da transação do teste (savepoints; rollback no fim)
+    monkeypatch.setattr(telegram_queue, 'SessionLocal', sessionmaker(
+        bind=db_session.get_bind(), join_transaction_mode='create_savepoint', expire_on_commit=False,
+    ))
+    monkeypatch.setattr(settings, 'TELEGRAM_QUEUE_MAX_ATTEMPTS', 2)
+    for update_id in (900001, 900002):
+        db_session.add(models.TelegramUpdate(update_id=update_id, chat_id='chat-q', payload={'n': update_id}))
+    db_session.flush()
+
+    attempts = []
+
+    def process(payload, db, last_attempt):
+        if payload['n'] == 900001:
+            attempts.append(last_attempt)
+            db.execute(text('SELECT 1/0'))  # deixa a transação abortada
+
+    queue = UpdateQueue(workers=1, lane_size=10)
+    queue._process = process
+
+    def row(update_id):
+        db_session.expire_all()
+        return db_session.get(models.TelegramUpdate, update_id)
+
+    assert queue.process_now(900001)[0] is False
+    assert (row(900001).status, row(900001).attempts) == ('pending', 1)
+    assert 'DivisionByZero' in row(900001).last_error
+    # O mais antigo do chat continua por acabar: o seguinte não passa à frente
+    assert queue.process_now(900002) is None
+    assert row(900002).status == 'pending'
+
+    assert queue.process_now(900001)[0] is False
+    assert row(900001).status == 'failed'
+    assert attempts == [False, True]  # o utilizador só é avisado na última tentativa
+
+    assert queue.process_now(900002)[0] is True
+    assert row(900002).status == 'done'
+
+
+def test_update_failing_after_a_handler_commit_is_not_retried(db_session, test_user, monkeypatch):
+    """Erro depois de um commit do handler: 'failed' logo, sem repetir o que já ficou gravado."""
+    monkeypatch.setattr(telegram_queue, 'SessionLocal', sessionmaker(
+        bind=db_session.get_bind(), join_transaction_mode='create_savepoint', expire_on_commit=False,
+    ))
+    monkeypatch.setattr(settings, 'TELEGRAM_QUEUE_MAX_ATTEMPTS', 3)
+    ws = models.Workspace(owner_id=test_user.id, name="Fila WS", opening_balance_cents=0)
+    db_session.add(ws)
+    db_session.commit()
+    db_session.add(models.TelegramUpdate(update_id=900011, chat_id='chat-c', payload={'n': 900011}))
+    db_session.flush()
+
+    attempts = []
+
+    def process(payload, db, last_attempt):
+        attempts.append(last_attempt)
+        db.add(models.TelegramPendingTransaction(
+            chat_id='chat-c', workspace_id=ws.id, amount_cents=-500, description='Café', transaction_date=date.today(),
+        ))
+        db.add(models.Transaction(
+            workspace_id=ws.id, amount_cents=-500, description='Café', transaction_date=date.today(),
+        ))
+        db.commit()
+        raise RuntimeError('falha depois do commit')
+
+    queue = UpdateQueue(workers=1, lane_size=10)
+    queue._process = process
+
+    assert queue.process_now(900011)[0] is False
+    db_session.expire_all()
+    row = db_session.get(models.TelegramUpdate, 900011)
+    assert (row.status, row.attempts) == ('failed', 1)
+    assert queue.process_now(900011) is None  # não volta a 'pending': nada a repetir
+    assert attempts == [False]
+    assert db_session.query(models.TelegramPendingTransaction).filter_by(workspace_id=ws.id).count() == 1
+    assert db_session.query(models.Transaction).filter_by(workspace_id=ws.id).count() == 1
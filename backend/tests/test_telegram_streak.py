@@ -0,0 +1,35 @@
+"""
+Testes da streak do Telegram (_check_streak): dias seguidos com transações, numa só query.
+"""
+from datetime import date, timedelta
+
+from sqlalchemy import event
+
+from app.models import database as models
+from app.webhooks.telegram import _check_streak
+
+
+def test_streak_counts_consecutive_days_in_one_query(db_session, test_user):
+    ws = models.Workspace(owner_id=test_user.id, name="Test WS", opening_balance_cents=0)
+    db_session.add(ws)
+    db_session.commit()
+    today = date.today()
+    # 7 dias seguidos até hoje (dois no mesmo dia), um buraco e uma transação mais antiga
+    for days_ago in (0, 0, 1, 2, 3, 4, 5, 6, 8):
+        db_session.add(models.Transaction(
+            workspace_id=ws.id, amount_cents=-100, description="Café",
+            transaction_date=today - timedelta(days=days_ago), is_installment=False,
+        ))
+    db_session.commit()
+
+    statements = []
+
+    def listener(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db_session.bind, 'before_cursor_execute', listener)
+    try:
+        assert _check_streak(ws.id, db_session, lambda key: key) == 'streak_milestone_7'
+    finally:
+        event.remove(db_session.bind, 'before_cursor_execute', listener)
+    assert len(statements) == 1
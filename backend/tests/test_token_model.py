@@ -0,0 +1,107 @@
+"""
+Testes de core.token_model: mesmos scores que a query por inferência, lote e invalidação.
+"""
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from app.core import categorization_engine as ce
+from app.core import token_model
+from app.core.token_model import TokenScoreModel
+from app.models import database as models
+
+
+def test_model_scores_match_per_row_formula():
+    now = datetime.now(timezone.utc)
+    food, transport = uuid.uuid4(), uuid.uuid4()
+    rows = [
+        (food, 'cafe', 3, 1.2, now - timedelta(days=2)),
+        (transport, 'cafe', 1, 1.0, now - timedelta(days=90)),
+        (transport, 'metro', 5, 2.0, None),
+        (None, 'metro', 9, 1.0, now),  # sem categoria: ignorado
+    ]
+    model = TokenScoreModel(uuid.uuid4(), rows, now)
+
+    scores, contribs = model.score(['cafe', 'metro', 'cafe', 'desconhecido'])
+    cafe_food = (0.7 * 3 * (1 - 2 / 60 * 0.8) + 0.3 * 3) * 1.2
+    cafe_transport = (0.7 * 1 * 0.2 + 0.3 * 1) * 1.0
+    metro = (0.7 * 5 + 0.3 * 5) * 2.0
+    assert scores[transport] == 1.0
+    assert abs(scores[food] - cafe_food / (cafe_transport + metro)) < 1e-9
+    assert contribs[transport] == {'cafe': cafe_transport, 'metro': metro}
+    assert model.score_many([['metro'], ['nada']]) == [({transport: 1.0}, {transport: {'metro': metro}}), ({}, {})]
+
+
+def test_learn_from_correction_invalidates_workspace_model(db_session, test_user):
+    ws = models.Workspace(owner_id=test_user.id, name="Test WS", opening_balance_cents=0)
+    db_session.add(ws)
+    db_session.commit()
+    cat = models.Category(workspace_id=ws.id, name="Alimentação", type="expense")
+    db_session.add(cat)
+    db_session.commit()
+
+    tokens = ce.extract_tokens(ce.canonicalize("Pastelaria Aurora"))
+    assert ce.compute_category_scores_from_tokens(tokens, ws.id, 'expense', db_session, models) == ({}, {})
+    ce.learn_from_correction("Pastelaria Aurora", cat.id, ws.id, 'expense', cat.name, db_session, models)
+
+    scores, _ = ce.compute_category_scores_from_tokens(tokens, ws.id, 'expense', db_session, models)
+    assert scores == {cat.id: 1.0}
+    loads = token_model.stats()['loads']
+    ce.compute_category_scores_many([tokens, tokens], ws.id, 'expense', db_session, models)
+    assert token_model.stats()['loads'] == loads  # lote servido pelo modelo em cache
+
+
+def test_score_descriptions_matches_per_line_scoring(db_session, test_user):
+    ws = models.Workspace(owner_id=test_user.id, name="Test WS", opening_balance_cents=0)
+    db_session.add(ws)
+    db_session.commit()
+    food = models.Category(workspace_id=ws.id, name="Restauração", type="expense")
+    salary = models.Category(workspace_id=ws.id, name="Salário", type="income")
+    db_session.add_all([food, salary])
+    db_session.commit()
+    ce.learn_from_correction("Tasca Aurora", food.id, ws.id, 'expense', food.name, db_session, models)
+    ce.learn_from_correction("Ordenado Aurora", salary.id, ws.id, 'income', salary.name, db_session, models)
+
+    items = [("Tasca Aurora petiscos", 'expense'), ("Ordenado Aurora", 'income'), ("", 'expense')]
+    batch = ce.score_descriptions(items, ws.id, db_session, models)
+    per_line = [
+        ce.compute_category_scores_from_tokens(
+            ce.extract_tokens(ce.canonicalize(d), n=3), ws.id, tipo, db_session, models
+        )
+        for d, tipo in items
+    ]
+    assert batch == per_line
+    assert batch[0][0] == {food.id: 1.0} and batch[1][0] == {salary.id: 1.0}
+
+    # infer_category com o resultado do lote decide como a pontuar por si
+    categories = [food, salary]
+    from_batch = ce.infer_category(
+        "Tasca Aurora petiscos", ws.id, 'expense', categories, db_session, models, None,
+        use_gemini=False, token_scores=batch[0],
+    )
+    assert from_batch[:2] == (food.id, 'token_scoring')
+    assert from_batch == ce.infer_category(
+        "Tasca Aurora petiscos", ws.id, 'expense', categories, db_session, models, None, use_gemini=False
+    )
+
+
+def test_telegram_list_scores_all_lines_in_one_batch(db_session, test_user, monkeypatch):
+    from app.webhooks.telegram import parse_transaction
+
+    ws = models.Workspace(owner_id=test_user.id, name="Test WS", opening_balance_cents=0)
+    db_session.add(ws)
+    db_session.commit()
+    db_session.add(models.Category(workspace_id=ws.id, name="Restauração", type="expense"))
+    db_session.commit()
+
+    calls = []
+    score_descriptions = ce.score_descriptions
+
+    def spy(items, *args):
+        calls.append(list(items))
+        return score_descriptions(items, *args)
+
+    monkeypatch.setattr(ce, 'score_descriptions', spy)
+    parsed = parse_transaction("Tasca 15€ Metro 10€", ws, db_session)
+
+    assert parsed['multiple'] and len(parsed['transactions']) == 2
+    assert calls == [[("Tasca", 'expense'), ("Metro", 'expense')]]
@@ -71,3 +71,40 @@ def test_get_transactions_returns_list(client, test_user_token, workspace_and_ca
     assert "id" in first
     assert "amount_cents" in first
     assert first["amount_cents"] == -1500
+
+
+def test_get_transactions_cursor_pagination(client, test_user_token, workspace_and_categories, db_session):
+    """Seguir X-Next-Cursor percorre todas as transações sem repetições; X-Total-Count com include_count."""
+    ws = workspace_and_categories["workspace"]
+    cat = workspace_and_categories["categories"][1]
+    db_session.add_all([
+        models.Transaction(
+            workspace_id=ws.id,
+            category_id=cat.id,
+            amount_cents=-100 * (i + 2),
+            description=f"Compra {i}",
+            transaction_date=date.today(),
+            is_installment=False,
+        )
+        for i in range(5)
+    ])
+    db_session.commit()
+    headers = {"Authorization": f"Bearer {test_user_token}"}
+
+    seen = []
+    r = client.get("/transactions/?limit=2&include_count=true&type=expense", headers=headers)
+    assert r.headers["X-Total-Count"] == "5"
+    while True:
+        assert r.status_code == 200
+        seen.extend(t["id"] for t in r.json())
+        cursor = r.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+        r = client.get(f"/transactions/?limit=2&cursor={cursor}", headers=headers)
+
+    assert len(seen) == 5
+    assert len(set(seen)) == 5
+
+    income_only = client.get("/transactions/?type=income", headers=headers)
+    assert income_only.json() == []
+    assert client.get("/transactions/?cursor=invalido", headers=headers).status_code == 400
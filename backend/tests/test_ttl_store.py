@@ -0,0 +1,45 @@
+"""
+Testes de core.ttl_store: expiração, tamanho máximo e rate limit por janela deslizante.
+"""
+from types import SimpleNamespace
+
+import pytest
+
+from app.core import ttl_store
+from app.core.ttl_store import SlidingWindowLimiter, TTLMap
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ttl_store, 'time', SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def test_entries_expire_and_size_is_bounded(clock):
+    m = TTLMap(maxsize=3, ttl_seconds=10)
+    assert m.add('a') and not m.add('a')
+    m.set('b', 2)
+    clock[0] += 6
+    m.set('a', 1)  # renova 'a'
+    clock[0] += 5
+    assert m.get('b') is None  # expirou
+    assert m.get('a') == 1
+    for key in 'cdef':
+        m.set(key, key)
+    stats = m.stats()
+    assert stats['size'] == 3 and stats['evicted'] == 2 and stats['expired'] == 1
+    assert m.get('a') is None and m.get('f') == 'f'
+
+
+def test_sliding_window_limiter_and_idle_keys(clock):
+    limiter = SlidingWindowLimiter(limit=2, window_seconds=60, maxsize=100)
+    assert limiter.hit('chat') and limiter.hit('chat')
+    assert not limiter.hit('chat')
+    clock[0] += 61
+    assert limiter.hit('chat')
+    limiter.hit('other')
+    clock[0] += 120
+    stats = limiter.stats()
+    assert stats['size'] == 0  # chats inativos expiraram
+    assert stats['rejected'] == 1